@@ -0,0 +1,168 @@
+"""
+Shared helpers of the benchmarks: timing, JSON results and baseline comparison.
+
+A result file is
+    {"benchmark": ..., "meta": {python, platform, commit, timestamp},
+     "cases": {case: {"median_ms": ..., "min_ms": ..., ...}}}
+and a baseline is a result file kept in the repository. A case regresses when
+its median is more than `threshold` (relative) slower than in the baseline.
+Only compare results from the same machine: the baseline is machine specific.
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Errors that make a case skipped instead of failing the run: a missing dependency, or a
+# download done on first use (tiktoken BPE files, model weights) while offline
+NETWORK_ERRORS: tuple = (ConnectionError, TimeoutError, urllib.error.URLError)
+try:
+    import requests
+    NETWORK_ERRORS += (requests.RequestException,)
+except ImportError:
+    pass
+
+
+def measure(func: Callable[[], Any], repeat: int = 7, min_time: float = 0.05, warmup: int = 1) -> Dict[str, float]:
+    """
+    Time `func` like timeit: each of the `repeat` samples runs it enough times to last `min_time` seconds.
+
+    Returns:
+        Per call timings in milliseconds (median, min, mean, stdev) and the number of calls per sample
+    """
+    for _ in range(warmup):
+        func()
+    # Calibrate the number of calls per sample
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) * 1000 / number)
+    return {
+        "median_ms": round(statistics.median(samples), 6),
+        "min_ms": round(min(samples), 6),
+        "mean_ms": round(statistics.mean(samples), 6),
+        "stdev_ms": round(statistics.stdev(samples), 6) if len(samples) > 1 else 0.0,
+        "calls_per_sample": number,
+    }
+
+
+def run_case(setup: Callable[[], Callable[[], Any]], repeat: int = 7) -> Dict[str, Any]:
+    """
+    Build a case with `setup` and time the callable it returns.
+
+    Returns:
+        The timings of `measure`, or {"skipped": reason} when a dependency or the network is missing
+    """
+    try:
+        return measure(setup(), repeat=repeat)
+    except ImportError as e:
+        return {"skipped": f"missing dependency: {e}"}
+    except NETWORK_ERRORS as e:
+        return {"skipped": f"network unavailable: {type(e).__name__}: {e}"}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata() -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def save_results(benchmark: str, cases: Dict[str, Dict[str, Any]], path: Optional[str] = None) -> str:
+    """Write the results (default: benchmarks/results/<benchmark>_<timestamp>.json) and return the path."""
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(RESULTS_DIR, f"{benchmark}_{stamp}.json")
+    with open(path, "w") as f:
+        json.dump({"benchmark": benchmark, "meta": metadata(), "cases": cases}, f, indent=2, sort_keys=True)
+    return path
+
+
+def load_results(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def compare(cases: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], threshold: float = 0.2,
+            metric: str = "median_ms") -> List[Dict[str, Any]]:
+    """
+    Args:
+        cases: Current results per case
+        baseline: Baseline result file content
+        threshold: Relative slowdown flagged as a regression (0.2 = 20% slower)
+        metric: Timing compared
+
+    Returns:
+        One row per case: baseline, current, ratio and status (ok, regression, improvement, new, skipped)
+    """
+    rows = []
+    baseline_cases = baseline.get("cases", {})
+    for name, current in sorted(cases.items()):
+        reference = baseline_cases.get(name)
+        row = {"case": name, "current": current.get(metric), "baseline": reference.get(metric) if reference else None}
+        if current.get("skipped"):
+            row["status"] = "skipped"
+        elif not reference or reference.get(metric) in (None, 0):
+            row["status"] = "new"
+        else:
+            row["ratio"] = round(current[metric] / reference[metric], 3)
+            if row["ratio"] > 1 + threshold:
+                row["status"] = "regression"
+            elif row["ratio"] < 1 / (1 + threshold):
+                row["status"] = "improvement"
+            else:
+                row["status"] = "ok"
+        rows.append(row)
+    return rows
+
+
+def print_comparison(rows: List[Dict[str, Any]], metric: str = "median_ms"):
+    print(f"  {'case':<40} {'baseline':>12} {'current':>12} {'ratio':>7}  status")
+    for row in rows:
+        baseline = f"{row['baseline']:.4f}" if row.get("baseline") is not None else "-"
+        current = f"{row['current']:.4f}" if row.get("current") is not None else "-"
+        ratio = f"{row['ratio']:.2f}" if "ratio" in row else "-"
+        print(f"  {row['case']:<40} {baseline:>12} {current:>12} {ratio:>7}  {row['status']}")
+    print(f"  ({metric})")
+
+
+def ensure_repo_on_path():
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
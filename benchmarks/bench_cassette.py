@@ -0,0 +1,104 @@
+"""
+Cassette benchmark: cost of a verification-sized request live (simulated
+provider latency) vs replayed from a cassette with the recorded, a scaled and
+no latency. The "zero" run measures what is left of the pipeline without the
+network (fingerprinting, cassette lookup, formatting).
+
+A fake provider client answers after `--latency` seconds; the requests carry a
+screenshot-sized base64 image like `Ask AI For Verification`.
+
+Usage (from the repository root):
+    python benchmarks/bench_cassette.py --requests 50 --latency 0.2
+"""
+import argparse
+import base64
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def _fake_client_class():
+    from src.AiHelper.providers.llm._baseclient import BaseLLMClient
+
+    class FakeProviderClient(BaseLLMClient):
+        def __init__(self, latency: float):
+            self.latency = latency
+
+        def create_chat_completion(self, messages, model=None, max_tokens=1400, temperature=1.0, top_p=1.0, **kwargs):
+            time.sleep(self.latency)
+            return {"content": '{"confidence": 0.9, "reason": "ok", "bug_summary": "", "bug_description": ""}'}
+
+        def format_response(self, response, include_tokens=True, include_reason=False):
+            result = {"content": response["content"]}
+            if include_tokens:
+                result.update({"prompt_tokens": 1200, "completion_tokens": 40, "total_tokens": 1240})
+            if include_reason:
+                result["finish_reason"] = "stop"
+            return result
+
+    return FakeProviderClient
+
+
+def _messages(index: int, screenshot: str) -> list:
+    return [
+        {"role": "system", "content": "You are a software tester experienced in UI verification of mobile apps."},
+        {"role": "user", "content": [
+            {"type": "text", "text": f"verification {index}: the home screen is displayed"},
+            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{screenshot}"}},
+        ]},
+    ]
+
+
+def _run(client, requests: int, screenshot: str) -> dict:
+    timings = []
+    for index in range(requests):
+        start = time.perf_counter()
+        client.format_response(client.create_chat_completion(_messages(index, screenshot)), include_tokens=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "total_s": round(sum(timings) / 1000, 3),
+        "mean_ms": round(statistics.mean(timings), 3),
+        "max_ms": round(max(timings), 3),
+    }
+
+
+def run(requests: int = 50, latency: float = 0.2) -> dict:
+    """ returns live / replay timings for each latency mode """
+    from src.AiHelper.common._cassette import Cassette
+    from src.AiHelper.providers.llm._cassette import CassetteLLMClient
+
+    fake_client = _fake_client_class()(latency)
+    # ~600 KB PNG-sized payload, hashed into the fingerprint, never stored
+    screenshot = base64.b64encode(os.urandom(450_000)).decode()
+    results = {"requests": requests, "latency_s": latency}
+    with tempfile.TemporaryDirectory(prefix="aihelper_cassette_bench_") as work_dir:
+        path = os.path.join(work_dir, "bench.json")
+        recorder = CassetteLLMClient(Cassette(path, "record"), "fake", "fake-model", lambda: fake_client)
+        results["live_record"] = _run(recorder, requests, screenshot)
+        results["cassette_bytes"] = os.path.getsize(path)
+        for mode in ("recorded", "0.25", "zero"):
+            player = CassetteLLMClient(Cassette(path, "replay", latency=mode), "fake", "fake-model", lambda: fake_client)
+            results[f"replay_{mode}"] = _run(player, requests, screenshot)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    result = run(args.requests, args.latency)
+    print(f"Cassette ({result['requests']} requests, {result['latency_s']} s simulated latency, "
+          f"cassette {result['cassette_bytes'] / 1e3:.1f} kB)")
+    for name in ("live_record", "replay_recorded", "replay_0.25", "replay_zero"):
+        timing = result[name]
+        print(f"  {name:<16} total {timing['total_s']:>8.3f} s   mean {timing['mean_ms']:>9.3f} ms   max {timing['max_ms']:>9.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
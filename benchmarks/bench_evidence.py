@@ -0,0 +1,143 @@
+"""
+Evidence benchmark: Robot output size and rebot time with inline base64
+screenshots vs links to the evidence store.
+
+A generated suite logs `--screenshots` screenshots (`--distinct` different
+images, the others are repeats, as when a screen is verified several times)
+through Utilities._embed_image_to_log, once with AIHELPER_EVIDENCE_STORE=false
+and once with true. Each run is then post-processed with rebot. Results are
+saved with the other benchmark results (benchmarks/results/evidence_*.json).
+
+Usage (from the repository root):
+    python benchmarks/bench_evidence.py --screenshots 200 --distinct 40
+"""
+import argparse
+import base64
+import io
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import _harness  # noqa: E402
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+LIBRARY = '''
+import base64
+from src.AiHelper.common._utils import Utilities
+
+
+class EvidenceBenchLibrary:
+
+    def __init__(self, image_dir):
+        self.images = [
+            base64.b64encode(open(f"{image_dir}/{name}", "rb").read()).decode()
+            for name in sorted(__import__("os").listdir(image_dir))
+        ]
+
+    def log_screenshots(self, count):
+        for index in range(int(count)):
+            Utilities._embed_image_to_log(self.images[index % len(self.images)], width=200, message=f"screenshot {index}")
+'''
+
+SUITE = '''*** Settings ***
+Library    EvidenceBenchLibrary    {image_dir}
+
+*** Test Cases ***
+Log Screenshots
+    Log Screenshots    {count}
+'''
+
+
+def _make_images(image_dir: str, distinct: int, width: int = 1080, height: int = 2340):
+    """Screenshot-sized PNGs (random noise when Pillow is missing)."""
+    os.makedirs(image_dir, exist_ok=True)
+    for index in range(distinct):
+        try:
+            from PIL import Image
+            image = Image.new("RGB", (width, height), (random.randrange(256), random.randrange(256), random.randrange(256)))
+            # A band of noise so that the PNGs do not compress to nothing
+            noise = Image.frombytes("RGB", (width, height // 8), os.urandom(width * (height // 8) * 3))
+            image.paste(noise, (0, height // 2))
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG")
+            data = buffer.getvalue()
+        except ImportError:
+            data = os.urandom(600_000)
+        with open(os.path.join(image_dir, f"screen_{index:04d}.png"), "wb") as f:
+            f.write(data)
+
+
+def _dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def _run_mode(work_dir: str, image_dir: str, count: int, evidence_store: bool) -> dict:
+    mode = "store" if evidence_store else "inline"
+    output_dir = os.path.join(work_dir, mode)
+    env = dict(os.environ, AIHELPER_EVIDENCE_STORE=str(evidence_store).lower(),
+               PYTHONPATH=os.pathsep.join([REPO_ROOT, work_dir, os.environ.get("PYTHONPATH", "")]))
+    suite = os.path.join(work_dir, "evidence_bench.robot")
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-m", "robot", "--outputdir", output_dir, "--report", "NONE", suite],
+                   env=env, check=True, stdout=subprocess.DEVNULL)
+    run_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-m", "robot.rebot", "--outputdir", output_dir, "--output", "rebot.xml",
+                    "--log", "rebot_log.html", "--report", "NONE", os.path.join(output_dir, "output.xml")],
+                   env=env, check=True, stdout=subprocess.DEVNULL)
+    rebot_time = time.perf_counter() - start
+
+    evidence_dir = os.path.join(output_dir, "evidence")
+    return {
+        "run_s": round(run_time, 3),
+        "rebot_s": round(rebot_time, 3),
+        "output_xml_bytes": os.path.getsize(os.path.join(output_dir, "output.xml")),
+        "log_html_bytes": os.path.getsize(os.path.join(output_dir, "log.html")),
+        "evidence_bytes": _dir_size(evidence_dir) if os.path.isdir(evidence_dir) else 0,
+    }
+
+
+def run(screenshots: int = 200, distinct: int = 40) -> dict:
+    """ returns {"inline": {...}, "store": {...}} sizes (bytes) and run / rebot times (s) """
+    with tempfile.TemporaryDirectory(prefix="aihelper_evidence_bench_") as work_dir:
+        image_dir = os.path.join(work_dir, "images")
+        _make_images(image_dir, distinct)
+        with open(os.path.join(work_dir, "EvidenceBenchLibrary.py"), "w") as f:
+            f.write(LIBRARY)
+        with open(os.path.join(work_dir, "evidence_bench.robot"), "w") as f:
+            f.write(SUITE.format(image_dir=image_dir, count=screenshots))
+        return {
+            "screenshots": screenshots,
+            "distinct": distinct,
+            "inline": _run_mode(work_dir, image_dir, screenshots, evidence_store=False),
+            "store": _run_mode(work_dir, image_dir, screenshots, evidence_store=True),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--screenshots", type=int, default=200)
+    parser.add_argument("--distinct", type=int, default=40)
+    args = parser.parse_args()
+
+    result = run(args.screenshots, args.distinct)
+    print(f"Evidence ({result['screenshots']} screenshots, {result['distinct']} distinct)")
+    for mode in ("inline", "store"):
+        timing = result[mode]
+        print(f"  {mode:<7} output.xml {timing['output_xml_bytes'] / 1e6:>8.2f} MB   log.html {timing['log_html_bytes'] / 1e6:>8.2f} MB"
+              f"   evidence {timing['evidence_bytes'] / 1e6:>8.2f} MB   run {timing['run_s']:>7.2f} s   rebot {timing['rebot_s']:>7.2f} s")
+    path = _harness.save_results("evidence", {
+        f"{result['screenshots']}_screenshots_{result['distinct']}_distinct.{mode}": result[mode] for mode in ("inline", "store")
+    })
+    print(f"Results saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
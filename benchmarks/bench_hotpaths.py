@@ -0,0 +1,397 @@
+"""
+Hot path benchmarks: the CPU work AiHelper does around every LLM call.
+
+Cases:
+    - message construction in ChatPromptFactory (uploads replaced by a no-op uploader)
+    - provider message compilation: Anthropic format (first and repeated
+      compilation), GeminiClient._convert_messages_to_gemini_format (short and long conversations)
+    - Utilities.extract_json_safely on large, wrapped and prose-heavy responses
+    - OmniParser._parse_response on a large element list
+    - TokenHelper token counting, cost accounting, and cost accounting from several
+      processes at once (also reports updates lost by the shared cost file)
+    - screenshot base64 encoding and decode / resize / re-encode
+    - UI XML compaction, and a conversation turn sending the changes of the screen
+
+Each run writes its results to benchmarks/results/hotpaths_<timestamp>.json (not
+versioned) and compares them with benchmarks/hotpaths_baseline.json. The
+committed baseline is a reference measured on the machine described in its
+"meta": timings are machine specific, so regenerate it with --update-baseline
+on the machine that runs the comparison (e.g. the CI runner) before relying on
+the verdicts. The exit status is 1 when a case is more than --threshold slower
+than the baseline.
+Cases whose dependencies are missing, or that need a download while offline (tiktoken
+encodings), are reported as skipped.
+
+Usage (from the repository root):
+    python benchmarks/bench_hotpaths.py [--filter gemini] [--threshold 0.2] [--update-baseline]
+"""
+import argparse
+import base64
+import io
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import _harness  # noqa: E402
+
+_harness.ensure_repo_on_path()
+# The library log goes to a temporary directory, not to ./logs
+os.environ.setdefault("CI_LOG_DIR", tempfile.gettempdir())
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hotpaths_baseline.json")
+
+SCREEN_SIZE = (1080, 2340)
+
+
+def _screenshot_png() -> bytes:
+    """Screenshot-like PNG: flat background, text-like rows, a noisy band."""
+    from PIL import Image, ImageDraw
+    image = Image.new("RGB", SCREEN_SIZE, (245, 245, 245))
+    draw = ImageDraw.Draw(image)
+    rng = random.Random(0)
+    for top in range(120, SCREEN_SIZE[1] - 200, 140):
+        draw.rectangle((60, top, SCREEN_SIZE[0] - 60, top + 100), outline=(200, 200, 200), width=2)
+        for left in range(90, rng.randrange(400, 900), 22):
+            draw.rectangle((left, top + 35, left + 14, top + 60), fill=(40, 40, 40))
+    noise = Image.frombytes("RGB", (SCREEN_SIZE[0], 200), rng.randbytes(SCREEN_SIZE[0] * 200 * 3))
+    image.paste(noise, (0, SCREEN_SIZE[1] // 2))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _screenshot_base64() -> str:
+    try:
+        return base64.b64encode(_screenshot_png()).decode("utf-8")
+    except ImportError:
+        # ~600 KB like a real PNG screenshot
+        return base64.b64encode(random.Random(0).randbytes(450_000)).decode("utf-8")
+
+
+# 1x1 PNG standing for the reference image of a verification
+_REFERENCE_PNG_BASE64 = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=="
+
+
+def _verification_content(screenshot_base64: str) -> list:
+    return [
+        {"type": "text", "text": "Verify that the itinerary screen shows the departure and arrival stops. " * 20},
+        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{screenshot_base64}"}},
+        # A second, small image inline too: a remote URL would make the Gemini case time the download
+        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{_REFERENCE_PNG_BASE64}"}},
+    ]
+
+
+def _conversation(turns: int, screenshot_base64: str) -> list:
+    messages = [{"role": "system", "content": "You are a software tester experienced in UI verification of mobile apps."}]
+    for index in range(turns):
+        # A screenshot every 10 turns, like an agent loop
+        messages.append({"role": "user", "content": _verification_content(screenshot_base64) if index % 10 == 0
+                         else f"step {index}: tap the search bar and type the destination"})
+        messages.append({"role": "assistant", "content": f'{{"step": {index}, "action": "tap", "x": 540, "y": 300}}'})
+    return messages
+
+
+class _NoUploadUploader:
+    """Stands in for ImageUploader: the benchmark measures message construction, not the network."""
+
+    def upload_from_base64(self, base64_data: str) -> str:
+        return "https://i.ibb.co/benchmark/screenshot.png"
+
+    def upload_from_file(self, file_path: str) -> str:
+        return "https://i.ibb.co/benchmark/reference.png"
+
+    def upload_screenshot(self, screenshot) -> str:
+        return "https://i.ibb.co/benchmark/screenshot.png"
+
+
+def _json_response(items: int) -> str:
+    return json.dumps({
+        "confidence": 0.93,
+        "reason": "The itinerary screen matches the expected layout",
+        "elements": [{"id": index, "label": f"Stop {index}", "bbox": [0.1, 0.2, 0.3, 0.4], "interactivity": True}
+                     for index in range(items)],
+    })
+
+
+# Cases: name -> setup() returning the callable to time (ImportError = skipped)
+def case_promptfactory_user_prompt() -> Callable[[], Any]:
+    from src.AiHelper.providers.promptfactory import ChatPromptFactory
+    factory = ChatPromptFactory(_NoUploadUploader())
+    text = "Verify that the itinerary screen shows the departure and arrival stops. " * 30
+    return lambda: factory.create_user_prompt(text, "https://i.ibb.co/benchmark/screenshot.png")
+
+
+def case_promptfactory_verification_messages() -> Callable[[], Any]:
+    from src.AiHelper.providers.promptfactory import ChatPromptFactory
+    factory = ChatPromptFactory(_NoUploadUploader())
+    screenshot = _screenshot_base64()
+
+    def build():
+        return [
+            factory.create_system_prompt("You are a software tester experienced in UI verification of mobile apps."),
+            factory.create_user_prompt_sending_screenshot("the home screen is displayed", screenshot),
+            factory.create_user_prompt("You should respond in JSON format with the following keys: ..."),
+        ]
+    return build
+
+
+def _anthropic_case(cold: bool) -> Callable[[], Any]:
+    from src.AiHelper.providers.llm import _messages
+    messages = [{"role": "system", "content": "You are a software tester experienced in UI verification of mobile apps."},
+                {"role": "user", "content": _verification_content(_screenshot_base64())}]
+    if not cold:
+        return lambda: _messages.anthropic_messages(messages)
+
+    def compile_cold():
+        _messages.clear_caches()
+        return _messages.anthropic_messages(messages)
+    return compile_cold
+
+
+def case_anthropic_compile_messages() -> Callable[[], Any]:
+    """Same messages sent again (retry, consensus): parts already compiled."""
+    return _anthropic_case(cold=False)
+
+
+def case_anthropic_compile_messages_cold() -> Callable[[], Any]:
+    return _anthropic_case(cold=True)
+
+
+def _gemini_case(turns: int) -> Callable[[], Any]:
+    from src.AiHelper.common._logger import RobotCustomLogger
+    from src.AiHelper.providers.llm._gemini import GeminiClient
+    client = GeminiClient.__new__(GeminiClient)
+    client.logger = RobotCustomLogger()
+    messages = _conversation(turns, _screenshot_base64())
+    return lambda: client._convert_messages_to_gemini_format(messages)
+
+
+def case_gemini_convert_messages_10() -> Callable[[], Any]:
+    return _gemini_case(10)
+
+
+def case_gemini_convert_messages_500() -> Callable[[], Any]:
+    return _gemini_case(500)
+
+
+def case_extract_json_clean() -> Callable[[], Any]:
+    from src.AiHelper.common._utils import Utilities
+    response = _json_response(2000)
+    return lambda: Utilities.extract_json_safely(response)
+
+
+def case_extract_json_wrapped() -> Callable[[], Any]:
+    from src.AiHelper.common._utils import Utilities
+    response = f"Here is the verification result:\n```json\n{_json_response(2000)}\n```\nLet me know if you need more."
+    return lambda: Utilities.extract_json_safely(response)
+
+
+def case_extract_json_prose() -> Callable[[], Any]:
+    from src.AiHelper.common._utils import Utilities
+    # Long reasoning with braces before the answer, as chatty models reply
+    prose = "The element {search bar} is visible and the {logo} too. " * 2000
+    response = f"{prose}\n{_json_response(50)}"
+
+    def extract():
+        try:
+            return Utilities.extract_json_safely(response)
+        except ValueError:
+            return None
+    return extract
+
+
+def case_omniparser_parse_response() -> Callable[[], Any]:
+    from src.AiHelper.providers.llm._huggingface import OmniParser
+    parser = OmniParser.__new__(OmniParser)
+    response = "\n".join(
+        f"icon {index}: {{'type': 'text', 'bbox': [0.{index % 9}1, 0.12, 0.35, 0.18], "
+        f"'interactivity': {index % 2 == 0}, 'content': 'Stop {index}', 'source': 'box_ocr_content_ocr'}}"
+        for index in range(400))
+    return lambda: parser._parse_response(response)
+
+
+def case_tokenhelper_count_tokens() -> Callable[[], Any]:
+    import tiktoken  # noqa: F401  (skipped without tiktoken)
+    from src.AiHelper.common._tiktoken import TokenHelper
+    helper = TokenHelper()
+    text = "Verify that the itinerary screen shows the departure and arrival stops. " * 200
+    return lambda: helper._count_tokens(text)
+
+
+def case_tokenhelper_calculate_cost() -> Callable[[], Any]:
+    from src.AiHelper.common._tiktoken import TokenHelper
+    helper = TokenHelper()
+    TokenHelper._COST_FILE = os.path.join(tempfile.mkdtemp(prefix="aihelper_bench_"), "cost.json")
+    return lambda: helper.calculate_cost(1200, 80, "gpt-4o-mini")
+
+
+def case_screenshot_encode_base64() -> Callable[[], Any]:
+    png = _screenshot_png()
+    return lambda: base64.b64encode(png).decode("utf-8")
+
+
+def case_screenshot_decode_resize() -> Callable[[], Any]:
+    from PIL import Image
+    screenshot = base64.b64encode(_screenshot_png()).decode("utf-8")
+
+    def reduce():
+        with Image.open(io.BytesIO(base64.b64decode(screenshot))) as image:
+            reduced = image.resize((image.width // 2, image.height // 2), Image.LANCZOS)
+        buffer = io.BytesIO()
+        reduced.save(buffer, format="PNG")
+        return base64.b64encode(buffer.getvalue()).decode("utf-8")
+    return reduce
+
+
+def _page_source(rows: int, dialog: bool = False, count: int = 2) -> str:
+    """UiAutomator2-like page source: a list of rows, optionally a dialog on top."""
+    items = "".join(
+        f'<node class="android.widget.LinearLayout" bounds="[0,{200 + 120 * i}][1080,{310 + 120 * i}]">'
+        f'<node class="android.widget.TextView" text="Item {i}" resource-id="app:id/title" bounds="[40,{210 + 120 * i}][800,{260 + 120 * i}]"/>'
+        f'<node class="android.widget.ImageButton" content-desc="More" clickable="true" resource-id="app:id/more" '
+        f'bounds="[900,{210 + 120 * i}][1040,{300 + 120 * i}]"/></node>'
+        for i in range(rows))
+    overlay = ('<node class="android.widget.FrameLayout" bounds="[100,900][980,1400]">'
+               '<node class="android.widget.TextView" text="Delete the item?" bounds="[140,950][940,1050]"/>'
+               '<node class="android.widget.Button" text="OK" clickable="true" resource-id="android:id/button1" bounds="[700,1250][940,1350]"/>'
+               '</node>') if dialog else ""
+    return ('<hierarchy rotation="0"><node class="android.widget.FrameLayout" bounds="[0,0][1080,2340]">' + overlay +
+            f'<node class="android.widget.TextView" text="{count} items" resource-id="app:id/count" bounds="[0,0][500,90]"/>'
+            f'<node class="androidx.recyclerview.widget.RecyclerView" scrollable="true" resource-id="app:id/list" '
+            f'bounds="[0,180][1080,2340]">{items}</node></node></hierarchy>')
+
+
+def case_uixml_compact() -> Callable[[], Any]:
+    from src.AiHelper.common._uixml import UISnapshot
+    source = _page_source(300)
+    return lambda: UISnapshot.parse(source).text()
+
+
+def case_uixml_diff_turn() -> Callable[[], Any]:
+    """Second turn of a conversation: a dialog appeared and a counter changed (change set sent)."""
+    from src.AiHelper.common._uixml import UIDiffTracker, UISnapshot
+    first, second = UISnapshot.parse(_page_source(300)), UISnapshot.parse(_page_source(300, dialog=True, count=3))
+
+    def turn():
+        tracker = UIDiffTracker()
+        tracker.turn(first)
+        return tracker.turn(second).text
+    return turn
+
+
+CASES: Dict[str, Callable[[], Callable[[], Any]]] = {
+    "promptfactory.user_prompt": case_promptfactory_user_prompt,
+    "promptfactory.verification_messages": case_promptfactory_verification_messages,
+    "anthropic.compile_messages": case_anthropic_compile_messages,
+    "anthropic.compile_messages_cold": case_anthropic_compile_messages_cold,
+    "gemini.convert_messages_10": case_gemini_convert_messages_10,
+    "gemini.convert_messages_500": case_gemini_convert_messages_500,
+    "utils.extract_json_clean": case_extract_json_clean,
+    "utils.extract_json_wrapped": case_extract_json_wrapped,
+    "utils.extract_json_prose": case_extract_json_prose,
+    "omniparser.parse_response": case_omniparser_parse_response,
+    "tokenhelper.count_tokens": case_tokenhelper_count_tokens,
+    "tokenhelper.calculate_cost": case_tokenhelper_calculate_cost,
+    "screenshot.encode_base64": case_screenshot_encode_base64,
+    "screenshot.decode_resize": case_screenshot_decode_resize,
+    "uixml.compact_300_rows": case_uixml_compact,
+    "uixml.diff_turn_300_rows": case_uixml_diff_turn,
+}
+
+
+def _cost_worker(cost_file: str, calls: int):
+    from src.AiHelper.common._tiktoken import TokenHelper
+    TokenHelper._COST_FILE = cost_file
+    helper = TokenHelper()
+    for _ in range(calls):
+        helper.calculate_cost(1000, 100, "gpt-4o-mini")
+
+
+def concurrent_cost_accounting(processes: int = 4, calls: int = 100) -> Dict[str, Any]:
+    """Cost accounting from several processes sharing the cost file (pabot workers)."""
+    import src.AiHelper.common._tiktoken  # noqa: F401  (imported before forking)
+    cost_file = os.path.join(tempfile.mkdtemp(prefix="aihelper_bench_"), "cost.json")
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+    workers = [context.Process(target=_cost_worker, args=(cost_file, calls)) for _ in range(processes)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    with open(cost_file) as f:
+        recorded_tokens = json.load(f).get("tokens", 0)
+    expected_tokens = processes * calls * 1100
+    return {
+        "median_ms": round(elapsed * 1000 / (processes * calls), 6),
+        "wall_s": round(elapsed, 3),
+        "processes": processes,
+        "calls_per_process": calls,
+        # Increments lost by concurrent read-modify-write of the cost file
+        "lost_updates": (expected_tokens - recorded_tokens) // 1100,
+    }
+
+
+def run(filter_text: str = "", repeat: int = 7) -> Dict[str, Dict[str, Any]]:
+    results: Dict[str, Dict[str, Any]] = {}
+    for name, setup in CASES.items():
+        if filter_text and filter_text not in name:
+            continue
+        results[name] = _harness.run_case(setup, repeat=repeat)
+    if not filter_text or filter_text in "tokenhelper.calculate_cost_concurrent":
+        try:
+            results["tokenhelper.calculate_cost_concurrent"] = concurrent_cost_accounting()
+        except ImportError as e:
+            results["tokenhelper.calculate_cost_concurrent"] = {"skipped": f"missing dependency: {e}"}
+        except _harness.NETWORK_ERRORS as e:
+            results["tokenhelper.calculate_cost_concurrent"] = {"skipped": f"network unavailable: {e}"}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="only run the cases whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown flagged as regression")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--output", default=None, help="result file (benchmarks/results/ by default)")
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the new baseline")
+    args = parser.parse_args()
+
+    results = run(args.filter, args.repeat)
+    path = _harness.save_results("hotpaths", results, args.output)
+    print(f"Results written to {path}")
+
+    if args.update_baseline:
+        _harness.save_results("hotpaths", results, args.baseline)
+        print(f"Baseline updated: {args.baseline}")
+        return
+
+    baseline = _harness.load_results(args.baseline)
+    if baseline is None:
+        for name, timing in results.items():
+            value = timing.get("skipped") or f"{timing['median_ms']:.4f} ms"
+            print(f"  {name:<40} {value}")
+        print(f"No baseline ({args.baseline}): run with --update-baseline to create it")
+        return
+
+    rows = _harness.compare(results, baseline, args.threshold)
+    _harness.print_comparison(rows)
+    lost = results.get("tokenhelper.calculate_cost_concurrent", {}).get("lost_updates")
+    if lost:
+        print(f"  tokenhelper.calculate_cost_concurrent lost {lost} cost updates")
+    regressions = [row["case"] for row in rows if row["status"] == "regression"]
+    if regressions:
+        print(f"Regressions above {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Import-time benchmark and regression guard for the AiHelper library.
+
+Runs `python -X importtime -c "import src.AiHelper"` in a fresh interpreter,
+reports the cumulative import time and the slowest imported modules, and
+checks the result against benchmarks/import_time_budget.json:
+    - provider SDKs (openai, anthropic, google.generativeai, gradio_client,
+      tiktoken, appium, PIL) must not be imported eagerly
+    - the cumulative import time must stay under max_cumulative_ms
+
+The results are written to benchmarks/results/import_time_<timestamp>.json.
+
+Usage (from the repository root):
+    python benchmarks/bench_import_time.py [--repeat 5] [--top 15]
+Exits with status 1 when the budget is exceeded.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import _harness  # noqa: E402
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+BUDGET_FILE = os.path.join(os.path.dirname(__file__), "import_time_budget.json")
+
+
+def _parse_importtime(stderr: str) -> dict:
+    """ returns module -> (self_us, cumulative_us) from `-X importtime` output """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def measure(module: str) -> dict:
+    """ import `module` in a fresh interpreter and return the parsed import times """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    return _parse_importtime(completed.stderr)
+
+
+def run(repeat: int = 5, top: int = 15) -> dict:
+    with open(BUDGET_FILE, "r") as f:
+        budget = json.load(f)
+    module = budget["module"]
+
+    runs = [measure(module) for _ in range(repeat)]
+    cumulative_ms = [modules[module][1] / 1000 for modules in runs]
+    last = runs[-1]
+    eager = sorted(
+        name for name in budget["forbidden_modules"]
+        if name in last
+    )
+    slowest = sorted(last.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    median_ms = statistics.median(cumulative_ms)
+    return {
+        "module": module,
+        "median_cumulative_ms": round(median_ms, 2),
+        "min_cumulative_ms": round(min(cumulative_ms), 2),
+        "budget_ms": budget["max_cumulative_ms"],
+        "eager_forbidden_modules": eager,
+        "slowest_self_ms": {name: round(times[0] / 1000, 2) for name, times in slowest},
+        "passed": not eager and median_ms <= budget["max_cumulative_ms"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    result = run(args.repeat, args.top)
+    print(f"import {result['module']}: median {result['median_cumulative_ms']} ms "
+          f"(min {result['min_cumulative_ms']} ms, budget {result['budget_ms']} ms)")
+    print("slowest modules (self time):")
+    for name, self_ms in result["slowest_self_ms"].items():
+        print(f"  {self_ms:>9.2f} ms  {name}")
+    path = _harness.save_results("import_time", {result["module"]: result})
+    print(f"Results saved to {path}")
+    if result["eager_forbidden_modules"]:
+        print(f"FAIL: eagerly imported: {', '.join(result['eager_forbidden_modules'])}")
+    if not result["passed"]:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
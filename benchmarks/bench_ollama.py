@@ -0,0 +1,134 @@
+"""
+Ollama native mode benchmark against the local stand-in server
+(src/AiHelper/providers/llm/_ollamaserver.py, model load of `--load-time` s).
+
+Sequential verifications, time per keyword (model load included):
+    cold        keep_alive 0, no warm-up: every call loads the model
+    keep_alive  keep_alive 30m: only the first call loads it
+    warm_up     model loaded at suite start (not counted): no call loads it
+
+Concurrent verifications (`--workers` threads, server with `--parallel` slots):
+    uncapped    every request is sent at once and queued by the server
+    slots       at most `--parallel` requests in flight (client slot files)
+"in flight" is the highest number of requests the server held at once,
+queued ones included.
+
+Usage (from the repository root, requests required):
+    python benchmarks/bench_ollama.py --calls 5 --load-time 1
+"""
+import argparse
+import base64
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import _harness  # noqa: E402
+
+_harness.ensure_repo_on_path()
+os.environ.setdefault("CI_LOG_DIR", tempfile.gettempdir())
+
+MODEL = "llama3.2-vision"
+
+
+def _messages():
+    image = base64.b64encode(os.urandom(30_000)).decode("ascii")
+    return [
+        {"role": "system", "content": "You verify mobile application screens."},
+        {"role": "user", "content": [
+            {"type": "text", "text": "Is the login button visible?"},
+            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image}"}},
+        ]},
+    ]
+
+
+def _client(server, keep_alive, parallel, slot_dir):
+    from src.AiHelper.providers.llm._ollamanative import OllamaNativeClient, OllamaSlots
+    client = OllamaNativeClient(model=MODEL, base_url=server.url, keep_alive=keep_alive, warm_up=False, max_retries=0)
+    client.slots = OllamaSlots(server.url, parallel, slot_dir)
+    return client
+
+
+def sequential(calls: int, load_time: float) -> dict:
+    from src.AiHelper.providers.llm._ollamaserver import OllamaStandInServer
+    results = {}
+    messages = _messages()
+    for name, keep_alive, warm_up in (("cold", 0, False), ("keep_alive", "30m", False), ("warm_up", "30m", True)):
+        with OllamaStandInServer(load_time=load_time) as server, tempfile.TemporaryDirectory() as slot_dir:
+            client = _client(server, keep_alive, 4, slot_dir)
+            if warm_up:
+                client.warm_up()
+            timings = []
+            for _ in range(calls):
+                start = time.perf_counter()
+                client.create_chat_completion(messages, response_schema="verification")
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = {
+                "first_ms": round(timings[0], 1),
+                "median_ms": round(statistics.median(timings), 1),
+                "total_ms": round(sum(timings), 1),
+                "cold_calls": client.stats["cold_calls"],
+                "load_ms": round(client.stats["load_ms"], 1),
+                "inference_ms": round(client.stats["inference_ms"], 1),
+            }
+    return results
+
+
+def concurrent(workers: int, parallel: int) -> dict:
+    from src.AiHelper.providers.llm._ollamaserver import OllamaStandInServer
+    results = {}
+    messages = _messages()
+    for name, slots in (("uncapped", workers), ("slots", parallel)):
+        with OllamaStandInServer(load_time=0, num_parallel=parallel, tokens_per_second=100) as server, \
+                tempfile.TemporaryDirectory() as slot_dir:
+            client = _client(server, "30m", slots, slot_dir)
+            client.warm_up()
+            latencies, lock = [], threading.Lock()
+
+            def verify():
+                start = time.perf_counter()
+                response = client.create_chat_completion(messages, response_schema="verification")
+                # Time spent on the server side: what the request timeout has to cover
+                with lock:
+                    latencies.append(((time.perf_counter() - start) * 1000 - response.queue_ms))
+
+            threads = [threading.Thread(target=verify) for _ in range(workers)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            results[name] = {
+                "wall_ms": round((time.perf_counter() - start) * 1000, 1),
+                "max_server_wait_ms": round(max(latencies), 1),
+                "max_in_flight": server.stats["max_in_flight"],
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=5)
+    parser.add_argument("--load-time", type=float, default=1.0)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--parallel", type=int, default=2)
+    args = parser.parse_args()
+
+    results = {"sequential": sequential(args.calls, args.load_time), "concurrent": concurrent(args.workers, args.parallel)}
+    print(f"Sequential ({args.calls} calls, model load {args.load_time:.1f}s)")
+    for name, row in results["sequential"].items():
+        print(f"  {name:<11} first {row['first_ms']:>8.1f} ms   median {row['median_ms']:>8.1f} ms   "
+              f"total {row['total_ms']:>8.1f} ms   cold calls {row['cold_calls']}   "
+              f"load {row['load_ms']:>7.0f} ms vs inference {row['inference_ms']:>6.0f} ms")
+    print(f"Concurrent ({args.workers} workers, {args.parallel} server slots)")
+    for name, row in results["concurrent"].items():
+        print(f"  {name:<11} wall {row['wall_ms']:>8.1f} ms   longest wait on the server {row['max_server_wait_ms']:>8.1f} ms   "
+              f"max in flight {row['max_in_flight']}")
+    _harness.save_results("ollama", {f"{group}.{name}": row for group, rows in results.items() for name, row in rows.items()})
+
+
+if __name__ == "__main__":
+    main()
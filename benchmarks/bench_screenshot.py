@@ -0,0 +1,182 @@
+"""
+Screenshot benchmark: image conversions, peak memory and time of the image
+work of one `Ask AI For Verification` with a reference screenshot (visual
+prefilter with crops, upload through a recording cassette, evidence store with
+thumbnail, half size copy for OmniParser).
+
+    legacy      the screenshot travels as base64 text: every step decodes it again
+    screenshot  one Screenshot object: decoded once, hash / PIL image / variants cached
+
+"conversions" counts the base64 decodes / encodes and the PIL decodes of a
+full-size image (crops and thumbnails excluded); peak memory is measured with
+tracemalloc around one keyword.
+
+Usage (from the repository root, Pillow and numpy required):
+    python benchmarks/bench_screenshot.py --runs 5
+"""
+import argparse
+import base64
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import _harness  # noqa: E402
+
+_harness.ensure_repo_on_path()
+os.environ.setdefault("CI_LOG_DIR", tempfile.gettempdir())
+
+SCREEN_SIZE = (1080, 2340)
+# Above this size a decode / encode is counted as a full-size conversion
+_FULL_SIZE = 100_000
+
+
+def _screens() -> tuple:
+    """(current PNG, reference PNG): same screen, one changed region."""
+    import random
+    from PIL import Image, ImageDraw
+    rng = random.Random(0)
+    image = Image.new("RGB", SCREEN_SIZE, (245, 245, 245))
+    draw = ImageDraw.Draw(image)
+    for top in range(120, SCREEN_SIZE[1] - 200, 140):
+        draw.rectangle((60, top, SCREEN_SIZE[0] - 60, top + 100), outline=(200, 200, 200), width=2)
+        for left in range(90, rng.randrange(400, 900), 22):
+            draw.rectangle((left, top + 35, left + 14, top + 60), fill=(40, 40, 40))
+    # Photo-like band: real screenshots are several hundred kB of PNG
+    noise = Image.frombytes("RGB", (SCREEN_SIZE[0], 200), rng.randbytes(SCREEN_SIZE[0] * 200 * 3))
+    image.paste(noise, (0, SCREEN_SIZE[1] // 2))
+    reference = image.copy()
+    ImageDraw.Draw(reference).rectangle((300, 1000, 800, 1150), fill=(30, 120, 200))
+    encoded = []
+    for screen in (image, reference):
+        buffer = io.BytesIO()
+        screen.save(buffer, format="PNG")
+        encoded.append(buffer.getvalue())
+    return tuple(encoded)
+
+
+class _Counter:
+    """Counts the full-size base64 / PIL conversions by patching the functions the library calls."""
+
+    def __init__(self):
+        from PIL import Image
+        self.count = 0
+        self._patched = [(base64, "b64decode"), (base64, "b64encode"), (Image, "open")]
+        self._originals = [getattr(module, name) for module, name in self._patched]
+
+    def __enter__(self):
+        for (module, name), original in zip(self._patched, self._originals):
+            setattr(module, name, self._wrap(original))
+        return self
+
+    def _wrap(self, original):
+        def counted(data, *args, **kwargs):
+            size = data.getbuffer().nbytes if isinstance(data, io.BytesIO) else len(data) if hasattr(data, "__len__") else 0
+            if size >= _FULL_SIZE:
+                self.count += 1
+            return original(data, *args, **kwargs)
+        return counted
+
+    def __exit__(self, *exc):
+        for (module, name), original in zip(self._patched, self._originals):
+            setattr(module, name, original)
+
+
+class _FakeUploader:
+    def upload_from_base64(self, base64_data: str) -> str:
+        return "https://i.ibb.co/benchmark/screenshot.png"
+
+    def upload_from_file(self, file_path: str) -> str:
+        return "https://i.ibb.co/benchmark/reference.png"
+
+    def upload_screenshot(self, screenshot) -> str:
+        return self.upload_from_base64(screenshot.base64)
+
+
+def _legacy(current_base64: str, reference_path: str, work_dir: str, uploader, store):
+    from src.AiHelper.common._visualdiff import VisualComparator
+    comparator = VisualComparator(threshold=0.999, masks="")
+    result = comparator.compare(current_base64, reference_path)
+    crops = []
+    for box in result.boxes:
+        crops.append(comparator.crop(current_base64, box))
+        crops.append(comparator.crop(reference_path, box, size=result.size))
+    uploader.upload_from_base64(current_base64)
+    store.store_image(current_base64, thumbnail_width=200)
+    # OmniParser input: decoded, reduced and written to a file
+    from PIL import Image
+    with Image.open(io.BytesIO(base64.b64decode(current_base64))) as image:
+        image.resize((image.width // 2, image.height // 2), Image.LANCZOS).save(os.path.join(work_dir, "omniparser.png"))
+    return crops
+
+
+def _screenshot(current_base64: str, reference_path: str, work_dir: str, uploader, store):
+    from src.AiHelper.common._screenshot import Screenshot
+    from src.AiHelper.common._visualdiff import VisualComparator
+    comparator = VisualComparator(threshold=0.999, masks="")
+    screenshot, reference = Screenshot.from_base64(current_base64), Screenshot.from_file(reference_path)
+    result = comparator.compare(screenshot, reference)
+    crops = []
+    for box in result.boxes:
+        crops.append(comparator.crop(screenshot, box))
+        crops.append(comparator.crop(reference, box, size=result.size))
+    uploader.upload_screenshot(screenshot)
+    store.store_image(screenshot, thumbnail_width=200)
+    screenshot.resized(screenshot.size[0] // 2).save(os.path.join(work_dir, "omniparser.png"))
+    return crops
+
+
+def run(runs: int = 5) -> dict:
+    from src.AiHelper.common._cassette import Cassette
+    from src.AiHelper.common._evidence import EvidenceStore
+    from src.AiHelper.providers.imguploader._cassette import CassetteImageUploader
+
+    current, reference = _screens()
+    current_base64 = base64.b64encode(current).decode("ascii")
+    results = {"screenshot_bytes": len(current), "runs": runs}
+    with tempfile.TemporaryDirectory(prefix="aihelper_screenshot_bench_") as work_dir:
+        reference_path = os.path.join(work_dir, "reference.png")
+        with open(reference_path, "wb") as f:
+            f.write(reference)
+        for name, pipeline in (("legacy", _legacy), ("screenshot", _screenshot)):
+            timings, peaks, conversions = [], [], []
+            for index in range(runs):
+                run_dir = os.path.join(work_dir, f"{name}_{index}")
+                os.makedirs(run_dir)
+                uploader = CassetteImageUploader(Cassette(os.path.join(run_dir, "cassette.json"), "record"), _FakeUploader)
+                store = EvidenceStore(run_dir)
+                tracemalloc.start()
+                start = time.perf_counter()
+                with _Counter() as counter:
+                    pipeline(current_base64, reference_path, run_dir, uploader, store)
+                timings.append((time.perf_counter() - start) * 1000)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+                conversions.append(counter.count)
+            results[name] = {
+                "median_ms": round(statistics.median(timings), 2),
+                "peak_mb": round(max(peaks) / 1e6, 2),
+                "conversions": max(conversions),
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    result = run(args.runs)
+    print(f"Screenshot pipeline ({result['screenshot_bytes'] / 1e3:.0f} kB PNG, {result['runs']} runs, tracemalloc on)")
+    for name in ("legacy", "screenshot"):
+        row = result[name]
+        print(f"  {name:<11} median {row['median_ms']:>9.2f} ms   peak {row['peak_mb']:>7.2f} MB   "
+              f"full-size conversions {row['conversions']}")
+
+
+if __name__ == "__main__":
+    main()
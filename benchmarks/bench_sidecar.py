@@ -0,0 +1,114 @@
+"""
+Sidecar benchmark: hit rate of the caches shared by the pabot workers
+(src/AiHelper/common/_sidecar.py) at 4, 8 and 16 worker processes.
+
+Every worker runs `--tests` tests. Each test visits the login and home
+screens, then `--visits` screens drawn from a pool of `--screens`; on each
+screen it uploads the screenshot (`--upload-latency` s) and asks one of three
+verifications to the LLM (`--llm-latency` s). Workers are seeded: the same
+command gives the same workload.
+
+Per worker count, the same workload runs without the sidecar (every lookup
+is computed by its worker) and with it:
+    computed    uploads / LLM requests actually sent
+    hit_rate    share of the lookups answered by the sidecar, from its cache
+                (hit) or from a worker computing the same key (joined)
+    wall_s      time until the last worker is done
+
+Usage (from the repository root):
+    python benchmarks/bench_sidecar.py --workers 4,8,16
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import _harness  # noqa: E402
+
+_harness.ensure_repo_on_path()
+os.environ.setdefault("CI_LOG_DIR", tempfile.gettempdir())
+
+CHECKS = ("the screen is displayed", "no text is truncated", "the layout matches the reference")
+
+
+def _workload(worker: int, tests: int, visits: int, screens: int):
+    rng = random.Random(worker)
+    for _ in range(tests):
+        for screen in ["login", "home"] + [f"screen{rng.randrange(screens)}" for _ in range(visits)]:
+            yield screen, rng.choice(CHECKS)
+
+
+def _worker(worker: int, args: argparse.Namespace, socket_path: str, sidecar: bool, results):
+    from src.AiHelper.common._sidecar import NAMESPACE_LLM, NAMESPACE_UPLOAD, shared_value
+    from src.AiHelper.config.config import Config
+    Config.SIDECAR = sidecar
+    Config.SIDECAR_SOCKET = socket_path
+    Config.SIDECAR_IDLE_TIMEOUT = 2.0
+    computed = {"upload": 0, "llm": 0}
+
+    def compute(kind: str, latency: float, value: str):
+        computed[kind] += 1
+        time.sleep(latency)
+        return value
+
+    for screen, check in _workload(worker, args.tests, args.visits, args.screens):
+        url, _ = shared_value(NAMESPACE_UPLOAD, screen, lambda: compute("upload", args.upload_latency, f"https://img/{screen}"), 600)
+        shared_value(NAMESPACE_LLM, f"{url}|{check}", lambda: compute("llm", args.llm_latency, '{"confidence": 1.0}'), 600)
+    results.put(computed)
+
+
+def _run(workers: int, args: argparse.Namespace, sidecar: bool) -> dict:
+    with tempfile.TemporaryDirectory(prefix="aihelper_sidecar_bench_") as work_dir:
+        socket_path = os.path.join(work_dir, "sidecar.sock")
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=_worker, args=(worker, args, socket_path, sidecar, results))
+                     for worker in range(workers)]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        computed = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        row = {
+            "wall_s": round(time.perf_counter() - start, 3),
+            "lookups": workers * args.tests * (2 + args.visits) * 2,
+            "computed_upload": sum(c["upload"] for c in computed),
+            "computed_llm": sum(c["llm"] for c in computed),
+        }
+        if sidecar:
+            from src.AiHelper.common._sidecar import SidecarClient
+            summary = SidecarClient(socket_path).call("summary")
+            for namespace, stats in summary["namespaces"].items():
+                row[f"hit_rate_{namespace}"] = stats["hit_rate"]
+                row[f"joined_{namespace}"] = stats["joined"]
+        return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="4,8,16", help="comma separated worker counts")
+    parser.add_argument("--tests", type=int, default=5, help="tests per worker")
+    parser.add_argument("--visits", type=int, default=3, help="screens visited per test after login and home")
+    parser.add_argument("--screens", type=int, default=40, help="screens of the application")
+    parser.add_argument("--upload-latency", type=float, default=0.02)
+    parser.add_argument("--llm-latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    cases = {}
+    print(f"{'workers':>7}  {'mode':<10} {'wall s':>7} {'lookups':>8} {'uploads':>8} {'llm':>6} "
+          f"{'hit rate upload':>16} {'hit rate llm':>13}")
+    for workers in (int(count) for count in args.workers.split(",")):
+        for mode, sidecar in (("local", False), ("sidecar", True)):
+            row = _run(workers, args, sidecar)
+            cases[f"workers_{workers}.{mode}"] = row
+            print(f"{workers:>7}  {mode:<10} {row['wall_s']:>7.2f} {row['lookups']:>8} {row['computed_upload']:>8} "
+                  f"{row['computed_llm']:>6} {row.get('hit_rate_upload', 0.0):>16.3f} {row.get('hit_rate_llm', 0.0):>13.3f}")
+    _harness.save_results("sidecar", cases)
+
+
+if __name__ == "__main__":
+    main()
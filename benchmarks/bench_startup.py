@@ -0,0 +1,72 @@
+"""
+Startup benchmark: per-test cost of constructing the AiHelper library.
+
+Robot instantiates AiHelper for every test case (ROBOT_LIBRARY_SCOPE = "TEST").
+The "cold" run clears the LLM client pool and the shared helpers before every
+instantiation (behaviour before pooling), the "pooled" run keeps them. The
+results are written to benchmarks/results/startup_<timestamp>.json.
+
+Usage (from the repository root):
+    python benchmarks/bench_startup.py --iterations 50 --provider openai
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import _harness  # noqa: E402
+
+_harness.ensure_repo_on_path()
+
+# Client construction does not call the network: placeholder keys are enough
+for _key in ("OPENAI_API_KEY", "ANTHROPIC_API_KEY", "GEMINI_API_KEY", "DEEPSEEK_API_KEY", "IMGBB_API_KEY"):
+    os.environ.setdefault(_key, "benchmark-placeholder")
+
+
+def _measure(iterations: int, provider: str, pooled: bool) -> dict:
+    from src.AiHelper import AiHelper
+    from src.AiHelper.providers.llm._factory import LLMClientFactory
+
+    timings = []
+    for _ in range(iterations):
+        if not pooled:
+            LLMClientFactory.clear_pool()
+            AiHelper._clear_shared()
+        start = time.perf_counter()
+        AiHelper(client_name=provider)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "mean_ms": round(statistics.mean(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "max_ms": round(max(timings), 3),
+    }
+
+
+def run(iterations: int = 50, provider: str = "openai") -> dict:
+    """ returns {"cold": {...}, "pooled": {...}} timings of one AiHelper instantiation in ms """
+    cold = _measure(iterations, provider, pooled=False)
+    pooled = _measure(iterations, provider, pooled=True)
+    return {"provider": provider, "iterations": iterations, "cold": cold, "pooled": pooled}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--provider", default="openai")
+    args = parser.parse_args()
+
+    result = run(args.iterations, args.provider)
+    print(f"AiHelper init ({result['provider']}, {result['iterations']} iterations)")
+    for mode in ("cold", "pooled"):
+        timing = result[mode]
+        print(f"  {mode:<7} mean {timing['mean_ms']:>9.3f} ms   median {timing['median_ms']:>9.3f} ms   max {timing['max_ms']:>9.3f} ms")
+    speedup = result["cold"]["mean_ms"] / result["pooled"]["mean_ms"] if result["pooled"]["mean_ms"] else float("inf")
+    print(f"  speedup x{speedup:.1f}")
+    path = _harness.save_results("startup", {f"{result['provider']}.{mode}": result[mode] for mode in ("cold", "pooled")})
+    print(f"Results saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
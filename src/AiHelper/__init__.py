@@ -1,21 +1,37 @@
 import time
+import threading
 from src.AiHelper.common._logger import RobotCustomLogger
 import base64
 from robot.libraries.BuiltIn import BuiltIn
 from typing import Any, List, Dict, Optional
 from src.AiHelper.common._parserutils import BBoxToClickCoordinates
+from src.AiHelper.common._device import DeviceProfiles
 from src.AiHelper.providers.llm._factory import LLMClientFactory
 from src.AiHelper.config.config import Config
+from src.AiHelper.config.model_config import CAPABILITY_STRUCTURED_OUTPUT, ModelConfig
 from robot.api.deco import keyword
 from src.AiHelper.providers.imguploader.imghandler import ImageUploader
 from src.AiHelper.common._logger import RobotCustomLogger
 from src.AiHelper.common._utils import Utilities
-from src.AiHelper.common._tiktoken import TokenHelper
+from src.AiHelper.common._cassette import CassetteSettings, active_cassette
+from src.AiHelper.common._agent import AGENT_CHECK, AGENT_DO, AgentEngine, AgentResult, AgentStats
+from src.AiHelper.common._deferred import DeferredVerdicts, DeferredVerificationListener
+from src.AiHelper.common._deadline import STAGE_CAPTURE, STAGE_LLM, deadline_scope, deadline_stage, keyword_budget, with_time_budget
+from src.AiHelper.common._tiktoken import PromptCacheStats, TokenHelper
+from src.AiHelper.common._screenshot import Screenshot
+from src.AiHelper.common._sidecar import via_sidecar
+from src.AiHelper.common._stability import ScreenStabilityWaiter
+from src.AiHelper.common._uixml import UIDiffStats, UIDiffTracker
+from src.AiHelper.common._structured import AGENT_PLAN_SCHEMA, BBOX_SCHEMA, LOCATOR_SCHEMA, VERIFICATION_SCHEMA, get_schema
 from src.AiHelper.providers.promptfactory import ChatPromptFactory
-from appium.webdriver.common.appiumby import AppiumBy
-from src.AiHelper.providers.llm._huggingface import OmniParser
+from src.AiHelper.providers.llm._batch import BatchJobStore, BatchCollector, STATUS_COMPLETED, batch_scope
+from src.AiHelper.providers.llm._consensus import ConsensusVerifier, ConsensusStats, parse_provider_specs, parse_weights
+from src.AiHelper.providers.llm._router import HedgedRoutingClient
+from src.AiHelper.providers.llm._cascade import CascadeClient, CascadeStats
+from src.AiHelper.providers.llm._adaptive import (AdaptiveRoutingClient, RoutingStats, parse_routing_overrides,
+                                                  parse_routing_policy, routed_keyword)
 
-__all__ = ['AiHelper']
+__all__ = ['AiHelper', 'DeferredVerificationListener']
 
 
 class AiHelper:
@@ -23,6 +39,24 @@ class AiHelper:
     ROBOT_LIBRARY_SCOPE = "TEST"
     ROBOT_LIBRARY_VERSION = 0.1
 
+    # Process-wide switch (the library is re-instantiated for every test)
+    _deferred_verification: Optional[bool] = None
+
+    # Hedged routing settings kept for the whole run (see `Use Hedged Routing`)
+    _hedged_routing: Optional[Dict[str, Any]] = None
+
+    # Local-first cascade settings kept for the whole run (see `Use Local First Cascade`).
+    # None follows AIHELPER_CASCADE, {} means stopped
+    _cascade: Optional[Dict[str, Any]] = None
+
+    # Adaptive routing settings kept for the whole run (see `Use Adaptive Routing`).
+    # None follows AIHELPER_ADAPTIVE_ROUTING, {} means stopped
+    _adaptive_routing: Optional[Dict[str, Any]] = None
+
+    # Stateless helpers shared by every instance (the library is re-instantiated for every test)
+    _shared_instances: Dict[str, Any] = {}
+    _shared_lock = threading.Lock()
+
     def __init__(self, client_name=None, model=None):
         self.config = Config()
         self.logger = RobotCustomLogger()
@@ -34,28 +68,64 @@ class AiHelper:
                 model = self.config.DEFAULT_GEMINI_MODEL
             elif client_name == "anthropic" or (client_name is None and self.config.DEFAULT_LLM_CLIENT == "anthropic"):
                 model = self.config.DEFAULT_ANTHROPIC_MODEL
+            elif client_name == "deepseek":
+                model = self.config.DEFAULT_DEEPSEEK_MODEL
+            elif client_name == "ollama":
+                model = self.config.DEFAULT_OLLAMA_MODEL
             else:
                 model = self.config.DEFAULT_OPENAI_MODEL
         
         # Get API key - pass None and let the factory handle it
         self._client = LLMClientFactory.create_client(client_name, model=model)
+        self._client_name = client_name
+        self._model = model
         self._last_response = None
-        self.img = ImageUploader()
+        self.img = self._shared("image_uploader", ImageUploader)
         
         # Use singleton TokenHelper to ensure cost persistence across all instances
         self._token = TokenHelper()
         self.logger.info(f"AiHelper initialized with TokenHelper instance ID: {id(self._token)}", False)
         
-        self.prompt = ChatPromptFactory()
+        self.prompt = self._shared("prompt_factory", lambda: ChatPromptFactory(self.img))
+        # UI XML last sent in this test's conversation: per instance, the prompt factory is shared by every test
+        self._ui_tracker = UIDiffTracker()
         self._cumulated_cost = 0.0
-        
-        # initialisation conditionnelle de OmniParser ( api non stabkle )
+
+        if AiHelper._hedged_routing:
+            self._apply_hedged_routing(**AiHelper._hedged_routing)
+        self._apply_adaptive_routing()
+        self._apply_cascade()
+
+    @classmethod
+    def _shared(cls, name: str, factory):
+        """ returns the process-wide instance registered under name, built lazily by factory() """
+        instance = cls._shared_instances.get(name)
+        if instance is None:
+            with cls._shared_lock:
+                instance = cls._shared_instances.get(name)
+                if instance is None:
+                    instance = factory()
+                    cls._shared_instances[name] = instance
+        return instance
+
+    @classmethod
+    def _clear_shared(cls):
+        with cls._shared_lock:
+            cls._shared_instances.clear()
+
+    @property
+    def omniparser(self):
+        # initialisation conditionnelle et paresseuse de OmniParser ( api non stabkle )
         api_key_huggingface = self.config.HUGGINGFACE_API_KEY
+        if not api_key_huggingface:
+            return None
         try:
-            self.omniparser = OmniParser(api_key_huggingface) if api_key_huggingface else None
+            # gradio_client is only imported when OmniParser is actually used
+            from src.AiHelper.providers.llm._huggingface import OmniParser
+            return self._shared("omniparser", lambda: OmniParser(api_key_huggingface))
         except Exception as e:
             self.logger.warning(f"Failed to initialize OmniParser: {str(e)}")
-            self.omniparser = None
+            return None
 
     @keyword("Get Cumulated Cost")
     def get_cumulated_cost(self):
@@ -109,13 +179,338 @@ class AiHelper:
                 model = self.config.DEFAULT_GEMINI_MODEL
             elif client_name == "anthropic":
                 model = self.config.DEFAULT_ANTHROPIC_MODEL
+            elif client_name == "deepseek":
+                model = self.config.DEFAULT_DEEPSEEK_MODEL
+            elif client_name == "ollama":
+                model = self.config.DEFAULT_OLLAMA_MODEL
             else:
                 model = self.config.DEFAULT_OPENAI_MODEL
         
         # Create new client
         self._client = LLMClientFactory.create_client(client_name, model=model)
+        self._client_name = client_name
+        self._model = model
+        self._apply_adaptive_routing()
+        self._apply_cascade()
         self.logger.info(f"Provider switched successfully. Using {type(self._client).__name__}", True)
 
+    @keyword("Warm Up LLM")
+    def warm_up_llm(self, model: Optional[str] = None):
+        """
+        Load the model of a local provider (Ollama native mode, or the screening model of the local-first cascade)
+        so that the first verification does not pay the load time.
+        Meant for Suite Setup; with AIHELPER_OLLAMA_WARMUP=true the load already starts in the background when the library is created.
+        args:
+            model: model to load. The current model by default.
+        returns the load time in milliseconds, None when the provider has nothing to warm up.
+        """
+        warm_up = getattr(self._client, "warm_up", None)
+        if warm_up is None:
+            self.logger.info(f"No warm-up needed for {type(self._client).__name__}", True)
+            return None
+        load_ms = warm_up(model) if model else warm_up()
+        self.logger.info(f"Model {model or 'of the provider'} ready (load {load_ms} ms)", True)
+        return load_ms
+
+    @keyword("Use Hedged Routing")
+    def use_hedged_routing(self, routes: Any, hedge_percentile: float = 95, min_hedge_delay: float = 1.0, initial_hedge_delay: float = 8.0):
+        """
+        Route every following request (for the rest of the run) to the provider with the best recent latency,
+        and duplicate it to the next provider when it is slower than its usual tail latency.
+        args:
+            routes: list or comma separated string of provider[:model], in order of preference
+            hedge_percentile: percentile of the primary's recent latencies that triggers the hedge. 95 by default.
+            min_hedge_delay: lower bound of the hedge delay in seconds. 1 by default.
+            initial_hedge_delay: hedge delay before enough latencies are known. 8 seconds by default.
+        Example:
+        | Use Hedged Routing | openai,gemini,anthropic |
+        """
+        AiHelper._hedged_routing = {
+            "routes": parse_provider_specs(routes),
+            "hedge_percentile": float(hedge_percentile),
+            "min_hedge_delay": float(min_hedge_delay),
+            "initial_hedge_delay": float(initial_hedge_delay),
+        }
+        self._apply_hedged_routing(**AiHelper._hedged_routing)
+        self._apply_adaptive_routing()
+        self._apply_cascade()
+
+    @keyword("Stop Hedged Routing")
+    def stop_hedged_routing(self):
+        """ go back to the single provider selected at construction or with `Switch Provider` """
+        AiHelper._hedged_routing = None
+        self._client = LLMClientFactory.create_client(self._client_name, model=self._model)
+        self._apply_adaptive_routing()
+        self._apply_cascade()
+        self.logger.info(f"Hedged routing stopped. Using {type(self._client).__name__}", True)
+
+    def _apply_hedged_routing(self, routes, hedge_percentile, min_hedge_delay, initial_hedge_delay):
+        key = f"hedged_router:{routes}:{hedge_percentile}:{min_hedge_delay}:{initial_hedge_delay}"
+        self._client = self._shared(key, lambda: HedgedRoutingClient(
+            routes,
+            hedge_percentile=hedge_percentile,
+            min_hedge_delay=min_hedge_delay,
+            initial_hedge_delay=initial_hedge_delay,
+        ))
+        self.logger.info(f"Hedged routing over {[f'{provider}:{model}' for provider, model in routes]}", False)
+
+    @keyword("Get Provider Health")
+    def get_provider_health(self) -> Dict[str, Dict[str, Any]]:
+        """ returns per route health, call/error/win/hedge counts and p50/p95 latency of the hedged routing """
+        health = HedgedRoutingClient.health_snapshot()
+        self.logger.info(f"Provider health: {health}", True)
+        return health
+
+    @keyword("Use Local First Cascade")
+    def use_local_first_cascade(self, screen: Optional[str] = None, low: Optional[float] = None, high: Optional[float] = None):
+        """
+        For the rest of the run, requests whose response schema has a confidence (`Ask AI For Verification`,
+        `Send AI Request` with response_schema="verification") are answered by a cheap screening model first, and sent
+        to the current provider only when the screening reply does not validate or its confidence is in the uncertainty
+        band [low, high). Locators, taps and agent plans cannot be judged and go to the current provider, as do
+        requests with images when the screening model has no vision.
+        args:
+            screen: screening model as provider[:model]. AIHELPER_CASCADE_SCREEN (ollama:llama3.2-vision) by default.
+            low: confidences below low are kept (confident fail). AIHELPER_CASCADE_LOW (0.3) by default, 0 escalates every fail.
+            high: confidences at or above high are kept (confident pass). AIHELPER_CASCADE_HIGH (0.9) by default.
+        Example:
+        | Use Local First Cascade | ollama:llama3.2-vision | 0.3 | 0.9 |
+        """
+        AiHelper._cascade = {
+            "screen": parse_provider_specs(screen or self.config.CASCADE_SCREEN)[0],
+            "low": float(self.config.CASCADE_LOW if low is None else low),
+            "high": float(self.config.CASCADE_HIGH if high is None else high),
+        }
+        self._apply_cascade()
+
+    @keyword("Stop Local First Cascade")
+    def stop_local_first_cascade(self):
+        """ send every request to the current provider again """
+        AiHelper._cascade = {}
+        if isinstance(self._client, CascadeClient):
+            self._client = self._client.primary
+        self.logger.info(f"Local-first cascade stopped. Using {type(self._client).__name__}", True)
+
+    def _cascade_settings(self) -> Optional[Dict[str, Any]]:
+        if AiHelper._cascade is not None:
+            return AiHelper._cascade or None
+        if self.config.CASCADE:
+            return {
+                "screen": parse_provider_specs(self.config.CASCADE_SCREEN)[0],
+                "low": self.config.CASCADE_LOW,
+                "high": self.config.CASCADE_HIGH,
+            }
+        return None
+
+    def _apply_cascade(self):
+        """ wraps the current client (provider, hedged or adaptive router) in the local-first cascade when it is enabled """
+        settings = self._cascade_settings()
+        if not settings:
+            return
+        primary = self._client.primary if isinstance(self._client, CascadeClient) else self._client
+        self._client = CascadeClient(primary, (self._client_name, self._model), **settings)
+        screen_provider, screen_model = settings["screen"]
+        self.logger.info(f"Local-first cascade: {screen_provider}:{screen_model or 'default'} screens, "
+                         f"escalation to {self._client_name}:{self._model} in [{settings['low']}, {settings['high']})", False)
+
+    @keyword("Get Cascade Stats")
+    def get_cascade_stats(self) -> Dict[str, Dict[str, Any]]:
+        """ returns per suite requests, escalation rate and reasons, mean screening / primary latency,
+        latency saved (seconds) and cost saved of the local-first cascade """
+        stats = CascadeStats.summary()
+        self.logger.info(f"Cascade stats: {stats}", True)
+        return stats
+
+    @keyword("Use Adaptive Routing")
+    def use_adaptive_routing(self, policy: Optional[Any] = None, overrides: Optional[Any] = None, min_samples: Optional[int] = None,
+                             min_validity: Optional[float] = None, max_latency: Optional[float] = None):
+        """
+        For the rest of the run, send each request to the model chosen for its task (locator, verification,
+        verification_reference, agent, general, <task>_large_xml): each candidate of the task is tried min_samples
+        times, then the cheapest one whose replies are valid JSON often enough and fast enough is used.
+        Tasks without candidates go to the current provider.
+        args:
+            policy: "task=provider[:model],...;..." (or a dictionary task: routes). AIHELPER_ROUTING_POLICY by default.
+            overrides: "Keyword Name=provider[:model];..." (or a dictionary) pinning a keyword to a model.
+                AIHELPER_ROUTING_OVERRIDES by default.
+            min_samples: replies measured per candidate before the stats decide. AIHELPER_ROUTING_MIN_SAMPLES (3) by default.
+            min_validity: share of valid JSON replies a candidate needs. AIHELPER_ROUTING_MIN_VALIDITY (0.9) by default.
+            max_latency: mean latency in seconds a candidate needs to stay under, 0 for no limit.
+                AIHELPER_ROUTING_MAX_LATENCY by default.
+        Example:
+        | Use Adaptive Routing | locator=openai:gpt-4o-mini,gemini;verification_reference=openai:gpt-4o |
+        """
+        settings = self._config_routing_settings()
+        if policy is not None:
+            settings["policy"] = parse_routing_policy(policy)
+        if overrides is not None:
+            settings["overrides"] = parse_routing_overrides(overrides)
+        if min_samples is not None:
+            settings["min_samples"] = int(min_samples)
+        if min_validity is not None:
+            settings["min_validity"] = float(min_validity)
+        if max_latency is not None:
+            settings["max_latency"] = float(max_latency)
+        AiHelper._adaptive_routing = settings
+        self._apply_adaptive_routing()
+        self._apply_cascade()
+
+    @keyword("Set Model For Keyword")
+    def set_model_for_keyword(self, keyword_name: str, route: str):
+        """
+        For the rest of the run, send the requests of a keyword to one model, whatever its task
+        (adaptive routing is enabled if it was not).
+        args:
+            keyword_name: name of the keyword, e.g. Click On UI Element
+            route: provider[:model], e.g. openai:gpt-4o
+        Example:
+        | Set Model For Keyword | Ask AI For Verification | anthropic:claude-3-5-sonnet-20241022 |
+        """
+        settings = dict(self._routing_settings() or self._config_routing_settings())
+        settings["overrides"] = {**settings["overrides"], **parse_routing_overrides({keyword_name: route})}
+        AiHelper._adaptive_routing = settings
+        self._apply_adaptive_routing()
+        self._apply_cascade()
+
+    @keyword("Stop Adaptive Routing")
+    def stop_adaptive_routing(self):
+        """ send every request to the current provider again """
+        AiHelper._adaptive_routing = {}
+        cascade = isinstance(self._client, CascadeClient)
+        client = self._client.primary if cascade else self._client
+        if isinstance(client, AdaptiveRoutingClient):
+            self._client = client.primary
+            if cascade:
+                self._apply_cascade()
+        self.logger.info(f"Adaptive routing stopped. Using {type(self._client).__name__}", True)
+
+    def _config_routing_settings(self) -> Dict[str, Any]:
+        return {
+            "policy": parse_routing_policy(self.config.ROUTING_POLICY),
+            "overrides": parse_routing_overrides(self.config.ROUTING_OVERRIDES),
+            "min_samples": self.config.ROUTING_MIN_SAMPLES,
+            "min_validity": self.config.ROUTING_MIN_VALIDITY,
+            "max_latency": self.config.ROUTING_MAX_LATENCY,
+            "large_xml": self.config.ROUTING_LARGE_XML,
+        }
+
+    def _routing_settings(self) -> Optional[Dict[str, Any]]:
+        if AiHelper._adaptive_routing is not None:
+            return AiHelper._adaptive_routing or None
+        if self.config.ADAPTIVE_ROUTING:
+            return self._config_routing_settings()
+        return None
+
+    def _apply_adaptive_routing(self):
+        """ wraps the current client (provider or hedged router) in the adaptive router when it is enabled """
+        settings = self._routing_settings()
+        if not settings:
+            return
+        primary = self._client.primary if isinstance(self._client, CascadeClient) else self._client
+        if isinstance(primary, AdaptiveRoutingClient):
+            primary = primary.primary
+        self._client = AdaptiveRoutingClient(primary, (self._client_name, self._model), **settings)
+        policy = {task: [f"{provider}:{model or 'default'}" for provider, model in routes] for task, routes in settings["policy"].items()}
+        self.logger.info(f"Adaptive routing: policy {policy}, {len(settings['overrides'])} keyword override(s), "
+                         f"other requests to {self._client_name}:{self._model}", False)
+
+    @keyword("Get Routing Stats")
+    def get_routing_stats(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """ returns per task and route the calls, JSON validity rate, mean latency and mean cost the adaptive routing learned """
+        stats = RoutingStats.summary()
+        self.logger.info(f"Routing stats: {stats}", True)
+        return stats
+
+    @keyword("Reset Routing Stats")
+    def reset_routing_stats(self):
+        """ forget what the adaptive routing learned (the next requests try every candidate again) """
+        RoutingStats.reset()
+        self.logger.info("Routing stats have been reset", True)
+
+    @keyword("Get Sidecar Stats")
+    def get_sidecar_stats(self) -> Dict[str, Any]:
+        """ returns the stats of the sidecar shared by the pabot workers (AIHELPER_SIDECAR): per namespace
+        (upload, llm, tokens) hits, joined in-flight requests, misses and hit rate; empty when it is not used """
+        stats = via_sidecar("summary", dict)
+        self.logger.info(f"Sidecar stats: {stats}", True)
+        return stats
+
+    @keyword("Get Prompt Cache Stats")
+    def get_prompt_cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """ returns per suite requests, prompt cache hit / miss tokens, hit ratio and cost saved
+        (providers reporting their prompt cache hits, DeepSeek) """
+        stats = PromptCacheStats.summary()
+        self.logger.info(f"Prompt cache stats: {stats}", True)
+        return stats
+
+    @keyword("Use Cassette")
+    def use_cassette(self, name: str, mode: str = "replay", latency: Optional[str] = None, match: Optional[str] = None):
+        """
+        Record the LLM and upload traffic of the rest of the run to a cassette, or replay it from one (no network, no API key).
+        args:
+            name: cassette file name in AIHELPER_CASSETTE_DIR (./cassettes by default), ".json" added if missing.
+            mode: "record", "replay", "auto" (replay what is recorded, record the rest) or "off". replay by default.
+            latency: replayed latency, "recorded", "zero" or a factor of the recorded latency. AIHELPER_CASSETTE_LATENCY by default.
+            match: "exact" or "relaxed" (requests whose screenshots changed get the response recorded for the same text).
+                AIHELPER_CASSETTE_MATCH by default.
+        Example:
+        | Use Cassette | login_suite | record |
+        | Use Cassette | login_suite | replay | latency=zero |
+        """
+        CassetteSettings.mode = mode.lower()
+        CassetteSettings.name = name
+        CassetteSettings.latency = latency or self.config.CASSETTE_LATENCY
+        CassetteSettings.match = (match or self.config.CASSETTE_MATCH).lower()
+        self._rebuild_clients()
+        self.logger.info(f"Cassette {CassetteSettings.path()} in {CassetteSettings.mode} mode", True)
+
+    @keyword("Stop Cassette")
+    def stop_cassette(self):
+        """ go back to live network calls """
+        CassetteSettings.mode = "off"
+        self._rebuild_clients()
+
+    @keyword("Get Cassette Stats")
+    def get_cassette_stats(self) -> Dict[str, Any]:
+        """ returns the cassette path and mode, hits (exact / relaxed), misses, recorded interactions and recorded / replayed latency """
+        cassette = active_cassette()
+        stats = cassette.summary() if cassette is not None else {"mode": "off"}
+        self.logger.info(f"Cassette stats: {stats}", True)
+        return stats
+
+    def _rebuild_clients(self):
+        """ drops the pooled clients and shared uploader so that they are rebuilt with (or without) the cassette """
+        LLMClientFactory.clear_pool()
+        AiHelper._clear_shared()
+        self._client = LLMClientFactory.create_client(self._client_name, model=self._model)
+        self.img = self._shared("image_uploader", ImageUploader)
+        self.prompt = self._shared("prompt_factory", lambda: ChatPromptFactory(self.img))
+        if AiHelper._hedged_routing:
+            self._apply_hedged_routing(**AiHelper._hedged_routing)
+        self._apply_adaptive_routing()
+        self._apply_cascade()
+
+    @keyword("Wait Until Screen Is Stable")
+    def wait_until_screen_is_stable(self, max_wait: float = 10, mode: Optional[str] = None, screen_key: Optional[str] = None) -> bool:
+        """
+        Polls the screen until two consecutive samples match, for max_wait seconds at most.
+        args:
+            max_wait: upper bound of the wait in seconds. 10 by default.
+            mode: "xml" (UI XML hash) or "screenshot" (low resolution pixel diff). AIHELPER_STABILITY_MODE by default.
+            screen_key: name of the screen to learn its settle time (the next waits poll later). None by default.
+        returns True if the screen settled, False if max_wait was reached.
+        """
+        return ScreenStabilityWaiter().wait(float(max_wait), key=screen_key, mode=mode).stable
+
+    def _wait_for_screen(self, max_wait: float, screen_key: str):
+        """ waits for the screen to settle (max_wait at most), or sleeps max_wait if the stability wait is disabled """
+        if max_wait <= 0:
+            return
+        if not self.config.STABILITY_WAIT:
+            time.sleep(max_wait)
+            return
+        ScreenStabilityWaiter().wait(max_wait, key=screen_key)
+
     @keyword("Get Current UI XML")
     def get_current_ui_xml(self):
         return Utilities._get_ui_xml()
@@ -131,18 +526,18 @@ class AiHelper:
     @keyword("Take Screenshot As Base64")
     def take_screenshot_as_base64(self, log: bool = True, width: int = 200):
         """ returns the screenshot as base64. does not log the screenshot if log is False (true by default)"""
-        screenshot_base64 = Utilities._take_screenshot_as_base64()
+        screenshot = Utilities._take_screenshot()
         if log:
-            Utilities._embed_image_to_log(screenshot_base64, width=width)
-        return screenshot_base64
+            Utilities._embed_image_to_log(screenshot, width=width)
+        return screenshot.base64
 
     @keyword("Encode Image To Base64")
     def encode_image_to_base64(self, file_path: str, log_image: bool = False, width: int = 200):
         """ returns the image as base64. does not log the image if log is False (false by default)"""
-        base64_data = Utilities.encode_image_to_base64(file_path)
+        image = Screenshot.from_file(file_path)
         if log_image:
-            Utilities._embed_image_to_log(base64_data, width=width)
-        return base64_data
+            Utilities._embed_image_to_log(image, width=width)
+        return image.base64
     
     @keyword("Create System Prompt")
     def create_system_prompt(self,system_prompt: str) -> dict:
@@ -171,19 +566,58 @@ class AiHelper:
     def create_user_prompt_sending_current_UI_XML(self,text: str) -> dict:
         return self.prompt.create_user_prompt_sending_current_UI_XML(text)
     
+    @keyword("Create User Prompt With UI XML Changes")
+    def create_user_prompt_sending_UI_XML_changes(self, text: str) -> dict:
+        """ user prompt with the compacted UI XML of the current screen: in full the first time, then only the
+        elements added, removed or changed since the previous call (multi-turn conversations).
+        `Reset UI XML Baseline` starts a new conversation. """
+        return self.prompt.create_user_prompt_sending_UI_XML_changes(text, self._ui_tracker)
+
+    @keyword("Reset UI XML Baseline")
+    def reset_UI_XML_baseline(self):
+        """ the next `Create User Prompt With UI XML Changes` sends the full compacted UI XML """
+        self._ui_tracker.reset()
+
+    @keyword("Get UI Diff Stats")
+    def get_ui_diff_stats(self) -> Dict[str, Dict[str, Any]]:
+        """ returns per suite UI XML turns, incremental turns, tokens of the full trees, tokens sent and tokens saved """
+        stats = UIDiffStats.summary()
+        self.logger.info(f"UI diff stats: {stats}", True)
+        return stats
+
+    @keyword("Get Device Profile")
+    def get_device_profile(self) -> Dict[str, Any]:
+        """ returns the device profile of the current Appium session: window, screenshot and tap sizes, density,
+        orientation (read once per session, dropped on a rotation or an app switch) """
+        profiles = DeviceProfiles()
+        profile = profiles.get(Utilities._get_driver())
+        self.logger.info(f"Device profile: {profile.as_dict()} (cache: {profiles.stats})", True)
+        return profile.as_dict()
+
+    @keyword("Refresh Device Profile")
+    def refresh_device_profile(self) -> Dict[str, Any]:
+        """ reads the device profile again, e.g. after switching apps with another library """
+        driver = Utilities._get_driver()
+        DeviceProfiles().invalidate(driver)
+        return DeviceProfiles().get(driver).as_dict()
+
     @keyword("Create User Prompt With Reference Screenshot")
     def create_user_prompt_sending_reference_screenshot(self,text: str, image_path: str, log_image: bool = False, width: int = 200) -> dict:
         return self.prompt.create_user_prompt_sending_reference_screenshot(text, image_path, log_image, width)    
 
+    @routed_keyword
     @keyword("Click On UI Element")
-    def click_on_ui_element(self, element_description: str):
+    @with_time_budget
+    def click_on_ui_element(self, element_description: str, timeout: Optional[float] = None):
         built_in = BuiltIn()
         driver = built_in.get_library_instance("AppiumLibrary")._current_application()
         from src.AiHelper.common._utils import Utilities
-        screenshot = Utilities._capture_screenshot_and_reduce_size(filename="omniparser_screenshot.png")
-        # screenshot_bytes = base64.b64decode(screenshot)
-    
-        elements = self.omniparser.parse_screenshot(screenshot)
+        # One capture for OmniParser and the LLM: the bboxes are fractions, OmniParser gets a half size copy
+        with deadline_stage(STAGE_CAPTURE):
+            screenshot = Utilities._take_screenshot()
+        # Read once per session: the screenshot size and the tap size come from the profile
+        profile = DeviceProfiles().get(driver, screenshot)
+        elements = self.omniparser.parse_screenshot(screenshot.resized(profile.scaled_width(2) or screenshot.size[0] // 2))
         self.logger.info("elements parsed by omniparser are: " + str(elements), True)
         user_prompt = self.prompt.create_system_prompt("""
             You are a software test automation expert in locating element coordinates.
@@ -193,25 +627,28 @@ class AiHelper:
             You need to return the element bbox list corresponding to that element in json format and you need to explain why you choosed this element bbox
             like this : {"bbox": [0.10640496015548706, 0.872053861618042, 0.14359503984451294, 0.8884680271148682], "explanation": "your explanation why you choosed this element"}
         """)
-        user_prompt3= self.prompt.create_user_prompt_sending_current_screenshot(f"elements parsed by omniparser are: {elements}", True)
+        user_prompt3= self.prompt.create_user_prompt_sending_screenshot(f"elements parsed by omniparser are: {elements}", screenshot, True)
         user_prompt2= self.prompt.create_user_prompt(f"element description : ${element_description}")
         messages = [user_prompt, user_prompt2, user_prompt3]
-        response = self.send_ai_request(messages)
-        bbox = Utilities.extract_json_safely(response)
+        response = self.send_ai_request(messages, response_schema=BBOX_SCHEMA)
+        bbox = Utilities.extract_json_safely(response, BBOX_SCHEMA)
         self.logger.info("bbox is : " + str(bbox['bbox']), True)
         self.logger.info("explanation is : " + bbox['explanation'], True)
         bbox: list[float] = bbox['bbox']
-        coordinates = BBoxToClickCoordinates().get_real_coordinates(driver, bbox)
+        coordinates = BBoxToClickCoordinates().get_real_coordinates(driver, bbox, screenshot)
         driver.tap([(coordinates['x'], coordinates['y'])])
         return coordinates
 
 
+    @routed_keyword
     @keyword("Send AI Request")
     def send_ai_request(
         self,
         messages: List[Dict[str, Any]],
         model: Optional[str] = None,
         temperature: float = 1.0, 
+        timeout: Optional[float] = None,
+        response_schema: Optional[Any] = None,
         **kwargs,
     ) -> Dict[str, Any]:
         """ 
@@ -219,27 +656,38 @@ class AiHelper:
         max_tokens est remplacé par max_completion_tokens pour les modèles gpt-5.0
         max_tokens est optionnel
         la documentation de openai explique tous sur les params 
+        timeout: budget en secondes (AIHELPER_KEYWORD_TIMEOUT par défaut, 0 = pas de budget).
+            Il borne le timeout de chaque appel API et des retries ; un dépassement échoue
+            immédiatement en indiquant l'étape (capture, upload, llm) qui a dépassé.
+        response_schema: schéma JSON imposé à la réponse ("verification", "locator", "bbox" ou un ResponseSchema),
+            appliqué nativement par le provider (response_format, tool use, response_schema de Gemini).
+            Ignoré si AIHELPER_STRUCTURED_OUTPUT=false : la réponse est alors extraite du texte.
         """
 
         self.logger.info(self.logger._icons['separator'])
         test_name = BuiltIn().get_variable_value("${TEST_NAME}")
         self.logger.info(self.logger._icons['brain'] + " Sarting New AI Verification"+
                              "\n"+ self.logger._icons['start'] + "Test Case name: " + test_name )
-        self.logger.info(f"Used arguments:\n"
+        # Formatted later in the log writer thread: snapshot what is mutated afterwards (kwargs below,
+        # the agent conversation on the next turn)
+        used_kwargs, used_messages = dict(kwargs), list(messages)
+        self.logger.info(lambda: f"Used arguments:\n"
                             f"Used Model: {model}\n"
                             f"Temperature: {temperature}\n"
-                            f"Le reste des arguments {kwargs.keys()}: {kwargs}\n"
-                            f"prompt: {messages}")
+                            f"Le reste des arguments {used_kwargs.keys()}: {used_kwargs}\n"
+                            f"prompt: {used_messages}")
 
         if not self._client:
             self._init_client()
             
-        response = self._client.create_chat_completion(
-            messages=messages,
-            model=model,
-            temperature=temperature,
-            **kwargs
-        )
+        kwargs.update(self._structured_output(response_schema))
+        with deadline_scope(keyword_budget(timeout)), deadline_stage(STAGE_LLM):
+            response = self._client.create_chat_completion(
+                messages=messages,
+                model=model,
+                temperature=temperature,
+                **kwargs
+            )
         
         formatted = self._client.format_response(response, include_tokens=True, include_reason=True)
 
@@ -249,7 +697,13 @@ class AiHelper:
         total_tokens = formatted['total_tokens']
 
 
-        cost = self._token.calculate_cost(prompt_tokens, completion_tokens, model)
+        cost = self._token.calculate_cost(prompt_tokens, completion_tokens, formatted.get("model") or model or self._model,
+                                          cached_tokens=formatted.get("cache_hit_tokens", 0))
+        if "cache_hit_tokens" in formatted:
+            PromptCacheStats.record(BuiltIn().get_variable_value("${SUITE_NAME}") or "default",
+                                    formatted["cache_hit_tokens"], formatted["cache_miss_tokens"], cost["cache_saving"])
+            self.logger.info(f"prompt cache: {formatted['cache_hit_tokens']} hit ; {formatted['cache_miss_tokens']} miss ; "
+                             f"saved {cost['cache_saving']}", True)
 
         self.logger.info(f"prompt tokens: {prompt_tokens} ; completion tokens: {completion_tokens} ; total tokens: {total_tokens}", True)
         self.logger.info(f"Finish reason: {formatted['finish_reason']}",False)
@@ -274,11 +728,24 @@ class AiHelper:
 
 
 
+    def _structured_output(self, response_schema: Optional[Any]) -> Dict[str, Any]:
+        """ create_chat_completion kwargs enforcing response_schema natively, empty when structured output is disabled
+        or not supported by the model (the reply is then parsed by extract_json) """
+        if getattr(self._client, "validates_schema", False) and response_schema is not None:
+            # The cascade and the adaptive router validate the replies against the schema, and enforce it per model
+            return {"response_schema": get_schema(response_schema)}
+        if response_schema is None or not self.config.STRUCTURED_OUTPUT:
+            return {}
+        if not ModelConfig().supports(self._model, CAPABILITY_STRUCTURED_OUTPUT, self._client_name):
+            return {}
+        return {"response_schema": get_schema(response_schema)}
+
     #########################################################
     # usage directe + prompt inclues + fail/pass mechanism
     #########################################################
+    @routed_keyword
     @keyword("Ask AI For Verification")
-    def ask_llm_to_verify_screenshot(self,verification_prompt:str, send_ui_xml:bool = False, reference_screenshot:str = None, confidence_threshold:float = 0.8, loading_time:float = 3):
+    def ask_llm_to_verify_screenshot(self,verification_prompt:str, send_ui_xml:bool = False, reference_screenshot:str = None, confidence_threshold:float = 0.8, loading_time:float = 3, deferred: Optional[bool] = None, timeout: Optional[float] = None, visual_prefilter: Optional[bool] = None):
         """
         This keyword sends a verification request to the LLM.
         args:
@@ -286,7 +753,18 @@ class AiHelper:
             send_ui_xml: whether to send the current UI XML to the LLM. False by default.
             reference_screenshot: the path to the reference screenshot to send to the LLM. None by default.
             confidence_threshold: the confidence threshold to use for the verification. 0.8 by default.
-            loading_time: time to wait before taking the screenshot and verifying the prompt. 1 second by default.
+            loading_time: maximum time to wait for the screen to settle before taking the screenshot. 3 seconds by default.
+                Returns as soon as the screen is stable (see `Wait Until Screen Is Stable`), or sleeps loading_time
+                when AIHELPER_STABILITY_WAIT is false.
+            deferred: enqueue the request for the batch collector instead of waiting for the verdict
+                (see `Enable Deferred Verification` and `Collect Deferred Verifications`).
+                None by default: follows the deferred mode switch.
+            timeout: time budget in seconds for capture, upload and LLM request, loading_time excluded.
+                AIHELPER_KEYWORD_TIMEOUT by default (0 = no budget).
+            visual_prefilter: compare the screen with reference_screenshot locally first. When they match
+                (masked regions such as the status bar ignored) the verification passes without LLM request;
+                when only a few regions differ, only crops of those regions are sent.
+                None by default: AIHELPER_VISUAL_DIFF.
         Example:
         | Ask AI For Verification | I want to verify the login screen | | ${CURDIR}/reference_screenshots/login_screen.png |
         
@@ -295,9 +773,31 @@ class AiHelper:
         | {"confidence": 0.5, "reason": "The login screen is incorrect", "bug_summary": "Login Screen Incorrect", "bug_description": "The login screen is incorrect because the logo is not visible."} |
         
         """
-        if loading_time > 0:
-            time.sleep(loading_time)
+        self._wait_for_screen(loading_time, f"verify:{verification_prompt}")
+
+        with deadline_scope(keyword_budget(timeout)):
+            screenshot, visual_diff = self._visual_prefilter(reference_screenshot, visual_prefilter)
+            if visual_diff is not None and visual_diff.identical:
+                return self._report_visual_match(verification_prompt, screenshot, visual_diff, confidence_threshold)
+            messages = self._build_verification_messages(verification_prompt, send_ui_xml, reference_screenshot,
+                                                         screenshot, visual_diff)
+
+            if self._is_deferred(deferred):
+                return self._enqueue_verification(messages, verification_prompt, confidence_threshold)
 
+            self.logger.info(lambda: f"Messages: {messages}")
+            response = self.send_ai_request(messages, response_schema=VERIFICATION_SCHEMA)
+        self.logger.info(f"Response: {response}")
+        response_json = Utilities.extract_json_safely(response, VERIFICATION_SCHEMA)
+        self._report_verification(verification_prompt, response_json, confidence_threshold)
+
+    def _build_verification_messages(self, verification_prompt: str, send_ui_xml: bool = False, reference_screenshot: str = None,
+                                     screenshot: Optional[Screenshot] = None, visual_diff=None) -> List[Dict[str, Any]]:
+        """
+        screenshot: screenshot already captured by the visual prefilter (a new one is taken otherwise)
+        visual_diff: VisualDiffResult of the prefilter; with changed regions, crops of the current and reference
+            screens are sent instead of the full screenshots.
+        """
         system_prompt = self.create_system_prompt("""
                 You are a software tester experienced in UI verification of mobile apps.
                 You have extensive expertise in passenger information and 
@@ -308,8 +808,14 @@ class AiHelper:
                 If the current screen doesn't match the desired verification prompt, you will need to report the bug 
                 """)
 
-        user_prompt_screenshot = self.create_user_prompt_sending_current_screenshot(verification_prompt, True)
-        self.logger.info(f"from keywords class: user prompt current screen : {user_prompt_screenshot}", robot_log=False)
+        send_crops = visual_diff is not None and bool(visual_diff.boxes)
+        if send_crops:
+            user_prompt_screenshot = self._create_visual_diff_prompt(verification_prompt, screenshot, reference_screenshot, visual_diff)
+        elif screenshot is not None:
+            user_prompt_screenshot = self.prompt.create_user_prompt_sending_screenshot(verification_prompt, screenshot, True)
+        else:
+            user_prompt_screenshot = self.create_user_prompt_sending_current_screenshot(verification_prompt, True)
+        self.logger.info(lambda: f"from keywords class: user prompt current screen : {user_prompt_screenshot}", robot_log=False)
 
         user_prompt_response_requirements = self.create_user_prompt("""
            You should respond in JSON format with the following keys:
@@ -323,23 +829,75 @@ class AiHelper:
 
         if send_ui_xml:
             user_prompt_ui_xml = self.create_user_prompt_sending_current_UI_XML("This is the current UI XML of the current screen got by appium")
-            self.logger.info(f"from keywords class: user prompt current UI XML : {user_prompt_ui_xml}", robot_log=False)
+            self.logger.info(lambda: f"from keywords class: user prompt current UI XML : {user_prompt_ui_xml}", robot_log=False)
             messages.append(user_prompt_ui_xml)
 
-        if reference_screenshot:
+        if reference_screenshot and not send_crops:
 
             user_prompt_reference_screenshot = self.create_user_prompt_sending_reference_screenshot("""
                     This is a reference screenshot showing the expected UI and how the app without bugs should look like.
                     """, reference_screenshot, True)
-            self.logger.info(f"from keywords class: user prompt reference screenshot: {user_prompt_reference_screenshot}", robot_log=False)
+            self.logger.info(lambda: f"from keywords class: user prompt reference screenshot: {user_prompt_reference_screenshot}", robot_log=False)
             messages.append(user_prompt_reference_screenshot)
 
+        return messages
 
+    def _visual_prefilter(self, reference_screenshot: Optional[str], enabled: Optional[bool]):
+        """ captures the screenshot once and compares it with the reference. returns (Screenshot, VisualDiffResult or None) """
+        if not reference_screenshot or not (self.config.VISUAL_DIFF if enabled is None else enabled):
+            return None, None
+        # numpy is only needed here: imported lazily to keep the library import fast
+        from src.AiHelper.common._visualdiff import VisualComparator
 
-        self.logger.info(f"Messages: {messages}")
-        response = self.send_ai_request(messages)
-        self.logger.info(f"Response: {response}")
-        response_json = Utilities.extract_json_safely(response)
+        with deadline_stage(STAGE_CAPTURE):
+            screenshot = Utilities._take_screenshot()
+        try:
+            visual_diff = self._shared("visual_comparator", VisualComparator).compare(screenshot, reference_screenshot)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Visual prefilter skipped, the full screenshots are sent: {e}", True)
+            return screenshot, None
+        self.logger.info(f"Visual diff with the reference: similarity={visual_diff.similarity:.4f} "
+                         f"changed={visual_diff.changed_fraction:.3f} regions={len(visual_diff.boxes)} -> {visual_diff.escalation}", True)
+        return screenshot, visual_diff
+
+    def _create_visual_diff_prompt(self, verification_prompt: str, screenshot: Screenshot, reference_screenshot: str, visual_diff) -> dict:
+        """ user prompt with, for each changed region, the crop of the current screen then the same crop of the reference """
+        from src.AiHelper.common._visualdiff import VisualComparator
+        comparator = self._shared("visual_comparator", VisualComparator)
+
+        Utilities._embed_image_to_log(screenshot, width=200, message="Actual app screenshot")
+        # Both screens are decoded once for all the crops
+        reference = Screenshot.of(reference_screenshot)
+        images, labels = [], []
+        for index, box in enumerate(visual_diff.boxes, 1):
+            images.append(comparator.crop(screenshot, box))
+            labels.append(f"Region {index} {box}: current screen")
+            images.append(comparator.crop(reference, box, size=visual_diff.size))
+            labels.append(f"Region {index} {box}: reference screenshot")
+        regions = "\n".join(f"- region {index}: {box}" for index, box in enumerate(visual_diff.boxes, 1))
+        width, height = visual_diff.size
+        text = f"""{verification_prompt}
+
+        The current screen ({width}x{height} px) was compared with a reference screenshot showing the expected UI
+        and how the app without bugs should look like. Outside the regions below both screens are identical.
+        Changed regions as (left, top, right, bottom) in pixels:
+        {regions}
+        For each region, the images are the crop of the current screen followed by the same crop of the reference screenshot.
+        """
+        return self.prompt.create_user_prompt_sending_images(text, images, True, messages=labels)
+
+    def _report_visual_match(self, verification_prompt: str, screenshot: Screenshot, visual_diff, confidence_threshold: float):
+        """ passes the verification without LLM request: the screen matches the reference screenshot """
+        Utilities._embed_image_to_log(screenshot, width=200, message="Actual app screenshot")
+        self._report_verification(verification_prompt, {
+            "confidence": 1.0,
+            "reason": f"The screen matches the reference screenshot (similarity {visual_diff.similarity:.4f}), no LLM request was needed",
+            "bug_summary": "",
+            "bug_description": "",
+        }, confidence_threshold)
+
+    def _report_verification(self, verification_prompt: str, response_json: Dict[str, Any], confidence_threshold: float):
+        """ fails the current keyword or sets the test message depending on the confidence """
         self.logger.info(f"""\n Verification prompt was : {verification_prompt} ;
                              \nConfidence: {response_json['confidence']} ;
                              \nReason: {response_json['reason']} ;
@@ -360,10 +918,194 @@ class AiHelper:
                                         \nActual behavior is matching the expected behavior: {response_json['reason']}""")
 
             self.logger.info(f"Response JSON: {response_json}", robot_log=True)
-            pass
 
+    @keyword("Ask AI For Verification With Consensus")
+    def ask_llm_to_verify_screenshot_with_consensus(self, verification_prompt: str, providers: Optional[Any] = None, policy: str = "quorum",
+                                                    quorum: Optional[int] = None, weights: Optional[Any] = None, send_ui_xml: bool = False,
+                                                    reference_screenshot: str = None, confidence_threshold: float = 0.8, loading_time: float = 3,
+                                                    timeout: Optional[float] = None, visual_prefilter: Optional[bool] = None):
+        """
+        Same as `Ask AI For Verification` but the evidence is sent concurrently to several providers
+        and the verdict is the consensus of their replies.
+        args:
+            verification_prompt: the prompt to send to the LLMs.
+            providers: list or comma separated string of provider[:model]. AIHELPER_CONSENSUS_PROVIDERS by default.
+            policy: "quorum" (quorum agreeing votes decide) or "weighted" (weighted mean confidence). quorum by default.
+            quorum: number of agreeing votes needed by the quorum policy. strict majority by default.
+            weights: dictionary or "openai=2,gemini=1" string of provider weights for the weighted policy. 1 by default.
+            send_ui_xml: whether to send the current UI XML. False by default.
+            reference_screenshot: the path to the reference screenshot. None by default.
+            confidence_threshold: the confidence threshold of a vote and of the decision. 0.8 by default.
+            loading_time: maximum time to wait for the screen to settle before taking the screenshot. 3 seconds by default.
+            timeout: time budget in seconds for capture, upload and the votes. AIHELPER_KEYWORD_TIMEOUT by default.
+            visual_prefilter: local comparison with reference_screenshot first (see `Ask AI For Verification`).
+                None by default: AIHELPER_VISUAL_DIFF.
+        Example:
+        | Ask AI For Verification With Consensus | the login screen is displayed | openai,anthropic,gemini | quorum | 2 |
+        | Ask AI For Verification With Consensus | the login screen is displayed | openai,gemini | weighted | weights=openai=2,gemini=1 |
+        """
+        self._wait_for_screen(loading_time, f"verify:{verification_prompt}")
+
+        specs = parse_provider_specs(providers or self.config.CONSENSUS_PROVIDERS)
+        verifier = ConsensusVerifier(
+            specs,
+            policy=policy,
+            quorum=int(quorum) if quorum else None,
+            weights=parse_weights(weights),
+            confidence_threshold=confidence_threshold,
+        )
+        with deadline_scope(keyword_budget(timeout)):
+            screenshot, visual_diff = self._visual_prefilter(reference_screenshot, visual_prefilter)
+            if visual_diff is not None and visual_diff.identical:
+                return self._report_visual_match(verification_prompt, screenshot, visual_diff, confidence_threshold)
+            messages = self._build_verification_messages(verification_prompt, send_ui_xml, reference_screenshot,
+                                                         screenshot, visual_diff)
+            with deadline_stage(STAGE_LLM):
+                # Structured output per vote: each provider's model has its own capability
+                result = verifier.verify(messages, response_schema=VERIFICATION_SCHEMA)
+
+        for vote in result.votes:
+            agreement = "error" if vote.error else ("agrees" if vote.passed == result.passed else "disagrees")
+            self.logger.info(f"{vote.label}: confidence={vote.confidence} latency={vote.latency:.2f}s ({agreement})", True)
+        if result.early_exit:
+            self.logger.info(f"Decision reached early after {len(result.votes)}/{len(specs)} votes in {result.elapsed:.2f}s", True)
+
+        self._report_verification(verification_prompt, result.to_response_json(), confidence_threshold)
+
+    @keyword("Get Visual Diff Stats")
+    def get_visual_diff_stats(self) -> Dict[str, float]:
+        """ returns the number of local comparisons with reference screenshots, the shortcut rate (no LLM request)
+        and the crop / full escalation counts """
+        from src.AiHelper.common._visualdiff import VisualDiffStats
+        stats = VisualDiffStats.summary()
+        self.logger.info(f"Visual diff stats: {stats}", True)
+        return stats
+
+    @keyword("Get Consensus Stats")
+    def get_consensus_stats(self) -> Dict[str, Dict[str, float]]:
+        """ returns per provider calls, errors, mean/max latency and agreement rate with the consensus decisions """
+        stats = ConsensusStats.summary()
+        self.logger.info(f"Consensus stats: {stats}", True)
+        return stats
+
+    #########################################################
+    # deferred verification (batch APIs)
+    #########################################################
+    def _is_deferred(self, deferred: Optional[bool]) -> bool:
+        if deferred is not None:
+            return deferred
+        if AiHelper._deferred_verification is not None:
+            return AiHelper._deferred_verification
+        return self.config.DEFERRED_VERIFICATION
+
+    @staticmethod
+    def _batch_store() -> BatchJobStore:
+        """ job store of the current suite in this run (shared by the pabot workers of the run) """
+        built_in = BuiltIn()
+        pabot = built_in.get_variable_value("${PABOTQUEUEINDEX}") is not None
+        return BatchJobStore(scope=batch_scope(built_in.get_variable_value("${SUITE_NAME}"), pabot=pabot))
+
+    def _enqueue_verification(self, messages: List[Dict[str, Any]], verification_prompt: str, confidence_threshold: float) -> str:
+        built_in = BuiltIn()
+        job_id = self._batch_store().enqueue(
+            provider=self._client_name,
+            model=self._model,
+            messages=messages,
+            metadata={
+                "kind": "verification",
+                "suite_name": built_in.get_variable_value("${SUITE_NAME}"),
+                "test_name": built_in.get_variable_value("${TEST_NAME}"),
+                "verification_prompt": verification_prompt,
+                "confidence_threshold": confidence_threshold,
+            },
+        )
+        built_in.set_test_message(f"Verification deferred to batch job {job_id}: {verification_prompt}")
+        self.logger.info(f"Verification deferred to batch job {job_id}", True)
+        return job_id
+
+    @keyword("Enable Deferred Verification")
+    def enable_deferred_verification(self):
+        """ `Ask AI For Verification` enqueues its requests until `Disable Deferred Verification` is called """
+        AiHelper._deferred_verification = True
+        self.logger.info("Deferred verification enabled", True)
+
+    @keyword("Disable Deferred Verification")
+    def disable_deferred_verification(self):
+        AiHelper._deferred_verification = False
+        self.logger.info("Deferred verification disabled", True)
+
+    @keyword("Collect Deferred Verifications")
+    def collect_deferred_verifications(self, poll_interval: float = 30, timeout: float = 86400, fail_on_error: bool = True, clear: bool = True):
+        """
+        Submit the verifications deferred by the current suite (and its child suites) in this run, whatever the
+        pabot worker that deferred them, through the provider batch APIs, wait for the results and report them.
+        Typically called from a suite teardown.
+        With the listener registered (robot --listener src.AiHelper.DeferredVerificationListener), each failed
+        verification fails its own test in output.xml, log and report. Without it, the keyword itself fails,
+        which fails every test of the suite.
+        args:
+            poll_interval: seconds between two batch status checks. 30 by default.
+            timeout: maximum time to wait for the batches in seconds. 24h by default.
+            fail_on_error: report the failed verifications as failures (of their tests with the listener,
+                of the keyword otherwise). True by default.
+            clear: remove the reported jobs from the job store. True by default.
+        returns:
+            list of dictionaries with test_name, verification_prompt, passed, confidence, reason, bug_summary
+        """
+        collector = BatchCollector(self._batch_store())
+        jobs = collector.collect(poll_interval=poll_interval, timeout=timeout)
+
+        report = []
+        for job in jobs:
+            metadata = job.get("metadata", {})
+            entry = {
+                "job_id": job["id"],
+                "test_name": metadata.get("test_name"),
+                "verification_prompt": metadata.get("verification_prompt"),
+                "passed": False,
+                "confidence": None,
+                "reason": "",
+                "bug_summary": "",
+            }
+            result = job.get("result") or {}
+            if job["status"] == STATUS_COMPLETED:
+                try:
+                    response_json = Utilities.extract_json_safely(result["content"], VERIFICATION_SCHEMA)
+                    entry.update({
+                        "confidence": response_json["confidence"],
+                        "reason": response_json.get("reason", ""),
+                        "bug_summary": response_json.get("bug_summary", ""),
+                        "passed": response_json["confidence"] >= metadata.get("confidence_threshold", 0.8),
+                    })
+                except (ValueError, KeyError, TypeError) as e:
+                    entry["reason"] = f"Invalid response: {e}"
+            else:
+                entry["reason"] = f"Batch request failed: {result.get('error')}"
+
+            status = "PASS" if entry["passed"] else "FAIL"
+            self.logger.info(f"[{status}] {entry['test_name']} - {entry['verification_prompt']} "
+                             f"(confidence: {entry['confidence']}) {entry['reason']} {entry['bug_summary']}", True)
+            if not entry["passed"] and fail_on_error and DeferredVerificationListener.active:
+                DeferredVerdicts.record(f"{metadata.get('suite_name')}.{entry['test_name']}",
+                                        f"Deferred verification failed: {entry['verification_prompt']} -> "
+                                        f"{entry['bug_summary'] or entry['reason']}")
+            report.append(entry)
+
+        if clear:
+            collector.store.clear(finished_only=True)
+
+        failed = [entry for entry in report if not entry["passed"]]
+        self.logger.info(f"Deferred verifications: {len(report) - len(failed)} passed, {len(failed)} failed", True)
+        if failed and fail_on_error and not DeferredVerificationListener.active:
+            BuiltIn().fail("Deferred verifications failed:\n" + "\n".join(
+                f"{entry['test_name']}: {entry['verification_prompt']} -> {entry['bug_summary'] or entry['reason']}"
+                for entry in failed))
+        return report
+
+    @routed_keyword
     @keyword("Click On Element Using LLM")
-    def click_on_element_using_llm(self,element_description:str, sleep_time: int=3):
+    @with_time_budget
+    def click_on_element_using_llm(self,element_description:str, sleep_time: int=3, timeout: Optional[float] = None):
 
 
         #system prompt
@@ -382,13 +1124,13 @@ class AiHelper:
 
         #user prompt : current screenshot
         user_prompt_screenshot = self.create_user_prompt_sending_current_screenshot(element_description, True)
-        self.logger.info(f"from keywords class: user prompt current screen : {user_prompt_screenshot}", robot_log=False)
+        self.logger.info(lambda: f"from keywords class: user prompt current screen : {user_prompt_screenshot}", robot_log=False)
 
         
 
         #user prompt : ui xml 
         user_prompt_ui_xml = self.create_user_prompt_sending_current_UI_XML("This is the current UI XML of the current screen got by appium")
-        self.logger.info(f"from keywords class: user prompt current UI XML : {user_prompt_ui_xml}", robot_log=False)
+        self.logger.info(lambda: f"from keywords class: user prompt current UI XML : {user_prompt_ui_xml}", robot_log=False)
 
 
         
@@ -396,10 +1138,10 @@ class AiHelper:
         #messages
         messages = [system_prompt, user_prompt_screenshot, user_prompt_ui_xml]
 
-        response = self.send_ai_request(messages)
+        response = self.send_ai_request(messages, response_schema=LOCATOR_SCHEMA)
         self.logger.info(f"Response: {response}")
 
-        response_json = Utilities.extract_json_safely(response)
+        response_json = Utilities.extract_json_safely(response, LOCATOR_SCHEMA)
         self.logger.info(f"""\n element description was : {element_description} ;
                              \nLocator: {response_json['locator']} ;
                              \nReason: {response_json['reason']} ;
@@ -420,16 +1162,18 @@ class AiHelper:
                                         \nReason: {response_json['reason']} ;""")
 
             self.logger.info(f"Response JSON: {response_json}", robot_log=True)
+            from appium.webdriver.common.appiumby import AppiumBy
             locator = response_json['locator']
             driver = built_in.get_library_instance('AppiumLibrary')._current_application()
             driver.find_element(AppiumBy.XPATH, locator).click()
-            if sleep_time > 0:
-                time.sleep(sleep_time)
+            self._wait_for_screen(sleep_time, f"click:{element_description}")
             return locator
 
 
+    @routed_keyword
     @keyword("Input Text Using AI")
-    def input_text_using_llm(self,element_description:str, text:str):
+    @with_time_budget
+    def input_text_using_llm(self,element_description:str, text:str, timeout: Optional[float] = None):
 
         #system prompt
         system_prompt = self.create_system_prompt("""
@@ -446,22 +1190,22 @@ class AiHelper:
 
         #user prompt : current screenshot
         user_prompt_screenshot = self.create_user_prompt_sending_current_screenshot(element_description)
-        self.logger.info(f"from keywords class: user prompt current screen : {user_prompt_screenshot}", robot_log=False)
+        self.logger.info(lambda: f"from keywords class: user prompt current screen : {user_prompt_screenshot}", robot_log=False)
 
         #user prompt : current UI XML
         user_prompt_ui_xml = self.create_user_prompt_sending_current_UI_XML("This is the current UI XML of the current screen got by appium")
-        self.logger.info(f"from keywords class: user prompt current UI XML : {user_prompt_ui_xml}", robot_log=False)
+        self.logger.info(lambda: f"from keywords class: user prompt current UI XML : {user_prompt_ui_xml}", robot_log=False)
 
         #user prompt : text to input
         user_prompt_text = self.create_user_prompt(f"The element that I look for is : ${element_description}")
-        self.logger.info(f"from keywords class: user prompt text to input : {user_prompt_text}", robot_log=False)
+        self.logger.info(lambda: f"from keywords class: user prompt text to input : {user_prompt_text}", robot_log=False)
 
         messages = [system_prompt, user_prompt_screenshot, user_prompt_ui_xml, user_prompt_text]
 
-        response = self.send_ai_request(messages)
+        response = self.send_ai_request(messages, response_schema=LOCATOR_SCHEMA)
         self.logger.info(f"Response: {response}")
 
-        response_json = Utilities.extract_json_safely(response)
+        response_json = Utilities.extract_json_safely(response, LOCATOR_SCHEMA)
         self.logger.info(f"""\n element description was : {element_description} ;
                              \nLocator: {response_json['locator']} ;
                              \nReason: {response_json['reason']} ;
@@ -482,12 +1226,87 @@ class AiHelper:
                                         \nReason: {response_json['reason']} ;""")
 
             self.logger.info(f"Response JSON: {response_json}", robot_log=True)
+            from appium.webdriver.common.appiumby import AppiumBy
             locator = response_json['locator']
             driver = built_in.get_library_instance('AppiumLibrary')._current_application()
             driver.find_element(AppiumBy.XPATH, locator).send_keys(text)
             return locator
 
 
+    #########################################################
+    # agent: multi-step plans executed and checked locally
+    #########################################################
+    def _agent_engine(self, max_replans: Optional[int] = None) -> AgentEngine:
+        return AgentEngine(
+            driver=Utilities._get_driver(),
+            send=lambda messages: self.send_ai_request(messages, response_schema=AGENT_PLAN_SCHEMA),
+            prompt=self.prompt,
+            settle=lambda screen_key: self._wait_for_screen(self.config.AGENT_STEP_WAIT, screen_key),
+            max_replans=self.config.AGENT_MAX_REPLANS if max_replans is None else int(max_replans),
+            max_steps=self.config.AGENT_MAX_STEPS,
+            plan_cache=self.config.AGENT_PLAN_CACHE,
+        )
+
+    def _report_agent(self, result: AgentResult) -> Dict[str, Any]:
+        """ records the flow, fails the test when it did not pass """
+        built_in = BuiltIn()
+        AgentStats.record(built_in.get_variable_value("${SUITE_NAME}") or "default", result)
+        steps = "\n".join(f"{'ok' if step.ok else 'KO'} {step.step}{'' if step.ok else ': ' + step.detail}" for step in result.steps)
+        if not result.passed:
+            built_in.fail(f"""Agent {result.mode}: {result.goal}
+                            \nReason: {result.reason}
+                            \nBug Summary: {result.bug_summary}
+                            \nBug Description: {result.bug_description}
+                            \nSteps:\n{steps}""")
+        built_in.set_test_message(f"""Agent {result.mode}: {result.goal} ;
+                                    \n{len(result.steps)} steps, {result.llm_calls} LLM calls ;
+                                    \nReason: {result.reason} ;""")
+        return result.as_dict()
+
+    @routed_keyword
+    @keyword("Agent Do")
+    @with_time_budget
+    def agent_do(self, instruction: str, send_screenshot: bool = False, max_replans: Optional[int] = None,
+                 timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Reach a goal on the app: the LLM plans every step (tap, type, scroll, back, assert) from the compacted
+        UI XML once, the steps are executed through Appium and each one is checked on the next UI XML.
+        The LLM is asked again only when the screen diverges from the plan.
+        args:
+            instruction: the goal, e.g. "log in with user demo / password secret".
+            send_screenshot: also send the current screenshot with the plan requests. False by default.
+            max_replans: LLM requests after a divergence before failing. AIHELPER_AGENT_MAX_REPLANS by default.
+            timeout: time budget in seconds of the whole flow. AIHELPER_KEYWORD_TIMEOUT by default (0 = no budget).
+        Example:
+        | Agent Do | click on the login button |
+        returns the executed steps, LLM calls and replans; fails when the goal cannot be reached
+        """
+        return self._report_agent(self._agent_engine(max_replans).run(instruction, AGENT_DO, send_screenshot))
+
+    @routed_keyword
+    @keyword("Agent Check")
+    @with_time_budget
+    def agent_check(self, condition: str, send_screenshot: bool = False, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Check a condition on the current screen: the LLM answers with texts of the compacted UI XML proving it,
+        asserted locally and reused (no LLM request) by the next checks of the same condition on the same screen layout.
+        args:
+            condition: what the screen should show.
+            send_screenshot: also send the current screenshot. False by default.
+            timeout: time budget in seconds. AIHELPER_KEYWORD_TIMEOUT by default (0 = no budget).
+        Example:
+        | Agent Check | the homepage with a timeline of news is displayed |
+        """
+        return self._report_agent(self._agent_engine().run(condition, AGENT_CHECK, send_screenshot))
+
+    @keyword("Get Agent Stats")
+    def get_agent_stats(self) -> Dict[str, Dict[str, Any]]:
+        """ returns per suite agent flows, passed flows, steps, LLM calls, replans, cached plans and steps per LLM call """
+        stats = AgentStats.summary()
+        self.logger.info(f"Agent stats: {stats}", True)
+        return stats
+
+
     #draft code for current step
     # def generate_code_for_current_step(self, step_description: str, send_ui_xml: bool = False, confidence_threshold: float = 0.8):
     #     """
@@ -0,0 +1,455 @@
+"""
+Agent engine of `Agent Do` / `Agent Check`: one LLM call plans several steps.
+
+The model gets the goal and the compacted UI XML of the current screen (see
+common._uixml) and answers with a plan: tap / type / scroll / back / assert
+steps, each with the text expected on the screen once it is done. The steps
+are executed locally through the Appium driver, and each one is checked on
+the next UI XML snapshot:
+
+    - the expected text is shown (typed text for type steps, when no expect,
+      except in password fields)
+    - otherwise the screen changed (an action that changes nothing failed)
+    - assert steps only check the current screen
+
+The model is consulted again only when the screen diverges from the plan (a
+step fails its check, or its target is not on the screen), at most
+`max_replans` times. The flow is one conversation: a replan adds the steps
+done since the last plan, the reason of the divergence and only the UI XML
+changes since the screen the model last saw (see UIDiffTracker).
+
+Plans are cached per goal and screen layout (node classes and ids, not their
+texts), so a flow replayed on the same screen costs no LLM call; a cached plan
+that diverges is dropped and the model is asked from where it diverged.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.AiHelper.common._device import DeviceProfiles
+from src.AiHelper.common._logger import RobotCustomLogger
+from src.AiHelper.common._structured import AGENT_PLAN_SCHEMA, extract_json
+from src.AiHelper.common._uixml import UIDiffTracker, UINode, UISnapshot
+
+AGENT_DO = "do"
+AGENT_CHECK = "check"
+
+ACTION_TAP = "tap"
+ACTION_TYPE = "type"
+ACTION_SCROLL = "scroll"
+ACTION_BACK = "back"
+ACTION_ASSERT = "assert"
+_ACTIONS = (ACTION_TAP, ACTION_TYPE, ACTION_SCROLL, ACTION_BACK, ACTION_ASSERT)
+_TARGETED = (ACTION_TAP, ACTION_TYPE)
+
+_NODE_REF = re.compile(r"^n\d+$")
+_PLAN_CACHE_SIZE = 256
+# Share of the scrolled area covered by a swipe
+_SWIPE_SPAN = 0.6
+
+_SYSTEM_PROMPTS = {
+    AGENT_DO: """
+        You drive a mobile application through Appium to reach a goal.
+        You are given the compacted UI XML of the current screen: one line per element,
+        <ref> <class> "text" desc="description" id=<id> <flags> @<x>,<y> (center of the element).
+
+        Plan every step reaching the goal, not only the first one:
+        - "tap": target is the element to tap
+        - "type": target is the field, text is the text to type
+        - "scroll": target is the scrollable element (empty for the whole screen), text is the direction (up, down, left, right)
+        - "back": the system back button
+        - "assert": expect is a text that must be shown on the screen
+        For elements of the current screen, target is their ref (n12). For elements of a later screen,
+        target is the text, description or id they will show.
+        For each step, expect is a text shown on the screen once the step is done (empty if you cannot tell):
+        every step is checked on the screen, and you are asked again only when the screen differs from the plan.
+        If the goal cannot be reached (missing element, error screen...) and you are confident of it, that means it is a bug:
+        return no steps and describe it.
+        """,
+    AGENT_CHECK: """
+        You check a condition on the current screen of a mobile application.
+        You are given the compacted UI XML of the current screen: one line per element,
+        <ref> <class> "text" desc="description" id=<id> <flags> @<x>,<y> (center of the element).
+
+        If the condition holds, return "assert" steps whose expect are texts shown on the screen that prove it
+        (target and text empty): they are checked on the screen, and reused on the next runs of the same check.
+        If the condition does not hold, that means it is a bug: return no steps and describe it.
+        """,
+}
+
+
+@dataclass
+class AgentStep:
+    action: str
+    # Element of the planning snapshot, or label of an element of a later screen
+    target: Optional[UINode] = None
+    target_label: str = ""
+    text: str = ""
+    expect: str = ""
+
+    def describe(self) -> str:
+        target = self.target.label if self.target else self.target_label
+        description = self.action + (f" '{target}'" if target else "")
+        if self.text:
+            description += f" ({self.text})"
+        if self.expect:
+            description += f" -> expect '{self.expect}'"
+        return description
+
+
+@dataclass
+class AgentPlan:
+    steps: List[AgentStep]
+    reason: str = ""
+    bug_summary: str = ""
+    bug_description: str = ""
+
+    @classmethod
+    def from_reply(cls, data: Dict[str, Any], snapshot: UISnapshot, mode: str) -> "AgentPlan":
+        """
+        Args:
+            data: agent_plan reply (AGENT_PLAN_SCHEMA)
+            snapshot: Screen the plan was made on (resolves the node references)
+            mode: AGENT_DO or AGENT_CHECK (assertions only)
+
+        Raises ValueError on an invalid step.
+        """
+        steps = []
+        for index, item in enumerate(data.get("steps") or [], start=1):
+            if not isinstance(item, dict):
+                raise ValueError(f"step {index} is not an object")
+            action = str(item.get("action", "")).lower().strip()
+            if action not in _ACTIONS:
+                raise ValueError(f"step {index}: unknown action '{action}'")
+            if mode == AGENT_CHECK and action != ACTION_ASSERT:
+                raise ValueError(f"step {index}: a check only asserts, got '{action}'")
+            target = str(item.get("target") or "").strip()
+            node = snapshot.node(target) if target else None
+            if node is None and _NODE_REF.match(target):
+                raise ValueError(f"step {index}: no element '{target}' on the screen")
+            step = AgentStep(action, node, "" if node else target, str(item.get("text") or ""), str(item.get("expect") or ""))
+            if action in _TARGETED and not target:
+                raise ValueError(f"step {index}: '{action}' needs a target")
+            if action == ACTION_ASSERT and not (step.expect or step.text):
+                raise ValueError(f"step {index}: assert without an expected text")
+            steps.append(step)
+        return cls(steps, str(data.get("reason") or ""), str(data.get("bug_summary") or ""),
+                   str(data.get("bug_description") or ""))
+
+
+@dataclass
+class StepResult:
+    step: str
+    ok: bool
+    detail: str = ""
+    # Nodes added or removed by the step
+    changes: int = 0
+
+
+@dataclass
+class AgentResult:
+    goal: str
+    mode: str
+    passed: bool
+    steps: List[StepResult] = field(default_factory=list)
+    llm_calls: int = 0
+    replans: int = 0
+    from_cache: bool = False
+    reason: str = ""
+    bug_summary: str = ""
+    bug_description: str = ""
+    duration: float = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "goal": self.goal, "mode": self.mode, "passed": self.passed,
+            "steps": [{"step": step.step, "ok": step.ok, "detail": step.detail} for step in self.steps],
+            "llm_calls": self.llm_calls, "replans": self.replans, "from_cache": self.from_cache,
+            "reason": self.reason, "bug_summary": self.bug_summary, "bug_description": self.bug_description,
+            "duration": round(self.duration, 3),
+        }
+
+
+class AgentStats:
+    """Process-wide agent flows per suite."""
+
+    _lock = threading.Lock()
+    _records: Dict[str, Dict[str, Any]] = {}
+
+    @classmethod
+    def record(cls, suite: str, result: AgentResult):
+        with cls._lock:
+            stats = cls._records.setdefault(suite, {"flows": 0, "passed": 0, "steps": 0, "llm_calls": 0,
+                                                    "replans": 0, "cached_plans": 0})
+            stats["flows"] += 1
+            stats["passed"] += int(result.passed)
+            stats["steps"] += len(result.steps)
+            stats["llm_calls"] += result.llm_calls
+            stats["replans"] += result.replans
+            stats["cached_plans"] += int(result.from_cache)
+
+    @classmethod
+    def summary(cls) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns:
+            Per suite: flows, passed, steps executed, LLM calls, replans, flows started from a cached
+            plan, and steps per LLM call (what one round-trip per action would make 1.0)
+        """
+        with cls._lock:
+            return {suite: dict(stats, steps_per_llm_call=round(stats["steps"] / stats["llm_calls"], 2)
+                                if stats["llm_calls"] else None)
+                    for suite, stats in cls._records.items()}
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._records = {}
+
+
+class AgentPlanCache:
+    """Process-wide plans per (mode, goal, screen layout)."""
+
+    _lock = threading.Lock()
+    _plans: "OrderedDict[Tuple[str, str, str], List[AgentStep]]" = OrderedDict()
+
+    @staticmethod
+    def key(mode: str, goal: str, snapshot: UISnapshot) -> Tuple[str, str, str]:
+        return mode, " ".join(goal.lower().split()), snapshot.layout_signature
+
+    @classmethod
+    def get(cls, key: Tuple[str, str, str]) -> Optional[List[AgentStep]]:
+        with cls._lock:
+            steps = cls._plans.get(key)
+            if steps is not None:
+                cls._plans.move_to_end(key)
+            return steps
+
+    @classmethod
+    def put(cls, key: Tuple[str, str, str], steps: List[AgentStep]):
+        with cls._lock:
+            cls._plans[key] = steps
+            cls._plans.move_to_end(key)
+            while len(cls._plans) > _PLAN_CACHE_SIZE:
+                cls._plans.popitem(last=False)
+
+    @classmethod
+    def drop(cls, key: Tuple[str, str, str]):
+        with cls._lock:
+            cls._plans.pop(key, None)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._plans.clear()
+
+
+def screen_changes(before: UISnapshot, after: UISnapshot) -> int:
+    """Number of nodes added or removed between two snapshots (same class, texts, id and bounds)."""
+    def nodes(snapshot: UISnapshot):
+        return {(node.cls, node.text, node.desc, node.resource_id, node.bounds) for node in snapshot.nodes}
+    return len(nodes(before) ^ nodes(after))
+
+
+class AgentEngine:
+
+    def __init__(
+        self,
+        driver: Any,
+        send: Callable[[List[Dict[str, Any]]], str],
+        prompt: Any,
+        settle: Callable[[str], None],
+        max_replans: int = 3,
+        max_steps: int = 25,
+        plan_cache: bool = True,
+    ):
+        """
+        Args:
+            driver: Appium driver
+            send: Sends the messages with AGENT_PLAN_SCHEMA and returns the reply text (AiHelper.send_ai_request)
+            prompt: ChatPromptFactory building the messages
+            settle: Waits for the screen to settle after an action, given a screen key
+            max_replans: Times the model is consulted again after a divergence
+            max_steps: Steps executed at most in one flow
+            plan_cache: Reuse the plans of the same goal on the same screen layout
+        """
+        self.logger = RobotCustomLogger()
+        self.driver = driver
+        self.send = send
+        self.prompt = prompt
+        self.settle = settle
+        self.max_replans = max_replans
+        self.max_steps = max_steps
+        self.plan_cache = plan_cache
+
+    def snapshot(self) -> UISnapshot:
+        page_source = self.driver.page_source
+        # A step may rotate the screen or open another app: the cached device profile is checked on it
+        DeviceProfiles().observe_page_source(self.driver, page_source)
+        snapshot = UISnapshot.parse(page_source)
+        self.logger.debug(lambda: f"Compacted UI XML: {len(snapshot)} nodes, {len(snapshot.text())} characters "
+                                  f"(page source {snapshot.raw_size})")
+        return snapshot
+
+    def run(self, goal: str, mode: str = AGENT_DO, send_screenshot: bool = False) -> AgentResult:
+        """
+        Plan and execute `goal` (AGENT_DO), or check it on the current screen (AGENT_CHECK).
+
+        Returns:
+            AgentResult (passed is False when the model found a bug or the flow diverged more than max_replans times)
+        """
+        start = time.perf_counter()
+        result = AgentResult(goal, mode, passed=False)
+        self._conversation: List[Dict[str, Any]] = []
+        self._tracker = UIDiffTracker()
+        # Steps executed before the last plan (already known by the model)
+        planned_at = 0
+        snapshot = self.snapshot()
+        key = AgentPlanCache.key(mode, goal, snapshot)
+        steps = AgentPlanCache.get(key) if self.plan_cache else None
+        if steps is not None:
+            result.from_cache = True
+            self.logger.info(f"Agent {mode}: plan of {len(steps)} steps reused for '{goal}'", True)
+        divergence = ""
+
+        while True:
+            if steps is None:
+                # Plans made so far, the cached plan being the first: every later plan is a replan
+                plans = result.llm_calls + int(result.from_cache)
+                if plans and result.replans >= self.max_replans:
+                    result.reason = f"the screen diverged from the plan {result.replans + 1} times ({divergence})"
+                    break
+                result.llm_calls += 1
+                result.replans = plans
+                try:
+                    plan, snapshot = self._plan(goal, mode, snapshot, result.steps[planned_at:], divergence, send_screenshot)
+                except ValueError as e:
+                    # Invalid plan: asked again like after a divergence
+                    divergence = f"invalid plan: {e}"
+                    continue
+                finally:
+                    planned_at = len(result.steps)
+                result.reason, result.bug_summary, result.bug_description = plan.reason, plan.bug_summary, plan.bug_description
+                if not plan.steps:
+                    break
+                steps = plan.steps
+                if self.plan_cache and not result.steps:
+                    # Only plans made from the start screen can be replayed from it
+                    AgentPlanCache.put(key, steps)
+
+            for step in steps:
+                if len(result.steps) >= self.max_steps:
+                    result.reason = f"more than {self.max_steps} steps"
+                    break
+                step_result, snapshot = self._execute(step, snapshot)
+                result.steps.append(step_result)
+                self.logger.info(f"Agent {mode}: {step_result.step}: {'ok' if step_result.ok else step_result.detail}", True)
+                if not step_result.ok:
+                    divergence = f"{step_result.step}: {step_result.detail}"
+                    break
+            else:
+                result.passed = True
+                break
+            if len(result.steps) >= self.max_steps:
+                break
+            if result.from_cache and result.llm_calls == 0:
+                AgentPlanCache.drop(key)
+            steps = None
+
+        result.duration = time.perf_counter() - start
+        self.logger.info(f"Agent {mode} '{goal}': {'passed' if result.passed else 'failed'} after {len(result.steps)} steps, "
+                         f"{result.llm_calls} LLM calls, {result.replans} replans ({result.duration:.1f}s)", True)
+        return result
+
+    def _plan(self, goal: str, mode: str, snapshot: UISnapshot, done: List[StepResult], divergence: str,
+              send_screenshot: bool) -> Tuple[AgentPlan, UISnapshot]:
+        """ (plan, snapshot sent: node references as the model knows them) """
+        if not self._conversation:
+            text = f"Goal: {goal}" if mode == AGENT_DO else f"Condition to check: {goal}"
+            self._conversation.append(self.prompt.create_system_prompt(_SYSTEM_PROMPTS[mode]))
+            if send_screenshot:
+                self._conversation.append(self.prompt.create_user_prompt_sending_current_screenshot("Current screen", True))
+        else:
+            text = ""
+        if done:
+            text += "\n\nSteps executed:\n" + "\n".join(f"- {step.step}: {'ok' if step.ok else step.detail}" for step in done)
+        if divergence:
+            text += (f"\n\nThe screen diverged from the plan ({divergence}). "
+                     "Plan the remaining steps from the current screen.")
+        self._conversation.append(self.prompt.create_user_prompt_sending_UI_XML_changes(text.strip(), self._tracker, snapshot))
+        snapshot = self._tracker.baseline
+        reply = self.send(self._conversation)
+        self._conversation.append({"role": "assistant", "content": reply})
+        data = AGENT_PLAN_SCHEMA.coerce(extract_json(reply, required=list(AGENT_PLAN_SCHEMA.properties)))
+        return AgentPlan.from_reply(data, snapshot, mode), snapshot
+
+    def _resolve(self, step: AgentStep, snapshot: UISnapshot) -> Optional[UINode]:
+        if step.target is not None:
+            return snapshot.find(step.target)
+        if step.target_label:
+            return snapshot.find_label(step.target_label)
+        return None
+
+    def _execute(self, step: AgentStep, before: UISnapshot) -> Tuple[StepResult, UISnapshot]:
+        """ (result, snapshot of the screen after the step) """
+        description = step.describe()
+        if step.action == ACTION_ASSERT:
+            expected = step.expect or step.text
+            ok = before.contains_text(expected)
+            return StepResult(description, ok, "" if ok else f"'{expected}' is not on the screen"), before
+
+        node = self._resolve(step, before)
+        if node is None and (step.action in _TARGETED or step.target or step.target_label):
+            label = step.target.label if step.target else step.target_label
+            return StepResult(description, False, f"'{label}' is not on the screen"), before
+        try:
+            self._act(step, node, before)
+        except Exception as e:
+            return StepResult(description, False, f"{type(e).__name__}: {e}"), before
+        self.settle(f"agent:{step.action}:{node.label if node else step.text}")
+
+        after = self.snapshot()
+        changes = screen_changes(before, after)
+        if step.expect:
+            ok = after.contains_text(step.expect)
+            detail = "" if ok else f"'{step.expect}' is not on the screen"
+        elif step.action == ACTION_TYPE:
+            # A password field does not show what was typed
+            ok = "password" in node.flags or after.contains_text(step.text)
+            detail = "" if ok else f"'{step.text}' was not typed"
+        else:
+            ok = changes > 0
+            detail = "" if ok else "the screen did not change"
+        return StepResult(description, ok, detail, changes), after
+
+    def _act(self, step: AgentStep, node: Optional[UINode], snapshot: UISnapshot):
+        if step.action == ACTION_TAP:
+            # One call, no element lookup: the node bounds are in the driver's coordinates
+            self.driver.tap([node.center])
+        elif step.action == ACTION_TYPE:
+            from appium.webdriver.common.appiumby import AppiumBy
+            xpath = node.xpath()
+            if xpath is None:
+                self.driver.tap([node.center])
+                element = self.driver.switch_to.active_element
+            else:
+                element = self.driver.find_element(AppiumBy.XPATH, xpath)
+            element.clear()
+            element.send_keys(step.text)
+        elif step.action == ACTION_SCROLL:
+            self._swipe(node.bounds if node else snapshot.window, (step.text or "down").lower().strip())
+        elif step.action == ACTION_BACK:
+            self.driver.back()
+
+    def _swipe(self, bounds: Tuple[int, int, int, int], direction: str):
+        """ scrolls the content of `bounds` towards `direction` (the finger moves the other way) """
+        x1, y1, x2, y2 = bounds
+        cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
+        dx, dy = int((x2 - x1) * _SWIPE_SPAN / 2), int((y2 - y1) * _SWIPE_SPAN / 2)
+        moves = {"down": (cx, cy + dy, cx, cy - dy), "up": (cx, cy - dy, cx, cy + dy),
+                 "right": (cx + dx, cy, cx - dx, cy), "left": (cx - dx, cy, cx + dx, cy)}
+        if direction not in moves:
+            raise ValueError(f"unknown scroll direction '{direction}'")
+        self.driver.swipe(*moves[direction], 400)
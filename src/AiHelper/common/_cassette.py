@@ -0,0 +1,310 @@
+"""
+Record / replay cassettes for the LLM and image upload traffic.
+
+In `record` mode every LLM completion and image upload goes to the network as
+usual and is appended to a cassette file (`<AIHELPER_CASSETTE_DIR>/<name>.json`)
+together with its latency. In `replay` mode nothing goes to the network: the
+requests are matched against the cassette and answered with the recorded
+response after the recorded latency, no latency, or a scaled one
+(AIHELPER_CASSETTE_LATENCY). `auto` replays what is recorded and records the rest.
+
+Requests are matched by a fingerprint of provider, model, parameters and
+messages where images are replaced by their digest, so screenshots are never
+stored in the cassette. Screenshots of a real device are never byte-identical
+from one run to the next: with AIHELPER_CASSETTE_MATCH=relaxed (default) a
+request that has no exact match is answered with the next recorded response of
+the same text-only fingerprint (images ignored), and an upload with the next
+recorded upload.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from src.AiHelper.common._deadline import check_deadline, current_deadline
+from src.AiHelper.common._logger import elide_payloads
+from src.AiHelper.config.config import Config
+
+MODE_OFF = "off"
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+MODE_AUTO = "auto"
+MODES = (MODE_OFF, MODE_RECORD, MODE_REPLAY, MODE_AUTO)
+
+MATCH_EXACT = "exact"
+MATCH_RELAXED = "relaxed"
+
+KIND_LLM = "llm"
+KIND_UPLOAD = "upload"
+
+CASSETTE_VERSION = 1
+
+
+class CassetteMiss(LookupError):
+    """A request has no recorded interaction in replay mode."""
+
+    ROBOT_SUPPRESS_NAME = True
+
+
+def parse_latency(latency: Any) -> float:
+    """ "recorded" -> 1.0, "zero" -> 0.0, "0.25" -> 0.25 (factor applied to the recorded latency) """
+    if isinstance(latency, (int, float)):
+        return max(0.0, float(latency))
+    latency = str(latency).strip().lower()
+    if latency in ("", "recorded"):
+        return 1.0
+    if latency in ("zero", "none"):
+        return 0.0
+    return max(0.0, float(latency))
+
+
+def _canonical(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def _without_images(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Messages with the image items removed (uploaded screenshot URLs differ from one run to the next)."""
+    stripped = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            content = [item for item in content if not (isinstance(item, dict) and item.get("type") in ("image_url", "image"))]
+        stripped.append({**message, "content": content})
+    return stripped
+
+
+def request_fingerprints(provider: str, model: Optional[str], messages: List[Dict[str, Any]],
+                         params: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Args:
+        provider: Provider name
+        model: Model name
+        messages: OpenAI-style messages (base64 images are replaced by their digest)
+        params: Completion parameters (temperature, top_p, max_tokens...)
+
+    Returns:
+        {"exact": ..., "relaxed": ...}: the relaxed fingerprint ignores the images
+    """
+    head = {"provider": provider, "model": model, "params": params}
+    return {
+        MATCH_EXACT: _digest(elide_payloads(_canonical({**head, "messages": messages}))),
+        MATCH_RELAXED: _digest(_canonical({**head, "messages": _without_images(messages)})),
+    }
+
+
+class Cassette:
+    """
+    One cassette file, shared by every client and uploader of the process.
+
+    Writes are appended under an fcntl lock so that pabot workers can record
+    into the same cassette.
+    """
+
+    _cassettes: Dict[str, "Cassette"] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, path: str, mode: str = MODE_REPLAY, match: str = MATCH_RELAXED, latency: Any = "recorded"):
+        """
+        Args:
+            path: Cassette file
+            mode: record, replay or auto
+            match: exact, or relaxed (fall back to the text-only fingerprint / upload order)
+            latency: "recorded", "zero" or a factor applied to the recorded latency
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode '{mode}', expected one of {', '.join(MODES)}")
+        self.path = path
+        self.mode = mode
+        self.match = match
+        self.latency_factor = parse_latency(latency)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "relaxed_hits": 0, "misses": 0, "recorded": 0,
+                      "recorded_latency_s": 0.0, "replayed_latency_s": 0.0}
+        self._load()
+
+    @classmethod
+    def get(cls, path: str, mode: str, match: str = MATCH_RELAXED, latency: Any = "recorded") -> "Cassette":
+        with cls._registry_lock:
+            cassette = cls._cassettes.get(path)
+            if cassette is None or (cassette.mode, cassette.match) != (mode, match):
+                cassette = cls._cassettes[path] = cls(path, mode, match, latency)
+            cassette.latency_factor = parse_latency(latency)
+            return cassette
+
+    @property
+    def replays(self) -> bool:
+        return self.mode in (MODE_REPLAY, MODE_AUTO)
+
+    @property
+    def records(self) -> bool:
+        return self.mode in (MODE_RECORD, MODE_AUTO)
+
+    def _load(self):
+        interactions = []
+        if os.path.exists(self.path):
+            with self._locked_file("r") as f:
+                content = f.read()
+            interactions = json.loads(content).get("interactions", []) if content else []
+        self._index: Dict[str, Dict[str, List[Dict[str, Any]]]] = {
+            MATCH_EXACT: defaultdict(list), MATCH_RELAXED: defaultdict(list)}
+        self._uploads: Dict[str, str] = {}
+        self._upload_order: List[Dict[str, Any]] = []
+        for interaction in interactions:
+            self._add_to_index(interaction)
+        # Next interaction to replay for each fingerprint: repeated requests get the responses in recorded order
+        self._cursors: Dict[str, int] = defaultdict(int)
+        self._upload_cursor = 0
+
+    def _add_to_index(self, interaction: Dict[str, Any]):
+        if interaction["kind"] == KIND_LLM:
+            self._index[MATCH_EXACT][interaction["fingerprint"]].append(interaction)
+            self._index[MATCH_RELAXED][interaction["relaxed_fingerprint"]].append(interaction)
+        else:
+            self._uploads.setdefault(interaction["sha"], interaction["url"])
+            self._upload_order.append(interaction)
+
+    @contextmanager
+    def _locked_file(self, mode: str) -> Iterator[Any]:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, mode, encoding="utf-8") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH if mode == "r" else fcntl.LOCK_EX)
+            try:
+                yield f
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _append(self, interaction: Dict[str, Any]):
+        """Append an interaction to the file (re-read under the lock: other workers may have recorded meanwhile)."""
+        with self._locked_file("a+") as f:
+            f.seek(0)
+            content = f.read()
+            try:
+                data = json.loads(content) if content else {}
+            except json.JSONDecodeError:
+                data = {}
+            data.setdefault("version", CASSETTE_VERSION)
+            data.setdefault("interactions", []).append(interaction)
+            f.seek(0)
+            f.truncate()
+            json.dump(data, f, indent=1, ensure_ascii=False, default=str)
+            f.flush()
+        with self._lock:
+            self._add_to_index(interaction)
+            self.stats["recorded"] += 1
+
+    def _next(self, fingerprint_kind: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        candidates = self._index[fingerprint_kind].get(fingerprint)
+        if not candidates:
+            return None
+        cursor_key = f"{fingerprint_kind}:{fingerprint}"
+        position = self._cursors[cursor_key]
+        self._cursors[cursor_key] = position + 1
+        # Past the last recording the last response is replayed again
+        return candidates[min(position, len(candidates) - 1)]
+
+    def _wait(self, recorded_latency: float):
+        """Replay the recorded latency (scaled), bounded by the keyword time budget."""
+        latency = recorded_latency * self.latency_factor
+        deadline = current_deadline()
+        if deadline is not None:
+            latency = min(latency, max(0.0, deadline.remaining()))
+        if latency > 0:
+            time.sleep(latency)
+        check_deadline()
+        with self._lock:
+            self.stats["recorded_latency_s"] += recorded_latency
+            self.stats["replayed_latency_s"] += latency
+
+    # LLM completions
+    def find_completion(self, fingerprints: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """Recorded formatted response of the request (after its replayed latency), None when not recorded."""
+        with self._lock:
+            interaction = self._next(MATCH_EXACT, fingerprints[MATCH_EXACT])
+            hit = "hits"
+            if interaction is None and self.match == MATCH_RELAXED:
+                interaction = self._next(MATCH_RELAXED, fingerprints[MATCH_RELAXED])
+                hit = "relaxed_hits"
+            self.stats[hit if interaction is not None else "misses"] += 1
+        if interaction is None:
+            return None
+        self._wait(interaction.get("latency", 0.0))
+        return dict(interaction["response"])
+
+    def record_completion(self, fingerprints: Dict[str, str], provider: str, model: Optional[str],
+                          messages: List[Dict[str, Any]], response: Dict[str, Any], latency: float):
+        self._append({
+            "kind": KIND_LLM,
+            "fingerprint": fingerprints[MATCH_EXACT],
+            "relaxed_fingerprint": fingerprints[MATCH_RELAXED],
+            "provider": provider,
+            "model": model,
+            # Kept for humans reading the cassette: images are replaced by their digest
+            "request": json.loads(elide_payloads(_canonical(messages))),
+            "response": response,
+            "latency": round(latency, 4),
+            "recorded_at": time.time(),
+        })
+
+    # Image uploads
+    def find_upload(self, sha: str) -> Optional[str]:
+        with self._lock:
+            url = self._uploads.get(sha)
+            interaction = None
+            if url is not None:
+                self.stats["hits"] += 1
+                interaction = next(item for item in self._upload_order if item["sha"] == sha)
+            elif self.match == MATCH_RELAXED and self._upload_order:
+                interaction = self._upload_order[min(self._upload_cursor, len(self._upload_order) - 1)]
+                self._upload_cursor += 1
+                url = interaction["url"]
+                self.stats["relaxed_hits"] += 1
+            else:
+                self.stats["misses"] += 1
+        if interaction is not None:
+            self._wait(interaction.get("latency", 0.0))
+        return url
+
+    def record_upload(self, sha: str, size: int, url: Optional[str], latency: float):
+        if url is None:
+            return
+        self._append({"kind": KIND_UPLOAD, "sha": sha, "bytes": size, "url": url,
+                      "latency": round(latency, 4), "recorded_at": time.time()})
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["recorded_latency_s"] = round(stats["recorded_latency_s"], 3)
+        stats["replayed_latency_s"] = round(stats["replayed_latency_s"], 3)
+        return {"path": self.path, "mode": self.mode, "match": self.match, **stats}
+
+
+class CassetteSettings:
+    """Process-wide cassette selection: AIHELPER_CASSETTE_* by default, changed by `Use Cassette`."""
+
+    mode: str = Config.CASSETTE_MODE
+    name: str = Config.CASSETTE_NAME
+    directory: str = Config.CASSETTE_DIR
+    match: str = Config.CASSETTE_MATCH
+    latency: str = Config.CASSETTE_LATENCY
+
+    @classmethod
+    def path(cls) -> str:
+        directory = cls.directory or os.path.join(os.getcwd(), "cassettes")
+        name = cls.name if cls.name.endswith(".json") else f"{cls.name}.json"
+        return os.path.join(directory, name)
+
+
+def active_cassette() -> Optional[Cassette]:
+    """Cassette the clients and uploaders built now are wrapped with, None when cassettes are off."""
+    if CassetteSettings.mode == MODE_OFF:
+        return None
+    return Cassette.get(CassetteSettings.path(), CassetteSettings.mode, CassetteSettings.match, CassetteSettings.latency)
@@ -0,0 +1,189 @@
+"""
+Time budgets propagated from the Robot keywords down to every network call.
+
+A keyword opens a `deadline_scope(budget)`; the Deadline is kept in a
+contextvar so that the prompt factory, the image uploaders and the LLM clients
+pick it up without extra parameters. Work is split in stages (capture, upload,
+llm): capture and upload may only use their share of the budget, the llm stage
+gets whatever is left. `request_timeout()` turns the remaining time into the
+`timeout` of the SDK / HTTP call, and an exhausted budget raises
+DeadlineExceeded naming the stage that overran.
+"""
+import contextvars
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+from src.AiHelper.config.config import Config
+
+STAGE_CAPTURE = "capture"
+STAGE_UPLOAD = "upload"
+STAGE_LLM = "llm"
+
+# Share of the whole budget a single capture or upload may use, the llm stage is not capped
+STAGE_SHARES: Dict[str, float] = {STAGE_CAPTURE: 0.2, STAGE_UPLOAD: 0.2}
+
+# Never hand a timeout smaller than this to a client: it would only produce confusing errors
+MIN_REQUEST_TIMEOUT = 0.5
+
+
+class DeadlineExceeded(TimeoutError):
+    """The time budget of a keyword is exhausted."""
+
+    # Robot Framework reports the message without the exception name
+    ROBOT_SUPPRESS_NAME = True
+
+    def __init__(self, deadline: "Deadline", stage: Optional[str] = None):
+        self.stage = stage or deadline.current_stage or "unknown"
+        self.budget = deadline.budget
+        self.elapsed = deadline.elapsed()
+        self.stages = dict(deadline.stage_times)
+        spent = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.stages.items())
+        super().__init__(
+            f"Time budget of {self.budget:.1f}s exceeded during stage '{self.stage}' "
+            f"(elapsed {self.elapsed:.2f}s{'; ' + spent if spent else ''})"
+        )
+
+
+class Deadline:
+
+    def __init__(self, budget: float):
+        """
+        Args:
+            budget: Time budget in seconds, starting now
+        """
+        self.budget = float(budget)
+        self.start = time.monotonic()
+        self.expires_at = self.start + self.budget
+        self.stage_times: Dict[str, float] = {}
+        self.current_stage: Optional[str] = None
+        self._stage_expires_at: Optional[float] = None
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    def remaining(self) -> float:
+        """Seconds left for the current stage (its own share, bounded by the whole budget)."""
+        expires_at = self.expires_at
+        if self._stage_expires_at is not None:
+            expires_at = min(expires_at, self._stage_expires_at)
+        return expires_at - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, stage: Optional[str] = None):
+        """Raise DeadlineExceeded when the budget (or the stage share) is exhausted."""
+        if self.expired:
+            raise DeadlineExceeded(self, stage)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator["Deadline"]:
+        """
+        Run a block as stage `name`: its time is recorded, and the block fails with
+        DeadlineExceeded if it ends after its share of the budget.
+        """
+        self.check(name)
+        previous_stage, previous_expires_at = self.current_stage, self._stage_expires_at
+        started = time.monotonic()
+        self.current_stage = name
+        share = STAGE_SHARES.get(name)
+        self._stage_expires_at = started + share * self.budget if share is not None else None
+        try:
+            yield self
+        except Exception as e:
+            self._record(name, started)
+            if self.expired and not isinstance(e, DeadlineExceeded):
+                # A client timeout caused by the budget: report the budget, not the transport error
+                raise DeadlineExceeded(self, name) from e
+            raise
+        else:
+            self._record(name, started)
+            self.check(name)
+        finally:
+            self.current_stage, self._stage_expires_at = previous_stage, previous_expires_at
+
+    def _record(self, name: str, started: float):
+        self.stage_times[name] = self.stage_times.get(name, 0.0) + time.monotonic() - started
+
+
+_current: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("aihelper_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(budget: Optional[float]) -> Iterator[Optional[Deadline]]:
+    """
+    Make a Deadline of `budget` seconds current for the block.
+    A nested scope keeps the outer deadline unless its own budget is tighter;
+    `budget=None` (or <= 0) without an outer deadline is a no-op.
+    """
+    outer = _current.get()
+    if budget is not None and float(budget) <= 0:
+        budget = None
+    if budget is None or (outer is not None and float(budget) >= outer.remaining()):
+        yield outer
+        return
+    token = _current.set(Deadline(float(budget)))
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def deadline_stage(name: str) -> Iterator[Optional[Deadline]]:
+    """`Deadline.stage` of the current deadline, no-op when none is set."""
+    deadline = _current.get()
+    if deadline is None:
+        yield None
+        return
+    with deadline.stage(name):
+        yield deadline
+
+
+def request_timeout(default: Optional[float]) -> Optional[float]:
+    """
+    Timeout to give to the next SDK / HTTP call: `default` bounded by the current deadline.
+
+    Raises:
+        DeadlineExceeded: when nothing is left of the budget
+    """
+    deadline = _current.get()
+    if deadline is None:
+        return default
+    deadline.check()
+    remaining = max(MIN_REQUEST_TIMEOUT, deadline.remaining())
+    return min(default, remaining) if default else remaining
+
+
+def check_deadline():
+    """Raise DeadlineExceeded if the current deadline (if any) is exhausted."""
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.check()
+
+
+def keyword_budget(timeout: Optional[float]) -> Optional[float]:
+    """Time budget of a keyword: its `timeout` argument, or AIHELPER_KEYWORD_TIMEOUT (0 = no budget)."""
+    budget = float(timeout) if timeout is not None else Config.KEYWORD_TIMEOUT
+    return budget if budget > 0 else None
+
+
+def with_time_budget(method: Callable) -> Callable:
+    """Run a keyword method inside a deadline_scope built from its `timeout` argument."""
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        timeout = signature.bind(*args, **kwargs).arguments.get("timeout")
+        with deadline_scope(keyword_budget(timeout)):
+            return method(*args, **kwargs)
+
+    return wrapper
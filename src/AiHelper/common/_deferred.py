@@ -0,0 +1,74 @@
+"""
+Per-test report of the deferred verifications (see providers.llm._batch).
+
+Deferred verdicts arrive in the suite teardown (`Collect Deferred Verifications`),
+after the tests ended and were written to output.xml: failing the teardown would
+fail every test of the suite. DeferredVerificationListener, a global listener,
+rewrites output.xml once it is closed instead: every test whose deferred
+verification failed is marked FAIL with the verdict, the others keep their status.
+Log and report are generated from the rewritten file (and pabot merges the
+rewritten outputs of its workers).
+
+    robot --listener src.AiHelper.DeferredVerificationListener tests/
+    pabot --listener src.AiHelper.DeferredVerificationListener tests/
+
+A verdict whose test is not in the output of the process (a test of the suite
+run by another worker) is reported in the execution errors of the log.
+"""
+import threading
+from datetime import datetime
+from typing import Dict, List
+
+
+class DeferredVerdicts:
+    """Failed deferred verifications of the process, per test full name, until the listener reports them."""
+
+    _lock = threading.Lock()
+    _failed: Dict[str, List[str]] = {}
+
+    @classmethod
+    def record(cls, test_full_name: str, message: str):
+        with cls._lock:
+            cls._failed.setdefault(test_full_name, []).append(message)
+
+    @classmethod
+    def pop_all(cls) -> Dict[str, List[str]]:
+        with cls._lock:
+            failed, cls._failed = cls._failed, {}
+            return failed
+
+
+class DeferredVerificationListener:
+    """Global listener marking the tests whose deferred verification failed (see the module docstring)."""
+
+    ROBOT_LISTENER_API_VERSION = 3
+    # Whether the listener is registered in this process: `Collect Deferred Verifications` leaves the failures to it
+    active = False
+
+    def __init__(self):
+        DeferredVerificationListener.active = True
+
+    def output_file(self, path: str):
+        failed = DeferredVerdicts.pop_all()
+        if failed:
+            self.report(path, failed)
+
+    @staticmethod
+    def report(path: str, failed: Dict[str, List[str]]):
+        """ mark the tests of `failed` as failed in the output file `path` """
+        from robot.api import ExecutionResult
+        from robot.result import Message
+
+        result = ExecutionResult(path)
+        for test in result.suite.all_tests:
+            messages = failed.pop(getattr(test, "full_name", None) or test.longname, None)
+            if not messages:
+                continue
+            message = "\n".join(messages)
+            test.message = f"{test.message}\n\n{message}" if test.status == "FAIL" and test.message else message
+            test.status = "FAIL"
+        for name, messages in failed.items():
+            for message in messages:
+                result.errors.messages.append(Message(f"Test '{name}' is not in this output: {message}", "WARN",
+                                                      timestamp=datetime.now()))
+        result.save()
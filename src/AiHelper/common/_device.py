@@ -0,0 +1,301 @@
+"""
+Per-session device profile: window size, screenshot size, density and orientation.
+
+Reading the window size and the capabilities costs a round trip to the Appium
+server each. The profile is read once per session and shared by the bbox to
+tap conversion, the screenshot preprocessing and the evidence store.
+
+Bboxes returned by OmniParser / the LLM are fractions of the screenshot, and
+screenshot pixels are not tap coordinates on every device:
+
+    - Android taps are in physical pixels. The screenshot covers the whole
+      display (system bars included) while the window size may exclude the
+      navigation bar: the screenshot size is the reference.
+    - iOS taps are in points. The screenshot is `scale` times larger than the
+      window (3x on recent iPhones): the window size is the reference.
+
+The profile of a session is dropped when the screen rotates or another app
+comes to the front. Both are seen without extra round trips, on what the
+library captures anyway: screenshots (width and height swapped) and the UI XML
+(rotation and package of the Android root, name and size of the iOS
+application element).
+"""
+import re
+import threading
+from dataclasses import asdict, dataclass, replace
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from src.AiHelper.common._logger import RobotCustomLogger
+from src.AiHelper.common._screenshot import Screenshot
+from src.AiHelper.config.config import Config
+
+PORTRAIT = "PORTRAIT"
+LANDSCAPE = "LANDSCAPE"
+
+INVALIDATED_ROTATION = "rotation"
+INVALIDATED_APP_SWITCH = "app_switch"
+INVALIDATED_MANUAL = "manual"
+
+# The state is read on the root of the UI XML only
+_HEADER_CHARS = 4096
+_ANDROID_ROOT = re.compile(r'<hierarchy\b[^>]*?\brotation="(\d)"')
+_ANDROID_PACKAGE = re.compile(r'\bpackage="([^"]+)"')
+_IOS_APP = re.compile(r'<XCUIElementTypeApplication\b[^>]*?\bname="([^"]*)"[^>]*?\bwidth="(\d+)"[^>]*?\bheight="(\d+)"')
+
+
+def _orientation(width: int, height: int) -> str:
+    return LANDSCAPE if width > height else PORTRAIT
+
+
+def _capability(capabilities: Dict[str, Any], name: str) -> Any:
+    value = capabilities.get(name)
+    return value if value is not None else capabilities.get(f"appium:{name}")
+
+
+def screen_state(ui_xml: str) -> Optional[Tuple[Optional[str], str]]:
+    """
+    Args:
+        ui_xml: Appium page source
+
+    Returns:
+        (foreground app, orientation) read on the root of the UI XML, None when it is not recognised
+    """
+    head = ui_xml[:_HEADER_CHARS]
+    match = _IOS_APP.search(head)
+    if match:
+        return match.group(1) or None, _orientation(int(match.group(2)), int(match.group(3)))
+    match = _ANDROID_ROOT.search(head)
+    if match:
+        package = _ANDROID_PACKAGE.search(head)
+        # Surface.ROTATION_90 / ROTATION_270
+        return package.group(1) if package else None, LANDSCAPE if match.group(1) in ("1", "3") else PORTRAIT
+    return None
+
+
+@dataclass(frozen=True)
+class DeviceProfile:
+    session_id: str
+    platform: str
+    device_name: Optional[str]
+    window_width: int
+    window_height: int
+    orientation: str
+    # Android physical display (deviceScreenSize capability), in the current orientation
+    display_width: Optional[int] = None
+    display_height: Optional[int] = None
+    # Known once a screenshot of the session was seen
+    screenshot_width: Optional[int] = None
+    screenshot_height: Optional[int] = None
+    # pixelRatio / deviceScreenDensity capability
+    pixel_ratio: Optional[float] = None
+    app: Optional[str] = None
+
+    @property
+    def density(self) -> float:
+        """Pixels per point (dp on Android): capability, else measured on a screenshot (iOS), else 1"""
+        if self.pixel_ratio:
+            return self.pixel_ratio
+        if self.platform == "ios" and self.screenshot_width:
+            return round(self.screenshot_width / self.window_width, 3)
+        return 1.0
+
+    @property
+    def tap_size(self) -> Tuple[int, int]:
+        """Size of the screen in tap coordinates: physical pixels on Android, points on iOS"""
+        if self.platform == "android":
+            if self.screenshot_width:
+                return self.screenshot_width, self.screenshot_height
+            if self.display_width:
+                return self.display_width, self.display_height
+        return self.window_width, self.window_height
+
+    def tap_point(self, bbox: Sequence[float]) -> Tuple[int, int]:
+        """
+        Args:
+            bbox: [x1, y1, x2, y2] as fractions (0-1) of the screenshot
+
+        Returns:
+            Tap coordinates of the center of the bbox
+        """
+        x1, y1, x2, y2 = bbox
+        width, height = self.tap_size
+        return int((x1 + x2) / 2 * width), int((y1 + y2) / 2 * height)
+
+    def to_tap(self, x: float, y: float) -> Tuple[int, int]:
+        """Tap coordinates of a pixel of the screenshot"""
+        if not self.screenshot_width:
+            raise ValueError(f"No screenshot of session {self.session_id} seen yet: its pixel size is unknown")
+        width, height = self.tap_size
+        return int(x * width / self.screenshot_width), int(y * height / self.screenshot_height)
+
+    def scaled_width(self, factor: float) -> Optional[int]:
+        """Width of a screenshot copy reduced by `factor` (None before the first screenshot)"""
+        return max(1, int(self.screenshot_width / factor)) if self.screenshot_width else None
+
+    def as_dict(self) -> Dict[str, Any]:
+        profile = asdict(self)
+        profile["density"] = self.density
+        profile["tap_size"] = list(self.tap_size)
+        return profile
+
+
+class DeviceProfiles:
+    """Singleton cache of the device profiles, per Appium session id."""
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self.logger = RobotCustomLogger()
+        self._lock = threading.Lock()
+        self._profiles: Dict[str, DeviceProfile] = {}
+        self.stats = {"built": 0, "hits": 0, "invalidated": {}}
+        self._initialized = True
+
+    @staticmethod
+    def _session(driver) -> str:
+        return str(getattr(driver, "session_id", None) or id(driver))
+
+    def get(self, driver, screenshot: Optional[Screenshot] = None) -> DeviceProfile:
+        """
+        Args:
+            driver: Appium driver of the session
+            screenshot: Screenshot just taken on the session, its size completes (or invalidates) the profile
+
+        Returns:
+            Profile of the session, read from the driver only when it is not cached
+        """
+        session = self._session(driver)
+        profile = self.observe_screenshot(driver, screenshot) if screenshot is not None else self._cached(session)
+        if profile is not None and Config.DEVICE_PROFILE_CACHE:
+            with self._lock:
+                self.stats["hits"] += 1
+            return profile
+        return self._build(driver, session, screenshot)
+
+    def _cached(self, session: str) -> Optional[DeviceProfile]:
+        with self._lock:
+            return self._profiles.get(session)
+
+    def _build(self, driver, session: str, screenshot: Optional[Screenshot]) -> DeviceProfile:
+        size = driver.get_window_size()
+        capabilities = driver.capabilities or {}
+        width, height = int(size["width"]), int(size["height"])
+        orientation = _orientation(width, height)
+
+        display = _capability(capabilities, "deviceScreenSize")
+        display_width = display_height = None
+        if display:
+            display_width, display_height = (int(v) for v in str(display).lower().split("x"))
+            if _orientation(display_width, display_height) != orientation:
+                display_width, display_height = display_height, display_width
+
+        pixel_ratio = _capability(capabilities, "pixelRatio")
+        dpi = _capability(capabilities, "deviceScreenDensity")
+        if not pixel_ratio and dpi:
+            pixel_ratio = int(dpi) / 160
+
+        screenshot_width = screenshot_height = None
+        if screenshot is not None:
+            screenshot_width, screenshot_height = screenshot.size
+            if _orientation(screenshot_width, screenshot_height) != orientation:
+                # Rotated between the capture and the window size request: the next screenshot completes it
+                screenshot_width = screenshot_height = None
+
+        profile = DeviceProfile(
+            session_id=session,
+            platform=str(_capability(capabilities, "platformName") or "").lower(),
+            device_name=_capability(capabilities, "deviceName"),
+            window_width=width,
+            window_height=height,
+            orientation=orientation,
+            display_width=display_width,
+            display_height=display_height,
+            screenshot_width=screenshot_width,
+            screenshot_height=screenshot_height,
+            pixel_ratio=float(pixel_ratio) if pixel_ratio else None,
+        )
+        with self._lock:
+            self._profiles[session] = profile
+            self.stats["built"] += 1
+        self.logger.info(f"Device profile of session {session}: {profile.device_name} ({profile.platform}) window "
+                         f"{width}x{height} {orientation}, tap size {profile.tap_size}, density {profile.density}")
+        self._store_evidence(profile)
+        return profile
+
+    def _store_evidence(self, profile: DeviceProfile):
+        if not Config.EVIDENCE_STORE:
+            return
+        try:
+            from src.AiHelper.common._utils import Utilities
+            Utilities._link_json_to_log(profile.as_dict(), "Device profile")
+        except Exception as e:
+            # Outside a Robot Framework run (no log to link it from)
+            self.logger.debug(f"Device profile not stored as evidence: {e}")
+
+    def observe_screenshot(self, driver, screenshot: Screenshot) -> Optional[DeviceProfile]:
+        """
+        Completes the cached profile with the size of a screenshot, drops it when the size shows a rotation.
+
+        Returns:
+            The cached profile, None when there is none (anymore)
+        """
+        session = self._session(driver)
+        profile = self._cached(session)
+        if profile is None:
+            return None
+        size = screenshot.size
+        if (profile.screenshot_width, profile.screenshot_height) == size:
+            return profile
+        if _orientation(*size) != profile.orientation:
+            self.invalidate(driver, INVALIDATED_ROTATION)
+            return None
+        profile = replace(profile, screenshot_width=size[0], screenshot_height=size[1])
+        with self._lock:
+            self._profiles[session] = profile
+        return profile
+
+    def observe_page_source(self, driver, ui_xml: str) -> Optional[DeviceProfile]:
+        """
+        Drops the cached profile when the UI XML shows a rotation or another foreground app.
+
+        Returns:
+            The cached profile, None when there is none (anymore)
+        """
+        session = self._session(driver)
+        profile = self._cached(session)
+        state = screen_state(ui_xml) if profile is not None else None
+        if state is None:
+            return profile
+        app, orientation = state
+        if orientation != profile.orientation:
+            self.invalidate(driver, INVALIDATED_ROTATION)
+            return None
+        if app and profile.app and app != profile.app:
+            self.invalidate(driver, INVALIDATED_APP_SWITCH)
+            return None
+        if app and not profile.app:
+            profile = replace(profile, app=app)
+            with self._lock:
+                self._profiles[session] = profile
+        return profile
+
+    def invalidate(self, driver=None, reason: str = INVALIDATED_MANUAL):
+        """Drops the profile of the session of `driver`, or every profile"""
+        with self._lock:
+            if driver is None:
+                dropped = len(self._profiles)
+                self._profiles = {}
+            else:
+                dropped = 1 if self._profiles.pop(self._session(driver), None) else 0
+            if dropped:
+                self.stats["invalidated"][reason] = self.stats["invalidated"].get(reason, 0) + dropped
+        if dropped:
+            self.logger.info(f"Device profile dropped ({reason})")
@@ -0,0 +1,145 @@
+"""
+Content-addressed evidence store for screenshots and UI XML.
+
+Instead of inlining base64 PNGs into log.html / output.xml, evidence is
+written once under `<log dir>/evidence/` with its SHA-256 as file name
+(identical screenshots are stored once), UI XML is gzip-compressed, and a
+small thumbnail is generated for the log. The log only gets an
+`<a href><img src></a>` link relative to log.html.
+
+With pabot, copy the evidence of the workers next to the merged log with
+`--artifacts png,gz --artifactsinsubfolders`.
+"""
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Union
+
+from src.AiHelper.common._logger import RobotCustomLogger
+from src.AiHelper.common._screenshot import Screenshot
+
+EVIDENCE_DIRNAME = "evidence"
+
+
+@dataclass
+class EvidenceRecord:
+    sha: str
+    path: str
+    size: int
+    thumbnail_path: Optional[str] = None
+    deduplicated: bool = False
+
+
+class EvidenceStore:
+    """One store per output directory, shared by every AiHelper instance of the process."""
+
+    _stores: Dict[str, "EvidenceStore"] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+        self.root = os.path.join(base_dir, EVIDENCE_DIRNAME)
+        self.logger = RobotCustomLogger()
+        self.stats = {"stored": 0, "deduplicated": 0, "bytes_written": 0, "bytes_saved": 0}
+        os.makedirs(os.path.join(self.root, "thumbs"), exist_ok=True)
+
+    @classmethod
+    def for_output_dir(cls, base_dir: Optional[str] = None) -> "EvidenceStore":
+        """Store of the Robot log directory (temp dir outside a Robot run)."""
+        if base_dir is None:
+            base_dir = cls._resolve_base_dir()
+        with cls._lock:
+            if base_dir not in cls._stores:
+                cls._stores[base_dir] = cls(base_dir)
+            return cls._stores[base_dir]
+
+    @staticmethod
+    def _resolve_base_dir() -> str:
+        try:
+            from src.AiHelper.common._utils import Utilities
+            return Utilities._get_log_dir()
+        except Exception:
+            return tempfile.gettempdir()
+
+    @staticmethod
+    def _digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def _write_once(self, path: str, data: bytes) -> bool:
+        """Write `data` atomically unless the file already exists. Returns False for a duplicate."""
+        if os.path.exists(path):
+            self.stats["deduplicated"] += 1
+            self.stats["bytes_saved"] += len(data)
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.stats["stored"] += 1
+        self.stats["bytes_written"] += len(data)
+        return True
+
+    def store_image(self, image: Union[str, bytes, Screenshot], thumbnail_width: Optional[int] = 200) -> EvidenceRecord:
+        """
+        Store a PNG screenshot.
+
+        Args:
+            image: Screenshot, base64 string or raw PNG bytes
+            thumbnail_width: Width of the generated thumbnail, None for no thumbnail
+
+        Returns:
+            EvidenceRecord with the paths of the image and of its thumbnail
+        """
+        if isinstance(image, Screenshot):
+            screenshot = image
+        else:
+            screenshot = Screenshot.from_base64(image) if isinstance(image, str) else Screenshot(image)
+        # The hash is cached on the screenshot (also used by the cassette uploader)
+        sha = screenshot.sha256
+        path = os.path.join(self.root, sha[:2], f"{sha}.png")
+        written = self._write_once(path, screenshot.data)
+        record = EvidenceRecord(sha=sha, path=path, size=screenshot.nbytes, deduplicated=not written)
+        if thumbnail_width:
+            record.thumbnail_path = self._thumbnail(sha, screenshot, int(thumbnail_width))
+        return record
+
+    def store_xml(self, xml: str) -> EvidenceRecord:
+        """Store a UI XML dump, gzip compressed."""
+        data = xml.encode("utf-8")
+        sha = self._digest(data)
+        path = os.path.join(self.root, sha[:2], f"{sha}.xml.gz")
+        # mtime=0: the same XML always gives the same compressed bytes
+        written = self._write_once(path, gzip.compress(data, compresslevel=6, mtime=0))
+        return EvidenceRecord(sha=sha, path=path, size=len(data), deduplicated=not written)
+
+    def store_json(self, data: Dict[str, Any]) -> EvidenceRecord:
+        """Store a JSON document (device profile...), keys sorted: the same data is stored once."""
+        encoded = json.dumps(data, sort_keys=True, indent=2).encode("utf-8")
+        sha = self._digest(encoded)
+        path = os.path.join(self.root, sha[:2], f"{sha}.json")
+        written = self._write_once(path, encoded)
+        return EvidenceRecord(sha=sha, path=path, size=len(encoded), deduplicated=not written)
+
+    def _thumbnail(self, sha: str, screenshot: Screenshot, width: int) -> Optional[str]:
+        path = os.path.join(self.root, "thumbs", f"{sha}_{width}.png")
+        if os.path.exists(path):
+            return path
+        try:
+            thumbnail = screenshot.resized(width, optimize=True)
+            if thumbnail is screenshot:
+                return None
+            self._write_once(path, thumbnail.data)
+            return path
+        except Exception as e:
+            # No thumbnail (Pillow missing or unreadable image): the log shows the full image scaled down
+            self.logger.debug(f"Could not generate a thumbnail for {sha}: {e}")
+            return None
+
+    def relative(self, path: str) -> str:
+        """Path usable as href/src in log.html (which lives in base_dir)."""
+        return os.path.relpath(path, self.base_dir).replace(os.sep, "/")
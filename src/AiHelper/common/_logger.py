@@ -1,12 +1,89 @@
+import atexit
+import hashlib
 import logging
+import logging.handlers
 import os
+import queue
+import re
 import tempfile
 from datetime import datetime
-from typing import Optional
+from typing import Callable, Optional, Union
+
+from src.AiHelper.config.config import Config
+
+# A message is either a string or a callable returning it, formatted only if the level is enabled.
+# The callable runs later in the writer thread: it must not capture objects mutated after the call
+Message = Union[str, Callable[[], str]]
+
+# data URLs and long bare base64 runs (screenshots) are replaced by a short digest
+_DATA_URL_PATTERN = re.compile(r"data:image/[a-zA-Z0-9.+-]+;base64,\s*([A-Za-z0-9+/=]+)")
+_BASE64_PATTERN = re.compile(r"[A-Za-z0-9+/]{512,}={0,2}")
+
+_SECRET_PATTERNS = [
+    re.compile(r"sk-(?:ant-|proj-)?[A-Za-z0-9_-]{16,}"),  # OpenAI / Anthropic / DeepSeek
+    re.compile(r"AIza[0-9A-Za-z_-]{30,}"),  # Google
+    re.compile(r"(?i)(bearer\s+)[A-Za-z0-9._~+/-]{16,}=*"),
+    re.compile(r"(?i)((?:api[_-]?key|x-magicapi-key|x-api-key|authorization)['\"]?\s*[:=]\s*['\"]?)[^'\"\s,}]{8,}"),
+]
+_SECRET_CONFIG_KEYS = ("OPENAI_API_KEY", "ANTHROPIC_API_KEY", "GEMINI_API_KEY", "DEEPSEEK_API_KEY",
+                       "IMGBB_API_KEY", "FREEIMAGEHOST_API_KEY", "MAGICAPI_KEY")
+_REDACTED = "***"
+
+
+def _image_digest(payload: str) -> str:
+    data = payload.strip()
+    digest = hashlib.sha256(data.encode("ascii", "ignore")).hexdigest()[:12]
+    return f"<image sha={digest} bytes={len(data) * 3 // 4 - data.count('=')}>"
+
+
+def elide_payloads(message: str) -> str:
+    """Replace base64 images by `<image sha=... bytes=...>` digests."""
+    if len(message) < 512:
+        return message
+    message = _DATA_URL_PATTERN.sub(lambda match: _image_digest(match.group(1)), message)
+    return _BASE64_PATTERN.sub(lambda match: _image_digest(match.group(0)), message)
+
+
+def redact_secrets(message: str) -> str:
+    """Mask the configured API keys and anything that looks like a credential."""
+    for key in _SECRET_CONFIG_KEYS:
+        secret = getattr(Config, key, "")
+        if secret and len(secret) >= 8 and secret in message:
+            message = message.replace(secret, _REDACTED)
+    for pattern in _SECRET_PATTERNS:
+        message = pattern.sub(lambda match: (match.group(1) if match.groups() else "") + _REDACTED, message)
+    return message
+
+
+def sanitize(message: str) -> str:
+    return redact_secrets(elide_payloads(message))
+
+
+class _LazyMessage:
+    """Formats, elides and redacts the message only when a handler writes it (in the writer thread)."""
+
+    __slots__ = ("_message", "_icon")
+
+    def __init__(self, message: Message, icon: str):
+        self._message = message
+        self._icon = icon
+
+    def __str__(self) -> str:
+        message = self._message() if callable(self._message) else str(self._message)
+        message = sanitize(message)
+        return f"{self._icon} {message}" if self._icon else message
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread instead of the caller."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
 
 class RobotCustomLogger:
 
-    
+
     _instance: Optional['RobotCustomLogger'] = None
     _default_filename = "custom_logger.log"
     _icons = {
@@ -19,6 +96,13 @@ class RobotCustomLogger:
         'brain': '🧠',
         'start': '🚀'
     }
+    _levels = {
+        'info': logging.INFO,
+        'error': logging.ERROR,
+        'success': logging.INFO,
+        'debug': logging.DEBUG,
+        'warning': logging.WARNING,
+    }
 
     def __new__(cls):
         if cls._instance is None:
@@ -29,25 +113,46 @@ class RobotCustomLogger:
     def __init__(self):
         if not self._initialized:
             self.logger = logging.getLogger("CustomLogger")
-            self.logger.setLevel(logging.DEBUG)
+            level = logging.getLevelName(Config.LOG_LEVEL.upper())
+            # getLevelName returns the string "Level X" for an unknown name
+            self.logger.setLevel(level if isinstance(level, int) else logging.INFO)
             self.logger.propagate = False
             self._log_path: Optional[str] = None
-            self._handler: Optional[logging.FileHandler] = None
+            self._handler: Optional[logging.Handler] = None
+            self._listener: Optional[logging.handlers.QueueListener] = None
             self._initialized = True
 
     def ensure_handler(self):
         if not self._handler:
             self._log_path = self._resolve_log_path()
             os.makedirs(os.path.dirname(self._log_path), exist_ok=True)
-            
-            self._handler = logging.FileHandler(self._log_path)
+
+            # The file is written by a background thread, size-bounded with rotation
+            file_handler = logging.handlers.RotatingFileHandler(
+                self._log_path,
+                maxBytes=Config.LOG_MAX_BYTES,
+                backupCount=Config.LOG_BACKUP_COUNT,
+                encoding="utf-8",
+            )
             formatter = logging.Formatter(
                 '%(asctime)s [%(levelname)s] %(message)s',
                 datefmt='%Y-%m-%d %H:%M:%S'
             )
-            self._handler.setFormatter(formatter)
+            file_handler.setFormatter(formatter)
+            self._listener = logging.handlers.QueueListener(queue.SimpleQueue(), file_handler)
+            self._listener.start()
+            atexit.register(self._listener.stop)
+            self._handler = _DeferredQueueHandler(self._listener.queue)
             self.logger.addHandler(self._handler)
 
+    def flush(self):
+        """Write every queued record (the listener is restarted so that logging can go on)."""
+        if self._listener is not None:
+            self._listener.stop()
+            for handler in self._listener.handlers:
+                handler.flush()
+            self._listener.start()
+
     def _resolve_log_path(self) -> str:
         try:
             from robot.libraries.BuiltIn import BuiltIn
@@ -66,7 +171,7 @@ class RobotCustomLogger:
         for base_dir in candidates:
             if not base_dir:
                 continue
-                
+
             try:
                 test_path = os.path.join(base_dir, self._default_filename)
                 os.makedirs(os.path.dirname(test_path), exist_ok=True)
@@ -78,31 +183,39 @@ class RobotCustomLogger:
 
         return os.path.join(tempfile.gettempdir(), self._default_filename)
 
-    def info(self, message: str, robot_log: bool = False):
+    def is_enabled(self, level: str) -> bool:
+        return self.logger.isEnabledFor(self._levels.get(level, logging.INFO))
+
+    def info(self, message: Message, robot_log: bool = False):
         self._log('info', message, robot_log)
 
-    def error(self, message: str, robot_log: bool = False):
+    def error(self, message: Message, robot_log: bool = False):
         self._log('error', message, robot_log)
 
-    def success(self, message: str, robot_log: bool = False):
+    def success(self, message: Message, robot_log: bool = False):
         self._log('success', message, robot_log)
 
-    def debug(self, message: str, robot_log: bool = False):
+    def debug(self, message: Message, robot_log: bool = False):
         self._log('debug', message, robot_log)
 
-    def warning(self, message: str, robot_log: bool = False):
+    def warning(self, message: Message, robot_log: bool = False):
         self._log('warning', message, robot_log)
 
-    def _log(self, level: str, message: str, robot_log: bool):
-        self.ensure_handler()
-        icon = self._icons.get(level, '')
-        full_message = f"{icon} {message}" if icon else message
-        
-        getattr(self.logger, level)(full_message)
-        
+    def _log(self, level: str, message: Message, robot_log: bool):
+        to_file = self.is_enabled(level)
+        if not to_file and not robot_log:
+            # Level gated: the message is never formatted
+            return
+
         if robot_log:
+            # The Robot log only accepts messages from the test thread: format here
+            message = sanitize(message() if callable(message) else str(message))
             self._robot_console_log(level, message)
 
+        if to_file:
+            self.ensure_handler()
+            self.logger.log(self._levels.get(level, logging.INFO), _LazyMessage(message, self._icons.get(level, '')))
+
     def _robot_console_log(self, level: str, message: str):
         try:
             from robot.api import logger
@@ -116,4 +229,4 @@ class RobotCustomLogger:
         if not self._log_path:
             self.ensure_handler()
         return str(self._log_path)
-    
\ No newline at end of file
+
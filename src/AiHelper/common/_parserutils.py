@@ -1,51 +1,30 @@
+from typing import Optional
+
+from src.AiHelper.common._device import DeviceProfiles
 from src.AiHelper.common._logger import RobotCustomLogger
+from src.AiHelper.common._screenshot import Screenshot
 
 
 class BBoxToClickCoordinates:
     def __init__(self):
         self.logger = RobotCustomLogger()
-        self.logger.info("--------------------------------")
-        self.logger.info("Initializing BBoxToClickCoordinates")
-        self.logger.info("--------------------------------")
-
-    def _convert_normalized_bbox_to_real_coordinates(self, bbox, screen_width, screen_height):
-        self.logger.info("coverting normalized bbox to real coordinates")
-        # les coordonnées normalisées rendu par omni parser sont dans l'ordre x1, y1, x2, y2
-        x1, y1, x2, y2 = bbox
-        
-        # le centre de la bbox
-        center_x = (x1 + x2) / 2
-        center_y = (y1 + y2) / 2
-        
-        # covertirn en pixels
-        real_x = int(center_x * screen_width)
-        real_y = int(center_y * screen_height)
 
-        self.logger.info(f"Converted normalized bbox to real coordinates: {real_x}, {real_y}")
-        return {'x': real_x, 'y': real_y}
-        
-    def _get_screen_dimensions(self, driver):
-        try:
-            screen_size = driver.get_window_size()
-            capabilities = driver.capabilities
-            device_name = capabilities.get('deviceName')
-            self.logger.info(f"device screen size: {screen_size} for device: {device_name}")
-            return screen_size['width'], screen_size['height']
-        except Exception as e:
-            print(f"Erreur lors de la récupération des dimensions de l'écran: {e}")
-            return None, None
-        
-    def get_real_coordinates(self, driver, bbox):
+    def get_real_coordinates(self, driver, bbox, screenshot: Optional[Screenshot] = None):
         """
-        Convertit les coordonnées normalisées en coordonnées réelles pour le clic.
-        
+        Convert a normalized bbox to the tap coordinates of its center.
+
+        The screen size comes from the device profile of the session (cached, see common._device):
+        no round trip to the Appium server once it is known.
+
         Args:
-            driver: Instance du driver Appium (car on get les dimensions de l'écran de DUT)
-            bbox: Liste [x1, y1, x2, y2] représentant la boîte englobante normalisée (0-1)
+            driver: Appium driver of the device under test
+            bbox: [x1, y1, x2, y2] normalized (0-1) bounding box, as returned by OmniParser
+            screenshot: Screenshot the bbox was found on, its pixel size completes the profile
+
+        Returns:
+            {'x': x, 'y': y} in tap coordinates (physical pixels on Android, points on iOS)
         """
-        self.logger.info(f"Getting real coordinates for bbox: {bbox}")
-        width, height = self._get_screen_dimensions(driver)
-        self.logger.info("--------------------------------")
-        self.logger.info(f"End of BBoxToClickCoordinates")
-        self.logger.info("--------------------------------")
-        return self._convert_normalized_bbox_to_real_coordinates(bbox, width, height)
\ No newline at end of file
+        profile = DeviceProfiles().get(driver, screenshot)
+        x, y = profile.tap_point(bbox)
+        self.logger.info(f"bbox {bbox} -> tap ({x}, {y}) on a {profile.tap_size[0]}x{profile.tap_size[1]} screen")
+        return {'x': x, 'y': y}
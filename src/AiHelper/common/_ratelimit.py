@@ -0,0 +1,338 @@
+"""
+Retry, backoff and rate limiting shared by every provider client.
+
+One token bucket per provider/model enforces the requests-per-minute (rpm)
+and tokens-per-minute (tpm) limits declared in llm_models.json. Bucket state
+lives in a small JSON file guarded by fcntl locks so that every pabot worker
+draws from the same budget, and a 429 seen by one worker (with its
+Retry-After delay) pauses the others too. With the sidecar (see _sidecar) the
+buckets are kept in its memory instead of the file. Failed calls are retried with
+jittered exponential backoff. Waits and retries that cannot finish within
+the keyword time budget (see _deadline) fail immediately instead.
+"""
+import email.utils
+import fcntl
+import json
+import random
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from src.AiHelper.common._deadline import DeadlineExceeded, current_deadline
+from src.AiHelper.common._logger import RobotCustomLogger
+from src.AiHelper.common._sidecar import via_sidecar
+from src.AiHelper.config.config import Config
+from src.AiHelper.config.model_config import ModelConfig
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+RETRYABLE_ERROR_NAMES = {
+    "RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError",
+    "OverloadedError", "ServiceUnavailable", "ResourceExhausted", "DeadlineExceeded",
+    "TooManyRequests", "Timeout", "ReadTimeout", "ConnectTimeout", "ConnectionError",
+}
+
+# Rough token cost of one image part, used before the provider reports the real usage
+IMAGE_TOKEN_ESTIMATE = 1000
+
+
+def estimate_request_tokens(messages: List[Dict[str, Any]], max_tokens: int = 0) -> int:
+    """Cheap estimate (4 characters per token) of the tokens a request will consume."""
+    characters = 0
+    images = 0
+    for message in messages or []:
+        content = message.get("content") if isinstance(message, dict) else message
+        if isinstance(content, str):
+            characters += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                if not isinstance(part, dict):
+                    characters += len(str(part))
+                elif part.get("type") in ("image_url", "image"):
+                    images += 1
+                else:
+                    characters += len(part.get("text", ""))
+    return characters // 4 + images * IMAGE_TOKEN_ESTIMATE + (max_tokens or 0)
+
+
+def get_status_code(error: Exception) -> Optional[int]:
+    for attribute in ("status_code", "code"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return value
+    return getattr(getattr(error, "response", None), "status_code", None)
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Delay in seconds requested by the server (retry-after-ms / retry-after headers)."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        # HTTP-date format
+        try:
+            retry_at = email.utils.parsedate_to_datetime(retry_after).timestamp()
+            return max(0.0, retry_at - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def is_retryable(error: Exception) -> bool:
+    status_code = get_status_code(error)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+
+def refill(state: Dict[str, Any], key: str, limits: Dict[str, int], now: float) -> Dict[str, Any]:
+    """Bucket `key` of `state` refilled up to `now` (created full)."""
+    rpm = limits.get("rpm") or 0
+    tpm = limits.get("tpm") or 0
+    entry = state.get(key)
+    if entry is None:
+        entry = {"requests": float(rpm), "tokens": float(tpm), "updated": now, "blocked_until": 0.0}
+    elapsed = max(0.0, now - entry["updated"])
+    entry["requests"] = min(float(rpm), entry["requests"] + elapsed * rpm / 60)
+    entry["tokens"] = min(float(tpm), entry["tokens"] + elapsed * tpm / 60)
+    entry["updated"] = now
+    state[key] = entry
+    return entry
+
+
+def take(state: Dict[str, Any], key: str, limits: Dict[str, int], tokens: int, now: float) -> float:
+    """
+    Take one request of `tokens` tokens from the buckets of `key` when it fits.
+
+    Returns:
+        0 when taken, otherwise the seconds to wait before it can fit
+    """
+    rpm = limits.get("rpm") or 0
+    tpm = limits.get("tpm") or 0
+    entry = refill(state, key, limits, now)
+    wait = max(0.0, entry["blocked_until"] - now)
+    if wait == 0.0:
+        missing_requests = 1 - entry["requests"] if rpm else 0
+        missing_tokens = tokens - entry["tokens"] if tpm else 0
+        if missing_requests > 0:
+            wait = max(wait, missing_requests * 60 / rpm)
+        if missing_tokens > 0:
+            wait = max(wait, missing_tokens * 60 / tpm)
+    if wait == 0.0:
+        if rpm:
+            entry["requests"] -= 1
+        if tpm:
+            entry["tokens"] -= tokens
+    return wait
+
+
+def correct_usage(state: Dict[str, Any], key: str, limits: Dict[str, int], estimated_tokens: int,
+                  actual_tokens: int, now: float):
+    """Give back (or take) the difference between the estimated and the reported tokens."""
+    entry = refill(state, key, limits, now)
+    entry["tokens"] += min(estimated_tokens, limits["tpm"]) - actual_tokens
+
+
+def block(state: Dict[str, Any], key: str, limits: Dict[str, int], delay: float, now: float):
+    """Block `key` for `delay` seconds (429 / Retry-After)."""
+    entry = refill(state, key, limits, now)
+    entry["blocked_until"] = max(entry["blocked_until"], now + delay)
+
+
+class RateLimitScheduler:
+    """
+    Singleton coordinating the calls of every client of the process,
+    and of the other processes through the shared state file.
+    """
+
+    _instance = None
+
+    # Never sleep longer than this in one go, so that limits freed by other workers are noticed
+    _MAX_SLEEP = 5.0
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self.logger = RobotCustomLogger()
+        self.model_config = ModelConfig()
+        self.enabled = Config.RATE_LIMIT_ENABLED
+        self.state_file = Config.RATE_LIMIT_STATE_FILE
+        self.max_retries = Config.MAX_RETRIES
+        self.base_backoff = Config.BASE_BACKOFF
+        self.max_backoff = Config.MAX_BACKOFF
+        self._initialized = True
+
+    @staticmethod
+    def _key(provider: str, model: Optional[str]) -> str:
+        return f"{provider}:{model}"
+
+    def _limits(self, provider: str, model: Optional[str]) -> Optional[Dict[str, int]]:
+        if not self.enabled:
+            return None
+        limits = self.model_config.get_rate_limits(provider, model)
+        if not limits or not (limits.get("rpm") or limits.get("tpm")):
+            return None
+        return limits
+
+    @contextmanager
+    def _shared_state(self):
+        """Read-modify-write the shared state file under an exclusive lock."""
+        with open(self.state_file, "a+") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                content = f.read()
+                try:
+                    state = json.loads(content) if content else {}
+                except json.JSONDecodeError:
+                    state = {}
+                yield state
+                f.seek(0)
+                f.truncate()
+                json.dump(state, f)
+                f.flush()
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _take(self, key: str, limits: Dict[str, int], tokens: int) -> float:
+        with self._shared_state() as state:
+            return take(state, key, limits, tokens, time.time())
+
+    def acquire(self, provider: str, model: Optional[str], tokens: int = 0) -> float:
+        """
+        Block until one request of `tokens` estimated tokens fits in the buckets.
+
+        Returns:
+            Time waited in seconds
+        """
+        limits = self._limits(provider, model)
+        if limits is None:
+            return 0.0
+        tpm = limits.get("tpm") or 0
+        # A request larger than the whole bucket would wait forever: cap it
+        tokens = min(tokens, tpm) if tpm else 0
+        key = self._key(provider, model)
+        waited = 0.0
+        while True:
+            wait = via_sidecar("acquire", lambda: self._take(key, limits, tokens), key=key, limits=limits, tokens=tokens)
+            if wait == 0.0:
+                if waited:
+                    self.logger.info(f"Rate limiter: waited {waited:.2f}s for {key}")
+                return waited
+            deadline = current_deadline()
+            if deadline is not None and wait >= deadline.remaining():
+                raise DeadlineExceeded(deadline)
+            sleep_time = min(wait, self._MAX_SLEEP)
+            time.sleep(sleep_time)
+            waited += sleep_time
+
+    def record_usage(self, provider: str, model: Optional[str], estimated_tokens: int, actual_tokens: int):
+        """Correct the token bucket once the provider reported the real usage."""
+        limits = self._limits(provider, model)
+        if limits is None or not limits.get("tpm") or actual_tokens is None:
+            return
+        key = self._key(provider, model)
+
+        def local():
+            with self._shared_state() as state:
+                correct_usage(state, key, limits, estimated_tokens, actual_tokens, time.time())
+
+        via_sidecar("record_usage", local, key=key, limits=limits, estimated_tokens=estimated_tokens,
+                    actual_tokens=actual_tokens)
+
+    def penalize(self, provider: str, model: Optional[str], delay: float) -> bool:
+        """
+        Pause every worker using this provider/model for `delay` seconds (429 / Retry-After).
+
+        Returns:
+            False when the model is not rate limited (nothing to coordinate)
+        """
+        limits = self._limits(provider, model)
+        if limits is None:
+            return False
+        key = self._key(provider, model)
+
+        def local():
+            with self._shared_state() as state:
+                block(state, key, limits, delay, time.time())
+
+        via_sidecar("penalize", local, key=key, limits=limits, delay=delay)
+        return True
+
+    def backoff_delay(self, attempt: int, base_backoff: Optional[float] = None) -> float:
+        """Exponential backoff with equal jitter: half fixed, half random."""
+        base = self.base_backoff if base_backoff is None else base_backoff
+        delay = min(self.max_backoff, base * (2 ** attempt))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def call_with_retry(
+        self,
+        provider: str,
+        model: Optional[str],
+        send: Callable[[], Any],
+        estimated_tokens: int = 0,
+        max_retries: Optional[int] = None,
+        base_backoff: Optional[float] = None,
+        usage: Optional[Callable[[Any], int]] = None,
+    ) -> Any:
+        """
+        Run `send()` under the rate limiter, retrying transient failures.
+
+        Args:
+            provider: Provider name (key of the rate limits)
+            model: Model name
+            send: Callable performing the API call
+            estimated_tokens: Token estimate charged before the call
+            max_retries: Number of retries (default AIHELPER_MAX_RETRIES)
+            base_backoff: First backoff delay in seconds (default AIHELPER_BASE_BACKOFF)
+            usage: Callable extracting the real token usage from the response
+
+        Returns:
+            The response of `send()`
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            self.acquire(provider, model, estimated_tokens)
+            try:
+                response = send()
+            except Exception as e:
+                deadline = current_deadline()
+                if deadline is not None and deadline.expired:
+                    raise DeadlineExceeded(deadline) from e
+                if attempt >= max_retries or not is_retryable(e):
+                    raise
+                retry_after = get_retry_after(e)
+                delay = retry_after if retry_after is not None else self.backoff_delay(attempt, base_backoff)
+                if deadline is not None and delay >= deadline.remaining():
+                    # The retry could not complete within the budget: fail now
+                    raise DeadlineExceeded(deadline) from e
+                self.logger.warning(
+                    f"{provider} call failed ({type(e).__name__}: {e}); retry {attempt + 1}/{max_retries} in {delay:.2f}s", True)
+                # A penalized bucket makes the next acquire() wait (in every worker), otherwise sleep here
+                penalized = (get_status_code(e) == 429 or retry_after is not None) and self.penalize(provider, model, delay)
+                if not penalized:
+                    time.sleep(delay)
+                attempt += 1
+                continue
+            if usage is not None:
+                try:
+                    self.record_usage(provider, model, estimated_tokens, usage(response))
+                except Exception as e:
+                    self.logger.debug(f"Could not record token usage for {provider}: {e}")
+            return response
@@ -0,0 +1,146 @@
+"""
+Screenshot value object.
+
+A screenshot is captured once, as the base64 text the driver returns or as PNG
+bytes, and every other form is derived from it on first use and cached: the
+raw bytes (held once, exposed as a read-only memoryview), base64, data URL,
+SHA-256, decoded PIL image and resized variants. Passing the object from the
+capture to the uploader, the log, OmniParser and the visual diff avoids
+decoding and re-encoding the same image at each step.
+
+The object is immutable from the outside: the PIL image it returns is shared,
+copy it before drawing on it.
+"""
+import base64
+import hashlib
+import io
+import os
+import struct
+from typing import Dict, Optional, Tuple, Union
+
+_IMAGE_EXTENSIONS = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".webp": "image/webp", ".gif": "image/gif"}
+
+
+class Screenshot:
+    """One image, held once: base64, data URL, hash, PIL image and resized variants are computed lazily."""
+
+    def __init__(self, data: Optional[Union[bytes, bytearray, memoryview]] = None, base64_data: Optional[str] = None,
+                 media_type: str = "image/png"):
+        """
+        Args:
+            data: Encoded image bytes (PNG by default)
+            base64_data: The same bytes as base64, when that is what was captured
+            media_type: MIME type of the encoded image
+        """
+        if data is None and base64_data is None:
+            raise ValueError("A screenshot needs its bytes or their base64 encoding")
+        # bytes, not a copy in a bytearray: memoryview() and BytesIO() share it without copying
+        self._raw: Optional[bytes] = bytes(data) if data is not None and not isinstance(data, bytes) else data
+        self._base64 = base64_data
+        self.media_type = media_type
+        self._sha256: Optional[str] = None
+        self._image = None
+        self._resized: Dict[Tuple[int, bool], "Screenshot"] = {}
+
+    @classmethod
+    def from_base64(cls, base64_data: str, media_type: str = "image/png") -> "Screenshot":
+        return cls(base64_data=base64_data, media_type=media_type)
+
+    @classmethod
+    def from_file(cls, file_path: str) -> "Screenshot":
+        with open(file_path, "rb") as f:
+            data = f.read()
+        return cls(data, media_type=_IMAGE_EXTENSIONS.get(os.path.splitext(file_path)[1].lower(), "image/png"))
+
+    @classmethod
+    def of(cls, image: Union["Screenshot", str, bytes, bytearray, memoryview]) -> "Screenshot":
+        """Screenshot from a Screenshot (returned as is), an image file path, base64 text or image bytes."""
+        if isinstance(image, Screenshot):
+            return image
+        if isinstance(image, str):
+            # "." is not a base64 character: an image extension means a file path
+            if image[-5:].lower().endswith(tuple(_IMAGE_EXTENSIONS)):
+                return cls.from_file(image)
+            return cls.from_base64(image)
+        return cls(image)
+
+    def _bytes(self) -> bytes:
+        if self._raw is None:
+            self._raw = base64.b64decode(self._base64)
+        return self._raw
+
+    @property
+    def data(self) -> memoryview:
+        """Encoded image bytes, read-only, without copy."""
+        return memoryview(self._bytes()).toreadonly()
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.data)
+
+    @property
+    def base64(self) -> str:
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self._raw).decode("ascii")
+        return self._base64
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.media_type};base64,{self.base64}"
+
+    @property
+    def sha256(self) -> str:
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(self._bytes()).hexdigest()
+        return self._sha256
+
+    @property
+    def image(self):
+        """Decoded PIL image (shared: copy it before modifying it)."""
+        if self._image is None:
+            from PIL import Image
+            image = Image.open(io.BytesIO(self._bytes()))
+            image.load()
+            self._image = image
+        return self._image
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """(width, height), read in the PNG header when the image is not decoded"""
+        if self._image is None and self.media_type == "image/png":
+            # Signature (8 bytes), IHDR length and type (8), width and height (2 x 4): 24 bytes = 32 base64 chars
+            header = self._raw[:24] if self._raw is not None else base64.b64decode(self._base64[:32])
+            if header[12:16] == b"IHDR":
+                return struct.unpack(">II", header[16:24])
+        return self.image.size
+
+    def resized(self, width: int, optimize: bool = False) -> "Screenshot":
+        """
+        Args:
+            width: Width of the variant, the aspect ratio is kept
+            optimize: Smaller PNG for a slower encoding (thumbnails kept in the evidence store)
+
+        Returns:
+            The PNG variant (cached per width), or this screenshot when it is not wider than `width`
+        """
+        width = int(width)
+        key = (width, optimize)
+        if key not in self._resized:
+            from PIL import Image
+            image = self.image
+            if image.width <= width:
+                return self
+            height = max(1, image.height * width // image.width)
+            buffer = io.BytesIO()
+            image.resize((width, height), Image.LANCZOS).save(buffer, format="PNG", optimize=optimize)
+            self._resized[key] = Screenshot(buffer.getvalue())
+        return self._resized[key]
+
+    def save(self, file_path: str):
+        with open(file_path, "wb") as f:
+            f.write(self.data)
+
+    def __repr__(self) -> str:
+        # Never the payload: screenshots end up in log messages
+        size = f"{len(self._raw)} bytes" if self._raw is not None else f"{len(self._base64)} base64 chars"
+        return f"Screenshot({self.media_type}, {size})"
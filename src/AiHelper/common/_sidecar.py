@@ -0,0 +1,544 @@
+"""
+Sidecar process sharing caches and budgets between the pabot workers.
+
+Every pabot worker is a separate process with its own singletons: the same
+screenshot is uploaded, the same request is sent to the LLM and the tokenizer
+is loaded once per worker, while the cost ledger and the rate limits go
+through JSON files under fcntl locks. With AIHELPER_SIDECAR=true the first
+worker that needs it starts a local daemon listening on a unix socket
+(AIHELPER_SIDECAR_SOCKET), and every worker asks it for:
+
+    - shared caches per namespace (uploaded screenshot URLs, LLM responses),
+      with single-flight: while one worker computes a missing entry, the
+      workers asking for the same key wait for its result instead of
+      computing it too
+    - the rate limit buckets (see _ratelimit), kept in its memory
+    - the cost ledger, read and written in the same file as without sidecar
+    - token counts, the tokenizer being loaded once, in the daemon
+
+The protocol is one JSON object per line in both directions. The daemon stops
+after AIHELPER_SIDECAR_IDLE_TIMEOUT seconds without any connection. When it
+cannot be reached, every feature falls back to its in-process behaviour.
+
+    python -m src.AiHelper.common._sidecar --socket /tmp/aihelper_sidecar.sock
+"""
+import argparse
+import fcntl
+import json
+import os
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from src.AiHelper.common._deadline import current_deadline
+from src.AiHelper.common._logger import RobotCustomLogger
+from src.AiHelper.config.config import Config
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+
+NAMESPACE_UPLOAD = "upload"
+NAMESPACE_LLM = "llm"
+
+# Seconds for one request to the daemon (claims wait longer, see shared_value)
+_CALL_TIMEOUT = 30.0
+_START_TIMEOUT = 10.0
+# After a failure the daemon is not asked again for this long
+_RETRY_DELAY = 30.0
+_MISSING = object()
+
+
+class SidecarError(RuntimeError):
+    """The daemon could not be reached or failed the request."""
+
+
+class SidecarState:
+    """Everything the daemon serves, guarded by one condition (claims wait on it)."""
+
+    def __init__(self, cache_size: int = 2048):
+        """
+        Args:
+            cache_size: Entries kept per namespace (least recently used first out)
+        """
+        self.cache_size = cache_size
+        self.started = time.time()
+        self._cond = threading.Condition()
+        self._caches: Dict[str, "OrderedDict[str, Tuple[Any, float]]"] = {}
+        self._inflight: Dict[Tuple[str, str], int] = {}
+        self._buckets: Dict[str, Dict[str, Any]] = {}
+        self._encodings: Dict[str, Any] = {}
+        self._encodings_lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def _namespace_stats(self, namespace: str) -> Dict[str, int]:
+        return self.stats.setdefault(namespace, {"hits": 0, "joined": 0, "misses": 0, "stored": 0, "evicted": 0})
+
+    def _lookup(self, namespace: str, key: str) -> Any:
+        cache = self._caches.get(namespace)
+        entry = cache.get(key) if cache is not None else None
+        if entry is None:
+            return _MISSING
+        value, expires = entry
+        if expires < time.time():
+            del cache[key]
+            return _MISSING
+        cache.move_to_end(key)
+        return value
+
+    def claim(self, namespace: str, key: str, wait: float, owner: int) -> Dict[str, Any]:
+        """
+        Returns:
+            {"state": "hit", "value": ...} when the entry is cached (or computed meanwhile by another worker),
+            {"state": "leader"} when the caller must compute it (then `put` or `release` it),
+            {"state": "timeout"} when the worker computing it did not finish within `wait` seconds
+        """
+        deadline = time.monotonic() + wait
+        joined = False
+        with self._cond:
+            while True:
+                value = self._lookup(namespace, key)
+                stats = self._namespace_stats(namespace)
+                if value is not _MISSING:
+                    stats["joined" if joined else "hits"] += 1
+                    return {"state": "hit", "value": value}
+                if (namespace, key) not in self._inflight:
+                    self._inflight[(namespace, key)] = owner
+                    stats["misses"] += 1
+                    return {"state": "leader"}
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    stats["misses"] += 1
+                    return {"state": "timeout"}
+                joined = True
+                self._cond.wait(remaining)
+
+    def get(self, namespace: str, key: str) -> Dict[str, Any]:
+        with self._cond:
+            value = self._lookup(namespace, key)
+            stats = self._namespace_stats(namespace)
+            stats["misses" if value is _MISSING else "hits"] += 1
+            return {"found": False} if value is _MISSING else {"found": True, "value": value}
+
+    def put(self, namespace: str, key: str, value: Any, ttl: float):
+        with self._cond:
+            self._inflight.pop((namespace, key), None)
+            if ttl > 0:
+                cache = self._caches.setdefault(namespace, OrderedDict())
+                cache[key] = (value, time.time() + ttl)
+                cache.move_to_end(key)
+                stats = self._namespace_stats(namespace)
+                stats["stored"] += 1
+                while len(cache) > self.cache_size:
+                    cache.popitem(last=False)
+                    stats["evicted"] += 1
+            self._cond.notify_all()
+
+    def release(self, namespace: str, key: str, owner: Optional[int] = None):
+        """Gives up a claim (the computation failed): one of the waiting workers takes it over."""
+        with self._cond:
+            if owner is None or self._inflight.get((namespace, key)) == owner:
+                self._inflight.pop((namespace, key), None)
+            self._cond.notify_all()
+
+    def release_owner(self, owner: int):
+        """Claims of a connection that closed (worker killed while computing)."""
+        with self._cond:
+            for claim in [claim for claim, claimed_by in self._inflight.items() if claimed_by == owner]:
+                del self._inflight[claim]
+            self._cond.notify_all()
+
+    def acquire(self, key: str, limits: Dict[str, int], tokens: int) -> float:
+        from src.AiHelper.common._ratelimit import take
+        with self._cond:
+            return take(self._buckets, key, limits, tokens, time.time())
+
+    def record_usage(self, key: str, limits: Dict[str, int], estimated_tokens: int, actual_tokens: int):
+        from src.AiHelper.common._ratelimit import correct_usage
+        with self._cond:
+            correct_usage(self._buckets, key, limits, estimated_tokens, actual_tokens, time.time())
+
+    def penalize(self, key: str, limits: Dict[str, int], delay: float):
+        from src.AiHelper.common._ratelimit import block
+        with self._cond:
+            block(self._buckets, key, limits, delay, time.time())
+
+    @staticmethod
+    @contextmanager
+    def _locked_ledger(file: str) -> Iterator[Dict[str, float]]:
+        """
+        Read-modify-write the ledger file under the lock the workers without sidecar use (the yielded dict is
+        saved on exit): the file stays the source of truth, workers falling back to it lose no update.
+        """
+        with open(file, "a+") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    stored = json.loads(f.read() or "{}")
+                except ValueError:
+                    stored = {}
+                ledger = {"cost": stored.get("cost", 0.0), "tokens": stored.get("tokens", 0)}
+                yield ledger
+                f.seek(0)
+                f.truncate()
+                json.dump(ledger, f)
+                f.flush()
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def ledger_add(self, file: str, cost: float, tokens: int) -> Dict[str, float]:
+        """
+        Returns:
+            The previous and the new totals (previous_cost, previous_tokens, cost, tokens)
+        """
+        with self._cond, self._locked_ledger(file) as ledger:
+            previous = {"previous_cost": ledger["cost"], "previous_tokens": ledger["tokens"]}
+            ledger["cost"] += cost
+            ledger["tokens"] += tokens
+            return {**previous, **ledger}
+
+    def ledger_get(self, file: str) -> Dict[str, float]:
+        with self._cond, self._locked_ledger(file) as ledger:
+            return dict(ledger)
+
+    def ledger_reset(self, file: str) -> Dict[str, float]:
+        """
+        Returns:
+            The totals before the reset
+        """
+        with self._cond, self._locked_ledger(file) as ledger:
+            previous = dict(ledger)
+            ledger.update(cost=0.0, tokens=0)
+            return previous
+
+    def count_tokens(self, encoding: str, text: str) -> int:
+        """Token count with the tokenizer loaded once for every worker (a miss is one tokenizer load)"""
+        with self._encodings_lock:
+            loaded = encoding in self._encodings
+            if not loaded:
+                import tiktoken
+                self._encodings[encoding] = tiktoken.get_encoding(encoding)
+        with self._cond:
+            self._namespace_stats("tokens")["hits" if loaded else "misses"] += 1
+        return len(self._encodings[encoding].encode(text))
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Per namespace: entries, hits (cached), joined (waited for another worker's in-flight computation),
+            misses (computed), hit_rate ((hits + joined) / lookups); plus the in-flight claims and the uptime
+        """
+        with self._cond:
+            namespaces = {}
+            for namespace, stats in self.stats.items():
+                lookups = stats["hits"] + stats["joined"] + stats["misses"]
+                namespaces[namespace] = {
+                    **stats,
+                    "entries": len(self._caches.get(namespace, ())),
+                    "hit_rate": round((stats["hits"] + stats["joined"]) / lookups, 3) if lookups else 0.0,
+                }
+            return {"pid": os.getpid(), "uptime": round(time.time() - self.started, 1),
+                    "inflight": len(self._inflight), "namespaces": namespaces}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        server: "SidecarServer" = self.server
+        owner = id(self)
+        server.connection_opened()
+        try:
+            for line in self.rfile:
+                try:
+                    request = json.loads(line)
+                    reply = {"ok": True, "value": server.dispatch(request.pop("op"), request, owner)}
+                except Exception as e:
+                    reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+        finally:
+            server.state.release_owner(owner)
+            server.connection_closed()
+
+
+class SidecarServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    # Operations taking the connection as owner of their claims
+    _OWNED = ("claim", "release")
+    _OPERATIONS = ("ping", "claim", "get", "put", "release", "acquire", "record_usage", "penalize",
+                   "ledger_add", "ledger_get", "ledger_reset", "count_tokens", "summary")
+
+    def __init__(self, socket_path: str, state: SidecarState):
+        self.state = state
+        self.connections = 0
+        self.last_activity = time.monotonic()
+        self._connections_lock = threading.Lock()
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o600)
+
+    def dispatch(self, op: str, args: Dict[str, Any], owner: int) -> Any:
+        if op not in self._OPERATIONS:
+            raise ValueError(f"unknown operation {op!r}")
+        if op == "ping":
+            return os.getpid()
+        if op in self._OWNED:
+            args["owner"] = owner
+        return getattr(self.state, op)(**args)
+
+    def connection_opened(self):
+        with self._connections_lock:
+            self.connections += 1
+            self.last_activity = time.monotonic()
+
+    def connection_closed(self):
+        with self._connections_lock:
+            self.connections -= 1
+            self.last_activity = time.monotonic()
+
+    def idle_for(self) -> float:
+        with self._connections_lock:
+            return 0.0 if self.connections else time.monotonic() - self.last_activity
+
+
+def _is_listening(socket_path: str) -> bool:
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+
+def serve(socket_path: str, idle_timeout: float = 600.0, cache_size: int = 2048):
+    """Run the daemon until it is idle for `idle_timeout` seconds (or receives SIGTERM)."""
+    if os.path.exists(socket_path):
+        if _is_listening(socket_path):
+            # Started by another worker in the meantime
+            return
+        os.unlink(socket_path)
+    server = SidecarServer(socket_path, SidecarState(cache_size))
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.5}, daemon=True)
+    thread.start()
+    print(f"AiHelper sidecar {os.getpid()} listening on {socket_path}", flush=True)
+    try:
+        while not stop.wait(1.0):
+            if server.idle_for() >= idle_timeout:
+                break
+    finally:
+        server.shutdown()
+        server.server_close()
+        try:
+            os.unlink(socket_path)
+        except OSError:
+            pass
+        print(f"AiHelper sidecar stopped: {json.dumps(server.state.summary())}", flush=True)
+
+
+class SidecarClient:
+    """Connection of a worker to the daemon (one socket per thread), started on demand."""
+
+    def __init__(self, socket_path: str, idle_timeout: float = 600.0, cache_size: int = 2048):
+        self.socket_path = socket_path
+        self.idle_timeout = idle_timeout
+        self.cache_size = cache_size
+        self.logger = RobotCustomLogger()
+        self.down_until = 0.0
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+            connection = self._local.connection = (sock, sock.makefile("rb"))
+        return connection
+
+    def _close(self):
+        connection = getattr(self._local, "connection", None)
+        self._local.connection = None
+        if connection is not None:
+            connection[1].close()
+            connection[0].close()
+
+    def call(self, op: str, timeout: float = _CALL_TIMEOUT, **args) -> Any:
+        """
+        Raises:
+            SidecarError: the daemon could not be reached (even after a restart) or failed the request
+        """
+        request = json.dumps({"op": op, **args}, default=str).encode("utf-8") + b"\n"
+        for attempt in range(2):
+            try:
+                sock, reader = self._connection()
+                sock.settimeout(timeout)
+                sock.sendall(request)
+                line = reader.readline()
+                if not line:
+                    raise ConnectionResetError("connection closed by the sidecar")
+                break
+            except OSError as e:
+                self._close()
+                # The daemon stopped (idle timeout, killed): start it again once
+                if attempt or isinstance(e, socket.timeout) or not self.start():
+                    raise SidecarError(f"sidecar {self.socket_path} unreachable: {e}") from e
+        reply = json.loads(line)
+        if not reply["ok"]:
+            raise SidecarError(f"sidecar {op} failed: {reply['error']}")
+        return reply["value"]
+
+    def start(self) -> bool:
+        """
+        Start the daemon unless it runs already. Workers starting at the same time are serialized by a
+        lock file: only the first one spawns it.
+
+        Returns:
+            True when the daemon is listening
+        """
+        if _is_listening(self.socket_path):
+            return True
+        with open(f"{self.socket_path}.lock", "a") as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                if _is_listening(self.socket_path):
+                    return True
+                env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT_DIR, os.environ.get("PYTHONPATH")])))
+                with open(f"{self.socket_path}.log", "a") as log:
+                    subprocess.Popen(
+                        # -c rather than -m: the package imports this module before runpy would run it
+                        [sys.executable, "-c", "from src.AiHelper.common._sidecar import main; main()", "--socket", self.socket_path,
+                         "--idle-timeout", str(self.idle_timeout), "--cache-size", str(self.cache_size)],
+                        cwd=ROOT_DIR, env=env, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                        start_new_session=True,
+                    )
+                deadline = time.monotonic() + _START_TIMEOUT
+                while time.monotonic() < deadline:
+                    if _is_listening(self.socket_path):
+                        self.logger.info(f"Sidecar started on {self.socket_path}")
+                        return True
+                    time.sleep(0.05)
+                return False
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def mark_down(self, error: Exception):
+        self.down_until = time.monotonic() + _RETRY_DELAY
+        self.logger.warning(f"Sidecar unavailable ({error}): falling back to the in-process caches "
+                            f"for {_RETRY_DELAY:.0f}s", True)
+
+
+_clients: Dict[str, SidecarClient] = {}
+_clients_lock = threading.Lock()
+
+
+def shared_sidecar() -> Optional[SidecarClient]:
+    """
+    Returns:
+        Client of the daemon (started when needed) when AIHELPER_SIDECAR is on and it can be reached, else None
+    """
+    if not Config.SIDECAR:
+        return None
+    path = Config.SIDECAR_SOCKET
+    client = _clients.get(path)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(path)
+            if client is None:
+                client = SidecarClient(path, Config.SIDECAR_IDLE_TIMEOUT, Config.SIDECAR_CACHE_SIZE)
+                if not client.start():
+                    client.mark_down(SidecarError(f"not started within {_START_TIMEOUT:.0f}s, see {path}.log"))
+                _clients[path] = client
+    return None if client.down_until > time.monotonic() else client
+
+
+def via_sidecar(op: str, local: Callable[[], Any], **args) -> Any:
+    """
+    Returns:
+        Result of `op` on the daemon, or of local() when the sidecar is off or unreachable
+    """
+    sidecar = shared_sidecar()
+    if sidecar is not None:
+        try:
+            return sidecar.call(op, **args)
+        except SidecarError as e:
+            sidecar.mark_down(e)
+    return local()
+
+
+def shared_value(namespace: str, key: str, compute: Callable[[], Any], ttl: float,
+                 shareable: Optional[Callable[[Any], bool]] = None) -> Tuple[Any, bool]:
+    """
+    Value of `key` computed once across the workers: from the shared cache, from the worker computing it
+    right now (single-flight), or computed here and shared. Empty values (None, {}, "") are not shared:
+    the claim is released and the next worker computes the value again.
+
+    Args:
+        namespace: Cache namespace (NAMESPACE_UPLOAD, NAMESPACE_LLM...)
+        key: Cache key, a digest of everything the value depends on
+        compute: Computes the value (JSON serializable) when nobody has it
+        ttl: Seconds the value stays shared, 0 computes it here without sharing
+        shareable: Whether a non empty value may be shared (error placeholders should not)
+
+    Returns:
+        (value, True when it came from another worker)
+    """
+    sidecar = shared_sidecar() if ttl > 0 else None
+    if sidecar is None:
+        return compute(), False
+    deadline = current_deadline()
+    wait = deadline.remaining() if deadline is not None else Config.LLM_TIMEOUT
+    try:
+        claim = sidecar.call("claim", timeout=wait + _CALL_TIMEOUT, namespace=namespace, key=key, wait=wait)
+    except SidecarError as e:
+        sidecar.mark_down(e)
+        return compute(), False
+    if claim["state"] == "hit":
+        return claim["value"], True
+    leader = claim["state"] == "leader"
+    try:
+        value = compute()
+    except BaseException:
+        if leader:
+            _release(sidecar, namespace, key)
+        raise
+    if leader:
+        if not value or (shareable is not None and not shareable(value)):
+            _release(sidecar, namespace, key)
+        else:
+            try:
+                sidecar.call("put", namespace=namespace, key=key, value=value, ttl=ttl)
+            except SidecarError as e:
+                sidecar.mark_down(e)
+    return value, False
+
+
+def _release(sidecar: SidecarClient, namespace: str, key: str):
+    try:
+        sidecar.call("release", namespace=namespace, key=key)
+    except SidecarError as e:
+        sidecar.mark_down(e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AiHelper sidecar shared by the pabot workers")
+    parser.add_argument("--socket", default=Config.SIDECAR_SOCKET)
+    parser.add_argument("--idle-timeout", type=float, default=Config.SIDECAR_IDLE_TIMEOUT)
+    parser.add_argument("--cache-size", type=int, default=Config.SIDECAR_CACHE_SIZE)
+    args = parser.parse_args()
+    serve(args.socket, args.idle_timeout, args.cache_size)
+
+
+if __name__ == "__main__":
+    main()
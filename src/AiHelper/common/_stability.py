@@ -0,0 +1,181 @@
+"""
+Wait until the screen is stable instead of sleeping a fixed time.
+
+The screen is sampled (UI XML hash, or a low-resolution grayscale screenshot
+compared with a cheap mean-pixel-difference) until the samples stay identical
+for AIHELPER_STABILITY_MIN_STABLE_TIME seconds, bounded by a maximum wait: two
+matching samples taken right after a tap, before the transition started,
+would otherwise pass for the new screen. The settle time of each screen key (for
+instance "verify:<prompt>" or "click:<element>") is learned across runs, and
+the next wait on the same key sleeps most of that time before polling, so that
+a screen that always takes 2 s does not cost 2 s of page source calls.
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+from src.AiHelper.common._logger import RobotCustomLogger
+from src.AiHelper.config.config import Config
+
+MODE_XML = "xml"
+MODE_SCREENSHOT = "screenshot"
+
+# Learned settle time = EWMA of the observed ones; the first poll happens after this fraction of it
+_EWMA_ALPHA = 0.3
+_PRESLEEP_FACTOR = 0.7
+
+
+@dataclass
+class StabilityResult:
+    stable: bool
+    waited: float
+    samples: int
+    key: Optional[str] = None
+
+
+class ScreenStabilityWaiter:
+    """Singleton holding the learned settle times (persisted in AIHELPER_STABILITY_STATE_FILE)."""
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self.logger = RobotCustomLogger()
+        self.mode = Config.STABILITY_MODE
+        self.poll_interval = Config.STABILITY_POLL_INTERVAL
+        self.diff_threshold = Config.STABILITY_DIFF_THRESHOLD
+        self.min_stable_time = Config.STABILITY_MIN_STABLE_TIME
+        self.state_file = Config.STABILITY_STATE_FILE
+        self._lock = threading.Lock()
+        self._settle_times: Dict[str, float] = self._load()
+        self._initialized = True
+
+    def _load(self) -> Dict[str, float]:
+        try:
+            with open(self.state_file, "r") as f:
+                return {key: float(value) for key, value in json.load(f).items()}
+        except (FileNotFoundError, json.JSONDecodeError, ValueError, AttributeError):
+            return {}
+
+    def _save(self):
+        tmp_path = f"{self.state_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self._settle_times, f)
+            os.replace(tmp_path, self.state_file)
+        except OSError as e:
+            self.logger.debug(f"Could not save the learned settle times: {e}")
+
+    @staticmethod
+    def _key(key: str) -> str:
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+    def learned_settle_time(self, key: Optional[str]) -> Optional[float]:
+        if key is None:
+            return None
+        with self._lock:
+            return self._settle_times.get(self._key(key))
+
+    def _learn(self, key: str, settle_time: float):
+        hashed = self._key(key)
+        with self._lock:
+            previous = self._settle_times.get(hashed)
+            self._settle_times[hashed] = settle_time if previous is None else (
+                _EWMA_ALPHA * settle_time + (1 - _EWMA_ALPHA) * previous)
+            self._save()
+
+    # Samplers return a value comparable with `_same`
+    @staticmethod
+    def _sample_xml() -> str:
+        from src.AiHelper.common._utils import Utilities
+        return hashlib.sha1(Utilities._get_ui_xml().encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _sample_screenshot():
+        import base64
+        from PIL import Image
+        from src.AiHelper.common._utils import Utilities
+        png = base64.b64decode(Utilities._take_screenshot_as_base64())
+        with Image.open(io.BytesIO(png)) as image:
+            return image.convert("L").resize((48, 96))
+
+    def _same(self, previous, current) -> bool:
+        if not hasattr(current, "convert"):
+            # Hashes (xml mode) and custom samplers: exact comparison
+            return previous == current
+        from PIL import ImageChops, ImageStat
+        # Mean absolute pixel difference of the low-resolution frames, in [0, 1]
+        difference = ImageStat.Stat(ImageChops.difference(previous, current)).mean[0] / 255
+        return difference <= self.diff_threshold
+
+    def wait(self, max_wait: float, key: Optional[str] = None, mode: Optional[str] = None,
+             sampler: Optional[Callable[[], object]] = None) -> StabilityResult:
+        """
+        Return as soon as the samples of the screen stay identical long enough, after `max_wait` seconds at most:
+        `min_stable_time` seconds (at most half of max_wait), or one poll interval when the settle time of the key
+        is learned (the transition is over when polling starts).
+
+        Args:
+            max_wait: Upper bound of the wait in seconds
+            key: Screen key used to learn the settle time (None: nothing learned)
+            mode: 'xml' (UI XML hash) or 'screenshot' (low resolution pixel diff). AIHELPER_STABILITY_MODE by default.
+            sampler: Custom sampler (overrides mode)
+
+        Returns:
+            StabilityResult (stable is False when max_wait was reached)
+        """
+        start = time.monotonic()
+        mode = mode or self.mode
+        sampler = sampler or (self._sample_screenshot if mode == MODE_SCREENSHOT else self._sample_xml)
+
+        learned = self.learned_settle_time(key)
+        if learned:
+            time.sleep(min(max_wait, learned * _PRESLEEP_FACTOR))
+        window = self.poll_interval if learned else max(self.poll_interval, min(self.min_stable_time, max_wait / 2))
+
+        samples = 0
+        previous = None
+        # Time of the first sample of the current run of identical samples
+        stable_since = 0.0
+        while True:
+            try:
+                current = sampler()
+            except Exception as e:
+                # No way to observe the screen (no driver...): behave like the fixed sleep
+                self.logger.debug(f"Screen stability sampling failed ({e}), sleeping instead")
+                time.sleep(max(0.0, max_wait - (time.monotonic() - start)))
+                return StabilityResult(stable=False, waited=time.monotonic() - start, samples=samples, key=key)
+            samples += 1
+            waited = time.monotonic() - start
+            if previous is None or not self._same(previous, current):
+                stable_since = waited
+            elif waited - stable_since >= window - 1e-3:
+                # The screen did not change during the window: it settled at the first sample of the run
+                if key is not None:
+                    self._learn(key, stable_since)
+                self.logger.info(f"Screen stable after {waited:.2f}s ({samples} samples, {mode})")
+                return StabilityResult(stable=True, waited=waited, samples=samples, key=key)
+            if waited + self.poll_interval > max_wait:
+                self.logger.info(f"Screen not stable after {waited:.2f}s (max {max_wait}s), going on", True)
+                if key is not None:
+                    self._learn(key, max_wait)
+                return StabilityResult(stable=False, waited=waited, samples=samples, key=key)
+            previous = current
+            time.sleep(self.poll_interval)
+
+    def reset(self):
+        with self._lock:
+            self._settle_times = {}
+            self._save()
@@ -0,0 +1,269 @@
+"""
+Structured output: response schemas of the keywords and JSON extraction.
+
+Each keyword declares the JSON object it expects once, as a ResponseSchema.
+The provider clients enforce it natively when they get
+`response_schema=<schema>` (OpenAI / Ollama `response_format` json_schema,
+Anthropic forced tool use, DeepSeek `json_object` with the schema in the
+system prompt, Gemini `response_schema`), so the reply
+is a JSON document and parsing cannot fail.
+
+Replies that were not enforced (batch jobs, AIHELPER_STRUCTURED_OUTPUT=false,
+older local models) go through `extract_json`: a single pass over the
+structural characters finds the balanced top-level objects of the text, and
+each candidate gets a light repair (trailing commas, smart quotes, Python
+literals, single quotes, unclosed brackets of a truncated reply) before giving up.
+"""
+import ast
+import copy
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+
+_STRUCTURAL = re.compile(r'[{}\[\]"\\]')
+# An object starts with a key (or is empty): "{search bar}" in prose is not worth parsing
+_OBJECT_START = re.compile(r"\{\s*[\"'“‘}]")
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_PYTHON_LITERALS = re.compile(r"(?<=[:\[,\s])(True|False|None)(?=\s*[,}\]])")
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+_JSON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+# Defaults of the properties a non-enforced reply may omit
+_TYPE_DEFAULTS = {"string": ""}
+
+
+@dataclass
+class ResponseSchema:
+    """JSON object expected from the LLM: every property is required (OpenAI strict mode)."""
+    name: str
+    description: str
+    properties: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+    def json_schema(self) -> Dict[str, Any]:
+        return {
+            "type": "object",
+            "properties": copy.deepcopy(self.properties),
+            "required": list(self.properties),
+            "additionalProperties": False,
+        }
+
+    def openai_response_format(self) -> Dict[str, Any]:
+        """`response_format` of the OpenAI chat completions API (also accepted by Ollama)."""
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": self.name, "description": self.description, "schema": self.json_schema(), "strict": True},
+        }
+
+    def anthropic_tool(self) -> Dict[str, Any]:
+        """Tool whose input is the response: the call is forced with tool_choice."""
+        return {"name": self.name, "description": self.description, "input_schema": self.json_schema()}
+
+    def gemini_schema(self) -> Dict[str, Any]:
+        """Gemini `response_schema`: OpenAPI subset without additionalProperties / description."""
+        def strip(node):
+            if isinstance(node, dict):
+                return {key: strip(value) for key, value in node.items() if key not in ("additionalProperties", "description")}
+            if isinstance(node, list):
+                return [strip(value) for value in node]
+            return node
+        return strip(self.json_schema())
+
+    def coerce(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Check a parsed reply against the schema: numbers given as strings are converted, missing strings
+        default to "". Raises ValueError when another property is missing or has the wrong type.
+        """
+        if not isinstance(data, dict):
+            raise ValueError(f"{self.name}: expected a JSON object, got {type(data).__name__}")
+        result = dict(data)
+        for key, spec in self.properties.items():
+            expected = spec.get("type")
+            value = result.get(key)
+            if value is None:
+                if expected not in _TYPE_DEFAULTS:
+                    raise ValueError(f"{self.name}: missing '{key}' in the LLM response")
+                result[key] = _TYPE_DEFAULTS[expected]
+            elif expected == "number" and not isinstance(value, (int, float)):
+                try:
+                    result[key] = float(value)
+                except (TypeError, ValueError):
+                    raise ValueError(f"{self.name}: '{key}' must be a number, got {value!r}")
+            elif expected == "array" and not isinstance(value, list):
+                raise ValueError(f"{self.name}: '{key}' must be a list, got {value!r}")
+            elif expected == "string" and not isinstance(value, str):
+                result[key] = str(value)
+        return result
+
+
+VERIFICATION_SCHEMA = ResponseSchema(
+    name="verification_result",
+    description="Verdict of a UI verification",
+    properties={
+        "confidence": {"type": "number", "description": "Confidence between 0 and 1 that the screen matches the verification prompt"},
+        "reason": {"type": "string", "description": "Short explanation of the confidence"},
+        "bug_summary": {"type": "string", "description": "Short summary of the bug, empty if no bug"},
+        "bug_description": {"type": "string", "description": "Detailed description of the bug, empty if no bug"},
+    },
+)
+
+LOCATOR_SCHEMA = ResponseSchema(
+    name="element_locator",
+    description="XPath locator of the described element",
+    properties={
+        "locator": {"type": "string", "description": "XPath of the element, empty if not found"},
+        "reason": {"type": "string", "description": "How and why this locator was chosen"},
+        "bug_summary": {"type": "string", "description": "Short summary of the bug, empty if no bug"},
+        "bug_description": {"type": "string", "description": "Detailed description of the bug, empty if no bug"},
+    },
+)
+
+BBOX_SCHEMA = ResponseSchema(
+    name="element_bbox",
+    description="Bounding box of the described element among the parsed elements",
+    properties={
+        "bbox": {"type": "array", "items": {"type": "number"}, "description": "[x1, y1, x2, y2] as fractions of the screen"},
+        "explanation": {"type": "string", "description": "Why this element was chosen"},
+    },
+)
+
+AGENT_PLAN_SCHEMA = ResponseSchema(
+    name="agent_plan",
+    description="Steps reaching the goal from the current screen, grounded in its compacted UI XML",
+    properties={
+        "steps": {
+            "type": "array",
+            "description": "Actions in order, empty if the goal cannot be reached from this screen",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "action": {"type": "string", "enum": ["tap", "type", "scroll", "back", "assert"]},
+                    "target": {"type": "string", "description": "Node reference (n12) of the element, empty for back / assert / a full screen scroll"},
+                    "text": {"type": "string", "description": "Text to type, or scroll direction (up, down, left, right)"},
+                    "expect": {"type": "string", "description": "Text shown on the screen once the step is done (asserted text for assert), empty if unknown"},
+                },
+                "required": ["action", "target", "text", "expect"],
+                "additionalProperties": False,
+            },
+        },
+        "reason": {"type": "string", "description": "Short explanation of the plan"},
+        "bug_summary": {"type": "string", "description": "Short summary of the bug, empty if no bug"},
+        "bug_description": {"type": "string", "description": "Detailed description of the bug, empty if no bug"},
+    },
+)
+
+SCHEMAS: Dict[str, ResponseSchema] = {
+    "verification": VERIFICATION_SCHEMA,
+    "locator": LOCATOR_SCHEMA,
+    "bbox": BBOX_SCHEMA,
+    "agent_plan": AGENT_PLAN_SCHEMA,
+}
+
+
+def get_schema(schema: Union[None, str, ResponseSchema]) -> Optional[ResponseSchema]:
+    """ResponseSchema from a schema or its name ("verification", "locator", "bbox", "agent_plan")."""
+    if schema is None or isinstance(schema, ResponseSchema):
+        return schema
+    try:
+        return SCHEMAS[str(schema).lower()]
+    except KeyError:
+        raise ValueError(f"Unknown response schema '{schema}'. Known schemas: {', '.join(SCHEMAS)}")
+
+
+def _balanced_objects(text: str) -> Iterator[str]:
+    """
+    Top-level {...} candidates of the text in one pass over its structural characters.
+    Braces inside JSON strings are ignored; a truncated last object is closed.
+    """
+    stack: List[str] = []
+    start = -1
+    in_string = False
+    skip_until = -1
+    for match in _STRUCTURAL.finditer(text):
+        position = match.start()
+        char = match.group()
+        if not stack:
+            if char == "{":
+                stack.append(char)
+                start = position
+                in_string = False
+            continue
+        if position < skip_until:
+            continue
+        if in_string:
+            if char == "\\":
+                skip_until = position + 2
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in _CLOSERS:
+            stack.append(char)
+        elif char in "}]":
+            stack.pop()
+            if not stack:
+                yield text[start:position + 1]
+    if stack:
+        # Truncated reply (max tokens reached): close what is open
+        yield text[start:] + ('"' if in_string else "") + "".join(_CLOSERS[opener] for opener in reversed(stack))
+
+
+def _repair(candidate: str) -> str:
+    repaired = candidate.translate(_SMART_QUOTES)
+    repaired = _TRAILING_COMMA.sub(r"\1", repaired)
+    return _PYTHON_LITERALS.sub(lambda match: _JSON_LITERALS[match.group(1)], repaired)
+
+
+def _loads(candidate: str) -> Any:
+    if not _OBJECT_START.match(candidate):
+        return None
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(_repair(candidate))
+    except json.JSONDecodeError:
+        pass
+    try:
+        # Python dict syntax (single quotes, True/None): literal_eval never executes code
+        return ast.literal_eval(candidate.translate(_SMART_QUOTES))
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        return None
+
+
+def extract_json(text: str, required: Sequence[str] = ()) -> Dict[str, Any]:
+    """
+    Args:
+        text: LLM reply (pure JSON, JSON in a code fence or in prose, Python dict syntax, truncated JSON...)
+        required: Keys the object should have: the first candidate object that has them all is preferred
+
+    Returns:
+        The parsed JSON object
+
+    Raises:
+        ValueError: No JSON object could be found or repaired
+    """
+    value = _loads(text.strip()) if text.lstrip().startswith("{") else None
+    if isinstance(value, dict) and all(key in value for key in required):
+        return value
+
+    # Cheap second try before the scan: everything between the first "{" and the last "}"
+    first, last = text.find("{"), text.rfind("}")
+    if 0 <= first < last:
+        value = _loads(text[first:last + 1])
+        if isinstance(value, dict) and all(key in value for key in required):
+            return value
+
+    fallback = value if isinstance(value, dict) else None
+    for candidate in _balanced_objects(text):
+        value = _loads(candidate)
+        if isinstance(value, dict):
+            if all(key in value for key in required):
+                return value
+            fallback = fallback or value
+    if fallback is not None:
+        return fallback
+    raise ValueError("No JSON content found in the response.")
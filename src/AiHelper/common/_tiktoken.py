@@ -1,11 +1,13 @@
-import tiktoken
 import os
 import json
 import fcntl
-from typing import List, Dict, Tuple, Any
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Tuple, Any, Iterator, Mapping
 from dataclasses import dataclass
 import warnings
 from src.AiHelper.common._logger import RobotCustomLogger
+from src.AiHelper.common._sidecar import via_sidecar
 from src.AiHelper.config.model_config import ModelConfig
 
 @dataclass
@@ -15,6 +17,53 @@ class TokenStats:
     completion_tokens: int
     estimated_cost: float
 
+class PromptCacheStats:
+    """Process-wide prompt cache hits per suite (providers reporting cache hit / miss tokens)."""
+
+    _lock = threading.Lock()
+    _records: Dict[str, Dict[str, Any]] = {}
+
+    @classmethod
+    def record(cls, suite: str, hit_tokens: int, miss_tokens: int, saved: float = 0.0):
+        """
+        Args:
+            suite: Suite name
+            hit_tokens: Prompt tokens served from the cache
+            miss_tokens: Prompt tokens not in the cache
+            saved: Cost avoided by the hits (list input price minus cached price)
+        """
+        with cls._lock:
+            stats = cls._records.setdefault(suite, {"requests": 0, "hit_tokens": 0, "miss_tokens": 0, "saved": 0.0})
+            stats["requests"] += 1
+            stats["hit_tokens"] += hit_tokens
+            stats["miss_tokens"] += miss_tokens
+            stats["saved"] += saved
+
+    @classmethod
+    def summary(cls) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns:
+            Per suite: requests, cache hit / miss tokens, hit ratio (hit tokens over prompt tokens) and cost saved
+        """
+        with cls._lock:
+            summary = {}
+            for suite, stats in cls._records.items():
+                prompt_tokens = stats["hit_tokens"] + stats["miss_tokens"]
+                summary[suite] = {
+                    "requests": stats["requests"],
+                    "cache_hit_tokens": stats["hit_tokens"],
+                    "cache_miss_tokens": stats["miss_tokens"],
+                    "hit_ratio": round(stats["hit_tokens"] / prompt_tokens, 3) if prompt_tokens else 0.0,
+                    "cost_saved": round(stats["saved"], 5),
+                }
+            return summary
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._records = {}
+
+
 class TokenHelper:
     
     # File-based storage for true cross-process persistence
@@ -26,15 +75,15 @@ class TokenHelper:
     
     # Load configuration from JSON file
     _model_config = ModelConfig()
-    
-    # Pricing per 1000 tokens (input/output) in USD
-    # Loaded from llm_models.json configuration file
-    PRICING = _model_config.get_pricing_dict()
 
-    # Maximum context tokens per model
-    # Loaded from llm_models.json configuration file
-    MAX_CONTEXT_TOKENS = _model_config.get_max_context_dict()
-    
+    # Model priced when the requested one has no pricing
+    DEFAULT_PRICING_MODEL = "gpt-4o-mini"
+    # Context size assumed for a model missing from llm_models.json
+    DEFAULT_MAX_CONTEXT_TOKENS = 8192
+
+    # Unknown models already reported (warned once per model, not once per call)
+    _unknown_models = set()
+
     def __new__(cls, model_name: str = "gpt-4o-mini"):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
@@ -43,7 +92,7 @@ class TokenHelper:
     def __init__(self, model_name: str = "gpt-4o-mini"):
         if not TokenHelper._initialized:
             self.model_name = model_name
-            self.encoding = self._get_encoding_for_model()
+            self._encoding = None
             self.logger = RobotCustomLogger()
             TokenHelper._initialized = True
             current_cost = self.get_cumulated_cost()
@@ -54,15 +103,45 @@ class TokenHelper:
             current_tokens = self.get_cumulated_tokens()
             self.logger.info(f"TokenHelper singleton reused - Current accumulated: cost={current_cost}, tokens={current_tokens}", False)
 
-    def _get_encoding_for_model(self) -> tiktoken.Encoding:
+    @property
+    def PRICING(self) -> Dict[str, Mapping[str, float]]:
+        """ Pricing per 1000 tokens (input/output) in USD, from the current llm_models.json """
+        return self._model_config.get_pricing_dict()
+
+    @property
+    def MAX_CONTEXT_TOKENS(self) -> Dict[str, int]:
+        """ Maximum context tokens per model, from the current llm_models.json """
+        return self._model_config.get_max_context_dict()
+
+    def _warn_unknown_model(self, model: str, message: str):
+        if model not in TokenHelper._unknown_models:
+            TokenHelper._unknown_models.add(model)
+            self.logger.warning(message)
+
+    @property
+    def encoding(self) -> "tiktoken.Encoding":
+        """ tiktoken and its BPE files are only loaded on the first token count """
+        if self._encoding is None:
+            self._encoding = self._get_encoding_for_model()
+        return self._encoding
+
+    def _encoding_name(self) -> str:
+        if "gpt-4" in self.model_name or "gpt-3.5" in self.model_name:
+            return "cl100k_base"
+        return "p50k_base"
+
+    def _get_encoding_for_model(self) -> "tiktoken.Encoding":
+        import tiktoken
         try:
-            if "gpt-4" in self.model_name or "gpt-3.5" in self.model_name:
-                return tiktoken.get_encoding("cl100k_base")
-            return tiktoken.get_encoding("p50k_base")
+            return tiktoken.get_encoding(self._encoding_name())
         except KeyError:
             raise ValueError(f"Unsupported model: {self.model_name}")
 
     def _count_tokens(self, text: str) -> int:
+        if self._encoding is None:
+            # With the sidecar the tokenizer is loaded once for every worker, in the daemon
+            return via_sidecar("count_tokens", lambda: len(self.encoding.encode(text)),
+                               encoding=self._encoding_name(), text=text)
         return len(self.encoding.encode(text))
     
     def _count_batch_tokens(self, texts: List[str]) -> List[int]:
@@ -120,7 +199,11 @@ class TokenHelper:
         max_tokens: int = None
     ) -> int:
         model = model or self.model_name
-        max_context = self.MAX_CONTEXT_TOKENS[model]  # y aura erreur si le model n'est pas dans le dictionnaire -> ajouter un default ? 
+        # Aliases and dated / versioned names resolve to their configured model
+        max_context = self._model_config.get_model_max_context(model)
+        if max_context is None:
+            max_context = self.DEFAULT_MAX_CONTEXT_TOKENS
+            self._warn_unknown_model(f"context:{model}", f"Max context not available for {model}, using {max_context} tokens")
         self.logger.info(f"Max context tokens for {model}: {max_context}")
         if max_tokens is not None:
             return min(max_tokens, max_context)
@@ -154,39 +237,58 @@ class TokenHelper:
         self,
         prompt_tokens: int,
         completion_tokens: int,
-        model: str = None
+        model: str = None,
+        price_factor: float = 1.0,
+        cached_tokens: int = 0
     ) -> Dict[str, float]:
+        """ price_factor: multiplier applied to the list price (e.g. 0.5 for batch API requests)
+        cached_tokens: prompt tokens served from the provider's prompt cache, priced at the model's
+        `cached_input` price (list input price when it has none) """
         model = model or self.model_name
-        if model not in self.PRICING:
-            self.logger.warning(f"Pricing not available for {model}, using GPT-4o default")
-            self.logger.info(f"Existing models: {self.PRICING.keys()}")
-            model = "gpt-4o-mini"
-            
-        input_cost = round((prompt_tokens / 1000) * self.PRICING[model]["input"], 5)
-        output_cost = round((completion_tokens / 1000) * self.PRICING[model]["output"], 5)
+        # Aliases and dated / versioned names (gpt-4o-2024-08-06) are priced as their configured model
+        pricing = self._model_config.get_model_pricing(model)
+        if pricing is None:
+            self._warn_unknown_model(f"pricing:{model}", f"Pricing not available for {model}, using {self.DEFAULT_PRICING_MODEL} default")
+            pricing = self._model_config.get_model_pricing(self.DEFAULT_PRICING_MODEL)
+
+        cached_tokens = min(cached_tokens or 0, prompt_tokens)
+        cached_price = pricing.get("cached_input", pricing["input"])
+        input_cost = round(((prompt_tokens - cached_tokens) * pricing["input"] + cached_tokens * cached_price) / 1000 * price_factor, 5)
+        output_cost = round((completion_tokens / 1000) * pricing["output"] * price_factor, 5)
+        cache_saving = round(cached_tokens * (pricing["input"] - cached_price) / 1000 * price_factor, 5)
         total_cost = round(input_cost + output_cost, 5)
 
-        # Debug logging - use file storage for true cross-process persistence
-        old_data = self._load_costs()
-        old_cumulated_cost = old_data['cost']
-        old_cumulated_tokens = old_data['tokens']
-        
-        new_cumulated_cost = old_cumulated_cost + total_cost
-        new_cumulated_tokens = old_cumulated_tokens + prompt_tokens + completion_tokens
-        
-        # Save to file with lock
-        self._save_costs(new_cumulated_cost, new_cumulated_tokens)
+        ledger = via_sidecar("ledger_add", lambda: self._add_to_cost_file(total_cost, prompt_tokens + completion_tokens),
+                             file=self._COST_FILE, cost=total_cost, tokens=prompt_tokens + completion_tokens)
 
-        self.logger.info(f"Cost calculation: {old_cumulated_cost} + {total_cost} = {new_cumulated_cost}", False)
-        self.logger.info(f"Token calculation: {old_cumulated_tokens} + {prompt_tokens + completion_tokens} = {new_cumulated_tokens}", False)
+        self.logger.info(f"Cost calculation: {ledger['previous_cost']} + {total_cost} = {ledger['cost']}", False)
+        self.logger.info(f"Token calculation: {ledger['previous_tokens']} + {prompt_tokens + completion_tokens} = {ledger['tokens']}", False)
 
         return {
             "input_cost": input_cost,
             "output_cost": output_cost,
-            "total_cost": total_cost
+            "total_cost": total_cost,
+            "cache_saving": cache_saving
         }
     
+    def _add_to_cost_file(self, cost: float, tokens: int) -> Dict[str, float]:
+        """
+        One locked read-modify-write: concurrent pabot workers do not lose each other's updates
+
+        Returns:
+            The previous and the new totals (previous_cost, previous_tokens, cost, tokens)
+        """
+        with self._locked_costs() as data:
+            previous = {"previous_cost": data['cost'], "previous_tokens": data['tokens']}
+            data['cost'] += cost
+            data['tokens'] += tokens
+            return {**previous, **data}
+
     def _load_costs(self) -> Dict[str, float]:
+        """Cumulated cost and tokens, from the sidecar ledger or from the cost file"""
+        return via_sidecar("ledger_get", self._load_cost_file, file=self._COST_FILE)
+
+    def _load_cost_file(self) -> Dict[str, float]:
         """Load costs from file with lock"""
         try:
             with open(self._COST_FILE, 'r') as f:
@@ -197,15 +299,36 @@ class TokenHelper:
         except (FileNotFoundError, json.JSONDecodeError, KeyError):
             return {"cost": 0.0, "tokens": 0}
     
-    def _save_costs(self, cost: float, tokens: int):
-        """Save costs to file with lock"""
+    @contextmanager
+    def _locked_costs(self) -> Iterator[Dict[str, float]]:
+        """Read-modify-write the cost file under an exclusive lock (the yielded dict is saved on exit)"""
         try:
-            with open(self._COST_FILE, 'w') as f:
-                fcntl.flock(f.fileno(), fcntl.LOCK_EX)  # Exclusive lock for writing
-                json.dump({"cost": cost, "tokens": tokens}, f)
-                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
-        except Exception as e:
+            f = open(self._COST_FILE, 'a+')
+        except OSError as e:
             self.logger.warning(f"Failed to save costs to file: {e}", False)
+            yield {"cost": 0.0, "tokens": 0}
+            return
+        with f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    stored = json.loads(f.read() or "{}")
+                except json.JSONDecodeError:
+                    stored = {}
+                data = {"cost": stored.get("cost", 0.0), "tokens": stored.get("tokens", 0)}
+                yield data
+                f.seek(0)
+                f.truncate()
+                json.dump(data, f)
+                f.flush()
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _save_costs(self, cost: float, tokens: int):
+        """Save costs to file with lock"""
+        with self._locked_costs() as data:
+            data.update(cost=cost, tokens=tokens)
     
     def get_cumulated_cost(self) -> float:
         """Get cumulated cost from file"""
@@ -215,13 +338,16 @@ class TokenHelper:
         """Get cumulated tokens from file"""
         return self._load_costs()['tokens']
     
+    def _reset_cost_file(self) -> Dict[str, float]:
+        with self._locked_costs() as data:
+            previous = dict(data)
+            data.update(cost=0.0, tokens=0)
+        return previous
+
     def reset_accumulation(self):
         """Reset cumulated cost and tokens to zero"""
-        old_data = self._load_costs()
-        old_cost = old_data['cost']
-        old_tokens = old_data['tokens']
-        self._save_costs(0.0, 0)
-        self.logger.info(f"Reset accumulation: cost {old_cost} → 0, tokens {old_tokens} → 0", False)
+        previous = via_sidecar("ledger_reset", self._reset_cost_file, file=self._COST_FILE)
+        self.logger.info(f"Reset accumulation: cost {previous['cost']} → 0, tokens {previous['tokens']} → 0", False)
     
     def get_stats_summary(self) -> Dict[str, Any]:
         """Get comprehensive statistics summary"""
@@ -0,0 +1,447 @@
+"""
+Compacted UI XML: the Appium page source reduced to the nodes a model can act on.
+
+A page source is mostly layout containers; the LLM only needs the nodes that
+show something or can be acted on. UISnapshot.parse keeps, in document order,
+the visible nodes with a text, a description, an id, or an interaction flag,
+and renders each of them as one line:
+
+    n4 Button "Log in" id=login_button click @540,1210
+
+`n4` is the reference of the node in this snapshot (what the model answers
+with), the coordinates are the center of its bounds. Android (UiAutomator2)
+and iOS (XCUITest) sources are both read; ids are shown without their package
+prefix. Each node also has a stable identity (id, bounds, index path) and an
+XPath selector, so a node chosen on one snapshot can be found on the next.
+
+Multi-turn conversations do not need the whole tree again on every turn:
+diff_snapshots matches the nodes of two snapshots by identity (id, bounds and
+index path; then, for the nodes a new dialog or list item moved, class, id
+and texts, or class, id and bounds) and gives the added, removed and changed
+nodes. UIDiffTracker keeps
+the snapshot a conversation last sent, gives the nodes of the next one the
+references the model already knows (new nodes get new ones), and renders
+either that change set or, for a new conversation or when most of the screen
+changed, the full tree:
+
+    + n31 Button "OK" click @540,1210
+    - n4 Button "Log in" id=login click @540,950
+    ~ n12 TextView "3 items" @540,300 (was "2 items")
+"""
+import dataclasses
+import hashlib
+import threading
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from src.AiHelper.common._logger import RobotCustomLogger
+
+PLATFORM_ANDROID = "android"
+PLATFORM_IOS = "ios"
+
+# Source attribute of (text, description, id) per platform
+_ATTRIBUTES = {
+    PLATFORM_ANDROID: ("text", "content-desc", "resource-id"),
+    PLATFORM_IOS: ("value", "label", "name"),
+}
+_ANDROID_FLAGS = {"clickable": "click", "long-clickable": "longclick", "scrollable": "scroll",
+                  "checked": "checked", "focused": "focused", "password": "password"}
+_EDITABLE_CLASSES = ("EditText", "TextField", "SecureTextField", "SearchField", "AutoCompleteTextView")
+_IOS_INTERACTIVE = ("Button", "Cell", "Link", "Switch", "Slider", "TextField", "SecureTextField", "SearchField", "Tab")
+
+Bounds = Tuple[int, int, int, int]
+
+# Above this share of the full tree size, the change set is not worth it: the full tree is sent
+DEFAULT_MAX_DIFF_RATIO = 0.6
+
+
+def _parse_bounds(element: ET.Element) -> Bounds:
+    """(x1, y1, x2, y2) of an Android `bounds="[x1,y1][x2,y2]"` or of iOS x / y / width / height."""
+    bounds = element.get("bounds")
+    if bounds:
+        try:
+            x1, y1, x2, y2 = (int(value) for value in bounds.replace("][", ",").strip("[]").split(","))
+            return x1, y1, x2, y2
+        except ValueError:
+            return 0, 0, 0, 0
+    try:
+        x, y = int(float(element.get("x", 0))), int(float(element.get("y", 0)))
+        return x, y, x + int(float(element.get("width", 0))), y + int(float(element.get("height", 0)))
+    except ValueError:
+        return 0, 0, 0, 0
+
+
+def _short_class(element: ET.Element) -> str:
+    name = element.get("class") or element.tag
+    name = name.rsplit(".", 1)[-1]
+    return name[len("XCUIElementType"):] if name.startswith("XCUIElementType") else name
+
+
+def _xpath_literal(value: str) -> Optional[str]:
+    if '"' not in value:
+        return f'"{value}"'
+    if "'" not in value:
+        return f"'{value}'"
+    return None
+
+
+@dataclass(frozen=True)
+class UINode:
+    ref: str
+    cls: str
+    text: str
+    desc: str
+    resource_id: str
+    bounds: Bounds
+    # Index path of the source element from the root ("0/2/1")
+    path: str
+    flags: FrozenSet[str]
+    platform: str = PLATFORM_ANDROID
+
+    @property
+    def center(self) -> Tuple[int, int]:
+        x1, y1, x2, y2 = self.bounds
+        return (x1 + x2) // 2, (y1 + y2) // 2
+
+    @property
+    def short_id(self) -> str:
+        return self.resource_id.rsplit(":id/", 1)[-1]
+
+    @property
+    def key(self) -> Tuple[str, Bounds, str]:
+        """Stable identity of the node across snapshots."""
+        return self.resource_id, self.bounds, self.path
+
+    @property
+    def label(self) -> str:
+        """What the node shows: its text, else its description, else its id."""
+        return self.text or self.desc or self.short_id
+
+    def line(self) -> str:
+        parts = [self.ref, self.cls]
+        if self.text:
+            parts.append(f'"{self.text}"')
+        if self.desc and self.desc != self.text:
+            parts.append(f'desc="{self.desc}"')
+        if self.resource_id and self.short_id not in (self.text, self.desc):
+            parts.append(f"id={self.short_id}")
+        parts.extend(sorted(self.flags))
+        parts.append("@{},{}".format(*self.center))
+        return " ".join(parts)
+
+    def xpath(self) -> Optional[str]:
+        """XPath on the identifying attributes of the node (None when it has none)."""
+        text_attr, desc_attr, id_attr = _ATTRIBUTES[self.platform]
+        predicates = []
+        for attribute, value in ((id_attr, self.resource_id), (desc_attr, self.desc), (text_attr, self.text)):
+            literal = _xpath_literal(value) if value else None
+            if literal:
+                predicates.append(f"@{attribute}={literal}")
+        if not predicates:
+            return None
+        return "//*[" + " and ".join(predicates) + "]"
+
+    def matches(self, other: "UINode") -> bool:
+        """Same element on another snapshot: same class and identifying attributes."""
+        return (self.cls, self.resource_id, self.desc, self.text) == (other.cls, other.resource_id, other.desc, other.text)
+
+
+class UISnapshot:
+    """Compacted page source."""
+
+    def __init__(self, nodes: List[UINode], platform: str = PLATFORM_ANDROID, raw_size: int = 0):
+        self.nodes = nodes
+        self.platform = platform
+        self.raw_size = raw_size
+        self._by_ref: Dict[str, UINode] = {node.ref: node for node in nodes}
+
+    @classmethod
+    def parse(cls, xml: str) -> "UISnapshot":
+        """Compact a page source (an unparsable source gives an empty snapshot)."""
+        try:
+            root = ET.fromstring(xml.encode("utf-8") if isinstance(xml, str) else xml)
+        except ET.ParseError as e:
+            RobotCustomLogger().warning(f"Unparsable UI XML ({e}), nothing to compact")
+            return cls([], raw_size=len(xml or ""))
+        # XCUITest sources: <AppiumAUT><XCUIElementTypeApplication ...>; UiAutomator2: <hierarchy>
+        platform = PLATFORM_IOS if root.tag == "AppiumAUT" or root.tag.startswith("XCUIElementType") else PLATFORM_ANDROID
+        text_attr, desc_attr, id_attr = _ATTRIBUTES[platform]
+        nodes: List[UINode] = []
+
+        def visit(element: ET.Element, path: str):
+            if platform == PLATFORM_IOS and element.get("visible") == "false":
+                return
+            bounds = _parse_bounds(element)
+            node_class = _short_class(element)
+            text = (element.get(text_attr) or "").strip()
+            desc = (element.get(desc_attr) or "").strip()
+            resource_id = (element.get(id_attr) or "").strip()
+            flags = set()
+            if platform == PLATFORM_ANDROID:
+                flags.update(flag for attribute, flag in _ANDROID_FLAGS.items() if element.get(attribute) == "true")
+            elif node_class in _IOS_INTERACTIVE:
+                flags.add("click")
+            if element.get("enabled") == "false":
+                flags.add("disabled")
+            if node_class.endswith(_EDITABLE_CLASSES) and (platform == PLATFORM_IOS or element.get("focusable") == "true"):
+                flags.add("edit")
+            if platform == PLATFORM_IOS and desc == resource_id:
+                # XCUITest names default to the label
+                resource_id = ""
+            has_area = bounds[2] > bounds[0] and bounds[3] > bounds[1]
+            if has_area and (text or desc or resource_id or flags - {"disabled", "focused"}):
+                nodes.append(UINode(f"n{len(nodes) + 1}", node_class, text, desc, resource_id, bounds, path,
+                                    frozenset(flags), platform))
+            for index, child in enumerate(element):
+                visit(child, f"{path}/{index}")
+
+        visit(root, "0")
+        return cls(nodes, platform, len(xml))
+
+    def node(self, ref: str) -> Optional[UINode]:
+        return self._by_ref.get(ref.strip())
+
+    def find(self, node: UINode) -> Optional[UINode]:
+        """The node of this snapshot matching one of another snapshot (the closest one when several match)."""
+        candidates = [candidate for candidate in self.nodes if candidate.matches(node)]
+        if not candidates:
+            return None
+        x, y = node.center
+        return min(candidates, key=lambda candidate: abs(candidate.center[0] - x) + abs(candidate.center[1] - y))
+
+    def find_label(self, label: str) -> Optional[UINode]:
+        """The node showing `label` (text, description or id; exact match first, then substring), actionable ones first."""
+        needle = label.strip().lower()
+        if not needle:
+            return None
+        exact, partial = [], []
+        for node in self.nodes:
+            values = (node.text.lower(), node.desc.lower(), node.short_id.lower())
+            if needle in values:
+                exact.append(node)
+            elif any(needle in value for value in values[:2]):
+                partial.append(node)
+        for candidates in (exact, partial):
+            if candidates:
+                return min(candidates, key=lambda node: "click" not in node.flags and "edit" not in node.flags)
+        return None
+
+    def contains_text(self, text: str) -> bool:
+        """Whether a node shows `text` (case-insensitive substring of its text, description or id)."""
+        needle = text.strip().lower()
+        return any(needle in node.text.lower() or needle in node.desc.lower() or needle == node.short_id.lower()
+                   for node in self.nodes)
+
+    @cached_property
+    def window(self) -> Bounds:
+        """Bounds covering every kept node (the screen, as far as the snapshot knows)."""
+        if not self.nodes:
+            return 0, 0, 0, 0
+        return (min(node.bounds[0] for node in self.nodes), min(node.bounds[1] for node in self.nodes),
+                max(node.bounds[2] for node in self.nodes), max(node.bounds[3] for node in self.nodes))
+
+    @cached_property
+    def layout_signature(self) -> str:
+        """Hash of the node classes and ids only: the same screen with other texts (news, times...) keeps it."""
+        digest = hashlib.sha1()
+        for node in self.nodes:
+            digest.update(f"{node.cls}|{node.resource_id}\n".encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    @cached_property
+    def signature(self) -> str:
+        return hashlib.sha1(self.text().encode("utf-8")).hexdigest()[:16]
+
+    def text(self) -> str:
+        """One line per node (see the module docstring)."""
+        return "\n".join(node.line() for node in self.nodes)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+
+@dataclass
+class UIDiff:
+    added: List[UINode]
+    removed: List[UINode]
+    # (before, after)
+    changed: List[Tuple[UINode, UINode]]
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+    @staticmethod
+    def _was(before: UINode, after: UINode) -> str:
+        """ what `before` showed that `after` does not """
+        was = []
+        if before.text != after.text:
+            was.append(f'"{before.text}"')
+        if before.desc != after.desc:
+            was.append(f'desc="{before.desc}"')
+        if before.flags != after.flags:
+            was.append(" ".join(sorted(before.flags)) or "no flags")
+        if before.center != after.center:
+            was.append("@{},{}".format(*before.center))
+        return " ".join(was)
+
+    def text(self) -> str:
+        """ one line per added (+), removed (-) and changed (~) node """
+        lines = [f"+ {node.line()}" for node in self.added]
+        lines += [f"- {node.line()}" for node in self.removed]
+        lines += [f"~ {after.line()} (was {self._was(before, after)})" for before, after in self.changed]
+        return "\n".join(lines)
+
+    def summary(self) -> str:
+        return f"{len(self.added)} added, {len(self.removed)} removed, {len(self.changed)} changed"
+
+
+# Matching passes, most specific first: stable identity (id, bounds, index path); then the same element
+# moved by a new sibling or a layout change (class, id, texts); then the same place with another text (class, id, bounds)
+_MATCH_KEYS = (
+    lambda node: node.key,
+    lambda node: (node.cls, node.resource_id, node.text, node.desc),
+    lambda node: (node.cls, node.resource_id, node.bounds),
+)
+
+
+def _match(before: UISnapshot, after: UISnapshot) -> Tuple[List[Tuple[UINode, UINode]], List[UINode], List[UINode]]:
+    """ (matched (before, after) pairs, added, removed) """
+    pairs = []
+    unmatched_before, unmatched_after = before.nodes, after.nodes
+    for match_key in _MATCH_KEYS:
+        if not unmatched_before or not unmatched_after:
+            break
+        candidates: Dict[Any, List[UINode]] = {}
+        for node in unmatched_before:
+            candidates.setdefault(match_key(node), []).append(node)
+        remaining = []
+        for node in unmatched_after:
+            bucket = candidates.get(match_key(node))
+            if bucket:
+                pairs.append((bucket.pop(0), node))
+            else:
+                remaining.append(node)
+        matched = {id(old) for old, _ in pairs}
+        unmatched_before = [node for node in unmatched_before if id(node) not in matched]
+        unmatched_after = remaining
+    return pairs, unmatched_after, unmatched_before
+
+
+def _shown(node: UINode) -> Tuple[Any, ...]:
+    return node.text, node.desc, node.flags, node.bounds
+
+
+def diff_snapshots(before: UISnapshot, after: UISnapshot) -> UIDiff:
+    """ nodes of `after` added, removed or changed since `before` """
+    pairs, added, removed = _match(before, after)
+    changed = [(old, new) for old, new in pairs if _shown(old) != _shown(new)]
+    return UIDiff(added, removed, changed)
+
+
+@dataclass
+class UITurn:
+    """ what one turn of a conversation sends """
+    text: str
+    snapshot: UISnapshot
+    diff: Optional[UIDiff]
+    full_text: str
+
+    @property
+    def incremental(self) -> bool:
+        return self.diff is not None
+
+
+class UIDiffTracker:
+    """Snapshots sent in one conversation: stable node references and changes since the last snapshot sent."""
+
+    def __init__(self, max_diff_ratio: float = DEFAULT_MAX_DIFF_RATIO):
+        """
+        Args:
+            max_diff_ratio: Size of the change set (share of the full tree) above which the full tree is sent
+        """
+        self.max_diff_ratio = max_diff_ratio
+        self.baseline: Optional[UISnapshot] = None
+        self._next_ref = 1
+
+    def reset(self):
+        """ new conversation: the next snapshot is sent in full """
+        self.baseline = None
+        self._next_ref = 1
+
+    def turn(self, snapshot: UISnapshot) -> UITurn:
+        """
+        Args:
+            snapshot: Screen to send
+
+        Returns:
+            UITurn: the change set since the last snapshot sent (diff set), or the full tree (diff None) for
+            the first turn or when the change set would not be much smaller. Its snapshot, where the nodes
+            already sent keep their reference and the others get new ones, becomes the baseline.
+        """
+        pairs, added, removed = _match(self.baseline, snapshot) if self.baseline is not None else ([], [], [])
+        refs = {id(new): old.ref for old, new in pairs}
+        renamed = {}
+        for node in snapshot.nodes:
+            ref = refs.get(id(node))
+            if ref is None:
+                ref = f"n{self._next_ref}"
+                self._next_ref += 1
+            renamed[id(node)] = dataclasses.replace(node, ref=ref)
+        snapshot = UISnapshot([renamed[id(node)] for node in snapshot.nodes], snapshot.platform, snapshot.raw_size)
+
+        full_text = snapshot.text()
+        text, diff = full_text, None
+        if self.baseline is not None:
+            diff = UIDiff([renamed[id(node)] for node in added], removed,
+                          [(old, renamed[id(new)]) for old, new in pairs if _shown(old) != _shown(new)])
+            diff_text = diff.text() if diff else "(no change)"
+            if len(diff_text) <= self.max_diff_ratio * len(full_text):
+                text = diff_text
+            else:
+                diff = None
+        self.baseline = snapshot
+        return UITurn(text, snapshot, diff, full_text)
+
+
+class UIDiffStats:
+    """Process-wide UI XML turns per suite: tokens of the full trees against tokens actually sent."""
+
+    _lock = threading.Lock()
+    _records: Dict[str, Dict[str, Any]] = {}
+
+    @classmethod
+    def record(cls, suite: str, full_tokens: int, sent_tokens: int, incremental: bool):
+        """
+        Args:
+            suite: Suite name
+            full_tokens: Tokens of the full compacted tree of the turn
+            sent_tokens: Tokens sent (the change set of an incremental turn)
+            incremental: Whether the change set was sent
+        """
+        with cls._lock:
+            stats = cls._records.setdefault(suite, {"turns": 0, "incremental_turns": 0, "full_tokens": 0, "sent_tokens": 0})
+            stats["turns"] += 1
+            stats["incremental_turns"] += int(incremental)
+            stats["full_tokens"] += full_tokens
+            stats["sent_tokens"] += sent_tokens
+
+    @classmethod
+    def summary(cls) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns:
+            Per suite: turns, incremental turns, tokens of the full trees, tokens sent, tokens saved and saved ratio
+        """
+        with cls._lock:
+            summary = {}
+            for suite, stats in cls._records.items():
+                saved = stats["full_tokens"] - stats["sent_tokens"]
+                summary[suite] = dict(stats, saved_tokens=saved,
+                                      saved_ratio=round(saved / stats["full_tokens"], 3) if stats["full_tokens"] else 0.0)
+            return summary
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._records = {}
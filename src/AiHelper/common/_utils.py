@@ -1,11 +1,12 @@
 import base64
 import os
 from robot.libraries.BuiltIn import BuiltIn
-from PIL import Image
 from robot.api import logger
 import json
 import re
-from typing import Any, Dict
+from typing import Any, Dict, Union
+from src.AiHelper.common._screenshot import Screenshot
+from src.AiHelper.config.config import Config
 
 class Utilities:
         
@@ -17,6 +18,14 @@ class Utilities:
             return os.path.dirname(logfile)
         return variables['${OUTPUTDIR}']
     
+    @staticmethod
+    def _get_suite_name() -> str:
+        """ current suite name, "default" outside a Robot Framework run """
+        try:
+            return BuiltIn().get_variable_value("${SUITE_NAME}") or "default"
+        except Exception:
+            return "default"
+
     @staticmethod
     def _get_driver():
         built_in = BuiltIn()
@@ -25,16 +34,62 @@ class Utilities:
 
     @staticmethod
     def _get_ui_xml():
-        return Utilities._get_driver().page_source
+        """ page source of the current screen, also checked for a rotation / app switch (device profile) """
+        from src.AiHelper.common._device import DeviceProfiles
+        driver = Utilities._get_driver()
+        ui_xml = driver.page_source
+        DeviceProfiles().observe_page_source(driver, ui_xml)
+        return ui_xml
     
     @staticmethod
     def _take_screenshot_as_base64():
-        return Utilities._get_driver().get_screenshot_as_base64()
+        return Utilities._take_screenshot().base64
+
+    @staticmethod
+    def _take_screenshot() -> Screenshot:
+        """ current screen as a Screenshot: captured once, its other forms are derived on demand.
+        Its size completes the device profile of the session (or shows a rotation) """
+        from src.AiHelper.common._device import DeviceProfiles
+        driver = Utilities._get_driver()
+        screenshot = Screenshot.from_base64(driver.get_screenshot_as_base64())
+        DeviceProfiles().observe_screenshot(driver, screenshot)
+        return screenshot
     
     @staticmethod
-    def _embed_image_to_log(base64_screenshot, width=400, message=None):
+    def _embed_image_to_log(screenshot: Union[str, Screenshot], width=400, message=None):
+        """ screenshot: Screenshot or base64 PNG """
+        if not Config.EVIDENCE_STORE:
+            base64_screenshot = screenshot.base64 if isinstance(screenshot, Screenshot) else screenshot
+            logger.info(f'{message if message else ""}</td></tr><tr><td colspan="3">'
+                           '<img src="data:image/png;base64, %s" width="%s">' % (base64_screenshot, width), True, False)
+            return
+        # The image is written once to the evidence store, the log only links to it
+        from src.AiHelper.common._evidence import EvidenceStore
+        store = EvidenceStore.for_output_dir()
+        record = store.store_image(screenshot, thumbnail_width=width)
+        src = store.relative(record.thumbnail_path or record.path)
         logger.info(f'{message if message else ""}</td></tr><tr><td colspan="3">'
-                       '<img src="data:image/png;base64, %s" width="%s">' % (base64_screenshot, width), True, False)
+                       f'<a href="{store.relative(record.path)}"><img src="{src}" width="{width}"></a>', True, False)
+
+    @staticmethod
+    def _link_ui_xml_to_log(ui_xml: str, message: str = "UI XML"):
+        """ stores the UI XML (gzip) in the evidence store and logs a link to it """
+        if not Config.EVIDENCE_STORE:
+            return
+        from src.AiHelper.common._evidence import EvidenceStore
+        store = EvidenceStore.for_output_dir()
+        record = store.store_xml(ui_xml)
+        logger.info(f'<a href="{store.relative(record.path)}">{message} ({record.size // 1024} KB, sha {record.sha[:12]})</a>', True, False)
+
+    @staticmethod
+    def _link_json_to_log(data: Dict[str, Any], message: str):
+        """ stores a JSON document in the evidence store and logs a link to it """
+        if not Config.EVIDENCE_STORE:
+            return
+        from src.AiHelper.common._evidence import EvidenceStore
+        store = EvidenceStore.for_output_dir()
+        record = store.store_json(data)
+        logger.info(f'<a href="{store.relative(record.path)}">{message} (sha {record.sha[:12]})</a>', True, False)
 
     @staticmethod
     def encode_image_to_base64(file_path: str):
@@ -43,23 +98,20 @@ class Utilities:
         return base64_data
 
     @staticmethod
-    def extract_json_safely(response: str) -> Dict[str, Any]:
-        try:
-            return json.loads(response)
-        except json.JSONDecodeError:
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                try:
-                    return json.loads(json_str)
-                except json.JSONDecodeError:
-                    raise ValueError("Extracted content is not valid JSON.")
-            else:
-                raise ValueError("No JSON content found in the response.")
+    def extract_json_safely(response: str, schema=None) -> Dict[str, Any]:
+        """
+        JSON object of an LLM reply (see common._structured.extract_json), checked against
+        `schema` (ResponseSchema or its name) when given. Raises ValueError when nothing can be parsed.
+        """
+        from src.AiHelper.common._structured import extract_json, get_schema
+        schema = get_schema(schema)
+        data = extract_json(response, required=list(schema.properties) if schema else ())
+        return schema.coerce(data) if schema else data
 
 
     @staticmethod
     def _capture_screenshot_and_reduce_size(output_filename="reduced_screenshot.png", resize_factor=2):
+        from PIL import Image
         try:
             driver = Utilities._get_driver()
             output_dir = Utilities._get_log_dir()
@@ -0,0 +1,255 @@
+"""
+Local visual comparison of the current screen with a reference screenshot.
+
+Both images are compared in grayscale at a reduced resolution with a
+NumPy-vectorized SSIM (box-filter windows computed from integral images).
+Mask regions (status bar clock, battery...) are ignored. When the similarity
+is above the threshold the verification can pass without an LLM call;
+otherwise the changed regions are located (SSIM map thresholded on a coarse
+grid, then connected cells grouped into boxes) so that only crops of those
+regions, with some surrounding context, are sent to the model.
+"""
+import io
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from src.AiHelper.common._screenshot import Screenshot
+from src.AiHelper.config.config import Config
+
+# (x0, y0, x1, y1) as fractions of the width / height
+Region = Tuple[float, float, float, float]
+# (left, top, right, bottom) in pixels of the current screenshot
+Box = Tuple[int, int, int, int]
+
+ESCALATION_NONE = "shortcut"
+ESCALATION_CROPS = "crops"
+ESCALATION_FULL = "full"
+
+_WORKING_WIDTH = 360
+_SSIM_WINDOW = 7
+_SSIM_C1 = (0.01 * 255) ** 2
+_SSIM_C2 = (0.03 * 255) ** 2
+_CELL = 12
+# A cell is changed when this share of its pixels has a local SSIM under _CHANGED_SSIM
+_CHANGED_SSIM = 0.8
+_CHANGED_CELL_SHARE = 0.05
+
+
+def parse_regions(regions: Union[None, str, Sequence]) -> List[Region]:
+    """ "0,0,1,0.04;0.8,0.9,1,1" or a list of 4-tuples -> list of regions """
+    if not regions:
+        return []
+    if isinstance(regions, str):
+        regions = [part.split(",") for part in regions.split(";") if part.strip()]
+    return [tuple(float(value) for value in region) for region in regions]
+
+
+@dataclass
+class VisualDiffResult:
+    similarity: float
+    changed_fraction: float
+    boxes: List[Box] = field(default_factory=list)
+    size: Tuple[int, int] = (0, 0)
+    escalation: str = ESCALATION_FULL
+
+    @property
+    def identical(self) -> bool:
+        return self.escalation == ESCALATION_NONE
+
+
+class VisualDiffStats:
+    """Process-wide shortcut / escalation counters."""
+
+    _lock = threading.Lock()
+    _counts: Dict[str, int] = {ESCALATION_NONE: 0, ESCALATION_CROPS: 0, ESCALATION_FULL: 0}
+    _similarity_total = 0.0
+
+    @classmethod
+    def record(cls, result: VisualDiffResult):
+        with cls._lock:
+            cls._counts[result.escalation] += 1
+            cls._similarity_total += result.similarity
+
+    @classmethod
+    def summary(cls) -> Dict[str, float]:
+        with cls._lock:
+            total = sum(cls._counts.values())
+            return {
+                "comparisons": total,
+                "shortcuts": cls._counts[ESCALATION_NONE],
+                "crop_escalations": cls._counts[ESCALATION_CROPS],
+                "full_escalations": cls._counts[ESCALATION_FULL],
+                "shortcut_rate": round(cls._counts[ESCALATION_NONE] / total, 3) if total else 0.0,
+                "escalation_rate": round(1 - cls._counts[ESCALATION_NONE] / total, 3) if total else 0.0,
+                "mean_similarity": round(cls._similarity_total / total, 4) if total else 0.0,
+            }
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._counts = {ESCALATION_NONE: 0, ESCALATION_CROPS: 0, ESCALATION_FULL: 0}
+            cls._similarity_total = 0.0
+
+
+def _box_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Mean over window x window neighbourhoods ('valid' positions) from an integral image."""
+    integral = np.pad(values, ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+    total = (integral[window:, window:] - integral[:-window, window:]
+             - integral[window:, :-window] + integral[:-window, :-window])
+    return total / (window * window)
+
+
+def ssim_map(a: np.ndarray, b: np.ndarray, window: int = _SSIM_WINDOW) -> np.ndarray:
+    """Local SSIM of two grayscale float arrays, same shape minus window - 1."""
+    mean_a = _box_mean(a, window)
+    mean_b = _box_mean(b, window)
+    var_a = _box_mean(a * a, window) - mean_a ** 2
+    var_b = _box_mean(b * b, window) - mean_b ** 2
+    covariance = _box_mean(a * b, window) - mean_a * mean_b
+    return ((2 * mean_a * mean_b + _SSIM_C1) * (2 * covariance + _SSIM_C2)) / (
+        (mean_a ** 2 + mean_b ** 2 + _SSIM_C1) * (var_a + var_b + _SSIM_C2))
+
+
+class VisualComparator:
+
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        masks: Union[None, str, Sequence] = None,
+        context: float = 0.05,
+        max_regions: int = 4,
+        max_changed_fraction: float = 0.4,
+    ):
+        """
+        Args:
+            threshold: Mean SSIM at or above which the screens are considered identical (AIHELPER_VISUAL_DIFF_THRESHOLD)
+            masks: Regions ignored by the comparison (AIHELPER_VISUAL_DIFF_MASKS: the status bar by default)
+            context: Margin added around each changed region, as a fraction of the screen width
+            max_regions: Above this number of changed regions the full screenshots are sent
+            max_changed_fraction: Above this changed area the full screenshots are sent
+        """
+        self.threshold = Config.VISUAL_DIFF_THRESHOLD if threshold is None else float(threshold)
+        self.masks = parse_regions(Config.VISUAL_DIFF_MASKS if masks is None else masks)
+        self.context = context
+        self.max_regions = max_regions
+        self.max_changed_fraction = max_changed_fraction
+
+    @staticmethod
+    def _load(image: Union[Screenshot, str, bytes], size: Optional[Tuple[int, int]] = None):
+        """PIL image from a Screenshot / base64 / PNG bytes / file path (decoded once per Screenshot)."""
+        loaded = Screenshot.of(image).image
+        if loaded.mode != "RGB":
+            loaded = loaded.convert("RGB")
+        if size is not None and loaded.size != size:
+            loaded = loaded.resize(size)
+        return loaded
+
+    def _valid_mask(self, shape: Tuple[int, int]) -> np.ndarray:
+        height, width = shape
+        valid = np.ones(shape, dtype=bool)
+        for x0, y0, x1, y1 in self.masks:
+            valid[int(y0 * height):int(np.ceil(y1 * height)), int(x0 * width):int(np.ceil(x1 * width))] = False
+        return valid
+
+    def compare(self, current: Union[Screenshot, str, bytes], reference: Union[Screenshot, str, bytes]) -> VisualDiffResult:
+        """
+        Args:
+            current: Current screenshot (Screenshot, base64, PNG bytes or file path)
+            reference: Reference screenshot (same formats), resized to the current one if needed
+
+        Returns:
+            VisualDiffResult with the escalation decision (recorded in VisualDiffStats)
+        """
+        current_image = self._load(current)
+        reference_image = self._load(reference, current_image.size)
+        width, height = current_image.size
+        scale = min(1.0, _WORKING_WIDTH / width)
+        working_size = (max(_SSIM_WINDOW, int(width * scale)), max(_SSIM_WINDOW, int(height * scale)))
+
+        a = np.asarray(current_image.convert("L").resize(working_size), dtype=np.float64)
+        b = np.asarray(reference_image.convert("L").resize(working_size), dtype=np.float64)
+        local = ssim_map(a, b)
+        # ssim_map drops window - 1 rows / columns: align the mask on the window centres
+        offset = _SSIM_WINDOW // 2
+        valid = self._valid_mask(a.shape)[offset:offset + local.shape[0], offset:offset + local.shape[1]]
+
+        similarity = float(local[valid].mean()) if valid.any() else 1.0
+        changed = (local < _CHANGED_SSIM) & valid
+        result = VisualDiffResult(
+            similarity=similarity,
+            changed_fraction=float(changed.sum() / max(1, valid.sum())),
+            size=(width, height),
+        )
+
+        # The mean SSIM hides small changes (a word, an icon): the shortcut also requires no changed region
+        boxes = self._changed_boxes(changed, offset, 1 / scale, (width, height))
+        if similarity >= self.threshold and not boxes:
+            result.escalation = ESCALATION_NONE
+        elif boxes and len(boxes) <= self.max_regions and result.changed_fraction <= self.max_changed_fraction:
+            result.boxes = boxes
+            result.escalation = ESCALATION_CROPS
+        else:
+            result.escalation = ESCALATION_FULL
+        VisualDiffStats.record(result)
+        return result
+
+    def _changed_boxes(self, changed: np.ndarray, offset: int, factor: float, size: Tuple[int, int]) -> List[Box]:
+        """Group changed cells into boxes in current screenshot pixels, with context, merged when overlapping."""
+        rows = -(-changed.shape[0] // _CELL)
+        columns = -(-changed.shape[1] // _CELL)
+        padded = np.zeros((rows * _CELL, columns * _CELL), dtype=bool)
+        padded[:changed.shape[0], :changed.shape[1]] = changed
+        cells = padded.reshape(rows, _CELL, columns, _CELL).mean(axis=(1, 3)) >= _CHANGED_CELL_SHARE
+
+        boxes: List[Box] = []
+        seen = np.zeros_like(cells)
+        margin = int(self.context * size[0])
+        for row, column in zip(*np.nonzero(cells)):
+            if seen[row, column]:
+                continue
+            # Flood fill (8-connectivity) over the coarse grid
+            stack = [(row, column)]
+            seen[row, column] = True
+            top, left, bottom, right = row, column, row, column
+            while stack:
+                r, c = stack.pop()
+                top, left, bottom, right = min(top, r), min(left, c), max(bottom, r), max(right, c)
+                for dr in (-1, 0, 1):
+                    for dc in (-1, 0, 1):
+                        nr, nc = r + dr, c + dc
+                        if 0 <= nr < rows and 0 <= nc < columns and cells[nr, nc] and not seen[nr, nc]:
+                            seen[nr, nc] = True
+                            stack.append((nr, nc))
+            boxes.append((
+                max(0, int((left * _CELL + offset) * factor) - margin),
+                max(0, int((top * _CELL + offset) * factor) - margin),
+                min(size[0], int(((right + 1) * _CELL + offset) * factor) + margin),
+                min(size[1], int(((bottom + 1) * _CELL + offset) * factor) + margin),
+            ))
+        return self._merge(boxes)
+
+    @staticmethod
+    def _merge(boxes: List[Box]) -> List[Box]:
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(boxes)):
+                for j in range(i + 1, len(boxes)):
+                    a, b = boxes[i], boxes[j]
+                    if a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]:
+                        boxes[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                        del boxes[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+        return boxes
+
+    def crop(self, image: Union[Screenshot, str, bytes], box: Box, size: Optional[Tuple[int, int]] = None) -> Screenshot:
+        """PNG Screenshot of `box` cut out of `image` (resized to `size` first, for the reference)."""
+        buffer = io.BytesIO()
+        self._load(image, size).crop(box).save(buffer, format="PNG")
+        return Screenshot(buffer.getvalue())
@@ -32,6 +32,121 @@ class Config:
     
     # Ollama Configuration (local server)
     OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/v1")
+    # native (/api/chat: keep_alive, warm-up, load / inference times) or openai (the /v1 compatible endpoint)
+    OLLAMA_MODE = os.getenv("AIHELPER_OLLAMA_MODE", "native").lower()
+    # How long the server keeps the model loaded after a request ("30m", -1 = forever)
+    OLLAMA_KEEP_ALIVE = os.getenv("AIHELPER_OLLAMA_KEEP_ALIVE", "30m")
+    # Load the model in the background when the client is created (first keyword of the suite)
+    OLLAMA_WARMUP = os.getenv("AIHELPER_OLLAMA_WARMUP", "true").lower() == "true"
+    # Requests in flight to the server at once, across pabot workers: the server's OLLAMA_NUM_PARALLEL
+    OLLAMA_NUM_PARALLEL = int(os.getenv("AIHELPER_OLLAMA_NUM_PARALLEL") or os.getenv("OLLAMA_NUM_PARALLEL") or "4")
+    
+    # Retry / backoff / rate limit scheduler shared by every provider client
+    MAX_RETRIES = int(os.getenv("AIHELPER_MAX_RETRIES", "3"))
+    BASE_BACKOFF = float(os.getenv("AIHELPER_BASE_BACKOFF", "2"))
+    MAX_BACKOFF = float(os.getenv("AIHELPER_MAX_BACKOFF", "60"))
+    RATE_LIMIT_ENABLED = os.getenv("AIHELPER_RATE_LIMIT_ENABLED", "true").lower() == "true"
+    # Token buckets are shared by every pabot worker through this file
+    RATE_LIMIT_STATE_FILE = os.getenv("AIHELPER_RATE_LIMIT_STATE_FILE", "/tmp/ai_rate_limits.json")
+
+    # Timeouts (seconds): per API call, per upload, and default time budget of the AI keywords (0 = no budget)
+    LLM_TIMEOUT = float(os.getenv("AIHELPER_LLM_TIMEOUT", "120"))
+    UPLOAD_TIMEOUT = float(os.getenv("AIHELPER_UPLOAD_TIMEOUT", "30"))
+    KEYWORD_TIMEOUT = float(os.getenv("AIHELPER_KEYWORD_TIMEOUT", "0"))
+
+    # Library log file (written by a background thread): level, rotation size and number of rotated files
+    LOG_LEVEL = os.getenv("AIHELPER_LOG_LEVEL", "INFO")
+    LOG_MAX_BYTES = int(os.getenv("AIHELPER_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    LOG_BACKUP_COUNT = int(os.getenv("AIHELPER_LOG_BACKUP_COUNT", "5"))
+
+    # Screenshots and UI XML logged as links to <log dir>/evidence/ instead of inline base64
+    EVIDENCE_STORE = os.getenv("AIHELPER_EVIDENCE_STORE", "true").lower() == "true"
+
+    # Screen stability wait used instead of the fixed loading_time / sleep_time sleeps
+    STABILITY_WAIT = os.getenv("AIHELPER_STABILITY_WAIT", "true").lower() == "true"
+    STABILITY_MODE = os.getenv("AIHELPER_STABILITY_MODE", "xml")
+    STABILITY_POLL_INTERVAL = float(os.getenv("AIHELPER_STABILITY_POLL_INTERVAL", "0.3"))
+    # Mean pixel difference (0-1) under which two low resolution screenshots are considered the same
+    STABILITY_DIFF_THRESHOLD = float(os.getenv("AIHELPER_STABILITY_DIFF_THRESHOLD", "0.01"))
+    # Seconds the samples must stay identical on a screen without learned settle time: right after a tap the
+    # old screen is still stable until the transition starts
+    STABILITY_MIN_STABLE_TIME = float(os.getenv("AIHELPER_STABILITY_MIN_STABLE_TIME", "1.0"))
+    STABILITY_STATE_FILE = os.getenv("AIHELPER_STABILITY_STATE_FILE", "/tmp/ai_settle_times.json")
+
+    # Local comparison with the reference screenshot before any LLM call
+    VISUAL_DIFF = os.getenv("AIHELPER_VISUAL_DIFF", "true").lower() == "true"
+    # Mean SSIM at or above which the verification passes without calling the LLM
+    VISUAL_DIFF_THRESHOLD = float(os.getenv("AIHELPER_VISUAL_DIFF_THRESHOLD", "0.98"))
+    # Ignored regions "x0,y0,x1,y1;..." as fractions of the screen (status bar by default)
+    VISUAL_DIFF_MASKS = os.getenv("AIHELPER_VISUAL_DIFF_MASKS", "0,0,1,0.04")
+
+
+    # Record / replay cassettes of the LLM and upload traffic: off, record, replay or auto
+    CASSETTE_MODE = os.getenv("AIHELPER_CASSETTE_MODE", "off").lower()
+    CASSETTE_DIR = os.getenv("AIHELPER_CASSETTE_DIR", "")
+    CASSETTE_NAME = os.getenv("AIHELPER_CASSETTE_NAME", "default")
+    # exact, or relaxed: without exact match, the next response recorded for the same text (images ignored)
+    CASSETTE_MATCH = os.getenv("AIHELPER_CASSETTE_MATCH", "relaxed").lower()
+    # Replayed latency: recorded, zero, or a factor of the recorded latency (e.g. 0.5)
+    CASSETTE_LATENCY = os.getenv("AIHELPER_CASSETTE_LATENCY", "recorded")
+
+    # Keyword response schemas enforced by the provider (response_format json_schema, tool use, Gemini response_schema)
+    STRUCTURED_OUTPUT = os.getenv("AIHELPER_STRUCTURED_OUTPUT", "true").lower() == "true"
+    
+    # Deferred verification (batch API) settings
+    # AIHELPER_DEFERRED_VERIFICATION=true makes "Ask AI For Verification" enqueue instead of blocking
+    DEFERRED_VERIFICATION = os.getenv("AIHELPER_DEFERRED_VERIFICATION", "false").lower() == "true"
+    # "auto" uses the provider batch API, "fake" uses the local fake batch endpoint (offline runs)
+    BATCH_BACKEND = os.getenv("AIHELPER_BATCH_BACKEND", "auto")
+    BATCH_JOB_DIR = os.getenv("AIHELPER_BATCH_JOB_DIR", "")
+    # Jobs of one run, collected by any of its processes (default: the pabot run, or the robot process)
+    BATCH_RUN_ID = os.getenv("AIHELPER_BATCH_RUN_ID", "")
+    
+    # Consensus verification: comma separated "provider[:model]" list
+    CONSENSUS_PROVIDERS = os.getenv("AIHELPER_CONSENSUS_PROVIDERS", "openai,anthropic,gemini")
+
+    # Local-first cascade: the screening model "provider[:model]" answers first, the current provider
+    # only when its reply does not validate or its confidence is in the uncertainty band [LOW, HIGH).
+    # Only requests with a confidence are screened, and those with images only by a vision model
+    CASCADE = os.getenv("AIHELPER_CASCADE", "false").lower() == "true"
+    CASCADE_SCREEN = os.getenv("AIHELPER_CASCADE_SCREEN", "ollama:llama3.2-vision")
+    CASCADE_LOW = float(os.getenv("AIHELPER_CASCADE_LOW", "0.3"))
+    CASCADE_HIGH = float(os.getenv("AIHELPER_CASCADE_HIGH", "0.9"))
+
+    # Adaptive model routing: requests classified by task (locator, verification, verification_reference, agent,
+    # general; "<task>_large_xml" above LARGE_XML characters of UI XML) and sent to the candidates of POLICY
+    # ("task=provider[:model],...;..."): each is tried MIN_SAMPLES times, then the cheapest one with a JSON validity
+    # >= MIN_VALIDITY and a mean latency <= MAX_LATENCY seconds (0 = no limit) is used. OVERRIDES
+    # ("Keyword Name=provider[:model];...") pin a keyword to a model. Stats persisted in STATE_FILE
+    ADAPTIVE_ROUTING = os.getenv("AIHELPER_ADAPTIVE_ROUTING", "false").lower() == "true"
+    ROUTING_POLICY = os.getenv("AIHELPER_ROUTING_POLICY", "")
+    ROUTING_OVERRIDES = os.getenv("AIHELPER_ROUTING_OVERRIDES", "")
+    ROUTING_MIN_SAMPLES = int(os.getenv("AIHELPER_ROUTING_MIN_SAMPLES", "3"))
+    ROUTING_MIN_VALIDITY = float(os.getenv("AIHELPER_ROUTING_MIN_VALIDITY", "0.9"))
+    ROUTING_MAX_LATENCY = float(os.getenv("AIHELPER_ROUTING_MAX_LATENCY", "0"))
+    ROUTING_LARGE_XML = int(os.getenv("AIHELPER_ROUTING_LARGE_XML", "20000"))
+    ROUTING_STATE_FILE = os.getenv("AIHELPER_ROUTING_STATE_FILE", "/tmp/ai_routing_stats.json")
+    
+    # Agent Do / Agent Check: LLM consultations after a divergence from the plan, steps per flow,
+    # settle wait after each step (seconds) and plan reuse on the same goal and screen layout
+    AGENT_MAX_REPLANS = int(os.getenv("AIHELPER_AGENT_MAX_REPLANS", "3"))
+    AGENT_MAX_STEPS = int(os.getenv("AIHELPER_AGENT_MAX_STEPS", "25"))
+    AGENT_STEP_WAIT = float(os.getenv("AIHELPER_AGENT_STEP_WAIT", "3"))
+    AGENT_PLAN_CACHE = os.getenv("AIHELPER_AGENT_PLAN_CACHE", "true").lower() == "true"
+
+    # Device profile (window / screenshot size, density, orientation) read once per Appium session,
+    # dropped on a rotation or an app switch; false reads it from the driver on every tap
+    DEVICE_PROFILE_CACHE = os.getenv("AIHELPER_DEVICE_PROFILE_CACHE", "true").lower() == "true"
+
+    # Sidecar daemon shared by the pabot workers over a unix socket (caches with single-flight, rate limits,
+    # cost ledger, token counts), started on demand and stopped after IDLE_TIMEOUT seconds without worker.
+    # CACHE_SIZE entries per namespace; LLM responses / upload URLs are shared for *_TTL seconds (0 = not shared)
+    SIDECAR = os.getenv("AIHELPER_SIDECAR", "false").lower() == "true"
+    SIDECAR_SOCKET = os.getenv("AIHELPER_SIDECAR_SOCKET", "/tmp/aihelper_sidecar.sock")
+    SIDECAR_IDLE_TIMEOUT = float(os.getenv("AIHELPER_SIDECAR_IDLE_TIMEOUT", "600"))
+    SIDECAR_CACHE_SIZE = int(os.getenv("AIHELPER_SIDECAR_CACHE_SIZE", "2048"))
+    SIDECAR_LLM_TTL = float(os.getenv("AIHELPER_SIDECAR_LLM_TTL", "600"))
+    SIDECAR_UPLOAD_TTL = float(os.getenv("AIHELPER_SIDECAR_UPLOAD_TTL", "3600"))
     
     # Image Upload Provider API Keys
     IMGBB_API_KEY = os.getenv("IMGBB_API_KEY", "")
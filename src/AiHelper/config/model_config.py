@@ -1,165 +1,378 @@
 """
 Model Configuration Loader
 Loads and provides access to LLM model configurations from JSON file.
+
+The JSON file is compiled into an immutable ModelIndex: O(1) lookup of exact
+names and aliases, resolution of dated / versioned names by stripping their
+date or version suffixes (gpt-4o-2024-08-06 -> gpt-4o, llama3.2:3b -> llama3.2,
+gemini-1.5-pro-002, models/gemini-1.5-pro, openai/gpt-4o) and per-model
+capability flags. Sibling models are not resolved to their base model
+(gpt-4o-mini-tts is not gpt-4o-mini): an unknown model resolves to None. The index is rebuilt when the
+file modification time changes (checked at most once per second), so long
+suites pick up an edited llm_models.json without restarting.
 """
 import json
 import os
-from typing import Dict, Optional, Any
+import re
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, FrozenSet, Mapping, Optional, Any
 from pathlib import Path
 
+CAPABILITY_VISION = "vision"
+CAPABILITY_CACHING = "caching"
+CAPABILITY_BATCH = "batch"
+CAPABILITY_STRUCTURED_OUTPUT = "structured_output"
+
+# Date or version suffixes: -2024-08-06, -20241022, -latest, -002 / -0613, :tag, @version
+_VERSION_SUFFIX = re.compile(r"(-\d{4}-\d{2}-\d{2}|-\d{3,8}|-latest|:[\w.-]+|@[\w.-]+)$")
+# Resolutions of unknown names kept per index
+_MAX_RESOLVED = 1024
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+@dataclass(frozen=True)
+class ModelEntry:
+    """Compiled configuration of one model."""
+    name: str
+    provider: str
+    display_name: str
+    pricing: Optional[Mapping[str, float]]
+    max_context_tokens: Optional[int]
+    rate_limits: Optional[Mapping[str, int]]
+    capabilities: FrozenSet[str]
+    info: Mapping[str, Any]
+
+    def supports(self, capability: str) -> bool:
+        return capability in self.capabilities
+
+    @property
+    def vision(self) -> bool:
+        return CAPABILITY_VISION in self.capabilities
+
+    @property
+    def caching(self) -> bool:
+        return CAPABILITY_CACHING in self.capabilities
+
+    @property
+    def batch(self) -> bool:
+        return CAPABILITY_BATCH in self.capabilities
+
+    @property
+    def structured_output(self) -> bool:
+        return CAPABILITY_STRUCTURED_OUTPUT in self.capabilities
+
+
+class ModelIndex:
+    """Immutable compiled view of the configuration file."""
+
+    def __init__(self, data: Dict[str, Any], mtime_ns: Optional[int] = None):
+        self.data = _freeze(data)
+        self.mtime_ns = mtime_ns
+        self.providers: Mapping[str, Mapping[str, Any]] = self.data.get("providers", MappingProxyType({}))
+        entries: Dict[str, ModelEntry] = {}
+        aliases: Dict[str, ModelEntry] = {}
+        for name, info in self.data.get("models", {}).items():
+            provider = info.get("provider", "")
+            provider_info = self.providers.get(provider, {})
+            capabilities = info.get("capabilities")
+            if capabilities is None:
+                capabilities = provider_info.get("capabilities") or ()
+            entry = ModelEntry(
+                name=name,
+                provider=provider,
+                display_name=info.get("display_name", name),
+                pricing=info.get("pricing"),
+                max_context_tokens=info.get("max_context_tokens"),
+                rate_limits=info.get("rate_limits", provider_info.get("rate_limits")),
+                capabilities=frozenset(capabilities),
+                info=info,
+            )
+            entries[name.lower()] = entry
+            for alias in info.get("aliases", ()):
+                aliases[alias.lower()] = entry
+        # Configured names win over aliases
+        self._exact: Mapping[str, ModelEntry] = MappingProxyType({**aliases, **entries})
+        self.models: Mapping[str, ModelEntry] = MappingProxyType({entry.name: entry for entry in entries.values()})
+        self._resolved: Dict[str, Optional[ModelEntry]] = {}
+
+    def resolve(self, model: Optional[str]) -> Optional[ModelEntry]:
+        """
+        Args:
+            model: Model name as given to the provider (exact, alias, dated / versioned or provider-qualified)
+
+        Returns:
+            The configured model it resolves to, or None
+        """
+        if not model:
+            return None
+        entry = self._exact.get(model)
+        if entry is not None:
+            return entry
+        try:
+            return self._resolved[model]
+        except KeyError:
+            pass
+        entry = self._lookup(model)
+        if len(self._resolved) < _MAX_RESOLVED:
+            self._resolved[model] = entry
+        return entry
+
+    def _lookup(self, model: str) -> Optional[ModelEntry]:
+        name = model.strip().lower()
+        if name.startswith("models/"):
+            name = name[len("models/"):]
+        provider, separator, rest = name.partition("/")
+        if separator and provider in self.providers:
+            name = rest
+        entry = self._exact.get(name)
+        if entry is not None:
+            return entry
+        # Strip date / version suffixes only: gpt-4o-mini-2024-07-18 -> gpt-4o-mini, but gpt-4o-mini-tts -> None
+        while True:
+            match = _VERSION_SUFFIX.search(name)
+            if match is None or match.start() == 0:
+                return None
+            name = name[:match.start()]
+            entry = self._exact.get(name)
+            if entry is not None:
+                return entry
+
 
 class ModelConfig:
     """
     Singleton class to load and access LLM model configurations.
     """
-    
+
     _instance = None
     _config_data = None
     _config_file = None
-    
+    _index: Optional[ModelIndex] = None
+    _checked_at = 0.0
+    _lock = threading.Lock()
+
+    # Seconds between two checks of the file modification time
+    RELOAD_CHECK_INTERVAL = 1.0
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
         return cls._instance
-    
+
     def __init__(self):
         if ModelConfig._config_data is None:
             self._load_config()
-    
+
     def _load_config(self):
         """Load configuration from JSON file."""
         if ModelConfig._config_file is None:
             # Get the directory where this file is located
             config_dir = Path(__file__).parent
             ModelConfig._config_file = config_dir / "llm_models.json"
-        
+
         try:
+            mtime_ns = os.stat(ModelConfig._config_file).st_mtime_ns
             with open(ModelConfig._config_file, 'r') as f:
-                ModelConfig._config_data = json.load(f)
+                data = json.load(f)
         except FileNotFoundError:
             raise FileNotFoundError(
                 f"Model configuration file not found: {ModelConfig._config_file}"
             )
         except json.JSONDecodeError as e:
             raise ValueError(f"Invalid JSON in model configuration file: {e}")
-    
+        index = ModelIndex(data, mtime_ns)
+        # One assignment each: readers see the old or the new index, never a partial one
+        ModelConfig._index = index
+        ModelConfig._config_data = index.data
+        ModelConfig._checked_at = time.monotonic()
+
+    @property
+    def index(self) -> ModelIndex:
+        """Current compiled index, rebuilt when the file has changed."""
+        now = time.monotonic()
+        if now - ModelConfig._checked_at >= self.RELOAD_CHECK_INTERVAL:
+            with ModelConfig._lock:
+                if now - ModelConfig._checked_at >= self.RELOAD_CHECK_INTERVAL:
+                    ModelConfig._checked_at = now
+                    try:
+                        changed = os.stat(ModelConfig._config_file).st_mtime_ns != ModelConfig._index.mtime_ns
+                    except OSError:
+                        # File being replaced: keep the current index
+                        changed = False
+                    if changed:
+                        try:
+                            self._load_config()
+                        except (OSError, ValueError):
+                            # Half-written file: retried on the next check
+                            pass
+        return ModelConfig._index
+
+    def resolve(self, model_name: Optional[str]) -> Optional[ModelEntry]:
+        """
+        Resolve a model name (exact, alias, dated / versioned, provider-qualified).
+
+        Args:
+            model_name: Model name (e.g., 'gpt-4o-2024-08-06', 'claude-sonnet-4-5')
+
+        Returns:
+            The compiled ModelEntry, or None for an unknown model
+        """
+        return self.index.resolve(model_name)
+
+    def supports(self, model_name: Optional[str], capability: str, provider: Optional[str] = None) -> bool:
+        """
+        Whether a model has a capability (vision, caching, batch, structured_output).
+
+        Args:
+            model_name: Model name (None: default model of the provider)
+            capability: One of the CAPABILITY_* constants
+            provider: Provider of the model, used for unknown models (its default capabilities apply)
+
+        Returns:
+            True when the model (or, for an unknown model, its provider) has the capability.
+            Unknown models of unknown providers are assumed capable.
+        """
+        index = self.index
+        entry = index.resolve(model_name or (self.get_provider_default_model(provider) if provider else None))
+        if entry is not None:
+            return entry.supports(capability)
+        provider_info = index.providers.get((provider or "").lower())
+        if provider_info is None or provider_info.get("capabilities") is None:
+            return True
+        return capability in provider_info["capabilities"]
+
     def get_provider_default_model(self, provider: str) -> Optional[str]:
         """
         Get the default model for a provider.
-        
+
         Args:
             provider: Provider name (e.g., 'openai', 'anthropic', 'gemini')
-            
+
         Returns:
             Default model name or None if provider not found
         """
-        providers = ModelConfig._config_data.get('providers', {})
-        provider_info = providers.get(provider.lower())
+        provider_info = self.index.providers.get(provider.lower())
         return provider_info.get('default_model') if provider_info else None
-    
-    def get_model_info(self, model_name: str) -> Optional[Dict[str, Any]]:
+
+    def get_model_info(self, model_name: str) -> Optional[Mapping[str, Any]]:
         """
         Get complete information about a model.
-        
+
         Args:
-            model_name: Model name (e.g., 'gpt-4o', 'gemini-2.5-flash')
-            
+            model_name: Model name (e.g., 'gpt-4o', 'gemini-2.5-flash'), aliases and dated names are resolved
+
         Returns:
-            Dictionary with model information or None if not found
+            Read-only mapping with model information or None if not found
         """
-        models = ModelConfig._config_data.get('models', {})
-        return models.get(model_name)
-    
-    def get_model_pricing(self, model_name: str) -> Optional[Dict[str, float]]:
+        entry = self.resolve(model_name)
+        return entry.info if entry else None
+
+    def get_model_pricing(self, model_name: str) -> Optional[Mapping[str, float]]:
         """
         Get pricing information for a model.
-        
+
         Args:
             model_name: Model name
-            
+
         Returns:
-            Dictionary with 'input' and 'output' pricing per 1M tokens, or None
+            Dictionary with 'input' and 'output' pricing per 1K tokens, or None
         """
-        model_info = self.get_model_info(model_name)
-        return model_info.get('pricing') if model_info else None
-    
+        entry = self.resolve(model_name)
+        return entry.pricing if entry else None
+
     def get_model_max_context(self, model_name: str) -> Optional[int]:
         """
         Get maximum context tokens for a model.
-        
+
         Args:
             model_name: Model name
-            
+
         Returns:
             Maximum context tokens or None if not found
         """
-        model_info = self.get_model_info(model_name)
-        return model_info.get('max_context_tokens') if model_info else None
-    
-    def get_all_models_by_provider(self, provider: str) -> Dict[str, Dict[str, Any]]:
+        entry = self.resolve(model_name)
+        return entry.max_context_tokens if entry else None
+
+    def get_rate_limits(self, provider: str, model_name: Optional[str] = None) -> Optional[Mapping[str, int]]:
         """
-        Get all models for a specific provider.
-        
+        Get the rate limits applied to a model.
+
+        Args:
+            provider: Provider name
+            model_name: Model name (a model level 'rate_limits' overrides the provider one)
+
+        Returns:
+            Dictionary with 'rpm' (requests per minute) and 'tpm' (tokens per minute), or None if unlimited
+        """
+        index = self.index
+        entry = index.resolve(model_name) if model_name else None
+        if entry and 'rate_limits' in entry.info:
+            return entry.info['rate_limits']
+        provider_info = index.providers.get(provider.lower())
+        return provider_info.get('rate_limits') if provider_info else None
+
+    def get_all_models_by_provider(self, provider: str) -> Dict[str, Mapping[str, Any]]:
+        """
+        Get all available models for a specific provider.
+
         Args:
             provider: Provider name (e.g., 'openai', 'anthropic', 'gemini')
-            
+
         Returns:
             Dictionary of model_name -> model_info for the provider
         """
-        models = ModelConfig._config_data.get('models', {})
         return {
-            name: info for name, info in models.items()
-            if info.get('provider') == provider.lower()
+            name: entry.info for name, entry in self.index.models.items()
+            if entry.provider == provider.lower()
         }
-    
-    def get_all_providers(self) -> Dict[str, Dict[str, str]]:
+
+    def get_all_providers(self) -> Mapping[str, Mapping[str, Any]]:
         """
         Get all available providers.
-        
+
         Returns:
             Dictionary of provider information
         """
-        return ModelConfig._config_data.get('providers', {})
-    
-    def get_all_models(self) -> Dict[str, Dict[str, Any]]:
+        return self.index.providers
+
+    def get_all_models(self) -> Mapping[str, Mapping[str, Any]]:
         """
         Get all available models.
-        
+
         Returns:
             Dictionary of all models
         """
-        return ModelConfig._config_data.get('models', {})
-    
-    def get_pricing_dict(self) -> Dict[str, Dict[str, float]]:
+        return self.index.data.get('models', MappingProxyType({}))
+
+    def get_pricing_dict(self) -> Dict[str, Mapping[str, float]]:
         """
         Get pricing dictionary for all models (compatible with legacy code).
-        
+
         Returns:
             Dictionary mapping model_name -> {'input': float, 'output': float}
         """
-        models = ModelConfig._config_data.get('models', {})
-        pricing_dict = {}
-        for model_name, model_info in models.items():
-            if 'pricing' in model_info:
-                pricing_dict[model_name] = model_info['pricing']
-        return pricing_dict
-    
+        return {name: entry.pricing for name, entry in self.index.models.items() if entry.pricing is not None}
+
     def get_max_context_dict(self) -> Dict[str, int]:
         """
         Get max context dictionary for all models (compatible with legacy code).
-        
+
         Returns:
             Dictionary mapping model_name -> max_context_tokens
         """
-        models = ModelConfig._config_data.get('models', {})
-        max_context_dict = {}
-        for model_name, model_info in models.items():
-            if 'max_context_tokens' in model_info:
-                max_context_dict[model_name] = model_info['max_context_tokens']
-        return max_context_dict
-    
+        return {name: entry.max_context_tokens for name, entry in self.index.models.items()
+                if entry.max_context_tokens is not None}
+
     def reload_config(self):
         """Reload configuration from file (useful if file changes)."""
-        ModelConfig._config_data = None
-        self._load_config()
-
+        with ModelConfig._lock:
+            self._load_config()
@@ -0,0 +1,53 @@
+import time
+from typing import Callable, Optional
+
+from src.AiHelper.common._cassette import Cassette, CassetteMiss
+from src.AiHelper.common._logger import RobotCustomLogger
+from src.AiHelper.common._screenshot import Screenshot
+from src.AiHelper.providers.imguploader._imgbase import BaseImageUploader
+
+
+class CassetteImageUploader(BaseImageUploader):
+    """ Uploader recording the uploaded image URLs to, or replaying them from, a cassette (only the image digest is stored) """
+
+    def __init__(self, cassette: Cassette, build_uploader: Callable[[], BaseImageUploader]):
+        """
+        Args:
+            cassette: Cassette to record to / replay from
+            build_uploader: Builds the real uploader, only called when an upload goes to the network
+        """
+        self.logger = RobotCustomLogger()
+        self.cassette = cassette
+        self._build_uploader = build_uploader
+        self._uploader: Optional[BaseImageUploader] = None
+
+    @property
+    def uploader(self) -> BaseImageUploader:
+        if self._uploader is None:
+            self._uploader = self._build_uploader()
+        return self._uploader
+
+    def _upload(self, screenshot: Screenshot, upload: Callable[[BaseImageUploader], Optional[str]]) -> Optional[str]:
+        sha = screenshot.sha256
+        if self.cassette.replays:
+            url = self.cassette.find_upload(sha)
+            if url is not None:
+                self.logger.debug(f"Cassette: replayed upload of image {sha[:12]}")
+                return url
+            if not self.cassette.records:
+                raise CassetteMiss(f"No recorded upload in cassette {self.cassette.path} for image {sha[:12]}")
+
+        start = time.monotonic()
+        url = upload(self.uploader)
+        if self.cassette.records:
+            self.cassette.record_upload(sha, screenshot.nbytes, url, time.monotonic() - start)
+        return url
+
+    def upload_from_file(self, file_path: str) -> Optional[str]:
+        return self._upload(Screenshot.from_file(file_path), lambda uploader: uploader.upload_from_file(file_path))
+
+    def upload_from_base64(self, base64_data: str) -> Optional[str]:
+        return self._upload(Screenshot.from_base64(base64_data), lambda uploader: uploader.upload_from_base64(base64_data))
+
+    def upload_screenshot(self, screenshot: Screenshot) -> Optional[str]:
+        return self._upload(screenshot, lambda uploader: uploader.upload_screenshot(screenshot))
@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
 from typing import Optional
+from src.AiHelper.common._screenshot import Screenshot
 
 class BaseImageUploader(ABC):
     """ Class de base pour les uploaders d'images"""
@@ -29,4 +30,15 @@ class BaseImageUploader(ABC):
         Raises:
             NotImplementedError: If the uploader doesn't support base64 upload
         """
-        pass
\ No newline at end of file
+        pass
+
+    def upload_screenshot(self, screenshot: Screenshot) -> Optional[str]:
+        """Upload a Screenshot (as base64, encoded at most once for the screenshot).
+        
+        Args:
+            screenshot: The screenshot to upload
+            
+        Returns:
+            Optional[str]: The URL of the uploaded image, or None if upload failed
+        """
+        return self.upload_from_base64(screenshot.base64)
@@ -1,6 +1,7 @@
 import os
 import requests
 from typing import Optional
+from src.AiHelper.common._deadline import DeadlineExceeded, check_deadline, request_timeout
 from src.AiHelper.common._logger import RobotCustomLogger
 from src.AiHelper.config.config import Config
 from src.AiHelper.providers.imguploader._imgbase import BaseImageUploader
@@ -15,7 +16,7 @@ class ImgBBUploader(BaseImageUploader):
     @property
     def api_key(self):
         api_key = self.config.IMGBB_API_KEY
-        self.logger.info(f"API key from config file : {api_key}")
+        self.logger.debug("API key loaded from config file")
         if not api_key:
             self.logger.error("IMGBB_API_KEY not found in configuration")
         return api_key
@@ -23,13 +24,17 @@ class ImgBBUploader(BaseImageUploader):
     def _make_request(self, payload: dict, files: bool = False) -> Optional[str]:
         try:
             if files:
-                response = requests.post(self.base_url, files=payload)
+                response = requests.post(self.base_url, files=payload, timeout=request_timeout(Config.UPLOAD_TIMEOUT))
             else:
-                response = requests.post(self.base_url, data=payload, headers=self.headers)
+                response = requests.post(self.base_url, data=payload, headers=self.headers, timeout=request_timeout(Config.UPLOAD_TIMEOUT))
             response.raise_for_status()
             json_data = response.json()
             return self._extract_url(json_data)
+        except DeadlineExceeded:
+            raise
         except requests.exceptions.RequestException as e:
+            # A timeout caused by the keyword time budget must fail the keyword, not return no URL
+            check_deadline()
             self.logger.error(f"API Request Failed: {e}")
             return None
         except ValueError:
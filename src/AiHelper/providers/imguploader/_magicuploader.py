@@ -2,6 +2,7 @@ import os
 import requests
 from typing import NoReturn, Optional
 from src.AiHelper.config.config import Config
+from src.AiHelper.common._deadline import DeadlineExceeded, check_deadline, request_timeout
 from src.AiHelper.common._logger import RobotCustomLogger 
 from src.AiHelper.providers.imguploader._imgbase import BaseImageUploader
 """
@@ -22,30 +23,34 @@ class MagicAPIUploader(BaseImageUploader):
     @property
     def api_key(self):
         api_key = self.config.MAGICAPI_KEY
-        self.logger.info(f"API key from config file : {api_key}")
+        self.logger.debug("API key loaded from config file")
         if not api_key:
             self.logger.error("MAGICAPI_KEY not found in configuration")
         return api_key
     
     def _make_request(self, files: dict) -> Optional[str]:
         try:
-            print(f"Sending request to {self.base_url}")
-            print(f"Headers: {self.headers}")
-            print(f"Files metadata: { {k: (v[0], v[2]) for k, v in files.items()} }")
+            self.logger.debug(f"Sending request to {self.base_url}")
+            self.logger.debug(lambda: f"Files metadata: { {k: (v[0], v[2]) for k, v in files.items()} }")
             
             response = requests.post(
                 self.base_url,
                 headers=self.headers,
-                files=files
+                files=files,
+                timeout=request_timeout(Config.UPLOAD_TIMEOUT)
             )
-            print(f"Response status: {response.status_code}")
-            print(f"Response content: {response.text}")
+            self.logger.debug(f"Response status: {response.status_code}")
+            self.logger.debug(lambda: f"Response content: {response.text}")
             response.raise_for_status()
             json_data = response.json()
 
             return self._extract_url(json_data)
             
+        except DeadlineExceeded:
+            raise
         except requests.exceptions.RequestException as e:
+            # A timeout caused by the keyword time budget must fail the keyword, not return no URL
+            check_deadline()
             self.logger.error(f"API Request Failed: {e}")
             return None
         except ValueError:
@@ -1,15 +1,24 @@
 from typing import Optional
+from src.AiHelper.common._cassette import active_cassette
+from src.AiHelper.common._screenshot import Screenshot
+from src.AiHelper.common._sidecar import NAMESPACE_UPLOAD, shared_value
 from src.AiHelper.config.config import Config
 from src.AiHelper.providers.imguploader._imgbb import ImgBBUploader
 from src.AiHelper.providers.imguploader._imghost import FreeImageHostUploader
 from src.AiHelper.providers.imguploader._magicuploader import MagicAPIUploader
 from src.AiHelper.providers.imguploader._imgbase import BaseImageUploader
+from src.AiHelper.providers.imguploader._cassette import CassetteImageUploader
 
 class ImageUploader:
     
     def __init__(self, service: str = "auto"):
         self.config = Config()
-        self.uploader: BaseImageUploader = self._select_uploader(service)
+        cassette = active_cassette()
+        if cassette is not None:
+            # Replay runs need no upload service: the real uploader is built on the first recorded upload
+            self.uploader: BaseImageUploader = CassetteImageUploader(cassette, lambda: self._select_uploader(service))
+        else:
+            self.uploader: BaseImageUploader = self._select_uploader(service)
 
     def _select_uploader(self, service: str):
         #TODO: add fallback and logic of selecting provider based on catching exception
@@ -26,7 +35,17 @@ class ImageUploader:
         return self.uploader.upload_from_file(file_path)
     
     def upload_from_base64(self, base64_data: str) -> Optional[str]:
-        return self.uploader.upload_from_base64(base64_data)
+        if not Config.SIDECAR:
+            return self.uploader.upload_from_base64(base64_data)
+        return self.upload_screenshot(Screenshot.from_base64(base64_data))
+
+    def upload_screenshot(self, screenshot: Screenshot) -> Optional[str]:
+        if not Config.SIDECAR:
+            return self.uploader.upload_screenshot(screenshot)
+        # With the sidecar, a screenshot already uploaded by any pabot worker is not uploaded again
+        url, _ = shared_value(NAMESPACE_UPLOAD, f"{type(self.uploader).__name__}:{screenshot.sha256}",
+                              lambda: self.uploader.upload_screenshot(screenshot), Config.SIDECAR_UPLOAD_TTL)
+        return url
 
 #quick test
 if __name__ == "__main__":
@@ -0,0 +1,543 @@
+"""
+Adaptive model routing: each request goes to the model chosen for its task.
+
+Requests are classified from the keyword that sends them and from features of
+the prompt:
+
+    locator                 locator / bbox schema, or a clicking / typing keyword
+    agent                   agent plan schema (Agent Do / Agent Check)
+    verification            verification schema or keyword, one image at most
+    verification_reference  the same with two images or more (reference screenshot, visual diff crops)
+    general                 anything else
+
+A request sending more than AIHELPER_ROUTING_LARGE_XML characters of UI XML
+is a "<task>_large_xml" request. The policy maps a task to its candidate
+routes ("provider[:model]"); a task without its own entry uses the entry of
+its base task, then "default", then the current provider:
+
+    locator=openai:gpt-4o-mini,gemini;verification_reference=openai:gpt-4o;default=openai
+
+The router learns which candidate to use from the latency, cost and JSON
+validity of the replies (checked against the response schema), recorded per
+task and route and persisted in AIHELPER_ROUTING_STATE_FILE for the next runs:
+
+    - a candidate with fewer than `min_samples` replies for the task is tried
+      first, in policy order, so that every candidate gets measured
+    - the others are eligible when their validity rate reaches `min_validity`
+      and their mean latency is within `max_latency` (0: no limit); the
+      cheapest eligible one is chosen (the fastest among equal costs). A model
+      without known pricing is not assumed free: it comes after the priced ones
+    - when none is eligible, the one with the best validity rate
+
+Explicit overrides per keyword ("Click On UI Element=openai:gpt-4o") bypass
+the policy, and so does a model other than the default one passed to
+`Send AI Request`. A route that fails falls back to the current provider.
+"""
+import contextvars
+import fcntl
+import functools
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from src.AiHelper.common._logger import RobotCustomLogger
+from src.AiHelper.common._structured import ResponseSchema, extract_json, get_schema
+from src.AiHelper.config.config import Config
+from src.AiHelper.config.model_config import CAPABILITY_STRUCTURED_OUTPUT, ModelConfig
+from src.AiHelper.providers.llm._baseclient import BaseLLMClient
+from src.AiHelper.providers.llm._consensus import parse_provider_specs
+from src.AiHelper.providers.llm._factory import LLMClientFactory
+
+TASK_LOCATOR = "locator"
+TASK_AGENT = "agent"
+TASK_VERIFICATION = "verification"
+TASK_VERIFICATION_REFERENCE = "verification_reference"
+TASK_GENERAL = "general"
+LARGE_XML_SUFFIX = "_large_xml"
+POLICY_DEFAULT = "default"
+
+REASON_OVERRIDE = "keyword override"
+REASON_EXPLICIT = "explicit model"
+REASON_SINGLE = "single candidate"
+REASON_EXPLORING = "exploring"
+REASON_CHEAPEST = "cheapest valid"
+REASON_BEST_VALIDITY = "best validity"
+
+Route = Tuple[str, Optional[str]]
+
+_SCHEMA_TASKS = {
+    "element_locator": TASK_LOCATOR,
+    "element_bbox": TASK_LOCATOR,
+    "agent_plan": TASK_AGENT,
+    "verification_result": TASK_VERIFICATION,
+}
+_KEYWORD_TASKS = {
+    "clickonuielement": TASK_LOCATOR,
+    "clickonelementusingllm": TASK_LOCATOR,
+    "inputtextusingai": TASK_LOCATOR,
+    "agentdo": TASK_AGENT,
+    "agentcheck": TASK_AGENT,
+    "askaiforverification": TASK_VERIFICATION,
+}
+# Raw page source, or the compacted UI XML / its changes (see common._uixml)
+_UI_XML_MARKERS = ("<hierarchy", "<XCUIElementType", "<?xml", "compacted UI XML", "since the previous UI XML")
+# Learned latency = EWMA of the observed ones, so that a provider getting slower is noticed
+_EWMA_ALPHA = 0.3
+
+# Name of the outermost AiHelper keyword running in this context (see routed_keyword)
+_current_keyword: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("aihelper_keyword", default=None)
+
+
+def _normalize_keyword(name: str) -> str:
+    """Robot Framework keyword names ignore case, spaces and underscores"""
+    return re.sub(r"[\s_]", "", name).lower()
+
+
+def current_keyword() -> Optional[str]:
+    return _current_keyword.get()
+
+
+def routed_keyword(method: Callable) -> Callable:
+    """
+    Record the name of the keyword while it runs, for the routing by keyword.
+    Goes above @keyword (the name is read from it); nested keywords keep the outermost name.
+    """
+    name = getattr(method, "robot_name", None) or method.__name__
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if _current_keyword.get() is not None:
+            return method(*args, **kwargs)
+        token = _current_keyword.set(name)
+        try:
+            return method(*args, **kwargs)
+        finally:
+            _current_keyword.reset(token)
+
+    return wrapper
+
+
+def parse_routing_policy(policy: Union[None, str, Dict[str, Any]]) -> Dict[str, List[Route]]:
+    """
+    Args:
+        policy: "locator=openai:gpt-4o-mini,gemini;verification=openai:gpt-4o" or {task: "provider[:model],..." or list}
+
+    Returns:
+        {task: [(provider, model), ...]}
+    """
+    if not policy:
+        return {}
+    if isinstance(policy, str):
+        policy = dict(item.split("=", 1) for item in policy.split(";") if "=" in item)
+    return {task.strip().lower(): parse_provider_specs(routes) for task, routes in policy.items()}
+
+
+def parse_routing_overrides(overrides: Union[None, str, Dict[str, Any]]) -> Dict[str, Route]:
+    """
+    Args:
+        overrides: "Click On UI Element=openai:gpt-4o;Agent Do=anthropic" or {keyword: "provider[:model]"}
+
+    Returns:
+        {normalized keyword name: (provider, model)}
+    """
+    if not overrides:
+        return {}
+    if isinstance(overrides, str):
+        overrides = dict(item.split("=", 1) for item in overrides.split(";") if "=" in item)
+    return {_normalize_keyword(name): parse_provider_specs(route)[0] for name, route in overrides.items()}
+
+
+def route_name(route: Route) -> str:
+    provider, model = route
+    return f"{provider}:{model or 'default'}"
+
+
+@dataclass(frozen=True)
+class RequestFeatures:
+    task: str
+    keyword: Optional[str]
+    images: int
+    xml_chars: int
+    large_xml: bool
+
+    @property
+    def policy_keys(self) -> List[str]:
+        """Policy entries to look up, most specific first"""
+        keys = [self.task + LARGE_XML_SUFFIX] if self.large_xml else []
+        return keys + [self.task, POLICY_DEFAULT]
+
+    @property
+    def label(self) -> str:
+        return self.task + LARGE_XML_SUFFIX if self.large_xml else self.task
+
+
+def classify(messages: List[Dict[str, Any]], schema: Optional[ResponseSchema] = None, keyword: Optional[str] = None,
+             large_xml: int = 20000) -> RequestFeatures:
+    """
+    Args:
+        messages: Chat messages of the request
+        schema: Response schema of the request
+        keyword: Name of the keyword sending it
+        large_xml: Characters of UI XML from which the request is a "<task>_large_xml" one (0: never)
+
+    Returns:
+        Task and prompt features of the request
+    """
+    images = xml_chars = 0
+    for message in messages:
+        content = message.get("content")
+        parts = [content] if isinstance(content, str) else content or []
+        for part in parts:
+            if isinstance(part, str):
+                text = part
+            elif part.get("type") in ("image_url", "image"):
+                images += 1
+                continue
+            else:
+                text = part.get("text") or ""
+            if any(marker in text for marker in _UI_XML_MARKERS):
+                xml_chars += len(text)
+
+    task = _SCHEMA_TASKS.get(schema.name) if schema is not None else None
+    if task is None and keyword:
+        task = _KEYWORD_TASKS.get(_normalize_keyword(keyword))
+    task = task or TASK_GENERAL
+    if task == TASK_VERIFICATION and images >= 2:
+        task = TASK_VERIFICATION_REFERENCE
+    return RequestFeatures(task, keyword, images, xml_chars, bool(large_xml) and xml_chars > large_xml)
+
+
+class RoutingStats:
+    """
+    Process-wide reply records per task and route, persisted in AIHELPER_ROUTING_STATE_FILE.
+
+    The file is the source of truth, shared by the pabot workers: every record is a read-modify-write of the
+    file under an exclusive lock (no worker drops the samples of another, a reset is not undone), and the
+    memory copy is reloaded when another process changed the file.
+    """
+
+    _lock = threading.Lock()
+    _records: Dict[str, Dict[str, Dict[str, float]]] = {}
+    # Modification time of the state file when it was last read or written by this process
+    _mtime: Optional[int] = None
+
+    @staticmethod
+    def _parse(text: str) -> Dict[str, Dict[str, Dict[str, float]]]:
+        try:
+            return {task: {route: {name: float(value) for name, value in stats.items()} for route, stats in routes.items()}
+                    for task, routes in json.loads(text or "{}").items()}
+        except (ValueError, AttributeError, TypeError):
+            return {}
+
+    @classmethod
+    def _state(cls) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """Records of every worker, under cls._lock"""
+        path = Config.ROUTING_STATE_FILE
+        if not path:
+            return cls._records
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return cls._records
+        if mtime != cls._mtime:
+            try:
+                with open(path, "r") as f:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_SH)
+                    try:
+                        cls._records = cls._parse(f.read())
+                        cls._mtime = os.fstat(f.fileno()).st_mtime_ns
+                    finally:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            except OSError as e:
+                RobotCustomLogger().debug(f"Could not read the routing stats: {e}")
+        return cls._records
+
+    @classmethod
+    @contextmanager
+    def _locked_state(cls) -> Iterator[Dict[str, Dict[str, Dict[str, float]]]]:
+        """Read-modify-write the state file under an exclusive lock (the yielded records are saved on exit), under cls._lock"""
+        path = Config.ROUTING_STATE_FILE
+        try:
+            f = open(path, "a+") if path else None
+        except OSError as e:
+            RobotCustomLogger().debug(f"Could not save the routing stats: {e}")
+            f = None
+        if f is None:
+            # Not persisted: this process only
+            yield cls._records
+            return
+        with f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                records = cls._parse(f.read())
+                yield records
+                f.seek(0)
+                f.truncate()
+                json.dump(records, f)
+                f.flush()
+                cls._records, cls._mtime = records, os.fstat(f.fileno()).st_mtime_ns
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    @classmethod
+    def record(cls, task: str, route: str, latency: float, valid: bool, cost: Optional[float]):
+        """
+        Args:
+            task: Task label of the request (see RequestFeatures.label)
+            route: "provider:model" that answered
+            latency: Seconds until the reply
+            valid: The reply parsed and validated against the response schema
+            cost: Cost of the reply, None when the pricing of the model is unknown
+        """
+        with cls._lock, cls._locked_state() as records:
+            stats = records.setdefault(task, {}).setdefault(route, {"calls": 0, "valid": 0, "latency": 0.0})
+            stats["latency"] = latency if not stats["calls"] else _EWMA_ALPHA * latency + (1 - _EWMA_ALPHA) * stats["latency"]
+            stats["calls"] += 1
+            stats["valid"] += 1 if valid else 0
+            if cost is not None:
+                stats["priced"] = stats.get("priced", 0) + 1
+                stats["cost"] = stats.get("cost", 0.0) + cost
+
+    @staticmethod
+    def _mean_cost(stats: Dict[str, float]) -> Optional[float]:
+        return stats["cost"] / stats["priced"] if stats.get("priced") else None
+
+    @classmethod
+    def get(cls, task: str, route: str) -> Optional[Dict[str, float]]:
+        """ calls, validity rate, mean latency and mean cost (None when unknown) of a route on a task,
+        None when it never answered """
+        with cls._lock:
+            stats = cls._state().get(task, {}).get(route)
+            if not stats or not stats["calls"]:
+                return None
+            return {
+                "calls": int(stats["calls"]),
+                "validity": stats["valid"] / stats["calls"],
+                "latency": stats["latency"],
+                "cost": cls._mean_cost(stats),
+            }
+
+    @classmethod
+    def summary(cls) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        Returns:
+            Per task and route: calls, JSON validity rate, mean latency (recent replies weigh more) and mean cost
+            (None when the pricing of the model is unknown)
+        """
+        with cls._lock:
+            summary = {}
+            for task, routes in cls._state().items():
+                summary[task] = {}
+                for route, stats in routes.items():
+                    if not stats["calls"]:
+                        continue
+                    mean_cost = cls._mean_cost(stats)
+                    summary[task][route] = {
+                        "calls": int(stats["calls"]),
+                        "validity": round(stats["valid"] / stats["calls"], 3),
+                        "mean_latency": round(stats["latency"], 3),
+                        "mean_cost": round(mean_cost, 6) if mean_cost is not None else None,
+                    }
+            return summary
+
+    @classmethod
+    def reset(cls):
+        """ forgets every record, those of the other workers and the state file included """
+        with cls._lock, cls._locked_state() as records:
+            records.clear()
+
+
+@dataclass
+class RoutedResponse:
+    """Response of the route that answered (format_response needs the right client)."""
+    client: BaseLLMClient
+    response: Any
+    provider: str
+    model: Optional[str]
+    features: RequestFeatures
+    schema: Optional[ResponseSchema]
+    latency: float
+    reason: str
+
+
+class AdaptiveRoutingClient(BaseLLMClient):
+
+    # Gets the response schema of every request to judge the replies (and enforces it per route)
+    validates_schema = True
+
+    def __init__(
+        self,
+        primary: BaseLLMClient,
+        primary_route: Route,
+        policy: Optional[Dict[str, List[Route]]] = None,
+        overrides: Optional[Dict[str, Route]] = None,
+        min_samples: int = 3,
+        min_validity: float = 0.9,
+        max_latency: float = 0,
+        large_xml: int = 20000,
+    ):
+        """
+        Args:
+            primary: Client of the current provider (any BaseLLMClient, a hedged router included), used for
+                the tasks without candidates and when a route fails
+            primary_route: (provider, model) of the primary
+            policy: {task: candidate routes in order of preference} (see parse_routing_policy)
+            overrides: {normalized keyword name: route} (see parse_routing_overrides)
+            min_samples: Replies measured per candidate and task before the stats decide
+            min_validity: Share of valid JSON replies a candidate needs to be eligible
+            max_latency: Mean latency in seconds a candidate needs to stay under to be eligible (0: no limit)
+            large_xml: Characters of UI XML from which a request is a "<task>_large_xml" one (0: never)
+        """
+        self.logger = RobotCustomLogger()
+        self.primary = primary
+        self.primary_provider, self.primary_model = LLMClientFactory.resolve(*primary_route)
+        self.policy = policy or {}
+        self.overrides = overrides or {}
+        self.min_samples = int(min_samples)
+        self.min_validity = float(min_validity)
+        self.max_latency = float(max_latency)
+        self.large_xml = int(large_xml)
+        self.default_model = self.primary_model
+
+    def __getattr__(self, name: str) -> Any:
+        # warm_up and the other extras of the primary client
+        primary = self.__dict__.get("primary")
+        if primary is None:
+            raise AttributeError(name)
+        return getattr(primary, name)
+
+    @staticmethod
+    def _resolve(route: Route) -> Route:
+        """ canonical provider name ("claude" -> "anthropic") and model (its default one when None) """
+        return LLMClientFactory.resolve(*route)
+
+    def _is_primary(self, route: Route) -> bool:
+        return route == (self.primary_provider, self.primary_model)
+
+    def _client(self, route: Route) -> BaseLLMClient:
+        if self._is_primary(route):
+            return self.primary
+        provider, model = route
+        return LLMClientFactory.create_client(provider, model=model)
+
+    def candidates(self, features: RequestFeatures) -> List[Route]:
+        for key in features.policy_keys:
+            if self.policy.get(key):
+                return [self._resolve(route) for route in self.policy[key]]
+        return [(self.primary_provider, self.primary_model)]
+
+    def choose(self, features: RequestFeatures) -> Tuple[Route, str]:
+        """
+        Returns:
+            (route, reason) for a request (see the module docstring)
+        """
+        if features.keyword:
+            override = self.overrides.get(_normalize_keyword(features.keyword))
+            if override:
+                return self._resolve(override), REASON_OVERRIDE
+        candidates = self.candidates(features)
+        if len(candidates) == 1:
+            return candidates[0], REASON_SINGLE
+
+        stats = {route: RoutingStats.get(features.label, route_name(route)) for route in candidates}
+        for route in candidates:
+            if stats[route] is None or stats[route]["calls"] < self.min_samples:
+                return route, REASON_EXPLORING
+        eligible = [route for route in candidates
+                    if stats[route]["validity"] >= self.min_validity
+                    and (not self.max_latency or stats[route]["latency"] <= self.max_latency)]
+        if eligible:
+            # Unknown costs last
+            return min(eligible, key=lambda route: (stats[route]["cost"] is None, stats[route]["cost"] or 0.0,
+                                                    stats[route]["latency"])), REASON_CHEAPEST
+        return max(candidates, key=lambda route: (stats[route]["validity"], -stats[route]["latency"])), REASON_BEST_VALIDITY
+
+    @staticmethod
+    def _schema_kwargs(schema: Optional[ResponseSchema], provider: str, model: Optional[str]) -> Dict[str, Any]:
+        """response_schema for the clients that enforce it natively (the replies are validated either way)"""
+        if schema is None or not Config.STRUCTURED_OUTPUT:
+            return {}
+        if not ModelConfig().supports(model, CAPABILITY_STRUCTURED_OUTPUT, provider):
+            return {}
+        return {"response_schema": schema}
+
+    def create_chat_completion(
+        self,
+        messages: List[Dict[str, Any]],
+        model: Optional[str] = None,
+        **kwargs
+    ) -> RoutedResponse:
+        """
+        Classify the request and send it to the route chosen for its task.
+
+        Returns:
+            RoutedResponse to pass to format_response
+        """
+        schema = get_schema(kwargs.pop("response_schema", None))
+        features = classify(messages, schema, current_keyword(), self.large_xml)
+        if model and model != self.primary_model:
+            route, reason = (self.primary_provider, model), REASON_EXPLICIT
+        else:
+            route, reason = self.choose(features)
+        provider, route_model = route
+        if reason != REASON_SINGLE:
+            self.logger.info(f"Adaptive routing: {features.label} request ({features.images} image(s), "
+                             f"{features.xml_chars} UI XML characters) -> {route_name(route)} ({reason})", True)
+
+        client = self._client(route) if reason != REASON_EXPLICIT else self.primary
+        start = time.perf_counter()
+        try:
+            response = client.create_chat_completion(messages=messages, model=route_model, **kwargs,
+                                                     **self._schema_kwargs(schema, provider, route_model))
+        except Exception as e:
+            if client is self.primary:
+                raise
+            # A failing route counts as an invalid reply
+            RoutingStats.record(features.label, route_name(route), time.perf_counter() - start, False, None)
+            self.logger.warning(f"Adaptive routing: {route_name(route)} failed ({e}), "
+                                f"falling back to {self.primary_provider}:{self.primary_model}", True)
+            route, reason, client = (self.primary_provider, self.primary_model), f"fallback after {route_name(route)} error", self.primary
+            provider, route_model = route
+            start = time.perf_counter()
+            response = client.create_chat_completion(messages=messages, model=route_model, **kwargs,
+                                                     **self._schema_kwargs(schema, provider, route_model))
+        return RoutedResponse(client, response, provider, route_model, features, schema, time.perf_counter() - start, reason)
+
+    @staticmethod
+    def _valid(content: str, schema: Optional[ResponseSchema]) -> bool:
+        """ the reply parses and validates against the schema; without schema, any reply is valid """
+        if schema is None:
+            return bool(content.strip())
+        try:
+            schema.coerce(extract_json(content, required=list(schema.properties)))
+        except ValueError:
+            return False
+        return True
+
+    @staticmethod
+    def _cost(formatted: Dict[str, Any], model: Optional[str]) -> Optional[float]:
+        """ cost of a reply, None when the pricing of the model is unknown """
+        pricing = ModelConfig().get_model_pricing(model) if model else None
+        if pricing is None:
+            return None
+        return (formatted.get("prompt_tokens", 0) * pricing["input"] + formatted.get("completion_tokens", 0) * pricing["output"]) / 1000
+
+    def format_response(self, response: RoutedResponse, include_tokens: bool = True, include_reason: bool = False):
+        # Tokens are always needed for the cost of the route
+        result = response.client.format_response(response.response, include_tokens=True, include_reason=include_reason)
+        # Cost must be computed with the model that actually answered
+        result["model"] = result.get("model") or response.model
+        RoutingStats.record(response.features.label, route_name((response.provider, response.model)), response.latency,
+                            self._valid(result.get("content") or "", response.schema), self._cost(result, result["model"]))
+        if not include_tokens:
+            for key in ("prompt_tokens", "completion_tokens", "total_tokens", "cache_hit_tokens", "cache_miss_tokens"):
+                result.pop(key, None)
+        result["route"] = route_name((response.provider, response.model))
+        result["task"] = response.features.label
+        return result
@@ -1,8 +1,10 @@
+import json
 from anthropic import Anthropic, APIError
 from typing import Optional, Dict, List, Union
 import os
 from src.AiHelper.common._logger import RobotCustomLogger
 from src.AiHelper.providers.llm._baseclient import BaseLLMClient
+from src.AiHelper.providers.llm._messages import anthropic_messages
 
 
 class AnthropicClient(BaseLLMClient):
@@ -27,7 +29,8 @@ class AnthropicClient(BaseLLMClient):
             
         self.default_model = model
         self.max_retries = max_retries
-        self.client = Anthropic(api_key=self.api_key, max_retries=max_retries)
+        # retries are handled by the shared rate limiter (see BaseLLMClient._send_with_retry)
+        self.client = Anthropic(api_key=self.api_key, max_retries=0)
 
     def create_chat_completion(
         self,
@@ -55,47 +58,23 @@ class AnthropicClient(BaseLLMClient):
         try:
             self._validate_parameters(temperature, top_p)
             
-            # Anthropic requires system messages to be separated
-            system_message = None
-            user_messages = []
+            api_params = self._build_api_params(messages, model, max_tokens, temperature, top_p, **kwargs)
             
-            for msg in messages:
-                if msg.get("role") == "system":
-                    system_message = msg.get("content")
-                else:
-                    transformed_content = self._transform_content(msg.get("content"))
-                    user_messages.append({
-                        "role": msg.get("role"),
-                        "content": transformed_content
-                    })
-            
-            # Prepare API call parameters
-            api_params = {
-                "model": model or self.default_model,
-                "messages": user_messages,
-                "max_tokens": max_tokens,
-                **kwargs
-            }
-            # Only add temperature or top_p, not both (Anthropic requirement)
-            if temperature != 1.0:
-                api_params["temperature"] = temperature
-            elif top_p != 1.0:
-                api_params["top_p"] = top_p
-            else:
-                # If both are default, use temperature
-                api_params["temperature"] = temperature
-            
-            if system_message:
-                api_params["system"] = system_message
-            
-            response = self.client.messages.create(**api_params)
+            response = self._send_with_retry(
+                "anthropic",
+                api_params["model"],
+                lambda: self.client.messages.create(**api_params, timeout=self._request_timeout()),
+                messages,
+                max_tokens,
+                usage=lambda r: r.usage.input_tokens + r.usage.output_tokens,
+            )
             
             # Log usage
             self.logger.info(
                 f"Anthropic API call successful. Tokens used: {response.usage.input_tokens + response.usage.output_tokens}",
                 True
             )
-            self.logger.info(f"Response: {response}")
+            self.logger.debug(lambda: f"Response: {response}")
             
             return response
             
@@ -106,91 +85,47 @@ class AnthropicClient(BaseLLMClient):
             self.logger.error(f"Unexpected error: {str(e)}", True)
             raise
 
-    def _transform_content(self, content):
+    def _build_api_params(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        max_tokens: int = 1400,
+        temperature: float = 1.0,
+        top_p: float = 1.0,
+        **kwargs
+    ) -> Dict:
         """
-        Transform content to Claude's format, handling images.
-        
-        Supports:
-        - String content (passed through)
-        - List content with text and images
-        - OpenAI-style image_url format -> Claude's image format
-        - Native Claude image format (passed through)
-        
-        Args:
-            content: String or list of content items
-            
-        Returns:
-            Transformed content in Claude's format
+        Build the keyword arguments of a Messages API call from OpenAI-style messages.
+        Shared by the synchronous call and the batch API (one entry per request).
         """
-        # If content is a simple string, return as-is
-        if isinstance(content, str):
-            return content
+        # Anthropic requires system messages to be separated
+        system_message, user_messages = anthropic_messages(messages)
         
-        # If content is not a list, return as-is
-        if not isinstance(content, list):
-            return content
+        response_schema = self._pop_response_schema(kwargs)
         
-        # Transform list content
-        transformed = []
-        for item in content:
-            if not isinstance(item, dict):
-                continue
-                
-            item_type = item.get("type")
-            
-            # Handle text content
-            if item_type == "text":
-                transformed.append({
-                    "type": "text",
-                    "text": item.get("text", "")
-                })
-            
-            # Handle OpenAI-style image_url format
-            elif item_type == "image_url":
-                image_url_data = item.get("image_url", {})
-                if isinstance(image_url_data, dict) and "url" in image_url_data:
-                    url = image_url_data["url"]
-                    
-                    # Check if it's a base64 data URL
-                    if url.startswith("data:"):
-                        # Extract media type and base64 data
-                        # Format: data:image/jpeg;base64,/9j/4AAQ...
-                        try:
-                            header, data = url.split(",", 1)
-                            media_type = header.split(";")[0].split(":")[1]
-                            transformed.append({
-                                "type": "image",
-                                "source": {
-                                    "type": "base64",
-                                    "media_type": media_type,
-                                    "data": data
-                                }
-                            })
-                        except (ValueError, IndexError) as e:
-                            self.logger.error(f"Invalid base64 image URL format: {e}")
-                            continue
-                    else:
-                        # Regular URL
-                        transformed.append({
-                            "type": "image",
-                            "source": {
-                                "type": "url",
-                                "url": url
-                            }
-                        })
-            
-            # Handle native Claude image format (already correct)
-            elif item_type == "image":
-                if "source" in item:
-                    transformed.append(item)
-                else:
-                    self.logger.warning("Image item missing 'source' field")
-            
-            # Pass through any other content types
-            else:
-                transformed.append(item)
+        # Prepare API call parameters
+        api_params = {
+            "model": model or self.default_model,
+            "messages": user_messages,
+            "max_tokens": max_tokens,
+            **kwargs
+        }
+        if response_schema is not None:
+            # Structured output through a forced tool call: the tool input is the response
+            api_params["tools"] = [response_schema.anthropic_tool()]
+            api_params["tool_choice"] = {"type": "tool", "name": response_schema.name}
+        # Only add temperature or top_p, not both (Anthropic requirement)
+        if temperature != 1.0:
+            api_params["temperature"] = temperature
+        elif top_p != 1.0:
+            api_params["top_p"] = top_p
+        else:
+            # If both are default, use temperature
+            api_params["temperature"] = temperature
         
-        return transformed if transformed else content
+        if system_message:
+            api_params["system"] = system_message
+        return api_params
 
     def _validate_parameters(self, temperature: float, top_p: float):
         """Validate API parameters."""
@@ -225,7 +160,10 @@ class AnthropicClient(BaseLLMClient):
         # Extract text content (Anthropic returns list of content blocks)
         content_text = ""
         for block in response.content:
-            if hasattr(block, 'text'):
+            if getattr(block, 'type', None) == 'tool_use':
+                # Forced tool call of a structured output request
+                content_text += json.dumps(block.input)
+            elif hasattr(block, 'text'):
                 content_text += block.text
         
         result = {
@@ -1,5 +1,9 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Optional
+from typing import Any, Callable, List, Dict, Optional
+from src.AiHelper.common._deadline import request_timeout
+from src.AiHelper.common._ratelimit import RateLimitScheduler, estimate_request_tokens
+from src.AiHelper.common._structured import ResponseSchema, get_schema
+from src.AiHelper.config.config import Config
 
 class BaseLLMClient(ABC):
     @abstractmethod
@@ -17,3 +21,41 @@ class BaseLLMClient(ABC):
     @abstractmethod
     def format_response(self, response, include_tokens: bool = True, include_reason: bool = False):
         pass
+
+    def _request_timeout(self) -> float:
+        """
+        Timeout of the next API call: AIHELPER_LLM_TIMEOUT bounded by the keyword time budget.
+        Called inside the `send` callables so that every retry gets what is left of the budget.
+        """
+        return request_timeout(Config.LLM_TIMEOUT)
+
+    @staticmethod
+    def _pop_response_schema(kwargs: Dict[str, Any]) -> Optional[ResponseSchema]:
+        """
+        Take the `response_schema` keyword argument (ResponseSchema or its name) out of the
+        SDK parameters: each client turns it into its provider's native structured output.
+        """
+        return get_schema(kwargs.pop("response_schema", None))
+
+    def _send_with_retry(
+        self,
+        provider: str,
+        model: Optional[str],
+        send: Callable[[], Any],
+        messages: List[Dict[str, Any]],
+        max_tokens: int = 0,
+        usage: Optional[Callable[[Any], int]] = None,
+    ):
+        """
+        Run the SDK call `send` through the shared rate limiter with retries and jittered backoff.
+        The SDK clients are created with max_retries=0 so that retries are not stacked.
+        """
+        return RateLimitScheduler().call_with_retry(
+            provider,
+            model,
+            send,
+            estimated_tokens=estimate_request_tokens(messages, max_tokens),
+            max_retries=getattr(self, "max_retries", None),
+            base_backoff=getattr(self, "base_backoff", None),
+            usage=usage,
+        )
@@ -0,0 +1,522 @@
+"""
+Deferred verification mode backed by the provider batch APIs.
+
+`Ask AI For Verification` can enqueue its request (prompt + uploaded screenshot)
+into a local job store instead of blocking on the LLM. A collector then submits
+every queued job through the OpenAI / Anthropic batch APIs, polls until the
+batches end and writes the verdicts back into the job store so they can be
+reported in the Robot output.
+
+Jobs belong to the run and the suite that enqueued them (see batch_scope): the
+pabot workers of one run share the run, so any worker collecting a suite also
+collects the jobs the other workers enqueued for it. Submission and result
+storage are done under a lock of the job store, so a job is submitted, and
+billed, once.
+
+Documentation:
+https://platform.openai.com/docs/guides/batch
+https://docs.anthropic.com/en/docs/build-with-claude/batch-processing
+"""
+import fcntl
+import json
+import os
+import tempfile
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from src.AiHelper.common._logger import RobotCustomLogger
+from src.AiHelper.config.config import Config
+from src.AiHelper.config.model_config import CAPABILITY_BATCH, ModelConfig
+
+# Both OpenAI and Anthropic bill batch requests at 50% of the synchronous price
+BATCH_PRICE_FACTOR = 0.5
+
+STATUS_QUEUED = "queued"
+STATUS_SUBMITTED = "submitted"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+# Run of a process started on its own: the store is shared by every run (and pabot worker)
+RUN_ID = uuid.uuid4().hex[:12]
+
+
+def _process_start(pid: int) -> str:
+    """ start time of a process (Linux), tells a pid apart from an earlier process with the same pid """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return ""
+
+
+def run_id(pabot: bool = False) -> str:
+    """
+    Args:
+        pabot: Whether this process is a pabot worker
+
+    Returns:
+        AIHELPER_BATCH_RUN_ID when set, else the pabot process for pabot workers (shared by the workers
+        of the run), else this process
+    """
+    if Config.BATCH_RUN_ID:
+        return Config.BATCH_RUN_ID
+    if pabot:
+        parent = os.getppid()
+        return f"pabot-{parent}-{_process_start(parent)}"
+    return RUN_ID
+
+
+def batch_scope(suite: Optional[str] = None, pabot: bool = False) -> str:
+    """
+    Args:
+        suite: Full name of the suite enqueuing / collecting (None: every suite of the run)
+        pabot: Whether this process is a pabot worker (see run_id)
+
+    Returns:
+        Tag of the jobs of this run and suite
+    """
+    scope = run_id(pabot)
+    return f"{scope}:{suite}" if suite else scope
+
+
+class BatchJobStore:
+    """
+    File based job store: one JSON file per job so that several pabot workers
+    can enqueue concurrently without sharing a lock.
+
+    A store only sees the jobs of its scope (see batch_scope): those enqueued with the same scope, or by a
+    child suite of its suite, whatever the worker. The jobs of the other runs are left alone.
+    """
+
+    def __init__(self, root_dir: Optional[str] = None, scope: Optional[str] = None):
+        self.logger = RobotCustomLogger()
+        self.root_dir = root_dir or Config.BATCH_JOB_DIR or os.path.join(tempfile.gettempdir(), "ai_batch_jobs")
+        self.scope = scope or batch_scope()
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def _in_scope(self, job: Dict[str, Any]) -> bool:
+        scope = job.get("scope") or ""
+        return scope == self.scope or scope.startswith(self.scope + ":") or scope.startswith(self.scope + ".")
+
+    def _job_path(self, job_id: str) -> str:
+        return os.path.join(self.root_dir, f"{job_id}.json")
+
+    def enqueue(
+        self,
+        provider: str,
+        model: Optional[str],
+        messages: List[Dict[str, Any]],
+        params: Optional[Dict[str, Any]] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        Store a request for later submission.
+
+        Args:
+            provider: Provider name as accepted by LLMClientFactory
+            model: Model name (None = provider default)
+            messages: OpenAI-style messages
+            params: Extra completion parameters (temperature, max_tokens, ...)
+            metadata: Free form data used when reporting (test name, threshold, ...)
+
+        Returns:
+            The job id (also used as batch custom_id)
+        """
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "scope": self.scope,
+            "status": STATUS_QUEUED,
+            "created_at": time.time(),
+            "provider": provider,
+            "model": model,
+            "messages": messages,
+            "params": params or {},
+            "metadata": metadata or {},
+            "batch_id": None,
+            "result": None,
+        }
+        self.save(job)
+        self.logger.info(f"Batch job {job_id} queued for provider {provider} ({model})")
+        return job_id
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Exclusive lock of the store across the processes (submission and result storage)."""
+        with open(os.path.join(self.root_dir, ".lock"), "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def save(self, job: Dict[str, Any]):
+        """Write a job atomically (write to temp file then rename)."""
+        path = self._job_path(job["id"])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(job, f)
+        os.replace(tmp_path, path)
+
+    def load(self, job_id: str) -> Dict[str, Any]:
+        with open(self._job_path(job_id), "r") as f:
+            return json.load(f)
+
+    def all(self) -> List[Dict[str, Any]]:
+        """Jobs of the scope of the store, oldest first."""
+        jobs = []
+        for name in sorted(os.listdir(self.root_dir)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.root_dir, name), "r") as f:
+                    job = json.load(f)
+                if self._in_scope(job):
+                    jobs.append(job)
+            except (OSError, json.JSONDecodeError) as e:
+                self.logger.warning(f"Skipping unreadable batch job file {name}: {e}")
+        return sorted(jobs, key=lambda job: job.get("created_at", 0))
+
+    def by_status(self, *statuses: str) -> List[Dict[str, Any]]:
+        return [job for job in self.all() if job.get("status") in statuses]
+
+    def clear(self, finished_only: bool = True):
+        """Remove the finished jobs (or every job) of the scope from the store."""
+        for job in self.all():
+            if finished_only and job["status"] not in (STATUS_COMPLETED, STATUS_FAILED):
+                continue
+            try:
+                os.remove(self._job_path(job["id"]))
+            except FileNotFoundError:
+                # Cleared by another worker collecting the same suite
+                pass
+
+
+class BaseBatchBackend(ABC):
+    """Submit a list of jobs as one provider batch and fetch normalized results."""
+
+    @abstractmethod
+    def submit(self, jobs: List[Dict[str, Any]]) -> str:
+        """Submit the jobs and return the provider batch id."""
+        pass
+
+    @abstractmethod
+    def is_done(self, batch_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    def fetch_results(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns:
+            Dictionary job_id -> {"content", "prompt_tokens", "completion_tokens", "error"}
+        """
+        pass
+
+
+class OpenAIBatchBackend(BaseBatchBackend):
+
+    _ENDPOINT = "/v1/chat/completions"
+    _RUNNING = ("validating", "in_progress", "finalizing", "cancelling")
+
+    def __init__(self, api_key: Optional[str] = None):
+        from openai import OpenAI
+        self.logger = RobotCustomLogger()
+        self.client = OpenAI(api_key=api_key or Config.OPENAI_API_KEY)
+
+    def submit(self, jobs: List[Dict[str, Any]]) -> str:
+        lines = []
+        for job in jobs:
+            body = {"model": job["model"], "messages": job["messages"], **job["params"]}
+            lines.append(json.dumps({
+                "custom_id": job["id"],
+                "method": "POST",
+                "url": self._ENDPOINT,
+                "body": body,
+            }))
+        payload = ("\n".join(lines) + "\n").encode("utf-8")
+        input_file = self.client.files.create(file=("ai_batch.jsonl", payload), purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=self._ENDPOINT,
+            completion_window="24h",
+        )
+        self.logger.info(f"OpenAI batch {batch.id} submitted with {len(jobs)} requests", True)
+        return batch.id
+
+    def is_done(self, batch_id: str) -> bool:
+        return self.client.batches.retrieve(batch_id).status not in self._RUNNING
+
+    def fetch_results(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        batch = self.client.batches.retrieve(batch_id)
+        results = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                results[entry["custom_id"]] = self._normalize(entry)
+        return results
+
+    @staticmethod
+    def _normalize(entry: Dict[str, Any]) -> Dict[str, Any]:
+        response = entry.get("response") or {}
+        if entry.get("error") or response.get("status_code") != 200:
+            error = entry.get("error") or response.get("body", {}).get("error")
+            return {"content": None, "prompt_tokens": 0, "completion_tokens": 0, "error": str(error)}
+        body = response["body"]
+        usage = body.get("usage") or {}
+        return {
+            "content": body["choices"][0]["message"]["content"],
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "error": None,
+        }
+
+
+class AnthropicBatchBackend(BaseBatchBackend):
+
+    def __init__(self, api_key: Optional[str] = None):
+        from src.AiHelper.providers.llm._anthropic import AnthropicClient
+        self.logger = RobotCustomLogger()
+        # Reuse the client for its message transformation and SDK handle
+        self._anthropic = AnthropicClient(api_key=api_key or Config.ANTHROPIC_API_KEY)
+        self.client = self._anthropic.client
+
+    def submit(self, jobs: List[Dict[str, Any]]) -> str:
+        requests = [
+            {
+                "custom_id": job["id"],
+                "params": self._anthropic._build_api_params(job["messages"], job["model"], **job["params"]),
+            }
+            for job in jobs
+        ]
+        batch = self.client.messages.batches.create(requests=requests)
+        self.logger.info(f"Anthropic batch {batch.id} submitted with {len(jobs)} requests", True)
+        return batch.id
+
+    def is_done(self, batch_id: str) -> bool:
+        return self.client.messages.batches.retrieve(batch_id).processing_status == "ended"
+
+    def fetch_results(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        results = {}
+        for entry in self.client.messages.batches.results(batch_id):
+            if entry.result.type != "succeeded":
+                error = getattr(entry.result, "error", None) or entry.result.type
+                results[entry.custom_id] = {"content": None, "prompt_tokens": 0, "completion_tokens": 0, "error": str(error)}
+                continue
+            formatted = self._anthropic.format_response(entry.result.message, include_tokens=True)
+            results[entry.custom_id] = {
+                "content": formatted.get("content"),
+                "prompt_tokens": formatted.get("prompt_tokens", 0),
+                "completion_tokens": formatted.get("completion_tokens", 0),
+                "error": None,
+            }
+        return results
+
+
+class FakeBatchBackend(BaseBatchBackend):
+    """
+    Local stand-in for the batch endpoints, used to exercise the deferred
+    mode offline. Batches are files next to the jobs (any worker of the run
+    can collect them) and end `latency` seconds after submission; every
+    request is answered by `responder(job)`.
+    """
+
+    def __init__(self, responder: Optional[Callable[[Dict[str, Any]], str]] = None, latency: float = 0.0,
+                 root_dir: Optional[str] = None):
+        self.logger = RobotCustomLogger()
+        self.responder = responder or self._default_responder
+        self.latency = latency
+        self.root_dir = root_dir or Config.BATCH_JOB_DIR or os.path.join(tempfile.gettempdir(), "ai_batch_jobs")
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def _batch_path(self, batch_id: str) -> str:
+        return os.path.join(self.root_dir, f"{batch_id}.batch")
+
+    def _load(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._batch_path(batch_id)) as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    @staticmethod
+    def _default_responder(job: Dict[str, Any]) -> str:
+        return json.dumps({
+            "confidence": job.get("metadata", {}).get("fake_confidence", 1.0),
+            "reason": "Answered by the fake batch endpoint",
+            "bug_summary": "",
+            "bug_description": "",
+        })
+
+    def submit(self, jobs: List[Dict[str, Any]]) -> str:
+        batch_id = f"fakebatch_{uuid.uuid4().hex[:12]}"
+        with open(self._batch_path(batch_id), "w") as f:
+            json.dump({"jobs": list(jobs), "ready_at": time.time() + self.latency}, f)
+        self.logger.info(f"Fake batch {batch_id} submitted with {len(jobs)} requests", True)
+        return batch_id
+
+    def is_done(self, batch_id: str) -> bool:
+        batch = self._load(batch_id)
+        # Without its file, the batch was fetched by another collector (or lost: its jobs get no result)
+        return batch is None or time.time() >= batch["ready_at"]
+
+    def fetch_results(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        results = {}
+        for job in (self._load(batch_id) or {}).get("jobs", []):
+            content = self.responder(job)
+            # No token usage reported so that offline runs leave the cost ledger untouched
+            results[job["id"]] = {
+                "content": content,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "error": None,
+            }
+        try:
+            os.remove(self._batch_path(batch_id))
+        except FileNotFoundError:
+            pass
+        return results
+
+
+class BatchCollector:
+    """
+    Submit queued jobs grouped by provider/model, poll the batches and store results.
+    Providers without a batch API (gemini, deepseek, ollama) are answered
+    synchronously through LLMClientFactory at collection time.
+    """
+
+    def __init__(self, store: Optional[BatchJobStore] = None, backend: Optional[str] = None):
+        self.logger = RobotCustomLogger()
+        self.store = store or BatchJobStore()
+        self.backend_name = (backend or Config.BATCH_BACKEND).lower()
+        self._backends: Dict[str, Optional[BaseBatchBackend]] = {}
+
+    def _get_backend(self, provider: str) -> Optional[BaseBatchBackend]:
+        if self.backend_name == "fake":
+            provider = "fake"
+        if provider not in self._backends:
+            if provider == "fake":
+                self._backends[provider] = FakeBatchBackend(root_dir=self.store.root_dir)
+            elif provider == "openai":
+                self._backends[provider] = OpenAIBatchBackend()
+            elif provider in ("anthropic", "claude"):
+                self._backends[provider] = AnthropicBatchBackend()
+            else:
+                self._backends[provider] = None
+        return self._backends[provider]
+
+    def submit_pending(self) -> List[str]:
+        """
+        Submit every queued job of the scope, whatever the worker that enqueued it.
+
+        Returns:
+            List of submitted batch ids
+        """
+        with self.store.locked():
+            # Under the lock: a job queued now is submitted by one collector only
+            return self._submit(self.store.by_status(STATUS_QUEUED))
+
+    def _submit(self, queued: List[Dict[str, Any]]) -> List[str]:
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        for job in queued:
+            groups.setdefault((job["provider"], job["model"]), []).append(job)
+
+        batch_ids = []
+        for (provider, model), jobs in groups.items():
+            backend = self._get_backend(provider)
+            if backend is not None and self.backend_name != "fake" and not ModelConfig().supports(model, CAPABILITY_BATCH, provider):
+                self.logger.warning(f"Model {model} is not available through the {provider} batch API", True)
+                backend = None
+            if backend is None:
+                self.logger.warning(f"No batch API for provider {provider}: running {len(jobs)} jobs synchronously", True)
+                self._run_synchronously(provider, model, jobs)
+                continue
+            batch_id = backend.submit(jobs)
+            for job in jobs:
+                job["status"] = STATUS_SUBMITTED
+                job["batch_id"] = batch_id
+                job["backend"] = provider
+                self.store.save(job)
+            batch_ids.append(batch_id)
+        return batch_ids
+
+    def _run_synchronously(self, provider: str, model: Optional[str], jobs: List[Dict[str, Any]]):
+        from src.AiHelper.providers.llm._factory import LLMClientFactory
+        client = LLMClientFactory.create_client(provider, model=model)
+        for job in jobs:
+            try:
+                response = client.create_chat_completion(messages=job["messages"], model=model, **job["params"])
+                formatted = client.format_response(response, include_tokens=True)
+                result = {
+                    "content": formatted.get("content"),
+                    "prompt_tokens": formatted.get("prompt_tokens", 0),
+                    "completion_tokens": formatted.get("completion_tokens", 0),
+                    "error": None,
+                }
+            except Exception as e:
+                result = {"content": None, "prompt_tokens": 0, "completion_tokens": 0, "error": str(e)}
+            self._store_result(job, result, price_factor=1.0)
+
+    def _store_result(self, job: Dict[str, Any], result: Dict[str, Any], price_factor: float = BATCH_PRICE_FACTOR):
+        from src.AiHelper.common._tiktoken import TokenHelper
+        if result.get("error") is None and (result["prompt_tokens"] or result["completion_tokens"]):
+            result["cost"] = TokenHelper().calculate_cost(
+                result["prompt_tokens"], result["completion_tokens"], job["model"], price_factor=price_factor
+            )
+        job["result"] = result
+        job["status"] = STATUS_FAILED if result.get("error") else STATUS_COMPLETED
+        job["finished_at"] = time.time()
+        self.store.save(job)
+
+    def collect(self, poll_interval: float = 30, timeout: float = 24 * 3600) -> List[Dict[str, Any]]:
+        """
+        Submit pending jobs, then poll every submitted batch until all ended.
+
+        Args:
+            poll_interval: Seconds between two status checks
+            timeout: Give up polling after this many seconds
+
+        Returns:
+            Every finished job (completed or failed)
+
+        Raises:
+            TimeoutError: If some batches are still running after `timeout`
+        """
+        self.submit_pending()
+        deadline = time.monotonic() + timeout
+        while True:
+            submitted = self.store.by_status(STATUS_SUBMITTED)
+            pending_batches: Dict[tuple, List[Dict[str, Any]]] = {}
+            for job in submitted:
+                pending_batches.setdefault((job["backend"], job["batch_id"]), []).append(job)
+
+            for (backend_name, batch_id), jobs in pending_batches.items():
+                backend = self._get_backend(backend_name)
+                if backend is None or not backend.is_done(batch_id):
+                    continue
+                results = backend.fetch_results(batch_id)
+                with self.store.locked():
+                    # Another worker may have stored (and billed) the results of the batch meanwhile
+                    jobs = [job for job in self.store.by_status(STATUS_SUBMITTED) if job["batch_id"] == batch_id]
+                    for job in jobs:
+                        result = results.get(job["id"]) or {
+                            "content": None, "prompt_tokens": 0, "completion_tokens": 0,
+                            "error": "No result returned by the batch",
+                        }
+                        self._store_result(job, result)
+                if jobs:
+                    self.logger.info(f"Batch {batch_id} ended: {len(jobs)} results stored", True)
+
+            if not self.store.by_status(STATUS_SUBMITTED):
+                break
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Batches still running after {timeout} seconds")
+            time.sleep(poll_interval)
+
+        return self.store.by_status(STATUS_COMPLETED, STATUS_FAILED)
@@ -0,0 +1,272 @@
+"""
+Local-first cascade: a cheap screening model answers first, the primary
+provider only when the screening reply cannot be trusted.
+
+CascadeClient wraps the primary client. A request whose response schema has a
+confidence goes to the screening model (Ollama llama3.2-vision by default, any
+provider[:model]) first; its reply is kept when it parses and validates against
+the schema and its confidence is outside the uncertainty band [low, high).
+Otherwise the same request is escalated to the primary client.
+
+The other requests go to the primary directly: without a schema or a
+confidence (locators, bboxes, agent plans) a valid reply is not a trustworthy
+one, and a request with images cannot be screened by a model without vision.
+
+Escalations (with their reason), latencies and the cost avoided are recorded
+per suite for the whole process (see CascadeStats / `Get Cascade Stats`).
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.AiHelper.common._logger import RobotCustomLogger
+from src.AiHelper.common._structured import ResponseSchema, extract_json, get_schema
+from src.AiHelper.common._tiktoken import TokenHelper
+from src.AiHelper.config.config import Config
+from src.AiHelper.config.model_config import CAPABILITY_STRUCTURED_OUTPUT, CAPABILITY_VISION, ModelConfig
+from src.AiHelper.providers.llm._baseclient import BaseLLMClient
+from src.AiHelper.providers.llm._factory import LLMClientFactory
+
+ESCALATION_BAND = "uncertain_confidence"
+ESCALATION_INVALID = "invalid_json"
+ESCALATION_ERROR = "screen_error"
+
+
+def _has_images(messages: List[Dict[str, Any]]) -> bool:
+    return any(isinstance(message.get("content"), list)
+               and any(isinstance(part, dict) and part.get("type") in ("image_url", "image") for part in message["content"])
+               for message in messages)
+
+
+def _suite_name() -> str:
+    try:
+        from robot.libraries.BuiltIn import BuiltIn
+        return BuiltIn().get_variable_value("${SUITE_NAME}") or "default"
+    except Exception:
+        # Outside a Robot Framework run
+        return "default"
+
+
+@dataclass
+class CascadeResponse:
+    """Response of the client that answered (format_response needs the right client)."""
+    client: BaseLLMClient
+    response: Any
+    provider: str
+    model: Optional[str]
+    escalated: bool
+    reason: Optional[str] = None
+
+
+class CascadeStats:
+    """Process-wide cascade records per suite."""
+
+    _lock = threading.Lock()
+    _records: Dict[str, Dict[str, Any]] = {}
+
+    @classmethod
+    def _suite(cls, suite: str) -> Dict[str, Any]:
+        return cls._records.setdefault(suite, {
+            "requests": 0, "accepted": 0, "escalated": 0, "reasons": {},
+            "screen_latency": 0.0, "primary_latency": 0.0, "cost_avoided": 0.0,
+        })
+
+    @classmethod
+    def record(cls, suite: str, screen_latency: float, primary_latency: Optional[float] = None,
+               reason: Optional[str] = None, cost_avoided: float = 0.0):
+        """
+        Args:
+            suite: Suite name
+            screen_latency: Seconds spent on the screening model (0 when it was not asked)
+            primary_latency: Seconds spent on the primary provider, None when the screening reply was kept
+            reason: Escalation reason
+            cost_avoided: Primary provider cost of the request, when the screening reply was kept
+        """
+        with cls._lock:
+            stats = cls._suite(suite)
+            stats["requests"] += 1
+            stats["screen_latency"] += screen_latency
+            if primary_latency is None:
+                stats["accepted"] += 1
+                stats["cost_avoided"] += cost_avoided
+            else:
+                stats["escalated"] += 1
+                stats["primary_latency"] += primary_latency
+                stats["reasons"][reason] = stats["reasons"].get(reason, 0) + 1
+
+    @classmethod
+    def summary(cls) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns:
+            Per suite: requests, escalation rate and reasons, mean screening / primary latency, and the
+            latency and cost saved. Latency saved is what the kept replies would have cost on the primary
+            (its mean latency) minus the time spent screening every request, escalated ones included.
+        """
+        with cls._lock:
+            summary = {}
+            for suite, stats in cls._records.items():
+                requests, escalated = stats["requests"], stats["escalated"]
+                mean_primary = stats["primary_latency"] / escalated if escalated else None
+                summary[suite] = {
+                    "requests": requests,
+                    "accepted": stats["accepted"],
+                    "escalated": escalated,
+                    "escalation_rate": round(escalated / requests, 3) if requests else 0.0,
+                    "escalation_reasons": dict(stats["reasons"]),
+                    "mean_screen_latency": round(stats["screen_latency"] / requests, 3) if requests else None,
+                    "mean_primary_latency": round(mean_primary, 3) if mean_primary is not None else None,
+                    # Unknown until one request reached the primary
+                    "latency_saved": round(stats["accepted"] * mean_primary - stats["screen_latency"], 3)
+                    if mean_primary is not None else None,
+                    "cost_saved": round(stats["cost_avoided"], 5),
+                }
+            return summary
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._records = {}
+
+
+class CascadeClient(BaseLLMClient):
+
+    # Gets the response schema of every request to judge the screening replies (and enforces it per model)
+    validates_schema = True
+
+    def __init__(
+        self,
+        primary: BaseLLMClient,
+        primary_route: Tuple[str, Optional[str]],
+        screen: Tuple[str, Optional[str]],
+        low: float = 0.3,
+        high: float = 0.9,
+    ):
+        """
+        Args:
+            primary: Client of the primary provider (any BaseLLMClient, a hedged router included)
+            primary_route: (provider, model) of the primary, for the capabilities and the cost avoided
+            screen: (provider, model) of the screening model, created through LLMClientFactory
+            low: Lower bound of the uncertainty band: a screening confidence below it is kept (confident fail)
+            high: Upper bound of the band: a screening confidence at or above it is kept (confident pass)
+        """
+        if not 0 <= low <= high <= 1:
+            raise ValueError(f"Invalid cascade band [{low}, {high}): expected 0 <= low <= high <= 1")
+        self.logger = RobotCustomLogger()
+        self.primary = primary
+        # Canonical providers ("claude" -> "anthropic"): their default model, pricing and capabilities apply
+        self.primary_provider, self.primary_model = LLMClientFactory.resolve(*primary_route)
+        self.screen_provider, self.screen_model = LLMClientFactory.resolve(*screen)
+        self.screen = LLMClientFactory.create_client(self.screen_provider, model=self.screen_model)
+        self.low = low
+        self.high = high
+        self.default_model = self.primary_model
+
+    def warm_up(self, model: Optional[str] = None) -> Optional[float]:
+        """Load the screening model when it is a local one (see OllamaNativeClient.warm_up)."""
+        warm_up = getattr(self.screen, "warm_up", None)
+        return warm_up(model or self.screen_model) if warm_up else None
+
+    @staticmethod
+    def _schema_kwargs(schema: Optional[ResponseSchema], provider: str, model: Optional[str]) -> Dict[str, Any]:
+        """response_schema for the clients that enforce it natively (the replies are validated either way)"""
+        if schema is None or not Config.STRUCTURED_OUTPUT:
+            return {}
+        if not ModelConfig().supports(model, CAPABILITY_STRUCTURED_OUTPUT, provider):
+            return {}
+        return {"response_schema": schema}
+
+    def _screenable(self, messages: List[Dict[str, Any]], schema: Optional[ResponseSchema]) -> bool:
+        """ whether the screening reply to a request can be judged (schema with a confidence) and sound (images seen) """
+        if schema is None or "confidence" not in schema.properties:
+            return False
+        if _has_images(messages) and not ModelConfig().supports(self.screen_model, CAPABILITY_VISION, self.screen_provider):
+            return False
+        return True
+
+    def _judge(self, content: str, schema: ResponseSchema) -> Tuple[Optional[str], Optional[float]]:
+        """ (escalation reason or None, confidence) of a screening reply """
+        try:
+            data = schema.coerce(extract_json(content, required=list(schema.properties)))
+        except ValueError:
+            return ESCALATION_INVALID, None
+        confidence = data["confidence"]
+        if not 0 <= confidence <= 1:
+            return ESCALATION_INVALID, confidence
+        if self.low <= confidence < self.high:
+            return ESCALATION_BAND, confidence
+        return None, confidence
+
+    def create_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        **kwargs
+    ) -> CascadeResponse:
+        """
+        Screen the request with the cheap model, escalate it to the primary when the reply cannot be kept.
+        `model` applies to the primary only.
+
+        Returns:
+            CascadeResponse to pass to format_response
+        """
+        schema = get_schema(kwargs.pop("response_schema", None))
+        suite = _suite_name()
+        model = model or self.primary_model
+        screen_latency = 0.0
+        reason = None
+        screened = self._screenable(messages, schema)
+
+        if screened:
+            start = time.perf_counter()
+            try:
+                response = self.screen.create_chat_completion(
+                    messages=messages, model=self.screen_model,
+                    **kwargs, **self._schema_kwargs(schema, self.screen_provider, self.screen_model))
+                formatted = self.screen.format_response(response, include_tokens=True)
+                reason, confidence = self._judge(formatted.get("content") or "", schema)
+            except Exception as e:
+                self.logger.warning(f"Cascade: screening model {self.screen_provider}:{self.screen_model} failed: {e}", True)
+                formatted, reason, confidence = {}, ESCALATION_ERROR, None
+            screen_latency = time.perf_counter() - start
+
+            if reason is None:
+                cost_avoided = self._primary_cost(formatted, model)
+                CascadeStats.record(suite, screen_latency, cost_avoided=cost_avoided)
+                self.logger.info(f"Cascade: {self.screen_provider}:{self.screen_model} answered in {screen_latency:.2f}s "
+                                 f"(confidence {confidence}), not escalated", True)
+                return CascadeResponse(self.screen, response, self.screen_provider, self.screen_model, escalated=False)
+            if formatted:
+                # The screening call is paid even when its reply is not kept
+                TokenHelper().calculate_cost(formatted.get("prompt_tokens", 0), formatted.get("completion_tokens", 0),
+                                             formatted.get("model") or self.screen_model,
+                                             cached_tokens=formatted.get("cache_hit_tokens", 0))
+            self.logger.info(f"Cascade: escalating to {self.primary_provider}:{model} ({reason}"
+                             f"{f', confidence {confidence}' if confidence is not None else ''})", True)
+
+        start = time.perf_counter()
+        if schema is not None and getattr(self.primary, "validates_schema", False):
+            # The adaptive router judges the replies too, and enforces the schema per route
+            schema_kwargs = {"response_schema": schema}
+        else:
+            schema_kwargs = self._schema_kwargs(schema, self.primary_provider, model)
+        response = self.primary.create_chat_completion(messages=messages, model=model, **kwargs, **schema_kwargs)
+        if screened:
+            # Requests that cannot be screened are not part of the cascade stats
+            CascadeStats.record(suite, screen_latency, primary_latency=time.perf_counter() - start, reason=reason)
+        return CascadeResponse(self.primary, response, self.primary_provider, model, escalated=screened, reason=reason)
+
+    def _primary_cost(self, formatted: Dict[str, Any], model: Optional[str]) -> float:
+        """Cost the kept reply would have had on the primary (same token counts)"""
+        pricing = ModelConfig().get_model_pricing(model) if model else None
+        if not pricing:
+            return 0.0
+        return (formatted.get("prompt_tokens", 0) * pricing["input"] + formatted.get("completion_tokens", 0) * pricing["output"]) / 1000
+
+    def format_response(self, response: CascadeResponse, include_tokens: bool = True, include_reason: bool = False):
+        result = response.client.format_response(response.response, include_tokens=include_tokens, include_reason=include_reason)
+        # Cost must be computed with the model that actually answered
+        result["model"] = result.get("model") or response.model
+        result["route"] = f"{response.provider}:{response.model}"
+        result["escalated"] = response.escalated
+        return result
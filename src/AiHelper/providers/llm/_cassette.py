@@ -0,0 +1,88 @@
+"""
+LLM client recording its completions to, or replaying them from, a cassette
+(see src.AiHelper.common._cassette).
+"""
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from src.AiHelper.common._cassette import Cassette, CassetteMiss, request_fingerprints
+from src.AiHelper.common._logger import RobotCustomLogger
+from src.AiHelper.providers.llm._baseclient import BaseLLMClient
+
+_TOKEN_KEYS = ("prompt_tokens", "completion_tokens", "total_tokens", "cache_hit_tokens", "cache_miss_tokens")
+_REASON_KEYS = ("finish_reason",)
+
+
+@dataclass
+class CassetteResponse:
+    """Provider independent response: the formatted response of the wrapped client."""
+    formatted: Dict[str, Any]
+    replayed: bool
+
+
+class CassetteLLMClient(BaseLLMClient):
+
+    def __init__(self, cassette: Cassette, provider: str, model: Optional[str], build_client: Callable[[], BaseLLMClient]):
+        """
+        Args:
+            cassette: Cassette to record to / replay from
+            provider: Provider name (part of the request fingerprint)
+            model: Default model of the wrapped client
+            build_client: Builds the real client, only called when a request goes to the network
+                (replay runs need no API key)
+        """
+        self.logger = RobotCustomLogger()
+        self.cassette = cassette
+        self.provider = provider
+        self.default_model = model
+        self._build_client = build_client
+        self._client: Optional[BaseLLMClient] = None
+
+    @property
+    def client(self) -> BaseLLMClient:
+        if self._client is None:
+            self._client = self._build_client()
+        return self._client
+
+    def create_chat_completion(
+        self,
+        messages: List[Dict[str, Any]],
+        model: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        temperature: float = 1.0,
+        top_p: float = 1.0,
+        **kwargs
+    ) -> CassetteResponse:
+        model = model or self.default_model
+        if max_tokens is not None:
+            # Part of the fingerprint, and only forwarded when given: the wrapped client keeps its own default
+            kwargs["max_tokens"] = max_tokens
+        params = {"temperature": temperature, "top_p": top_p, **kwargs}
+        fingerprints = request_fingerprints(self.provider, model, messages, params)
+
+        if self.cassette.replays:
+            formatted = self.cassette.find_completion(fingerprints)
+            if formatted is not None:
+                self.logger.info(f"Cassette: replayed {self.provider}:{model} response", True)
+                return CassetteResponse(formatted, replayed=True)
+            if not self.cassette.records:
+                raise CassetteMiss(f"No recorded {self.provider}:{model} response matches this request "
+                                   f"in cassette {self.cassette.path} (fingerprint {fingerprints['exact'][:12]})")
+
+        start = time.monotonic()
+        response = self.client.create_chat_completion(messages=messages, model=model, temperature=temperature, top_p=top_p, **kwargs)
+        latency = time.monotonic() - start
+        formatted = self.client.format_response(response, include_tokens=True, include_reason=True)
+        if self.cassette.records:
+            self.cassette.record_completion(fingerprints, self.provider, model, messages, formatted, latency)
+        return CassetteResponse(formatted, replayed=False)
+
+    def format_response(self, response: CassetteResponse, include_tokens: bool = True, include_reason: bool = False) -> Dict[str, Any]:
+        if not response or not response.formatted:
+            self.logger.error("Invalid cassette response", True)
+            return {}
+        result = dict(response.formatted)
+        for key in (() if include_tokens else _TOKEN_KEYS) + (() if include_reason else _REASON_KEYS):
+            result.pop(key, None)
+        return result
@@ -0,0 +1,307 @@
+"""
+Multi-model consensus for verification requests.
+
+The same evidence is sent concurrently to several providers (created through
+LLMClientFactory). Votes are aggregated with a quorum or a weighted-confidence
+policy and the decision is returned as soon as the remaining votes can no
+longer change it. Per-provider latency and agreement with the final decision
+are kept in memory for the whole process to tune the ensemble.
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from src.AiHelper.common._logger import RobotCustomLogger
+from src.AiHelper.common._structured import ResponseSchema
+from src.AiHelper.common._utils import Utilities
+from src.AiHelper.common._tiktoken import TokenHelper
+from src.AiHelper.config.config import Config
+from src.AiHelper.config.model_config import CAPABILITY_STRUCTURED_OUTPUT, ModelConfig
+from src.AiHelper.providers.llm._factory import LLMClientFactory
+
+POLICY_QUORUM = "quorum"
+POLICY_WEIGHTED = "weighted"
+
+
+def parse_provider_specs(providers: Union[str, List[str]]) -> List[Tuple[str, Optional[str]]]:
+    """
+    Parse provider specifications.
+
+    Args:
+        providers: "openai,anthropic:claude-3-5-haiku-20241022" or a list of "provider[:model]"
+
+    Returns:
+        List of (provider, model) tuples: canonical provider names ("claude" -> "anthropic"), the default model
+        of the provider when not specified (see LLMClientFactory.resolve)
+    """
+    if isinstance(providers, str):
+        providers = providers.split(",")
+    specs = []
+    for spec in providers:
+        spec = spec.strip()
+        if not spec:
+            continue
+        provider, _, model = spec.partition(":")
+        specs.append(LLMClientFactory.resolve(provider.strip(), model.strip() or None))
+    return specs
+
+
+def parse_weights(weights: Union[None, str, Dict[str, float]]) -> Dict[str, float]:
+    """ "openai=2,claude=1" or {"openai": 2} -> {"openai": 2.0, "anthropic": 1.0, ...} (canonical provider names) """
+    if not weights:
+        return {}
+    if isinstance(weights, str):
+        weights = dict(item.split("=", 1) for item in weights.split(",") if "=" in item)
+    parsed = {}
+    for key, value in weights.items():
+        provider, separator, model = key.strip().partition(":")
+        provider = LLMClientFactory.resolve(provider)[0]
+        parsed[f"{provider}{separator}{model}"] = float(value)
+    return parsed
+
+
+@dataclass
+class ProviderVote:
+    provider: str
+    model: Optional[str]
+    latency: float
+    confidence: Optional[float] = None
+    passed: Optional[bool] = None
+    reason: str = ""
+    bug_summary: str = ""
+    bug_description: str = ""
+    error: Optional[str] = None
+
+    @property
+    def label(self) -> str:
+        return f"{self.provider}:{self.model}" if self.model else self.provider
+
+
+@dataclass
+class ConsensusResult:
+    passed: bool
+    confidence: float
+    policy: str
+    votes: List[ProviderVote] = field(default_factory=list)
+    early_exit: bool = False
+    elapsed: float = 0.0
+
+    def to_response_json(self) -> Dict[str, Any]:
+        """Shape the decision like a single-model verification reply."""
+        dissent = [vote for vote in self.votes if vote.passed is False]
+        summary = next((vote.bug_summary for vote in dissent if vote.bug_summary), "")
+        description = next((vote.bug_description for vote in dissent if vote.bug_description), "")
+        reasons = "; ".join(
+            f"{vote.label} ({vote.confidence}): {vote.reason}" if vote.error is None else f"{vote.label}: error {vote.error}"
+            for vote in self.votes
+        )
+        return {
+            "confidence": self.confidence,
+            "reason": f"{self.policy} consensus of {len(self.votes)} providers - {reasons}",
+            "bug_summary": summary,
+            "bug_description": description,
+        }
+
+
+class ConsensusStats:
+    """Process-wide latency and agreement records per provider."""
+
+    _lock = threading.Lock()
+    _records: Dict[str, Dict[str, Any]] = {}
+
+    @classmethod
+    def record(cls, result: ConsensusResult):
+        with cls._lock:
+            for vote in result.votes:
+                stats = cls._records.setdefault(vote.label, {
+                    "calls": 0, "errors": 0, "agreements": 0, "total_latency": 0.0, "max_latency": 0.0,
+                })
+                stats["calls"] += 1
+                stats["total_latency"] += vote.latency
+                stats["max_latency"] = max(stats["max_latency"], vote.latency)
+                if vote.error is not None:
+                    stats["errors"] += 1
+                elif vote.passed == result.passed:
+                    stats["agreements"] += 1
+
+    @classmethod
+    def summary(cls) -> Dict[str, Dict[str, float]]:
+        with cls._lock:
+            summary = {}
+            for label, stats in cls._records.items():
+                answered = stats["calls"] - stats["errors"]
+                summary[label] = {
+                    "calls": stats["calls"],
+                    "errors": stats["errors"],
+                    "mean_latency": round(stats["total_latency"] / stats["calls"], 3),
+                    "max_latency": round(stats["max_latency"], 3),
+                    "agreement_rate": round(stats["agreements"] / answered, 3) if answered else 0.0,
+                }
+            return summary
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._records = {}
+
+
+class ConsensusVerifier:
+
+    def __init__(
+        self,
+        providers: List[Tuple[str, Optional[str]]],
+        policy: str = POLICY_QUORUM,
+        quorum: Optional[int] = None,
+        weights: Optional[Dict[str, float]] = None,
+        confidence_threshold: float = 0.8,
+    ):
+        """
+        Args:
+            providers: List of (provider, model) tuples
+            policy: 'quorum' (N agreeing votes decide) or 'weighted' (weighted mean confidence vs threshold)
+            quorum: Number of agreeing votes needed (default: strict majority)
+            weights: Provider (or provider:model) -> weight for the weighted policy (default 1.0)
+            confidence_threshold: Confidence at or above which a vote (or the weighted mean) passes
+        """
+        if not providers:
+            raise ValueError("At least one provider is required for a consensus verification")
+        if policy not in (POLICY_QUORUM, POLICY_WEIGHTED):
+            raise ValueError(f"Unsupported consensus policy: {policy}. Use '{POLICY_QUORUM}' or '{POLICY_WEIGHTED}'")
+        self.logger = RobotCustomLogger()
+        self.providers = providers
+        self.policy = policy
+        self.quorum = quorum or len(providers) // 2 + 1
+        if self.quorum > len(providers):
+            raise ValueError(f"Quorum {self.quorum} is larger than the number of providers ({len(providers)})")
+        self.weights = weights or {}
+        self.confidence_threshold = confidence_threshold
+
+    def _weight(self, provider: str, model: Optional[str]) -> float:
+        return self.weights.get(f"{provider}:{model}", self.weights.get(provider, 1.0))
+
+    @staticmethod
+    def _schema_kwargs(schema: Optional[ResponseSchema], provider: str, model: Optional[str]) -> Dict[str, Any]:
+        """response_schema for the clients that enforce it natively (the replies are parsed either way)"""
+        if schema is None or not Config.STRUCTURED_OUTPUT:
+            return {}
+        if not ModelConfig().supports(model, CAPABILITY_STRUCTURED_OUTPUT, provider):
+            return {}
+        return {"response_schema": schema}
+
+    def _ask(self, provider: str, model: Optional[str], messages: List[Dict[str, Any]],
+             response_schema: Optional[ResponseSchema], params: Dict[str, Any]) -> ProviderVote:
+        start = time.perf_counter()
+        provider, model = LLMClientFactory.resolve(provider, model)
+        try:
+            client = LLMClientFactory.create_client(provider, model=model)
+            response = client.create_chat_completion(messages=messages, model=model,
+                                                     **self._schema_kwargs(response_schema, provider, model), **params)
+            formatted = client.format_response(response, include_tokens=True)
+            TokenHelper().calculate_cost(formatted.get("prompt_tokens", 0), formatted.get("completion_tokens", 0), model)
+            response_json = Utilities.extract_json_safely(formatted["content"], "verification")
+            confidence = float(response_json["confidence"])
+            return ProviderVote(
+                provider=provider,
+                model=model,
+                latency=time.perf_counter() - start,
+                confidence=confidence,
+                passed=confidence >= self.confidence_threshold,
+                reason=response_json.get("reason", ""),
+                bug_summary=response_json.get("bug_summary", ""),
+                bug_description=response_json.get("bug_description", ""),
+            )
+        except Exception as e:
+            return ProviderVote(provider=provider, model=model, latency=time.perf_counter() - start, error=str(e))
+
+    def _decide(self, votes: List[ProviderVote], pending: List[Tuple[str, Optional[str]]]) -> Optional[Tuple[bool, float]]:
+        """
+        Returns (passed, confidence) once the outcome can no longer change, None otherwise.
+        Errored votes abstain.
+        """
+        valid = [vote for vote in votes if vote.error is None]
+        if self.policy == POLICY_QUORUM:
+            passes = [vote for vote in valid if vote.passed]
+            fails = [vote for vote in valid if not vote.passed]
+            if len(passes) >= self.quorum:
+                return True, min(vote.confidence for vote in passes)
+            if len(fails) >= self.quorum:
+                return False, max(vote.confidence for vote in fails)
+            if not pending:
+                # Quorum not reached and nothing left to wait for: fall back to simple majority
+                if not valid:
+                    return False, 0.0
+                passed = len(passes) > len(fails)
+                side = passes if passed else fails
+                return passed, sum(vote.confidence for vote in side) / len(side)
+            return None
+
+        answered_weight = sum(self._weight(vote.provider, vote.model) for vote in valid)
+        score = sum(self._weight(vote.provider, vote.model) * vote.confidence for vote in valid)
+        remaining_weight = sum(self._weight(provider, model) for provider, model in pending)
+        total_weight = answered_weight + remaining_weight
+        if total_weight == 0:
+            return (False, 0.0) if not pending else None
+        lowest = score / total_weight
+        highest = (score + remaining_weight) / total_weight
+        if lowest >= self.confidence_threshold:
+            return True, lowest if pending else score / answered_weight
+        if highest < self.confidence_threshold:
+            return False, highest if pending else score / answered_weight
+        return None
+
+    def verify(self, messages: List[Dict[str, Any]], response_schema: Optional[ResponseSchema] = None,
+               **params) -> ConsensusResult:
+        """
+        Send the messages to every provider concurrently and aggregate the votes.
+
+        Args:
+            messages: OpenAI-style messages (shared by all providers)
+            response_schema: Schema of the replies, enforced natively by the models that support it
+            **params: Extra parameters for create_chat_completion
+
+        Returns:
+            ConsensusResult (also recorded in ConsensusStats)
+        """
+        start = time.perf_counter()
+        votes: List[ProviderVote] = []
+        pending = list(self.providers)
+        decision = None
+
+        executor = ThreadPoolExecutor(max_workers=len(self.providers), thread_name_prefix="consensus")
+        try:
+            futures = {
+                executor.submit(contextvars.copy_context().run, self._ask, provider, model, messages,
+                                response_schema, params): (provider, model)
+                for provider, model in self.providers
+            }
+            for future in as_completed(futures):
+                vote = future.result()
+                votes.append(vote)
+                pending.remove(futures[future])
+                self.logger.info(
+                    f"Consensus vote {vote.label}: confidence={vote.confidence} latency={vote.latency:.2f}s"
+                    + (f" error={vote.error}" if vote.error else ""), True)
+                decision = self._decide(votes, pending)
+                if decision is not None:
+                    break
+        finally:
+            # Do not wait for the slower providers once the decision is made
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        passed, confidence = decision if decision is not None else (False, 0.0)
+        result = ConsensusResult(
+            passed=passed,
+            confidence=confidence,
+            policy=self.policy,
+            votes=votes,
+            early_exit=bool(pending),
+            elapsed=time.perf_counter() - start,
+        )
+        ConsensusStats.record(result)
+        self.logger.info(
+            f"Consensus ({self.policy}) {'passed' if passed else 'failed'} with confidence {confidence} "
+            f"after {len(votes)}/{len(self.providers)} votes in {result.elapsed:.2f}s", True)
+        return result
@@ -1,42 +1,63 @@
-from anthropic import Anthropic, APIError
-from typing import Optional, Dict, List, Union
-import os
+"""
+DeepSeek client on the OpenAI-compatible endpoint (https://api.deepseek.com).
+
+DeepSeek caches prompts on disk by prefix: a request whose first tokens match
+an earlier request's (64-token units) is billed at the cache-hit price for
+them, and the reply's usage reports `prompt_cache_hit_tokens` /
+`prompt_cache_miss_tokens`. The messages are therefore compiled to a stable
+prefix:
+
+    - every system message is hoisted into one leading system message,
+      followed by the JSON instruction of the response schema (keys sorted),
+      so the prefix only depends on the prompt and on the schema
+    - multi-part contents are flattened to plain text: the same text gives
+      the same bytes whatever its split in parts
+
+DeepSeek chat models take no images: a request with image parts is refused
+(ValueError) rather than answered without them.
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from openai import APIError, OpenAI
+from openai.types.chat import ChatCompletion
+
 from src.AiHelper.common._logger import RobotCustomLogger
+from src.AiHelper.common._structured import ResponseSchema
 from src.AiHelper.providers.llm._baseclient import BaseLLMClient
+from src.AiHelper.providers.llm._messages import Message, TextPart, to_ir
+
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
 
 
 class DeepSeekClient(BaseLLMClient):
     """
-    DeepSeek client using Anthropic API compatibility.
+    DeepSeek client using OpenAI API compatibility.
     """
 
     def __init__(
-        self, 
+        self,
         api_key: Optional[str] = None,
         model: str = "deepseek-chat",
         max_retries: int = 3,
+        base_url: str = DEEPSEEK_BASE_URL,
     ):
         self.logger = RobotCustomLogger()
         self.api_key: str = api_key
-        
+
         if not self.api_key:
             from src.AiHelper.config.config import Config
             config = Config()
             self.api_key = config.DEEPSEEK_API_KEY
             self.logger.info(f"API key loaded from config file")
-            
+
         if not self.api_key:
             raise ValueError("API key must be provided either as an argument or in the environment variables.")
-            
+
         self.default_model = model
         self.max_retries = max_retries
-        
-        # Initialize Anthropic client with DeepSeek's base URL
-        self.client = Anthropic(
-            api_key=self.api_key,
-            base_url="https://api.deepseek.com/anthropic",
-            max_retries=max_retries
-        )
+        # retries are handled by the shared rate limiter (see BaseLLMClient._send_with_retry)
+        self.client = OpenAI(api_key=self.api_key, base_url=base_url, max_retries=0)
 
     def create_chat_completion(
         self,
@@ -46,10 +67,10 @@ class DeepSeekClient(BaseLLMClient):
         temperature: float = 1.0,
         top_p: float = 1.0,
         **kwargs
-    ):
+    ) -> Optional[ChatCompletion]:
         """
-        Create a chat completion using DeepSeek's Anthropic-compatible API.
-        
+        Create a chat completion using DeepSeek's OpenAI-compatible API.
+
         Args:
             messages: List of message dictionaries with 'role' and 'content'
             model: Model to use (if None, uses default_model)
@@ -57,57 +78,47 @@ class DeepSeekClient(BaseLLMClient):
             temperature: Sampling temperature (0-2.0 for DeepSeek)
             top_p: Nucleus sampling parameter (0-1)
             **kwargs: Additional parameters to pass to the API
-            
+
         Returns:
-            Anthropic Message object (from DeepSeek)
+            ChatCompletion object (from DeepSeek)
         """
         try:
             self._validate_parameters(temperature, top_p)
-            
-            # DeepSeek follows Anthropic's format - separate system messages
-            system_message = None
-            user_messages = []
-            
-            for msg in messages:
-                if msg.get("role") == "system":
-                    system_message = msg.get("content")
-                else:
-                    transformed_content = self._transform_content(msg.get("content"))
-                    user_messages.append({
-                        "role": msg.get("role"),
-                        "content": transformed_content
-                    })
-            
-            # Prepare API call parameters
-            api_params = {
-                "model": model or self.default_model,
-                "messages": user_messages,
-                "max_tokens": max_tokens,
-                **kwargs
-            }
-            # Only add temperature or top_p, not both
-            if temperature != 1.0:
-                api_params["temperature"] = temperature
-            elif top_p != 1.0:
-                api_params["top_p"] = top_p
-            else:
-                # If both are default, use temperature
-                api_params["temperature"] = temperature
-            
-            if system_message:
-                api_params["system"] = system_message
-            
-            response = self.client.messages.create(**api_params)
-            
-            # Log usage
+
+            model = model or self.default_model
+            response_schema = self._pop_response_schema(kwargs)
+            if response_schema is not None:
+                # DeepSeek's JSON output is `json_object` only: the schema goes in the system prompt
+                kwargs["response_format"] = {"type": "json_object"}
+            kwargs.pop("max_completion_tokens", None)
+            converted = self._convert_messages(messages, response_schema)
+
+            response = self._send_with_retry(
+                "deepseek",
+                model,
+                lambda: self.client.chat.completions.create(
+                    model=model,
+                    messages=converted,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    top_p=top_p,
+                    timeout=self._request_timeout(),
+                    **kwargs
+                ),
+                messages,
+                max_tokens,
+                usage=lambda r: r.usage.total_tokens,
+            )
+
+            hit, miss = self.cache_tokens(response)
             self.logger.info(
-                f"DeepSeek API call successful. Tokens used: {response.usage.input_tokens + response.usage.output_tokens}",
+                f"DeepSeek API call successful. Tokens used: {response.usage.total_tokens} "
+                f"(prompt cache: {hit} hit, {miss} miss)",
                 True
             )
-            self.logger.info(f"Response: {response}")
-            
+            self.logger.debug(lambda: f"Response: {response}")
             return response
-            
+
         except APIError as e:
             self.logger.error(f"DeepSeek API Error: {str(e)}", True)
             raise
@@ -115,92 +126,46 @@ class DeepSeekClient(BaseLLMClient):
             self.logger.error(f"Unexpected error: {str(e)}", True)
             raise
 
-    def _transform_content(self, content):
+    def _convert_messages(
+        self,
+        messages: List[Union[Dict[str, Any], Message]],
+        response_schema: Optional[ResponseSchema] = None,
+    ) -> List[Dict[str, str]]:
         """
-        Transform content to DeepSeek's format (follows Anthropic format).
-        
-        Supports:
-        - String content (passed through)
-        - List content with text and images (if supported)
-        - OpenAI-style image_url format -> Anthropic's image format
-        - Native Anthropic image format (passed through)
-        
         Args:
-            content: String or list of content items
-            
+            messages: OpenAI-style messages
+            response_schema: Schema the reply must match (described in the system prompt)
+
         Returns:
-            Transformed content in Anthropic/DeepSeek format
+            Text-only messages, the system prompt first (stable prefix, see the module docstring)
+
+        Raises:
+            ValueError: When a message has an image part
         """
-        # If content is a simple string, return as-is
-        if isinstance(content, str):
-            return content
-        
-        # If content is not a list, return as-is
-        if not isinstance(content, list):
-            return content
-        
-        # Transform list content
-        transformed = []
-        for item in content:
-            if not isinstance(item, dict):
-                continue
-                
-            item_type = item.get("type")
-            
-            # Handle text content
-            if item_type == "text":
-                transformed.append({
-                    "type": "text",
-                    "text": item.get("text", "")
-                })
-            
-            # Handle OpenAI-style image_url format
-            # Note: DeepSeek's docs show image support as "Not Supported"
-            # but we'll include the transformation for future compatibility
-            elif item_type == "image_url":
-                image_url_data = item.get("image_url", {})
-                if isinstance(image_url_data, dict) and "url" in image_url_data:
-                    url = image_url_data["url"]
-                    
-                    # Check if it's a base64 data URL
-                    if url.startswith("data:"):
-                        # Extract media type and base64 data
-                        try:
-                            header, data = url.split(",", 1)
-                            media_type = header.split(";")[0].split(":")[1]
-                            transformed.append({
-                                "type": "image",
-                                "source": {
-                                    "type": "base64",
-                                    "media_type": media_type,
-                                    "data": data
-                                }
-                            })
-                        except (ValueError, IndexError) as e:
-                            self.logger.error(f"Invalid base64 image URL format: {e}")
-                            continue
-                    else:
-                        # Regular URL
-                        transformed.append({
-                            "type": "image",
-                            "source": {
-                                "type": "url",
-                                "url": url
-                            }
-                        })
-            
-            # Handle native Anthropic image format
-            elif item_type == "image":
-                if "source" in item:
-                    transformed.append(item)
-                else:
-                    self.logger.warning("Image item missing 'source' field")
-            
-            # Pass through any other content types
+        system, converted = [], []
+        for message in to_ir(messages):
+            if isinstance(message.content, str):
+                text = message.content
+            else:
+                if any(not isinstance(part, TextPart) for part in message.content):
+                    # A verification answered without its screenshot would be a guess
+                    raise ValueError("DeepSeek models do not take images: use a vision capable provider")
+                text = "\n".join(part.text for part in message.content)
+            if message.role == "system":
+                system.append(text)
             else:
-                transformed.append(item)
-        
-        return transformed if transformed else content
+                converted.append({"role": message.role, "content": text})
+        if response_schema is not None:
+            system.append(self._schema_instruction(response_schema))
+        if system:
+            converted.insert(0, {"role": "system", "content": "\n\n".join(system)})
+        return converted
+
+    @staticmethod
+    def _schema_instruction(response_schema: ResponseSchema) -> str:
+        schema = json.dumps(response_schema.json_schema(), sort_keys=True, ensure_ascii=False)
+        return (f"Reply with a single JSON object ({response_schema.name}: {response_schema.description}) "
+                f"matching this JSON schema:\n{schema}")
 
     def _validate_parameters(self, temperature: float, top_p: float):
         """Validate API parameters. DeepSeek supports temperature 0-2.0."""
@@ -211,48 +176,58 @@ class DeepSeekClient(BaseLLMClient):
             self.logger.error(f"Invalid top_p {top_p}. Must be between 0 and 1")
             raise ValueError(f"Invalid top_p {top_p}. Must be between 0 and 1")
 
+    @staticmethod
+    def cache_tokens(response: ChatCompletion) -> Tuple[int, int]:
+        """
+        Returns:
+            (prompt_cache_hit_tokens, prompt_cache_miss_tokens) of the reply; without them (older
+            deployments) every prompt token is a miss
+        """
+        usage = response.usage
+        hit = getattr(usage, "prompt_cache_hit_tokens", None) or 0
+        miss = getattr(usage, "prompt_cache_miss_tokens", None)
+        if miss is None:
+            miss = usage.prompt_tokens - hit
+        return hit, miss
+
     def format_response(
-        self, 
-        response,
+        self,
+        response: ChatCompletion,
         include_tokens: bool = True,
         include_reason: bool = False
     ) -> Dict[str, Union[str, int]]:
         """
         Format DeepSeek response to a standardized dictionary.
-        
+
         Args:
-            response: Anthropic Message object (from DeepSeek)
-            include_tokens: Whether to include token usage information
-            include_reason: Whether to include stop reason
-            
+            response: ChatCompletion object (from DeepSeek)
+            include_tokens: Whether to include token usage information (prompt cache hit / miss included)
+            include_reason: Whether to include finish reason
+
         Returns:
             Standardized response dictionary
         """
-        if not response or not response.content:
-            self.logger.error(f"Invalid response or no content in the response", True)
+        if not response or not response.choices:
+            self.logger.error(f"Invalid response or no choices in the response", True)
             return {}
-        
-        # Extract text content (follows Anthropic's format)
-        content_text = ""
-        for block in response.content:
-            if hasattr(block, 'text'):
-                content_text += block.text
-        
+
         result = {
-            "content": content_text,
+            "content": response.choices[0].message.content,
         }
-        
+
         if include_tokens and response.usage:
-            self.logger.info(f"Tokens used: input={response.usage.input_tokens}, output={response.usage.output_tokens}")
+            hit, miss = self.cache_tokens(response)
+            self.logger.info(f"Tokens used: {response.usage} (prompt cache: {hit} hit, {miss} miss)")
             result.update({
-                "prompt_tokens": response.usage.input_tokens,
-                "completion_tokens": response.usage.output_tokens,
-                "total_tokens": response.usage.input_tokens + response.usage.output_tokens
+                "prompt_tokens": response.usage.prompt_tokens,
+                "completion_tokens": response.usage.completion_tokens,
+                "total_tokens": response.usage.total_tokens,
+                "cache_hit_tokens": hit,
+                "cache_miss_tokens": miss,
             })
-            
+
         if include_reason:
-            self.logger.info(f"Stop reason: {response.stop_reason}")
-            result["finish_reason"] = response.stop_reason
-            
-        return result
+            self.logger.info(f"Finish reason: {response.choices[0].finish_reason}")
+            result["finish_reason"] = response.choices[0].finish_reason
 
+        return result
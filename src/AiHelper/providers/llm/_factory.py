@@ -1,18 +1,39 @@
-from typing import Optional
+import importlib
+import threading
+from typing import Dict, Optional, Tuple
+from src.AiHelper.common._cassette import active_cassette
 from src.AiHelper.providers.llm._baseclient import BaseLLMClient
-from src.AiHelper.providers.llm._openaiclient import OpenAIClient
-from src.AiHelper.providers.llm._anthropic import AnthropicClient
-from src.AiHelper.providers.llm._gemini import GeminiClient
-from src.AiHelper.providers.llm._deepseek import DeepSeekClient
-from src.AiHelper.providers.llm._ollama import OllamaClient
 from src.AiHelper.config.model_config import ModelConfig
 from src.AiHelper.config.config import Config
 
 class LLMClientFactory:
     """
     Factory class to create and return LLM client instances.
+    
+    Clients are kept in a process-wide pool keyed by (provider, model) so that the
+    SDK client and its HTTP connection pool are reused across test cases
+    (the library scope is TEST) and across `Switch Provider` calls.
     """
     
+    _ALIASES = {"claude": "anthropic", "google": "gemini"}
+    
+    # Provider modules are imported on first use only: importing every SDK
+    # (openai, anthropic, google.generativeai, ...) costs seconds per pabot worker
+    _PROVIDER_CLASSES = {
+        "openai": ("src.AiHelper.providers.llm._openaiclient", "OpenAIClient"),
+        "anthropic": ("src.AiHelper.providers.llm._anthropic", "AnthropicClient"),
+        "gemini": ("src.AiHelper.providers.llm._gemini", "GeminiClient"),
+        "deepseek": ("src.AiHelper.providers.llm._deepseek", "DeepSeekClient"),
+        "ollama": ("src.AiHelper.providers.llm._ollama", "OllamaClient"),
+    }
+    # AIHELPER_OLLAMA_MODE=native: /api/chat instead of the OpenAI-compatible endpoint
+    _OLLAMA_NATIVE_CLASS = ("src.AiHelper.providers.llm._ollamanative", "OllamaNativeClient")
+    
+    # Process-wide client pool
+    _clients: Dict[Tuple[str, Optional[str]], BaseLLMClient] = {}
+    _pool_lock = threading.Lock()
+    _key_locks: Dict[Tuple[str, Optional[str]], threading.Lock] = {}
+    
     # Load default models from configuration file
     _model_config = ModelConfig()
     DEFAULT_MODELS = {
@@ -26,14 +47,17 @@ class LLMClientFactory:
     @staticmethod
     def create_client(
         client_name: str = "openai", 
-        model: Optional[str] = None
+        model: Optional[str] = None,
+        reuse: bool = True
     ) -> BaseLLMClient:
         """
-        Create and return an LLM client instance.
+        Return an LLM client instance, from the pool when one already exists.
         
         Args:
             client_name: Name of the provider ('openai', 'anthropic', 'gemini', 'deepseek', 'ollama')
             model: Model name to use (if None, uses default for the provider)
+            reuse: Take the client from the process-wide pool (created lazily on first use).
+                False always builds a new, unpooled client.
             
         Returns:
             BaseLLMClient instance
@@ -41,28 +65,93 @@ class LLMClientFactory:
         Raises:
             ValueError: If the client_name is not supported
         """
+        client_name_lower, model = LLMClientFactory.resolve(client_name, model)
+        
+        if not reuse:
+            return LLMClientFactory._build_client(client_name_lower, model)
+        
+        key = (client_name_lower, model)
+        client = LLMClientFactory._clients.get(key)
+        if client is not None:
+            return client
+        
+        # One lock per key: building a client does not block lookups of other providers
+        with LLMClientFactory._pool_lock:
+            key_lock = LLMClientFactory._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            client = LLMClientFactory._clients.get(key)
+            if client is None:
+                client = LLMClientFactory._build_client(client_name_lower, model)
+                LLMClientFactory._clients[key] = client
+        return client
+    
+    @staticmethod
+    def resolve(client_name: str, model: Optional[str] = None) -> Tuple[str, Optional[str]]:
+        """
+        Args:
+            client_name: Provider name or alias ('claude', 'google'...)
+            model: Model name (None = provider default)
+
+        Returns:
+            (canonical provider name, model), the default model of the provider when model is None
+        """
         client_name_lower = client_name.lower()
+        client_name_lower = LLMClientFactory._ALIASES.get(client_name_lower, client_name_lower)
+        return client_name_lower, model or LLMClientFactory.DEFAULT_MODELS.get(client_name_lower)
+
+    @staticmethod
+    def clear_pool():
+        """Drop every pooled client (e.g. after an API key rotation)."""
+        with LLMClientFactory._pool_lock:
+            LLMClientFactory._clients.clear()
+            LLMClientFactory._key_locks.clear()
+    
+    @staticmethod
+    def _load_client_class(client_name_lower: str):
+        if client_name_lower == "ollama" and Config.OLLAMA_MODE == "native":
+            module_name, class_name = LLMClientFactory._OLLAMA_NATIVE_CLASS
+        else:
+            module_name, class_name = LLMClientFactory._PROVIDER_CLASSES[client_name_lower]
+        return getattr(importlib.import_module(module_name), class_name)
+    
+    @staticmethod
+    def _build_client(client_name_lower: str, model: Optional[str]) -> BaseLLMClient:
+        # With a cassette the real client is only built when a request goes to the network
+        cassette = active_cassette()
+        if cassette is not None:
+            from src.AiHelper.providers.llm._cassette import CassetteLLMClient
+            client = CassetteLLMClient(cassette, client_name_lower, model,
+                                       lambda: LLMClientFactory._build_provider_client(client_name_lower, model))
+        else:
+            client = LLMClientFactory._build_provider_client(client_name_lower, model)
+        if Config.SIDECAR and Config.SIDECAR_LLM_TTL > 0:
+            # Identical requests of the pabot workers are sent once (see common._sidecar)
+            from src.AiHelper.providers.llm._shared import SharedCacheLLMClient
+            client = SharedCacheLLMClient(client, client_name_lower, model)
+        return client
+    
+    @staticmethod
+    def _build_provider_client(client_name_lower: str, model: Optional[str]) -> BaseLLMClient:
         config = Config()
         
-        # Use default model if not specified
-        if model is None:
-            model = LLMClientFactory.DEFAULT_MODELS.get(client_name_lower)
+        if client_name_lower in LLMClientFactory._PROVIDER_CLASSES:
+            client_class = LLMClientFactory._load_client_class(client_name_lower)
         
         if client_name_lower == "openai":
             api_key = config.OPENAI_API_KEY
-            return OpenAIClient(model=model, api_key=api_key)
-        elif client_name_lower == "anthropic" or client_name_lower == "claude":
+            return client_class(model=model, api_key=api_key)
+        elif client_name_lower == "anthropic":
             api_key = config.ANTHROPIC_API_KEY
-            return AnthropicClient(model=model, api_key=api_key)
-        elif client_name_lower == "gemini" or client_name_lower == "google":
+            return client_class(model=model, api_key=api_key)
+        elif client_name_lower == "gemini":
             api_key = config.GEMINI_API_KEY
-            return GeminiClient(model=model)
+            return client_class(model=model)
         elif client_name_lower == "deepseek":
             api_key = config.DEEPSEEK_API_KEY
-            return DeepSeekClient(model=model, api_key=api_key)
+            return client_class(model=model, api_key=api_key)
         elif client_name_lower == "ollama":
             base_url = config.OLLAMA_BASE_URL
-            return OllamaClient(model=model, base_url=base_url)
+            return client_class(model=model, base_url=base_url)
         
         # Future implementations
         elif client_name_lower == "huggingface":
@@ -72,6 +161,6 @@ class LLMClientFactory:
         else:
             supported = list(LLMClientFactory.DEFAULT_MODELS.keys())
             raise ValueError(
-                f"Unsupported LLM client: {client_name}. "
+                f"Unsupported LLM client: {client_name_lower}. "
                 f"Supported providers: {', '.join(supported)}"
             )
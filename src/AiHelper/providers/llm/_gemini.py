@@ -6,6 +6,7 @@ import base64
 import requests
 from src.AiHelper.common._logger import RobotCustomLogger
 from src.AiHelper.providers.llm._baseclient import BaseLLMClient
+from src.AiHelper.providers.llm._messages import PROVIDER_GEMINI, ImagePart, Message, Part, TextPart, compile_parts, to_ir
 
 
 class GeminiClient(BaseLLMClient):
@@ -85,6 +86,11 @@ class GeminiClient(BaseLLMClient):
             # Convert messages to Gemini format
             gemini_messages = self._convert_messages_to_gemini_format(messages)
             
+            response_schema = self._pop_response_schema(kwargs)
+            if response_schema is not None:
+                kwargs["response_mime_type"] = "application/json"
+                kwargs["response_schema"] = response_schema.gemini_schema()
+            
             # Configure generation parameters
             generation_config = genai.types.GenerationConfig(
                 max_output_tokens=max_tokens,
@@ -94,9 +100,17 @@ class GeminiClient(BaseLLMClient):
             )
             
             # Generate content
-            response = client.generate_content(
-                gemini_messages,
-                generation_config=generation_config
+            response = self._send_with_retry(
+                "gemini",
+                model or self.default_model,
+                lambda: client.generate_content(
+                    gemini_messages,
+                    generation_config=generation_config,
+                    request_options={"timeout": self._request_timeout()},
+                ),
+                messages,
+                max_tokens,
+                usage=lambda r: r.usage_metadata.prompt_token_count + r.usage_metadata.candidates_token_count,
             )
             
             # Log usage (Gemini provides token counts in usage_metadata)
@@ -109,7 +123,7 @@ class GeminiClient(BaseLLMClient):
             else:
                 self.logger.info(f"Gemini API call successful (no usage metadata available)", True)
             
-            self.logger.info(f"Response: {response}")
+            self.logger.debug(lambda: f"Response: {response}")
             
             return response
             
@@ -122,46 +136,34 @@ class GeminiClient(BaseLLMClient):
         Convert standard message format to Gemini format.
         Gemini uses 'user' and 'model' roles instead of 'user' and 'assistant'.
         System messages are prepended to the first user message.
-        Handles complex content structures (text + images).
+        Handles complex content structures (text + images): each part is converted once
+        (see _messages), so a growing conversation only converts its new parts.
         """
         gemini_messages = []
         system_message = None
+        user_seen = False
         
-        for msg in messages:
-            role = msg.get("role")
-            content = msg.get("content")
-            
-            if role == "system":
-                system_message = content if isinstance(content, str) else str(content)
-            elif role == "assistant":
-                # Handle assistant messages
-                if isinstance(content, str):
-                    gemini_messages.append({
-                        "role": "model",
-                        "parts": [content]
-                    })
-                else:
-                    gemini_messages.append({
-                        "role": "model",
-                        "parts": [str(content)]
-                    })
-            elif role == "user":
+        for message in to_ir(messages):
+            if message.role == "system":
+                system_message = message.text
+            elif message.role == "assistant":
+                gemini_messages.append({
+                    "role": "model",
+                    "parts": [message.text]
+                })
+            elif message.role == "user":
                 # Handle user messages - can be string or complex content list
-                parts = []
-                
-                if isinstance(content, str):
-                    # Simple text message
-                    parts.append(content)
-                elif isinstance(content, list):
-                    # Complex content with text and/or images (OpenAI style)
-                    parts = self._process_content_parts(content)
+                if isinstance(message.content, str):
+                    parts = [message.content]
                 else:
-                    parts.append(str(content))
+                    # Complex content with text and/or images (OpenAI style)
+                    parts = self._process_content_parts(message)
                 
                 # If there's a system message and this is the first user message, prepend it
-                if system_message and not any(m.get("role") == "user" for m in gemini_messages):
+                if system_message and not user_seen:
                     parts.insert(0, system_message)
                     system_message = None  # Only add once
+                user_seen = True
                 
                 gemini_messages.append({
                     "role": "user",
@@ -170,7 +172,7 @@ class GeminiClient(BaseLLMClient):
         
         return gemini_messages
 
-    def _process_content_parts(self, content_list: List[Dict]) -> List:
+    def _process_content_parts(self, message: Message) -> List:
         """
         Process content parts and convert images to Gemini format.
         
@@ -182,90 +184,52 @@ class GeminiClient(BaseLLMClient):
         Returns:
             List of parts suitable for Gemini API (strings and image data)
         """
-        parts = []
-        
-        for item in content_list:
-            if isinstance(item, str):
-                parts.append(item)
-                continue
-                
-            if not isinstance(item, dict):
-                continue
-            
-            item_type = item.get("type")
-            
-            # Handle text content
-            if item_type == "text":
-                text = item.get("text", "")
-                if text:
-                    parts.append(text)
-            
-            # Handle OpenAI-style image_url format
-            elif item_type == "image_url":
-                image_data = self._process_image_url(item.get("image_url", {}))
-                if image_data:
-                    parts.append(image_data)
-            
-            # Handle native Gemini image format (if provided)
-            elif item_type == "image":
-                # Native Gemini format with inline_data
-                if "inline_data" in item:
-                    parts.append(item)
-        
-        return parts
+        return compile_parts(message, PROVIDER_GEMINI, self._convert_part)
 
-    def _process_image_url(self, image_url_data: Dict) -> Optional[Dict]:
+    def _convert_part(self, part: Part) -> Optional[Union[str, Dict]]:
+        if isinstance(part, TextPart):
+            return part.text or None
+        if isinstance(part, ImagePart):
+            if part.is_inline:
+                # Gemini expects inline_data format
+                return {
+                    "inline_data": {
+                        "mime_type": part.media_type,
+                        "data": part.base64
+                    }
+                }
+            return self._fetch_image(part.url)
+        # Native Gemini format with inline_data
+        if part.type == "image" and "inline_data" in part.item:
+            return part.item
+        return None
+
+    def _fetch_image(self, url: str) -> Optional[Dict]:
         """
-        Process image URL and convert to Gemini format.
-        
-        Handles:
-        - Regular URLs (fetches and converts to base64)
-        - Base64 data URLs (extracts and converts)
+        Fetch a remote image and convert it to Gemini format.
         
         Returns:
             Dict with inline_data in Gemini format, or None if error
         """
-        if not isinstance(image_url_data, dict):
-            return None
-        
-        url = image_url_data.get("url", "")
-        if not url:
-            return None
-        
         try:
-            # Check if it's a base64 data URL
-            if url.startswith("data:"):
-                # Format: data:image/jpeg;base64,/9j/4AAQ...
-                header, data = url.split(",", 1)
-                media_type = header.split(";")[0].split(":")[1]
-                
-                # Gemini expects inline_data format
-                return {
-                    "inline_data": {
-                        "mime_type": media_type,
-                        "data": data
-                    }
-                }
-            else:
-                # Regular URL - fetch the image
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-                }
-                response = requests.get(url, headers=headers, timeout=10)
-                response.raise_for_status()
-                
-                # Determine MIME type from response headers
-                mime_type = response.headers.get("content-type", "image/jpeg")
-                
-                # Convert to base64
-                image_base64 = base64.b64encode(response.content).decode('utf-8')
-                
-                return {
-                    "inline_data": {
-                        "mime_type": mime_type,
-                        "data": image_base64
-                    }
+            headers = {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+            }
+            response = requests.get(url, headers=headers, timeout=10)
+            response.raise_for_status()
+            
+            # Determine MIME type from response headers
+            mime_type = response.headers.get("content-type", "image/jpeg")
+            
+            # Convert to base64
+            image_base64 = base64.b64encode(response.content).decode('utf-8')
+            
+            return {
+                "inline_data": {
+                    "mime_type": mime_type,
+                    "data": image_base64
                 }
+            }
                 
         except Exception as e:
             self.logger.error(f"Error processing image URL: {e}", True)
@@ -1,4 +1,3 @@
-import base64
 import os
 from typing import Dict, List, Optional, Any, Union
 from PIL import Image
@@ -6,6 +5,7 @@ import io
 from gradio_client import Client, handle_file
 from robot.libraries.BuiltIn import BuiltIn
 from src.AiHelper.common._logger import RobotCustomLogger
+from src.AiHelper.common._screenshot import Screenshot
 class OmniParser:
     """Client for Microsoft's OmniParser v2 model on Hugging Face."""
     
@@ -23,7 +23,7 @@ class OmniParser:
 
     def parse_screenshot(
         self, 
-        image: Union[str, Image.Image, bytes],
+        image: Union[str, Image.Image, bytes, Screenshot],
         box_threshold: float = 0.05,
         iou_threshold: float = 0.1,
         use_paddleocr: bool = True,
@@ -32,7 +32,7 @@ class OmniParser:
         """Parse a screenshot using OmniParser.
         
         Args:
-            image: Path to image file, PIL Image, or bytes of image
+            image: Path to image file, PIL Image, bytes of image or Screenshot
             box_threshold: Confidence threshold for bounding boxes
             iou_threshold: IOU threshold for NMS
             use_paddleocr: Whether to use PaddleOCR for text detection
@@ -51,6 +51,12 @@ class OmniParser:
             image.save(temp_path)
             image_input = handle_file(temp_path)
             os.remove(temp_path)  # Clean up temp file
+        elif isinstance(image, Screenshot):
+            # Written from the screenshot buffer, no decoding
+            temp_path = "temp_image.png"
+            image.save(temp_path)
+            image_input = handle_file(temp_path)
+            os.remove(temp_path)  # Clean up temp file
         elif isinstance(image, bytes):
             # Raw bytes - save to temporary file and use handle_file
             temp_path = "temp_image.png"
@@ -59,7 +65,7 @@ class OmniParser:
             image_input = handle_file(temp_path)
             os.remove(temp_path)  # Clean up temp file
         else:
-            raise ValueError("Image must be a file path, PIL Image, or bytes")
+            raise ValueError("Image must be a file path, PIL Image, bytes or Screenshot")
         
         
         try:
@@ -114,7 +120,7 @@ class OmniParser:
         """Analyze screenshot with OmniParser.
         
         Args:
-            screenshot_base64: Base64 encoded screenshot. If None, captures current screen.
+            screenshot_base64: Screenshot or base64 encoded screenshot. If None, captures current screen.
             embed_to_log: Whether to embed the screenshot in the log
             
         Returns:
@@ -127,8 +133,7 @@ class OmniParser:
         if screenshot_base64 is None:
             screenshot_base64 = self._capture_page_screenshot(embed_to_log=embed_to_log)
         
-        # Convert base64 to bytes
-        screenshot_bytes = base64.b64decode(screenshot_base64)
+        screenshot = Screenshot.of(screenshot_base64)
         
         # Initialize OmniParser
         # Try to get API key from environment variable
@@ -138,7 +143,7 @@ class OmniParser:
         # Send screenshot to OmniParser and get results
         try:
             elements = parser.parse_screenshot(
-                image=screenshot_bytes,
+                image=screenshot,
                 box_threshold=0.05,
                 iou_threshold=0.1
             )
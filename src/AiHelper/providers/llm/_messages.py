@@ -0,0 +1,273 @@
+"""
+Provider independent message IR.
+
+The keywords build OpenAI-style message dicts (ChatPromptFactory); the
+providers that need another format compile them through this module:
+
+    to_ir(messages)         -> immutable Message(role, content) objects
+    compile_parts(message, provider, convert)
+                            -> provider form of the parts, converted once per part
+
+Parts are interned by the identity of their source item and of its text / URL
+string, so the same dict sent again (retries, consensus, a conversation that
+grows turn after turn) maps to the same Part object without being re-parsed.
+An ImagePart keeps a reference to the data URL string and slices its base64
+payload once; every provider compiled form shares that payload.
+
+The compiled form of a part is memoized per provider and per Part identity
+(weak references: it goes away with the part), so resending or extending a
+conversation only converts the new parts.
+"""
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import cached_property, partial
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from src.AiHelper.common._logger import RobotCustomLogger
+
+PROVIDER_ANTHROPIC = "anthropic"
+PROVIDER_GEMINI = "gemini"
+PROVIDER_OLLAMA = "ollama"
+
+# Interned parts: at most this many, holding at most this many characters of source text
+_INTERN_MAX_PARTS = 1024
+_INTERN_MAX_CHARS = 64_000_000
+
+
+@dataclass(frozen=True, eq=False)
+class TextPart:
+    text: str
+
+
+@dataclass(frozen=True, eq=False)
+class ImagePart:
+    """Image given by URL: a remote URL or a base64 data URL (data:<media type>;base64,<payload>)."""
+    url: str
+    media_type: Optional[str] = None
+    # Start of the base64 payload in url, -1 for a remote URL
+    payload_offset: int = -1
+
+    @classmethod
+    def from_url(cls, url: str) -> "ImagePart":
+        """Raises ValueError on a malformed data URL."""
+        if not url.startswith("data:"):
+            return cls(url)
+        comma = url.find(",")
+        if comma < 0:
+            raise ValueError("missing ',' before the base64 payload")
+        header = url[5:comma]
+        return cls(url, header.split(";")[0], comma + 1)
+
+    @property
+    def is_inline(self) -> bool:
+        return self.payload_offset >= 0
+
+    @cached_property
+    def base64(self) -> str:
+        """Base64 payload of a data URL, sliced once and shared by the compiled forms."""
+        return self.url[self.payload_offset:] if self.is_inline else ""
+
+
+@dataclass(frozen=True, eq=False)
+class NativePart:
+    """Content item already in a provider format (Anthropic image source, Gemini inline_data, ...): passed through."""
+    item: Dict[str, Any]
+
+    @property
+    def type(self) -> Optional[str]:
+        return self.item.get("type")
+
+
+Part = Union[TextPart, ImagePart, NativePart]
+
+
+class Message(NamedTuple):
+    role: str
+    # Plain text, or the parts of a multi-part content
+    content: Union[str, Tuple[Part, ...]]
+
+    @property
+    def text(self) -> str:
+        """Text of the message (parts other than text are ignored)."""
+        if isinstance(self.content, str):
+            return self.content
+        return "\n".join(part.text for part in self.content if isinstance(part, TextPart))
+
+
+class _PartInterner:
+    """Source item -> Part, keyed by the item identity and checked against the identity of its source string."""
+
+    def __init__(self, max_parts: int = _INTERN_MAX_PARTS, max_chars: int = _INTERN_MAX_CHARS):
+        self.logger = RobotCustomLogger()
+        self.max_parts = max_parts
+        self.max_chars = max_chars
+        self._parts: "OrderedDict[int, Tuple[Any, Any, Optional[Part]]]" = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+
+    def part(self, item: Any) -> Optional[Part]:
+        if isinstance(item, str):
+            return TextPart(item)
+        if not isinstance(item, dict):
+            return None
+        item_type = item.get("type")
+        if item_type == "text":
+            source = item.get("text", "")
+        elif item_type == "image_url":
+            image_url = item.get("image_url", {})
+            source = image_url.get("url") if isinstance(image_url, dict) else None
+            if source is None:
+                return None
+        else:
+            return NativePart(item)
+
+        key = id(item)
+        with self._lock:
+            cached = self._parts.get(key)
+            # Same item, still holding the same string object: same part (the cache keeps both alive)
+            if cached is not None and cached[0] is item and cached[1] is source:
+                self._parts.move_to_end(key)
+                return cached[2]
+
+        if item_type == "text":
+            part = TextPart(source)
+        else:
+            try:
+                part = ImagePart.from_url(source)
+            except (ValueError, IndexError) as e:
+                self.logger.error(f"Invalid base64 image URL format: {e}")
+                part = None
+
+        with self._lock:
+            previous = self._parts.pop(key, None)
+            if previous is not None:
+                self._chars -= len(previous[1])
+            self._parts[key] = (item, source, part)
+            self._chars += len(source)
+            while self._parts and (len(self._parts) > self.max_parts or self._chars > self.max_chars):
+                _, (_, evicted, _) = self._parts.popitem(last=False)
+                self._chars -= len(evicted)
+        return part
+
+    def clear(self):
+        with self._lock:
+            self._parts.clear()
+            self._chars = 0
+
+
+_interner = _PartInterner()
+# Message(role, content) without the keyword handling of the NamedTuple constructor
+_new_message = partial(tuple.__new__, Message)
+
+
+def to_ir(messages: Sequence[Union[Dict[str, Any], Message]]) -> List[Message]:
+    """
+    Args:
+        messages: OpenAI-style message dicts (Message objects are kept as is)
+
+    Returns:
+        The messages as immutable Message objects
+    """
+    converted = []
+    append = converted.append
+    part = _interner.part
+    for message in messages:
+        if isinstance(message, Message):
+            append(message)
+            continue
+        content = message.get("content")
+        if isinstance(content, str):
+            append(_new_message((message.get("role"), content)))
+        elif isinstance(content, list):
+            append(_new_message((message.get("role"), tuple(item for item in map(part, content) if item is not None))))
+        else:
+            append(_new_message((message.get("role"), "" if content is None else str(content))))
+    return converted
+
+
+class _CompiledParts:
+    """Provider -> {Part: compiled form}, weakly keyed by the parts."""
+
+    def __init__(self):
+        self._by_provider: Dict[str, "weakref.WeakKeyDictionary[Any, Any]"] = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider: str, part: Part, convert: Callable[[Part], Any]) -> Any:
+        with self._lock:
+            compiled = self._by_provider.setdefault(provider, weakref.WeakKeyDictionary())
+            if part in compiled:
+                return compiled[part]
+        value = convert(part)
+        if value is not None:
+            # A failed conversion (e.g. image download) is retried on the next call
+            with self._lock:
+                compiled[part] = value
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._by_provider.clear()
+
+
+_compiled = _CompiledParts()
+
+
+def compile_parts(message: Message, provider: str, convert: Callable[[Part], Any]) -> List[Any]:
+    """
+    Args:
+        message: Message with multi-part content
+        provider: Memoization namespace of the compiled form (one per target format)
+        convert: Provider form of one part, None to drop it
+
+    Returns:
+        The compiled parts, in order
+    """
+    compiled = []
+    for part in message.content:
+        value = _compiled.get(provider, part, convert)
+        if value is not None:
+            compiled.append(value)
+    return compiled
+
+
+def clear_caches():
+    """Drop the interned parts and the compiled forms."""
+    _interner.clear()
+    _compiled.clear()
+
+
+# Anthropic Messages API
+def _anthropic_part(part: Part) -> Optional[Dict[str, Any]]:
+    if isinstance(part, TextPart):
+        return {"type": "text", "text": part.text}
+    if isinstance(part, ImagePart):
+        if part.is_inline:
+            return {"type": "image", "source": {"type": "base64", "media_type": part.media_type, "data": part.base64}}
+        return {"type": "image", "source": {"type": "url", "url": part.url}}
+    if part.type == "image" and "source" not in part.item:
+        RobotCustomLogger().warning("Image item missing 'source' field")
+        return None
+    return part.item
+
+
+def anthropic_content(message: Message) -> Union[str, List[Dict[str, Any]]]:
+    if isinstance(message.content, str):
+        return message.content
+    return compile_parts(message, PROVIDER_ANTHROPIC, _anthropic_part)
+
+
+def anthropic_messages(messages: Sequence[Union[Dict[str, Any], Message]]) -> Tuple[Any, List[Dict[str, Any]]]:
+    """
+    Returns:
+        The system prompt (Anthropic takes it apart) and the other messages in the Messages API format
+    """
+    system_message = None
+    converted = []
+    for message in to_ir(messages):
+        if message.role == "system":
+            system_message = anthropic_content(message)
+        else:
+            converted.append({"role": message.role, "content": anthropic_content(message)})
+    return system_message, converted
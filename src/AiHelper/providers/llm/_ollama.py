@@ -35,7 +35,8 @@ class OllamaClient(BaseLLMClient):
         self.client = OpenAI(
             base_url=base_url,
             api_key="ollama",  # Dummy key, not used by Ollama
-            max_retries=max_retries
+            # retries are handled by the shared rate limiter (see BaseLLMClient._send_with_retry)
+            max_retries=0
         )
         
         self.logger.info(f"Ollama client initialized with base_url: {base_url}")
@@ -66,13 +67,25 @@ class OllamaClient(BaseLLMClient):
         try:
             self._validate_parameters(temperature, top_p)
             
-            response = self.client.chat.completions.create(
-                model=model or self.default_model,
-                messages=messages,
-                temperature=temperature,
-                top_p=top_p,
-                max_tokens=max_tokens,
-                **kwargs
+            model = model or self.default_model
+            # Ollama's OpenAI-compatible endpoint accepts json_schema response formats (structured outputs)
+            response_schema = self._pop_response_schema(kwargs)
+            if response_schema is not None:
+                kwargs["response_format"] = response_schema.openai_response_format()
+            response = self._send_with_retry(
+                "ollama",
+                model,
+                lambda: self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    top_p=top_p,
+                    max_tokens=max_tokens,
+                    timeout=self._request_timeout(),
+                    **kwargs
+                ),
+                messages,
+                max_tokens,
             )
             
             # Log usage
@@ -80,7 +93,7 @@ class OllamaClient(BaseLLMClient):
                 f"Ollama API call successful. Tokens used: {response.usage.total_tokens}",
                 True
             )
-            self.logger.info(f"Response: {response}")
+            self.logger.debug(lambda: f"Response: {response}")
             
             return response
             
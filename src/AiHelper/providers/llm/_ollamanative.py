@@ -0,0 +1,423 @@
+"""
+Ollama native client (/api/chat).
+
+Compared with the OpenAI-compatible /v1 shim (OllamaClient), the native API:
+    - takes images as bare base64 strings (`images` of a message): data URLs are
+      sliced once by the message IR, remote URLs are downloaded once per part
+    - keeps the model loaded with `keep_alive` (AIHELPER_OLLAMA_KEEP_ALIVE) and
+      loads it ahead of the first request (`warm_up`, run in the background when
+      the client is built with AIHELPER_OLLAMA_WARMUP=true)
+    - reports the model load time apart from the prompt evaluation and
+      generation times: each call logs them and format_response returns them
+
+Requests beyond the server's parallel slots (OLLAMA_NUM_PARALLEL on the server,
+AIHELPER_OLLAMA_NUM_PARALLEL here) are queued by Ollama and spend their timeout
+waiting. The client holds one of N slot lock files per server while a request
+is in flight, so the threads and pabot workers of a run never send more than N
+requests at once and a queued request waits before its timeout starts.
+"""
+import base64
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Union
+
+import requests
+
+from src.AiHelper.common._deadline import DeadlineExceeded, current_deadline
+from src.AiHelper.common._logger import RobotCustomLogger
+from src.AiHelper.config.config import Config
+from src.AiHelper.providers.llm._baseclient import BaseLLMClient
+from src.AiHelper.providers.llm._messages import PROVIDER_OLLAMA, ImagePart, Message, Part, TextPart, compile_parts, to_ir
+
+_NANOSECONDS_PER_MS = 1_000_000
+# Poll interval while every slot is taken
+_SLOT_POLL_INTERVAL = 0.02
+
+
+def native_host(base_url: str) -> str:
+    """http://localhost:11434/v1 (OLLAMA_BASE_URL of the OpenAI shim) -> http://localhost:11434"""
+    host = base_url.rstrip("/")
+    return host[:-3] if host.endswith("/v1") else host
+
+
+def parse_keep_alive(value: Union[str, int, float]) -> Union[str, int, float]:
+    """keep_alive as Ollama reads it: a number of seconds (-1 forever, 0 unload now) or a duration ("30m")"""
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            return value.strip()
+    return value
+
+
+@dataclass
+class OllamaResponse:
+    """Reply of /api/chat (stream=false); durations converted from nanoseconds to milliseconds."""
+    content: str
+    model: str
+    done_reason: Optional[str] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    load_ms: float = 0.0
+    prompt_eval_ms: float = 0.0
+    eval_ms: float = 0.0
+    total_ms: float = 0.0
+    # Time spent waiting for a parallel slot on the client side
+    queue_ms: float = 0.0
+    raw: Dict[str, Any] = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any], queue_ms: float = 0.0) -> "OllamaResponse":
+        def ms(key: str) -> float:
+            return round((data.get(key) or 0) / _NANOSECONDS_PER_MS, 1)
+        return cls(
+            content=(data.get("message") or {}).get("content", ""),
+            model=data.get("model", ""),
+            done_reason=data.get("done_reason"),
+            prompt_tokens=data.get("prompt_eval_count") or 0,
+            completion_tokens=data.get("eval_count") or 0,
+            load_ms=ms("load_duration"),
+            prompt_eval_ms=ms("prompt_eval_duration"),
+            eval_ms=ms("eval_duration"),
+            total_ms=ms("total_duration"),
+            queue_ms=round(queue_ms, 1),
+            raw=data,
+        )
+
+    @property
+    def inference_ms(self) -> float:
+        return round(self.prompt_eval_ms + self.eval_ms, 1)
+
+    @property
+    def cold(self) -> bool:
+        """The model was loaded by this call (not already in memory)."""
+        # A loaded model still reports a load_duration of a few milliseconds
+        return self.load_ms >= 100
+
+
+class OllamaSlots:
+    """
+    At most `count` requests in flight to one server, across the threads and the processes of a run:
+    a request holds an exclusive lock on one of `count` slot files.
+    """
+
+    def __init__(self, host: str, count: int, directory: Optional[str] = None):
+        self.count = max(1, int(count))
+        digest = hashlib.sha1(host.encode("utf-8")).hexdigest()[:12]
+        self.directory = os.path.join(directory or tempfile.gettempdir(), "aihelper_ollama_slots", digest)
+        os.makedirs(self.directory, exist_ok=True)
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float] = None):
+        """
+        Returns:
+            The open slot file (to give back to release), locked
+
+        Raises:
+            DeadlineExceeded: the keyword time budget ran out while every slot was taken
+            TimeoutError: no slot within `timeout` seconds
+        """
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                # Start with a different slot each time: threads do not all fight for slot 0
+                first = self._next
+                self._next = (self._next + 1) % self.count
+            for offset in range(self.count):
+                f = open(os.path.join(self.directory, f"slot{(first + offset) % self.count}.lock"), "a")
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return f
+                except BlockingIOError:
+                    f.close()
+            deadline = current_deadline()
+            if deadline is not None and deadline.expired:
+                raise DeadlineExceeded(deadline)
+            if timeout is not None and time.monotonic() - started >= timeout:
+                raise TimeoutError(f"No free Ollama slot (of {self.count}) within {timeout:.0f}s")
+            time.sleep(_SLOT_POLL_INTERVAL)
+
+    @staticmethod
+    def release(f):
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        finally:
+            f.close()
+
+
+class OllamaNativeClient(BaseLLMClient):
+    """
+    Ollama client using the native /api/chat endpoint.
+
+    No API key required - just needs Ollama running locally.
+    Default endpoint: http://localhost:11434
+
+    Documentation: https://github.com/ollama/ollama/blob/main/docs/api.md
+    """
+
+    # Slot pools per server, shared by every client of the process
+    _slots: Dict[str, OllamaSlots] = {}
+    _slots_lock = threading.Lock()
+
+    def __init__(
+        self,
+        model: str = "llama3.2",
+        base_url: str = "http://localhost:11434",
+        max_retries: int = 3,
+        keep_alive: Optional[str] = None,
+        num_parallel: Optional[int] = None,
+        warm_up: Optional[bool] = None,
+    ):
+        """
+        Args:
+            model: Default model to use
+            base_url: Ollama server (a trailing /v1 of the OpenAI shim URL is dropped)
+            max_retries: Maximum number of retry attempts
+            keep_alive: How long the server keeps the model loaded after a request ("30m", "-1" forever, "0")
+            num_parallel: Requests sent at once to the server (its OLLAMA_NUM_PARALLEL)
+            warm_up: Load the model in the background now (default AIHELPER_OLLAMA_WARMUP)
+        """
+        self.logger = RobotCustomLogger()
+        self.default_model = model
+        self.host = native_host(base_url)
+        self.max_retries = max_retries
+        self.keep_alive = parse_keep_alive(Config.OLLAMA_KEEP_ALIVE if keep_alive is None else keep_alive)
+        self.session = requests.Session()
+        self.slots = self._get_slots(self.host, num_parallel or Config.OLLAMA_NUM_PARALLEL)
+        self.stats = {"calls": 0, "cold_calls": 0, "load_ms": 0.0, "inference_ms": 0.0, "queue_ms": 0.0}
+        self._stats_lock = threading.Lock()
+        self._warm_up_thread: Optional[threading.Thread] = None
+
+        self.logger.info(f"Ollama native client initialized with host: {self.host} "
+                         f"(keep_alive {self.keep_alive}, {self.slots.count} parallel slots)")
+        if Config.OLLAMA_WARMUP if warm_up is None else warm_up:
+            self._warm_up_thread = threading.Thread(target=self.warm_up, name="ollama-warm-up", daemon=True)
+            self._warm_up_thread.start()
+
+    @classmethod
+    def _get_slots(cls, host: str, count: int) -> OllamaSlots:
+        with cls._slots_lock:
+            slots = cls._slots.get(host)
+            if slots is None or slots.count != count:
+                slots = cls._slots[host] = OllamaSlots(host, count)
+            return slots
+
+    def warm_up(self, model: Optional[str] = None) -> Optional[float]:
+        """
+        Load the model into the server memory (chat request without messages) and pin it with keep_alive.
+
+        Returns:
+            The load time in milliseconds (close to 0 when it was already loaded), None if the server is unreachable
+        """
+        model = model or self.default_model
+        try:
+            response = self.session.post(
+                f"{self.host}/api/chat",
+                json={"model": model, "messages": [], "keep_alive": self.keep_alive},
+                timeout=Config.LLM_TIMEOUT,
+            )
+            response.raise_for_status()
+        except requests.RequestException as e:
+            self.logger.warning(f"Ollama warm-up of {model} failed: {e}", False)
+            return None
+        load_ms = OllamaResponse.from_json(response.json()).load_ms
+        self.logger.info(f"Ollama model {model} loaded in {load_ms:.0f} ms (keep_alive {self.keep_alive})", False)
+        return load_ms
+
+    def create_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        max_tokens: int = 1400,
+        temperature: float = 1.0,
+        top_p: float = 1.0,
+        **kwargs
+    ) -> Optional[OllamaResponse]:
+        """
+        Create a chat completion using the local Ollama server.
+
+        Args:
+            messages: List of message dictionaries with 'role' and 'content'
+            model: Model to use (if None, uses default_model)
+            max_tokens: Maximum tokens to generate (num_predict)
+            temperature: Sampling temperature (0-2)
+            top_p: Nucleus sampling parameter (0-1)
+            **kwargs: Additional model options (seed, stop, num_ctx, ...)
+
+        Returns:
+            OllamaResponse with the reply, token counts and load / inference times
+        """
+        try:
+            self._validate_parameters(temperature, top_p)
+
+            model = model or self.default_model
+            response_schema = self._pop_response_schema(kwargs)
+            keep_alive = parse_keep_alive(kwargs.pop("keep_alive", self.keep_alive))
+            payload = {
+                "model": model,
+                "messages": self._convert_messages(messages),
+                "stream": False,
+                "keep_alive": keep_alive,
+                "options": {"num_predict": max_tokens, "temperature": temperature, "top_p": top_p, **kwargs},
+            }
+            if response_schema is not None:
+                # Structured outputs: `format` takes the JSON schema
+                payload["format"] = response_schema.json_schema()
+
+            response = self._send_with_retry(
+                "ollama",
+                model,
+                lambda: self._post_chat(payload),
+                messages,
+                max_tokens,
+                usage=lambda r: r.prompt_tokens + r.completion_tokens,
+            )
+            self._record(response)
+            self.logger.info(
+                f"Ollama API call successful ({model}): load {response.load_ms:.0f} ms"
+                f"{' (cold start)' if response.cold else ''}, prompt eval {response.prompt_eval_ms:.0f} ms, "
+                f"generation {response.eval_ms:.0f} ms, slot wait {response.queue_ms:.0f} ms. "
+                f"Tokens used: {response.prompt_tokens + response.completion_tokens}",
+                True
+            )
+            self.logger.debug(lambda: f"Response: {response}")
+            return response
+
+        except requests.ConnectionError:
+            self.logger.error(
+                f"Cannot connect to Ollama server at {self.host}. Is Ollama running? "
+                "Start it with: ollama serve",
+                True
+            )
+            raise
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                self.logger.error(f"Model not available on the Ollama server. Pull it with: ollama pull {model}", True)
+            else:
+                self.logger.error(f"Ollama API Error: {e}", True)
+            raise
+        except Exception as e:
+            self.logger.error(f"Ollama API Error: {e}", True)
+            raise
+
+    def _post_chat(self, payload: Dict[str, Any]) -> OllamaResponse:
+        timeout = self._request_timeout()
+        started = time.monotonic()
+        slot = self.slots.acquire(timeout)
+        try:
+            queue_ms = (time.monotonic() - started) * 1000
+            # The wait for a slot comes out of the request timeout
+            remaining = timeout - queue_ms / 1000 if timeout else None
+            if remaining is not None and remaining <= 0:
+                # The slot came just at the timeout: nothing left for the request (requests refuses <= 0)
+                raise TimeoutError(f"Ollama slot obtained after {queue_ms / 1000:.1f}s: "
+                                   f"no time left of the {timeout:g}s request timeout")
+            response = self.session.post(f"{self.host}/api/chat", json=payload, timeout=remaining)
+            response.raise_for_status()
+            return OllamaResponse.from_json(response.json(), queue_ms)
+        finally:
+            self.slots.release(slot)
+
+    def _record(self, response: OllamaResponse):
+        with self._stats_lock:
+            self.stats["calls"] += 1
+            self.stats["cold_calls"] += response.cold
+            self.stats["load_ms"] += response.load_ms
+            self.stats["inference_ms"] += response.inference_ms
+            self.stats["queue_ms"] += response.queue_ms
+
+    def _convert_messages(self, messages: List[Union[Dict[str, Any], Message]]) -> List[Dict[str, Any]]:
+        """OpenAI-style messages -> /api/chat messages: text joined in `content`, base64 images in `images`."""
+        converted = []
+        for message in to_ir(messages):
+            if isinstance(message.content, str):
+                converted.append({"role": message.role, "content": message.content})
+                continue
+            texts, images = [], []
+            for kind, value in compile_parts(message, PROVIDER_OLLAMA, self._convert_part):
+                (texts if kind == "text" else images).append(value)
+            item = {"role": message.role, "content": "\n".join(texts)}
+            if images:
+                item["images"] = images
+            converted.append(item)
+        return converted
+
+    def _convert_part(self, part: Part) -> Optional[tuple]:
+        if isinstance(part, TextPart):
+            return ("text", part.text)
+        if isinstance(part, ImagePart):
+            if part.is_inline:
+                return ("image", part.base64)
+            return self._fetch_image(part.url)
+        # Provider formats already holding base64: Anthropic image source, Gemini inline_data
+        source = part.item.get("source") or part.item.get("inline_data") or {}
+        if source.get("data"):
+            return ("image", source["data"])
+        self.logger.warning(f"Unsupported content item for Ollama: {part.type}")
+        return None
+
+    def _fetch_image(self, url: str) -> Optional[tuple]:
+        """Download a remote image: Ollama only takes base64 images."""
+        try:
+            response = self.session.get(url, timeout=Config.UPLOAD_TIMEOUT)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            self.logger.error(f"Error fetching image from URL: {e}")
+            return None
+        return ("image", base64.b64encode(response.content).decode("ascii"))
+
+    def _validate_parameters(self, temperature: float, top_p: float):
+        """Validate API parameters."""
+        if not (0 <= temperature <= 2):
+            self.logger.error(f"Invalid temperature {temperature}. Must be between 0 and 2")
+            raise ValueError(f"Invalid temperature {temperature}. Must be between 0 and 2")
+        if not (0 <= top_p <= 1):
+            self.logger.error(f"Invalid top_p {top_p}. Must be between 0 and 1")
+            raise ValueError(f"Invalid top_p {top_p}. Must be between 0 and 1")
+
+    def format_response(
+        self,
+        response: OllamaResponse,
+        include_tokens: bool = True,
+        include_reason: bool = False
+    ) -> Dict[str, Union[str, int, float]]:
+        """
+        Format Ollama response to a standardized dictionary.
+
+        Args:
+            response: OllamaResponse returned by create_chat_completion
+            include_tokens: Whether to include token usage information
+            include_reason: Whether to include stop reason
+
+        Returns:
+            Standardized response dictionary, with the load / inference times in milliseconds
+        """
+        if not response:
+            self.logger.error(f"Invalid response from Ollama", True)
+            return {}
+
+        result = {
+            "content": response.content,
+            "model": response.model,
+            "load_ms": response.load_ms,
+            "inference_ms": response.inference_ms,
+            "queue_ms": response.queue_ms,
+        }
+
+        if include_tokens:
+            result.update({
+                "prompt_tokens": response.prompt_tokens,
+                "completion_tokens": response.completion_tokens,
+                "total_tokens": response.prompt_tokens + response.completion_tokens
+            })
+
+        if include_reason:
+            result["finish_reason"] = response.done_reason
+
+        return result
@@ -0,0 +1,288 @@
+"""
+Local stand-in for an Ollama server (offline runs, benchmarks).
+
+It answers the native endpoints the library uses, and simulates what matters
+for them:
+    POST /api/chat      reply (a JSON object matching `format` when one is given),
+                        token counts and durations in Ollama's format
+    GET  /api/ps        models currently loaded
+    GET  /api/tags      models available
+    GET  /api/version
+
+A model not in memory costs `load_time` seconds to the request that loads it,
+and stays loaded for the keep_alive of the last request (5 minutes when none
+is given, like Ollama; -1 forever, 0 unloads after the reply). At most
+`num_parallel` requests are processed at once; the others wait in a queue, as
+with Ollama's OLLAMA_NUM_PARALLEL. The highest number of requests in flight,
+including the queued ones, is kept in `stats`.
+
+    python -m src.AiHelper.providers.llm._ollamaserver --port 11434 --load-time 3
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, Optional
+
+DEFAULT_KEEP_ALIVE = 300.0
+_DURATION = re.compile(r"^(-?\d+(?:\.\d+)?)(ms|s|m|h)?$")
+_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, None: 1}
+# Rough prompt cost of one image (tokens)
+_IMAGE_TOKENS = 600
+
+
+def keep_alive_seconds(value: Any) -> float:
+    """Seconds the model stays loaded (inf for a negative value)."""
+    if value is None or value == "":
+        return DEFAULT_KEEP_ALIVE
+    match = _DURATION.match(str(value).strip())
+    if not match:
+        raise ValueError(f"invalid keep_alive {value!r}")
+    seconds = float(match.group(1)) * _UNITS[match.group(2)]
+    return float("inf") if seconds < 0 else seconds
+
+
+def schema_reply(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Object matching a JSON schema: numbers 1.0, strings empty, lists empty."""
+    defaults = {"number": 1.0, "integer": 1, "string": "", "array": [], "boolean": True, "object": {}}
+    return {key: defaults.get(spec.get("type"), None) for key, spec in schema.get("properties", {}).items()}
+
+
+def default_responder(request: Dict[str, Any]) -> str:
+    if isinstance(request.get("format"), dict):
+        return json.dumps(schema_reply(request["format"]))
+    if request.get("format") == "json":
+        return "{}"
+    return "OK"
+
+
+class OllamaStandInServer:
+    """Ollama-like HTTP server on a background thread; use as a context manager."""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        models: Iterable[str] = ("llama3.2", "llama3.2-vision", "llava"),
+        load_time: float = 2.0,
+        tokens_per_second: float = 400.0,
+        prompt_tokens_per_second: float = 4000.0,
+        num_parallel: int = 4,
+        responder: Optional[Callable[[Dict[str, Any]], str]] = None,
+    ):
+        """
+        Args:
+            host: Interface to listen on
+            port: Port (0: any free port, see `url`)
+            models: Model names served ("name" also matches "name:tag")
+            load_time: Seconds to load a model that is not in memory
+            tokens_per_second: Generation speed
+            prompt_tokens_per_second: Prompt evaluation speed
+            num_parallel: Requests processed at once (OLLAMA_NUM_PARALLEL)
+            responder: Reply text for a /api/chat request body (default: a JSON object matching `format`, or "OK")
+        """
+        self.models = set(models)
+        self.load_time = load_time
+        self.tokens_per_second = tokens_per_second
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.num_parallel = num_parallel
+        self.responder = responder or default_responder
+        self.stats = {"requests": 0, "loads": 0, "in_flight": 0, "max_in_flight": 0, "max_processing": 0}
+        # model -> time at which it is unloaded
+        self._loaded: Dict[str, float] = {}
+        self._processing = 0
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._slots = threading.BoundedSemaphore(num_parallel)
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "OllamaStandInServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="ollama-stand-in", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "OllamaStandInServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def unload(self, model: Optional[str] = None):
+        """Drop one model (all when None) from memory, as after its keep_alive."""
+        with self._lock:
+            if model is None:
+                self._loaded.clear()
+            else:
+                self._loaded.pop(model, None)
+
+    def _serves(self, model: str) -> bool:
+        return model in self.models or model.split(":")[0] in self.models
+
+    def _ensure_loaded(self, model: str) -> float:
+        """Load the model if needed; returns the load time in seconds."""
+        with self._lock:
+            lock = self._load_locks.setdefault(model, threading.Lock())
+        # One load per model: concurrent requests wait for it
+        with lock:
+            with self._lock:
+                if self._loaded.get(model, 0) > time.monotonic():
+                    return 0.002
+            time.sleep(self.load_time)
+            with self._lock:
+                self.stats["loads"] += 1
+                self._loaded[model] = float("inf")
+            return self.load_time
+
+    def _set_keep_alive(self, model: str, keep_alive: float):
+        with self._lock:
+            if keep_alive <= 0:
+                self._loaded.pop(model, None)
+            else:
+                self._loaded[model] = time.monotonic() + keep_alive
+
+    def chat(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Body of the /api/chat reply (raises KeyError for an unknown model, ValueError for a bad request)."""
+        model = request.get("model") or ""
+        if not self._serves(model):
+            raise KeyError(model)
+        keep_alive = keep_alive_seconds(request.get("keep_alive"))
+        messages = request.get("messages") or []
+        started = time.monotonic()
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["in_flight"] += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+        try:
+            with self._slots:
+                with self._lock:
+                    self._processing += 1
+                    self.stats["max_processing"] = max(self.stats["max_processing"], self._processing)
+                try:
+                    load = self._ensure_loaded(model)
+                    if not messages:
+                        # Load request (warm-up)
+                        self._set_keep_alive(model, keep_alive)
+                        return self._reply(model, "", "load", started, load, 0, 0, 0.0, 0.0)
+                    content = self.responder(request)
+                    characters = sum(len(str(message.get("content", ""))) for message in messages)
+                    images = sum(len(message.get("images") or []) for message in messages)
+                    prompt_tokens = characters // 4 + images * _IMAGE_TOKENS
+                    completion_tokens = max(1, len(content) // 4)
+                    prompt_eval = prompt_tokens / self.prompt_tokens_per_second
+                    generation = completion_tokens / self.tokens_per_second
+                    time.sleep(prompt_eval + generation)
+                    self._set_keep_alive(model, keep_alive)
+                    return self._reply(model, content, "stop", started, load, prompt_tokens, completion_tokens,
+                                       prompt_eval, generation)
+                finally:
+                    with self._lock:
+                        self._processing -= 1
+        finally:
+            with self._lock:
+                self.stats["in_flight"] -= 1
+
+    @staticmethod
+    def _reply(model, content, done_reason, started, load, prompt_tokens, completion_tokens, prompt_eval, generation):
+        def ns(seconds: float) -> int:
+            return int(seconds * 1e9)
+        reply = {
+            "model": model,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "message": {"role": "assistant", "content": content},
+            "done_reason": done_reason,
+            "done": True,
+            "total_duration": ns(time.monotonic() - started),
+            "load_duration": ns(load),
+        }
+        if done_reason != "load":
+            reply.update({
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": ns(prompt_eval),
+                "eval_count": completion_tokens,
+                "eval_duration": ns(generation),
+            })
+        return reply
+
+    def loaded_models(self) -> Dict[str, float]:
+        now = time.monotonic()
+        with self._lock:
+            return {model: until for model, until in self._loaded.items() if until > now}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: Dict[str, Any]):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == "/api/version":
+                    self._send(200, {"version": "0.0.0-stand-in"})
+                elif self.path == "/api/tags":
+                    self._send(200, {"models": [{"name": model, "model": model} for model in sorted(server.models)]})
+                elif self.path == "/api/ps":
+                    self._send(200, {"models": [{"name": model, "model": model} for model in server.loaded_models()]})
+                else:
+                    self._send(404, {"error": "not found"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError as e:
+                    self._send(400, {"error": f"invalid JSON: {e}"})
+                    return
+                if self.path != "/api/chat":
+                    self._send(404, {"error": "not found"})
+                    return
+                try:
+                    self._send(200, server.chat(request))
+                except KeyError as e:
+                    self._send(404, {"error": f"model {e.args[0]!r} not found, try pulling it first"})
+                except ValueError as e:
+                    self._send(400, {"error": str(e)})
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for an Ollama server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--load-time", type=float, default=2.0)
+    parser.add_argument("--num-parallel", type=int, default=4)
+    parser.add_argument("--models", default="llama3.2,llama3.2-vision,llava")
+    args = parser.parse_args()
+    server = OllamaStandInServer(args.host, args.port, args.models.split(","), args.load_time, num_parallel=args.num_parallel)
+    print(f"Ollama stand-in listening on {server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -15,12 +15,13 @@ class OpenAIClient(BaseLLMClient):
         max_retries: int = 3,
         base_backoff: int = 2,
     ):
+        self.logger = RobotCustomLogger()
         self.api_key : str = api_key
         if not self.api_key:
             from src.AiHelper.config.config import Config
             config = Config()
             self.api_key = config.OPENAI_API_KEY
-            self.logger.info(f"API key from config file : {self.api_key}")
+            self.logger.info(f"API key loaded from config file")
             
         if not self.api_key:
             raise ValueError("API key must be provided either as an argument or in the environment variables.")
@@ -28,8 +29,8 @@ class OpenAIClient(BaseLLMClient):
         self.default_model = model
         self.max_retries = max_retries
         self.base_backoff = base_backoff
-        self.client = OpenAI(api_key=self.api_key)
-        self.logger = RobotCustomLogger()
+        # retries are handled by the shared rate limiter (see BaseLLMClient._send_with_retry)
+        self.client = OpenAI(api_key=self.api_key, max_retries=0)
 
     def create_chat_completion(
         self,
@@ -42,15 +43,27 @@ class OpenAIClient(BaseLLMClient):
         try:
             self._validate_parameters(temperature, top_p)
             
-            response = self.client.chat.completions.create(
-                model=model or self.default_model,
-                messages=messages,
-                temperature=temperature,
-                top_p=top_p,
-                **kwargs
+            model = model or self.default_model
+            response_schema = self._pop_response_schema(kwargs)
+            if response_schema is not None:
+                kwargs["response_format"] = response_schema.openai_response_format()
+            response = self._send_with_retry(
+                "openai",
+                model,
+                lambda: self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    top_p=top_p,
+                    timeout=self._request_timeout(),
+                    **kwargs
+                ),
+                messages,
+                kwargs.get("max_tokens") or kwargs.get("max_completion_tokens") or 0,
+                usage=lambda r: r.usage.total_tokens,
             )
             self.logger.info(f"OpenAI API call successful. Tokens used: {response.usage.total_tokens}",True)
-            self.logger.info(f"messages: {response}")
+            self.logger.debug(lambda: f"messages: {response}")
             return response
         except Exception as e:
             self.logger.error(f"OpenAI API Error: {str(e)}",True)
@@ -71,7 +84,7 @@ class OpenAIClient(BaseLLMClient):
         include_reason: bool = False
     ) -> Dict[str, Union[str, int]]:
         if not response or not response.choices:
-            self.logger.error(f"Invalid response or no choices in the response", True, True)
+            self.logger.error(f"Invalid response or no choices in the response", True)
             return {}
             
         result = {
@@ -0,0 +1,253 @@
+"""
+Latency-aware routing with hedged requests across several LLM providers.
+
+HedgedRoutingClient wraps BaseLLMClient instances created by LLMClientFactory.
+Each call goes to the healthy provider with the best recent latency; when it
+has not answered after an adaptive threshold (a percentile of its own recent
+latencies) a duplicate request is fired to the next best provider and the
+first answer wins. The loser is abandoned: its future is cancelled if it has
+not started and its late result is discarded (a running SDK call cannot be
+interrupted from another thread).
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from src.AiHelper.common._logger import RobotCustomLogger
+from src.AiHelper.providers.llm._baseclient import BaseLLMClient
+from src.AiHelper.providers.llm._factory import LLMClientFactory
+
+
+@dataclass
+class RoutedResponse:
+    """SDK response tagged with the route that produced it (format_response needs the right client)."""
+    route: str
+    client: BaseLLMClient
+    response: Any
+    hedged: bool = False
+
+
+class ProviderHealth:
+    """Sliding window of latencies and error streak of one route, shared by the whole process."""
+
+    # Consecutive failures after which a route is skipped for `cooldown` seconds
+    MAX_CONSECUTIVE_ERRORS = 3
+
+    def __init__(self, window: int = 50, cooldown: float = 60.0):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.cooldown = cooldown
+        self.calls = 0
+        self.errors = 0
+        self.wins = 0
+        self.hedges = 0
+        self.consecutive_errors = 0
+        self.unhealthy_until = 0.0
+        self._lock = threading.Lock()
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self.calls += 1
+            self.latencies.append(latency)
+            self.consecutive_errors = 0
+
+    def record_hedge(self):
+        with self._lock:
+            self.hedges += 1
+
+    def record_win(self):
+        with self._lock:
+            self.wins += 1
+
+    def record_error(self):
+        with self._lock:
+            self.calls += 1
+            self.errors += 1
+            self.consecutive_errors += 1
+            if self.consecutive_errors >= self.MAX_CONSECUTIVE_ERRORS:
+                self.unhealthy_until = time.monotonic() + self.cooldown
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        with self._lock:
+            if not self.latencies:
+                return None
+            ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50 = self.percentile(50)
+        p95 = self.percentile(95)
+        return {
+            "healthy": self.healthy,
+            "calls": self.calls,
+            "errors": self.errors,
+            "wins": self.wins,
+            "hedges_fired": self.hedges,
+            "samples": len(self.latencies),
+            "p50": round(p50, 3) if p50 is not None else None,
+            "p95": round(p95, 3) if p95 is not None else None,
+        }
+
+
+class HedgedRoutingClient(BaseLLMClient):
+
+    # Process-wide health registry: the library is re-instantiated for every test
+    _health: Dict[str, ProviderHealth] = {}
+    _health_lock = threading.Lock()
+
+    def __init__(
+        self,
+        routes: List[Tuple[str, Optional[str]]],
+        hedge_percentile: float = 95,
+        min_hedge_delay: float = 1.0,
+        initial_hedge_delay: float = 8.0,
+        min_samples: int = 5,
+    ):
+        """
+        Args:
+            routes: List of (provider, model) tuples, in order of preference before any latency is known
+            hedge_percentile: Percentile of the primary's recent latencies after which the hedge is fired
+            min_hedge_delay: Lower bound of the hedge delay in seconds
+            initial_hedge_delay: Hedge delay used until `min_samples` latencies are known
+            min_samples: Latencies needed before the percentile is trusted
+        """
+        if not routes:
+            raise ValueError("At least one route is required")
+        self.logger = RobotCustomLogger()
+        # Aliases resolved first ("claude" -> "anthropic"): the default model is looked up on the canonical name
+        self.routes = [LLMClientFactory.resolve(provider, model) for provider, model in routes]
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.initial_hedge_delay = initial_hedge_delay
+        self.min_samples = min_samples
+        self.default_model = None
+        self._clients: Dict[str, BaseLLMClient] = {}
+        for provider, model in self.routes:
+            self._clients[self._label(provider, model)] = LLMClientFactory.create_client(provider, model=model)
+        self._executor = ThreadPoolExecutor(max_workers=max(2, 2 * len(self.routes)), thread_name_prefix="hedge")
+
+    @staticmethod
+    def _label(provider: str, model: Optional[str]) -> str:
+        return f"{provider}:{model}"
+
+    @classmethod
+    def health(cls, label: str) -> ProviderHealth:
+        with cls._health_lock:
+            if label not in cls._health:
+                cls._health[label] = ProviderHealth()
+            return cls._health[label]
+
+    @classmethod
+    def health_snapshot(cls) -> Dict[str, Dict[str, Any]]:
+        with cls._health_lock:
+            labels = list(cls._health)
+        return {label: cls.health(label).snapshot() for label in labels}
+
+    @classmethod
+    def reset_health(cls):
+        with cls._health_lock:
+            cls._health = {}
+
+    def _ranked_routes(self) -> List[str]:
+        """Healthy routes first, by recent median latency; unknown latency keeps the configured order."""
+        labels = [self._label(provider, model) for provider, model in self.routes]
+
+        def sort_key(item):
+            position, label = item
+            health = self.health(label)
+            median = health.percentile(50)
+            return (not health.healthy, median is None, median if median is not None else 0, position)
+
+        ranked = [label for _, label in sorted(enumerate(labels), key=sort_key)]
+        return ranked
+
+    def _hedge_delay(self, label: str) -> float:
+        health = self.health(label)
+        if len(health.latencies) < self.min_samples:
+            return self.initial_hedge_delay
+        return max(self.min_hedge_delay, health.percentile(self.hedge_percentile))
+
+    def _call(self, label: str, messages: List[Dict[str, Any]], kwargs: Dict[str, Any]) -> Tuple[str, Any, float]:
+        client = self._clients[label]
+        model = label.split(":", 1)[1]
+        start = time.perf_counter()
+        try:
+            response = client.create_chat_completion(messages=messages, model=model, **kwargs)
+        except Exception:
+            self.health(label).record_error()
+            raise
+        latency = time.perf_counter() - start
+        self.health(label).record_success(latency)
+        return label, response, latency
+
+    def _submit(self, label: str, messages: List[Dict[str, Any]], kwargs: Dict[str, Any]):
+        # The keyword deadline lives in a contextvar: run the call in a copy of the caller's context
+        return self._executor.submit(contextvars.copy_context().run, self._call, label, messages, kwargs)
+
+    def create_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        **kwargs
+    ) -> RoutedResponse:
+        """
+        Send the request to the best route, hedging to the next one when it is slow.
+        `model` is ignored: every route carries its own model.
+
+        Returns:
+            RoutedResponse to pass to format_response
+        """
+        ranked = self._ranked_routes()
+        primary = ranked[0]
+        backups = ranked[1:]
+        futures = {self._submit(primary, messages, kwargs): primary}
+        hedged = False
+        last_error: Optional[Exception] = None
+        timeout = self._hedge_delay(primary) if backups else None
+
+        while futures:
+            done, _ = wait(list(futures), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # Primary is slower than its usual tail latency: fire the hedge
+                backup = backups.pop(0)
+                self.health(primary).record_hedge()
+                self.logger.info(f"Hedging: {primary} exceeded {timeout:.2f}s, duplicating request to {backup}", True)
+                futures[self._submit(backup, messages, kwargs)] = backup
+                hedged = True
+                timeout = None
+                continue
+            for future in done:
+                label = futures.pop(future)
+                try:
+                    label, response, latency = future.result()
+                except Exception as e:
+                    last_error = e
+                    self.logger.warning(f"Route {label} failed: {e}", True)
+                    if not futures and backups:
+                        # Failure: fail over immediately to the next route
+                        backup = backups.pop(0)
+                        futures[self._submit(backup, messages, kwargs)] = backup
+                        timeout = self._hedge_delay(backup) if backups else None
+                    continue
+                for loser in futures:
+                    loser.cancel()
+                self.health(label).record_win()
+                self.logger.info(f"Route {label} answered in {latency:.2f}s{' (hedged)' if hedged else ''}", True)
+                return RoutedResponse(route=label, client=self._clients[label], response=response, hedged=hedged)
+
+        raise last_error if last_error else RuntimeError("No route answered")
+
+    def format_response(self, response: RoutedResponse, include_tokens: bool = True, include_reason: bool = False):
+        result = response.client.format_response(response.response, include_tokens=include_tokens, include_reason=include_reason)
+        result["route"] = response.route
+        # Cost must be computed with the model that actually answered
+        result["model"] = response.route.split(":", 1)[1]
+        return result
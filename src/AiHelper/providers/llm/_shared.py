@@ -0,0 +1,97 @@
+"""
+LLM client sharing its responses between the pabot workers through the sidecar
+(see src.AiHelper.common._sidecar).
+
+Identical requests (same provider, model, parameters and messages, images by
+digest) get the same formatted response: from the sidecar cache for
+AIHELPER_SIDECAR_LLM_TTL seconds, or from the worker sending the same request
+right now (single-flight). A shared response was paid by the worker that sent
+it: its token counts are 0 here and it is flagged `shared`. Empty responses
+and error placeholders (e.g. Gemini "[Content blocked ...]") are not shared.
+"""
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from src.AiHelper.common._cassette import MATCH_EXACT, request_fingerprints
+from src.AiHelper.common._logger import RobotCustomLogger
+from src.AiHelper.common._sidecar import NAMESPACE_LLM, shared_value
+from src.AiHelper.config.config import Config
+from src.AiHelper.providers.llm._baseclient import BaseLLMClient
+
+_TOKEN_KEYS = ("prompt_tokens", "completion_tokens", "total_tokens", "cache_hit_tokens", "cache_miss_tokens")
+_REASON_KEYS = ("finish_reason",)
+# Placeholders the clients return instead of a reply (see GeminiClient.format_response)
+_PLACEHOLDER = re.compile(r"^\[(Content blocked|No content available)\b")
+
+
+def _shareable(formatted: Dict[str, Any]) -> bool:
+    content = formatted.get("content")
+    return isinstance(content, str) and bool(content.strip()) and not _PLACEHOLDER.match(content)
+
+
+@dataclass
+class SharedResponse:
+    """Provider independent response: the formatted response of the wrapped client."""
+    formatted: Dict[str, Any]
+    shared: bool
+
+
+class SharedCacheLLMClient(BaseLLMClient):
+
+    def __init__(self, client: BaseLLMClient, provider: str, model: Optional[str]):
+        """
+        Args:
+            client: Client sending the requests nobody shared yet
+            provider: Provider name (part of the request fingerprint)
+            model: Default model of the wrapped client
+        """
+        self.logger = RobotCustomLogger()
+        self.client = client
+        self.provider = provider
+        self.default_model = model
+
+    def create_chat_completion(
+        self,
+        messages: List[Dict[str, Any]],
+        model: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        temperature: float = 1.0,
+        top_p: float = 1.0,
+        **kwargs
+    ) -> SharedResponse:
+        model = model or self.default_model
+        if max_tokens is not None:
+            # Only when given: the wrapped client keeps its own default (OpenAI models take none, or max_completion_tokens)
+            kwargs["max_tokens"] = max_tokens
+        params = {"temperature": temperature, "top_p": top_p, **kwargs}
+        key = request_fingerprints(self.provider, model, messages, params)[MATCH_EXACT]
+
+        def send() -> Dict[str, Any]:
+            response = self.client.create_chat_completion(messages=messages, model=model,
+                                                          temperature=temperature, top_p=top_p, **kwargs)
+            return self.client.format_response(response, include_tokens=True, include_reason=True)
+
+        formatted, shared = shared_value(NAMESPACE_LLM, key, send, Config.SIDECAR_LLM_TTL, shareable=_shareable)
+        if shared:
+            self.logger.info(f"Sidecar: {self.provider}:{model} response shared by another worker "
+                             f"(fingerprint {key[:12]})", True)
+            formatted = {**formatted, **{name: 0 for name in _TOKEN_KEYS if name in formatted}}
+        return SharedResponse(formatted, shared)
+
+    def __getattr__(self, name: str) -> Any:
+        # warm_up and the other extras of the wrapped client
+        client = self.__dict__.get("client")
+        if client is None:
+            raise AttributeError(name)
+        return getattr(client, name)
+
+    def format_response(self, response: SharedResponse, include_tokens: bool = True, include_reason: bool = False) -> Dict[str, Any]:
+        if not response or not response.formatted:
+            self.logger.error("Invalid shared response", True)
+            return {}
+        result = dict(response.formatted)
+        for key in (() if include_tokens else _TOKEN_KEYS) + (() if include_reason else _REASON_KEYS):
+            result.pop(key, None)
+        result["shared"] = response.shared
+        return result
@@ -1,12 +1,18 @@
+from typing import List, Optional, Union
+
+from src.AiHelper.common._deadline import STAGE_CAPTURE, STAGE_UPLOAD, deadline_stage
 from src.AiHelper.common._logger import RobotCustomLogger
+from src.AiHelper.common._screenshot import Screenshot
+from src.AiHelper.common._tiktoken import TokenHelper
+from src.AiHelper.common._uixml import UIDiffStats, UIDiffTracker, UISnapshot
 from src.AiHelper.common._utils import Utilities
 from src.AiHelper.providers.imguploader.imghandler import ImageUploader
 
 class ChatPromptFactory:
 
-    def __init__(self):
+    def __init__(self, img_uploader: ImageUploader = None):
         self.logger = RobotCustomLogger()
-        self.img_uploader = ImageUploader()
+        self.img_uploader = img_uploader or ImageUploader()
 
     def create_system_prompt(self,system_prompt: str) -> dict:
         self.logger.info(f"From ChatPromptFactory: Creating system prompt: {system_prompt}")
@@ -31,7 +37,7 @@ class ChatPromptFactory:
                 }
             }
             content.append(image_item)
-        self.logger.info(f"From ChatPromptFactory: User prompt created: {content}")
+        self.logger.info(lambda: f"From ChatPromptFactory: User prompt created: {content}")
         return {
             "role": "user",
             "content": content
@@ -39,24 +45,78 @@ class ChatPromptFactory:
     
     def create_user_prompt_sending_current_screenshot(self,text: str, log_image: bool = False, width: int = 200) -> dict:
         self.logger.info(f"From ChatPromptFactory: Creating current screenshot prompt: {text}")
-        screenshot_base64 = Utilities._take_screenshot_as_base64()
-        screenshot_url = self.img_uploader.upload_from_base64(screenshot_base64)
+        with deadline_stage(STAGE_CAPTURE):
+            screenshot = Utilities._take_screenshot()
+        return self.create_user_prompt_sending_screenshot(text, screenshot, log_image, width)
+
+    def create_user_prompt_sending_screenshot(self, text: str, screenshot: Union[Screenshot, str], log_image: bool = False, width: int = 200,
+                                              message: str = "Actual app screenshot") -> dict:
+        """ same as create_user_prompt_sending_current_screenshot with an already captured screenshot (Screenshot or base64) """
+        screenshot = Screenshot.of(screenshot)
+        with deadline_stage(STAGE_UPLOAD):
+            screenshot_url = self.img_uploader.upload_screenshot(screenshot)
         if log_image:
-            Utilities._embed_image_to_log(screenshot_base64, width=width, message="Actual app screenshot")
+            Utilities._embed_image_to_log(screenshot, width=width, message=message)
         return self.create_user_prompt(text, screenshot_url)
+
+    def create_user_prompt_sending_images(self, text: str, images: List[Union[Screenshot, str]], log_images: bool = False, width: int = 200,
+                                          messages: Optional[List[str]] = None) -> dict:
+        """ user prompt with several images (e.g. crops of the current and reference screens), in the given order """
+        images = [Screenshot.of(image) for image in images]
+        with deadline_stage(STAGE_UPLOAD):
+            image_urls = [self.img_uploader.upload_screenshot(image) for image in images]
+        if log_images:
+            for index, image in enumerate(images):
+                Utilities._embed_image_to_log(image, width=width, message=messages[index] if messages else f"Image {index + 1}")
+        prompt = self.create_user_prompt(text)
+        prompt["content"].extend({"type": "image_url", "image_url": {"url": url}} for url in image_urls)
+        return prompt
     
     def create_user_prompt_sending_current_UI_XML(self,text: str) -> dict:
         self.logger.info(f"From ChatPromptFactory: Sending current UI XML prompt: {text}")
-        current_ui_xml = Utilities._get_ui_xml()
+        with deadline_stage(STAGE_CAPTURE):
+            current_ui_xml = Utilities._get_ui_xml()
+        Utilities._link_ui_xml_to_log(current_ui_xml, "Current UI XML")
         text= text + "\n\n" + current_ui_xml
         return self.create_user_prompt(text)
     
+    def create_user_prompt_sending_UI_XML_changes(self, text: str, tracker: UIDiffTracker,
+                                                  snapshot: Optional[UISnapshot] = None) -> dict:
+        """
+        User prompt with the compacted UI XML of the screen: in full on the first turn of the conversation,
+        then only the nodes added, removed or changed since the previous turn (see common._uixml).
+        tracker: conversation state, owned by the caller (the factory is shared by every test of the process)
+        snapshot: already captured screen (the current page source by default)
+        """
+        if snapshot is None:
+            with deadline_stage(STAGE_CAPTURE):
+                current_ui_xml = Utilities._get_ui_xml()
+            Utilities._link_ui_xml_to_log(current_ui_xml, "Current UI XML")
+            snapshot = UISnapshot.parse(current_ui_xml)
+        turn = tracker.turn(snapshot)
+
+        token = TokenHelper()
+        full_tokens = token._count_tokens(turn.full_text)
+        sent_tokens = token._count_tokens(turn.text) if turn.incremental else full_tokens
+        UIDiffStats.record(Utilities._get_suite_name(), full_tokens, sent_tokens, turn.incremental)
+        if turn.incremental:
+            saved = 1 - sent_tokens / full_tokens if full_tokens else 0.0
+            self.logger.info(f"From ChatPromptFactory: UI XML changes ({turn.diff.summary()}): {sent_tokens} tokens "
+                             f"instead of {full_tokens} ({saved:.0%} saved)", True)
+            text += ("\n\nChanges of the screen since the previous UI XML (+ added, - removed, ~ changed; "
+                     "the other elements did not change):\n" + turn.text)
+        else:
+            self.logger.info(f"From ChatPromptFactory: full compacted UI XML ({len(turn.snapshot)} elements, {full_tokens} tokens)")
+            text += "\n\nCurrent screen (compacted UI XML, one line per element):\n" + turn.text
+        return self.create_user_prompt(text)
+
     def create_user_prompt_sending_reference_screenshot(self,text: str, image_path: str, log_image: bool = False, width: int = 200) -> dict:
         self.logger.info(f"From ChatPromptFactory: Creating reference screenshot prompt: {text}")
-        image_url = self.img_uploader.upload_from_file(image_path)
+        with deadline_stage(STAGE_UPLOAD):
+            image_url = self.img_uploader.upload_from_file(image_path)
         self.logger.info(f" From ChatPromptFactory: Reference image path : {image_path} - \n"+
                              f" Reference screenshot uploaded: {image_url}")
 
         if log_image:
-            Utilities._embed_image_to_log(Utilities.encode_image_to_base64(image_path), width=width, message="Reference screenshot")
+            Utilities._embed_image_to_log(Screenshot.from_file(image_path), width=width, message="Reference screenshot")
         return self.create_user_prompt(text, image_url)
@@ -0,0 +1,11 @@
+"""
+Unit tests of the pure modules (no device, no LLM call).
+
+Run from the repository root:
+    python -m pytest src/AiHelper/tests/utest
+"""
+import os
+
+# The library reads its settings at import: placeholder keys, no network is used
+for _key in ("OPENAI_API_KEY", "ANTHROPIC_API_KEY", "GEMINI_API_KEY", "DEEPSEEK_API_KEY", "IMGBB_API_KEY"):
+    os.environ.setdefault(_key, "utest-placeholder")
@@ -0,0 +1,69 @@
+import pytest
+
+from src.AiHelper.common._agent import (ACTION_TAP, AGENT_DO, AgentEngine, AgentPlan, AgentPlanCache, AgentStep,
+                                        StepResult)
+from src.AiHelper.common._uixml import UISnapshot
+
+SCREEN = UISnapshot.parse('<hierarchy><node index="0" class="android.widget.Button" text="Log in" '
+                          'resource-id="app:id/login" clickable="true" bounds="[0,0][1080,90]" /></hierarchy>')
+
+
+class DivergingEngine(AgentEngine):
+    """ every plan has one step, and every step diverges """
+
+    def __init__(self, max_replans, plan_cache=False):
+        super().__init__(driver=None, send=None, prompt=None, settle=lambda key: None, max_replans=max_replans,
+                         plan_cache=plan_cache)
+        self.plans = 0
+
+    def snapshot(self):
+        return SCREEN
+
+    def _plan(self, goal, mode, snapshot, done, divergence, send_screenshot):
+        self.plans += 1
+        return AgentPlan([AgentStep(ACTION_TAP, target_label="Log in")]), snapshot
+
+    def _execute(self, step, before):
+        return StepResult(step.describe(), False, "the screen did not change"), before
+
+
+@pytest.fixture(autouse=True)
+def plan_cache():
+    AgentPlanCache.clear()
+    yield
+    AgentPlanCache.clear()
+
+
+@pytest.mark.parametrize("max_replans", [0, 1, 3])
+def test_the_model_is_asked_max_replans_times_after_the_first_plan(max_replans):
+    engine = DivergingEngine(max_replans)
+
+    result = engine.run("Log in")
+
+    assert not result.passed
+    assert engine.plans == result.llm_calls == max_replans + 1
+    assert result.replans == max_replans
+    assert result.reason.startswith(f"the screen diverged from the plan {max_replans + 1} times")
+
+
+def test_cached_plan_counts_as_the_first_plan():
+    AgentPlanCache.put(AgentPlanCache.key(AGENT_DO, "Log in", SCREEN), [AgentStep(ACTION_TAP, target_label="Log in")])
+    engine = DivergingEngine(max_replans=2, plan_cache=True)
+
+    result = engine.run("Log in")
+
+    assert result.from_cache
+    assert engine.plans == result.llm_calls == 2
+    assert result.replans == 2
+    # The diverging cached plan is not replayed again
+    assert AgentPlanCache.get(AgentPlanCache.key(AGENT_DO, "Log in", SCREEN)) is None
+
+
+def test_invalid_plans_count_as_replans():
+    engine = DivergingEngine(max_replans=2)
+    engine._plan = lambda *args: (_ for _ in ()).throw(ValueError("step 1: unknown action 'hover'"))
+
+    result = engine.run("Log in")
+
+    assert result.llm_calls == 3
+    assert "invalid plan" in result.reason
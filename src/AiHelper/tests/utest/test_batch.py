@@ -0,0 +1,58 @@
+import multiprocessing
+import os
+
+import pytest
+
+from src.AiHelper.config.config import Config
+from src.AiHelper.providers.llm._batch import (STATUS_COMPLETED, STATUS_QUEUED, BatchCollector, BatchJobStore,
+                                               batch_scope, run_id)
+
+MESSAGES = [{"role": "user", "content": "Is the login button shown?"}]
+
+
+@pytest.fixture
+def run(monkeypatch):
+    monkeypatch.setattr(Config, "BATCH_RUN_ID", "")
+    monkeypatch.setattr(Config, "BATCH_BACKEND", "fake")
+
+
+def _pabot_run_id(queue):
+    queue.put(run_id(pabot=True))
+
+
+def test_pabot_workers_share_the_run(run):
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    workers = [context.Process(target=_pabot_run_id, args=(queue,)) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    # Both workers are children of this process, as pabot workers are of the pabot process
+    first, second = queue.get(), queue.get()
+    assert first == second and first.startswith(f"pabot-{os.getpid()}-")
+
+
+def test_collect_picks_up_the_jobs_of_every_worker_of_the_suite(run, tmp_path):
+    root = str(tmp_path)
+    # Enqueued by two workers of the run, and by another run
+    BatchJobStore(root, "run1:Atest.Login").enqueue("openai", "gpt-4o-mini", MESSAGES)
+    BatchJobStore(root, "run1:Atest.Login.Child").enqueue("openai", "gpt-4o-mini", MESSAGES)
+    other_run = BatchJobStore(root, "run2:Atest.Login")
+    other_run.enqueue("openai", "gpt-4o-mini", MESSAGES)
+
+    jobs = BatchCollector(BatchJobStore(root, "run1:Atest.Login")).collect(poll_interval=0)
+
+    assert [job["status"] for job in jobs] == [STATUS_COMPLETED, STATUS_COMPLETED]
+    assert [job["status"] for job in other_run.all()] == [STATUS_QUEUED]
+
+
+def test_a_queued_job_is_submitted_once(run, tmp_path):
+    root = str(tmp_path)
+    BatchJobStore(root, "run1:Atest.Login").enqueue("openai", "gpt-4o-mini", MESSAGES)
+    assert len(BatchCollector(BatchJobStore(root, "run1:Atest.Login")).submit_pending()) == 1
+    assert BatchCollector(BatchJobStore(root, "run1:Atest.Login")).submit_pending() == []
+
+
+def test_batch_scope_is_the_run_and_the_suite(run):
+    assert batch_scope("Atest.Login") == f"{run_id()}:Atest.Login"
@@ -0,0 +1,14 @@
+from src.AiHelper.providers.llm._cascade import CascadeClient
+from src.AiHelper.providers.llm._factory import LLMClientFactory
+
+
+def test_screening_and_primary_aliases_resolve_to_their_provider_and_default_model(monkeypatch):
+    created = []
+    monkeypatch.setattr(LLMClientFactory, "create_client",
+                        staticmethod(lambda client_name="openai", model=None: created.append((client_name, model))))
+
+    cascade = CascadeClient(primary=None, primary_route=("google", None), screen=("claude", None))
+
+    assert (cascade.screen_provider, cascade.screen_model) == ("anthropic", LLMClientFactory.DEFAULT_MODELS["anthropic"])
+    assert (cascade.primary_provider, cascade.primary_model) == ("gemini", LLMClientFactory.DEFAULT_MODELS["gemini"])
+    assert created == [("anthropic", LLMClientFactory.DEFAULT_MODELS["anthropic"])]
@@ -0,0 +1,49 @@
+from src.AiHelper.common._cassette import Cassette
+from src.AiHelper.providers.llm._cassette import CassetteLLMClient
+
+
+class RecordingClient:
+    """ stands in for a provider client: keeps the arguments of every call """
+
+    def __init__(self):
+        self.calls = []
+
+    def create_chat_completion(self, messages, model=None, **kwargs):
+        self.calls.append(kwargs)
+        return kwargs
+
+    def format_response(self, response, include_tokens=True, include_reason=False):
+        return {"content": f"reply {len(self.calls)}", "prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12,
+                "cache_hit_tokens": 8, "cache_miss_tokens": 2}
+
+
+MESSAGES = [{"role": "user", "content": "Is the login button shown?"}]
+
+
+def _client(tmp_path, inner, mode="auto"):
+    cassette = Cassette(str(tmp_path / "cassette.json"), mode)
+    return CassetteLLMClient(cassette, "deepseek", "deepseek-chat", lambda: inner)
+
+
+def test_max_tokens_is_forwarded_only_when_given(tmp_path):
+    inner = RecordingClient()
+    client = _client(tmp_path, inner, mode="record")
+    client.create_chat_completion(MESSAGES, max_tokens=300)
+    client.create_chat_completion(MESSAGES)
+    assert inner.calls[0]["max_tokens"] == 300
+    assert "max_tokens" not in inner.calls[1]
+
+
+def test_requests_differing_in_max_tokens_do_not_replay_each_other(tmp_path):
+    inner = RecordingClient()
+    client = _client(tmp_path, inner)
+    client.create_chat_completion(MESSAGES, max_tokens=100)
+    assert client.create_chat_completion(MESSAGES, max_tokens=100).replayed
+    assert not client.create_chat_completion(MESSAGES, max_tokens=200).replayed
+    assert len(inner.calls) == 2
+
+
+def test_format_response_drops_prompt_cache_tokens_without_include_tokens(tmp_path):
+    client = _client(tmp_path, RecordingClient())
+    response = client.create_chat_completion(MESSAGES)
+    assert client.format_response(response, include_tokens=False) == {"content": "reply 1"}
@@ -0,0 +1,47 @@
+import json
+
+from src.AiHelper.common._structured import VERIFICATION_SCHEMA
+from src.AiHelper.common._tiktoken import TokenHelper
+from src.AiHelper.providers.llm._consensus import ConsensusVerifier, parse_provider_specs, parse_weights
+from src.AiHelper.providers.llm._factory import LLMClientFactory
+
+
+class VotingClient:
+    """ stands in for a provider client: passes with full confidence and keeps the arguments of every call """
+
+    calls = []
+
+    def __init__(self, provider):
+        self.provider = provider
+
+    def create_chat_completion(self, messages, model=None, **kwargs):
+        VotingClient.calls.append((self.provider, model, kwargs))
+        return {"confidence": 1.0, "reason": "shown"}
+
+    def format_response(self, response, include_tokens=True):
+        return {"content": json.dumps(response), "prompt_tokens": 10, "completion_tokens": 5}
+
+
+def test_parse_provider_specs_resolves_aliases_and_default_models():
+    assert parse_provider_specs("claude, google:gemini-1.5-pro") == [
+        ("anthropic", LLMClientFactory.DEFAULT_MODELS["anthropic"]), ("gemini", "gemini-1.5-pro")]
+
+
+def test_parse_weights_resolves_aliases():
+    assert parse_weights("claude=2,google:gemini-1.5-pro=0.5") == {"anthropic": 2.0, "gemini:gemini-1.5-pro": 0.5}
+
+
+def test_structured_output_is_requested_per_vote(monkeypatch):
+    VotingClient.calls = []
+    monkeypatch.setattr(LLMClientFactory, "create_client",
+                        staticmethod(lambda client_name="openai", model=None: VotingClient(client_name)))
+    monkeypatch.setattr(TokenHelper, "calculate_cost", lambda self, *args, **kwargs: 0.0)
+    verifier = ConsensusVerifier(parse_provider_specs("openai:gpt-3.5-turbo,claude"), quorum=2)
+
+    result = verifier.verify([{"role": "user", "content": "Is the login button shown?"}], response_schema=VERIFICATION_SCHEMA)
+
+    assert result.passed
+    calls = {provider: (model, kwargs) for provider, model, kwargs in VotingClient.calls}
+    # gpt-3.5-turbo has no structured output, the default Claude model has
+    assert "response_schema" not in calls["openai"][1]
+    assert calls["anthropic"] == (LLMClientFactory.DEFAULT_MODELS["anthropic"], {"response_schema": VERIFICATION_SCHEMA})
@@ -0,0 +1,33 @@
+import io
+
+import robot
+from robot.api import ExecutionResult
+
+from src.AiHelper.common._deferred import DeferredVerificationListener
+
+SUITE = """*** Test Cases ***
+Login Screen
+    No Operation
+Search Screen
+    No Operation
+"""
+
+
+def test_listener_fails_only_the_tests_whose_deferred_verification_failed(tmp_path):
+    suite = tmp_path / "deferred.robot"
+    suite.write_text(SUITE)
+    output = str(tmp_path / "output.xml")
+    robot.run(str(suite), output=output, log=None, report=None, stdout=io.StringIO())
+
+    DeferredVerificationListener.report(output, {
+        "Deferred.Search Screen": ["Deferred verification failed: the search bar is visible -> no search bar"],
+        "Other.Test": ["Deferred verification failed: run by another worker"],
+    })
+
+    result = ExecutionResult(output)
+    statuses = {test.name: (test.status, test.message) for test in result.suite.all_tests}
+    assert statuses["Login Screen"] == ("PASS", "")
+    assert statuses["Search Screen"] == (
+        "FAIL", "Deferred verification failed: the search bar is visible -> no search bar")
+    assert result.statistics.total.failed == 1
+    assert "Other.Test" in result.errors.messages[0].message
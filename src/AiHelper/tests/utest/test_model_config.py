@@ -0,0 +1,49 @@
+from src.AiHelper.config.model_config import ModelIndex
+
+INDEX = ModelIndex({
+    "providers": {"openai": {"capabilities": ["vision"]}, "ollama": {}, "gemini": {}},
+    "models": {
+        "gpt-4o": {"provider": "openai"},
+        "gpt-4o-mini": {"provider": "openai", "aliases": ["gpt-4o-mini-audio"]},
+        "llama3.2": {"provider": "ollama", "capabilities": []},
+        "gemini-1.5-pro": {"provider": "gemini"},
+    },
+})
+
+
+def _name(model):
+    entry = INDEX.resolve(model)
+    return entry.name if entry else None
+
+
+def test_exact_names_and_aliases():
+    assert _name("gpt-4o") == "gpt-4o"
+    assert _name("GPT-4o-Mini") == "gpt-4o-mini"
+    assert _name("gpt-4o-mini-audio") == "gpt-4o-mini"
+
+
+def test_date_and_version_suffixes_are_stripped():
+    assert _name("gpt-4o-2024-08-06") == "gpt-4o"
+    assert _name("gpt-4o-mini-2024-07-18") == "gpt-4o-mini"
+    assert _name("gemini-1.5-pro-002") == "gemini-1.5-pro"
+    assert _name("gemini-1.5-pro-latest") == "gemini-1.5-pro"
+    assert _name("llama3.2:3b") == "llama3.2"
+
+
+def test_provider_qualified_names():
+    assert _name("openai/gpt-4o") == "gpt-4o"
+    assert _name("models/gemini-1.5-pro") == "gemini-1.5-pro"
+
+
+def test_sibling_and_unknown_models_do_not_resolve():
+    # A name suffix that is not a date or a version is another model
+    assert _name("gpt-4o-mini-tts") is None
+    assert _name("gpt-4o-realtime-preview") is None
+    assert _name("mistral-large") is None
+    assert _name("") is None
+    assert _name(None) is None
+
+
+def test_capabilities_default_to_the_provider_ones():
+    assert INDEX.resolve("gpt-4o-2024-08-06").vision
+    assert not INDEX.resolve("llama3.2").vision
@@ -0,0 +1,48 @@
+import pytest
+
+from src.AiHelper import AiHelper
+from src.AiHelper.common._tiktoken import TokenHelper
+from src.AiHelper.common._utils import Utilities
+
+
+def _screen(title: str) -> str:
+    rows = "".join(
+        f'<node index="{index}" class="android.widget.TextView" text="Stop {index}" '
+        f'resource-id="app:id/stop{index}" bounds="[0,{100 * index}][1080,{100 * index + 90}]" />'
+        for index in range(1, 20))
+    return (f'<hierarchy><node index="0" class="android.widget.FrameLayout" bounds="[0,0][1080,2400]">'
+            f'<node index="0" class="android.widget.TextView" text="{title}" resource-id="app:id/title" '
+            f'bounds="[0,0][1080,90]" />{rows}</node></hierarchy>')
+
+
+@pytest.fixture
+def screen(monkeypatch):
+    """ the page source returned to the keyword: screen["xml"] """
+    current = {"xml": _screen("Itinerary")}
+    monkeypatch.setattr(Utilities, "_get_ui_xml", staticmethod(lambda: current["xml"]))
+    monkeypatch.setattr(Utilities, "_link_ui_xml_to_log", staticmethod(lambda ui_xml, message="UI XML": None))
+    monkeypatch.setattr(TokenHelper, "_count_tokens", lambda self, text: len(text.split()))
+    return current
+
+
+def _prompt_text(prompt: dict) -> str:
+    return prompt["content"][0]["text"]
+
+
+def test_ui_xml_changes_first_call_of_each_instance_sends_full_tree(screen):
+    first_test = AiHelper(client_name="openai")
+    assert "Current screen" in _prompt_text(first_test.create_user_prompt_sending_UI_XML_changes("Check"))
+    screen["xml"] = _screen("Itinerary details")
+    assert "Changes of the screen" in _prompt_text(first_test.create_user_prompt_sending_UI_XML_changes("Check"))
+
+    # Library scope TEST: the next test gets a new instance, which never sent a screen
+    second_test = AiHelper(client_name="openai")
+    assert second_test.prompt is first_test.prompt
+    assert "Current screen" in _prompt_text(second_test.create_user_prompt_sending_UI_XML_changes("Check"))
+
+
+def test_reset_ui_xml_baseline_sends_full_tree_again(screen):
+    helper = AiHelper(client_name="openai")
+    helper.create_user_prompt_sending_UI_XML_changes("Check")
+    helper.reset_UI_XML_baseline()
+    assert "Current screen" in _prompt_text(helper.create_user_prompt_sending_UI_XML_changes("Check"))
@@ -0,0 +1,62 @@
+import pytest
+
+from src.AiHelper.common._ratelimit import block, correct_usage, refill, take
+
+LIMITS = {"rpm": 60, "tpm": 6000}
+
+
+def test_bucket_is_created_full():
+    state = {}
+
+    entry = refill(state, "openai:gpt-4o", LIMITS, now=100.0)
+
+    assert (entry["requests"], entry["tokens"]) == (60, 6000)
+
+
+def test_take_until_empty_then_wait_for_the_refill():
+    state = {}
+    assert take(state, "openai:gpt-4o", LIMITS, tokens=5000, now=0.0) == 0
+    assert take(state, "openai:gpt-4o", LIMITS, tokens=1000, now=0.0) == 0
+
+    # 500 missing tokens at 100 tokens per second
+    assert take(state, "openai:gpt-4o", LIMITS, tokens=500, now=0.0) == pytest.approx(5.0)
+    assert take(state, "openai:gpt-4o", LIMITS, tokens=500, now=2.0) == pytest.approx(3.0)
+    assert take(state, "openai:gpt-4o", LIMITS, tokens=500, now=5.0) == 0
+    assert state["openai:gpt-4o"]["tokens"] == pytest.approx(0)
+
+
+def test_refill_is_capped_at_the_limit():
+    state = {}
+    take(state, "openai:gpt-4o", LIMITS, tokens=3000, now=0.0)
+
+    entry = refill(state, "openai:gpt-4o", LIMITS, now=3600.0)
+
+    assert (entry["requests"], entry["tokens"]) == (60, 6000)
+
+
+def test_requests_per_minute_limit():
+    state = {}
+    limits = {"rpm": 2}
+    assert take(state, "gemini", limits, tokens=10 ** 6, now=0.0) == 0
+    assert take(state, "gemini", limits, tokens=10 ** 6, now=0.0) == 0
+
+    # One request every 30 s, the token count does not matter without tpm
+    assert take(state, "gemini", limits, tokens=1, now=0.0) == pytest.approx(30.0)
+    assert take(state, "gemini", limits, tokens=1, now=30.0) == 0
+
+
+def test_reported_usage_corrects_the_estimate():
+    state = {}
+    take(state, "openai:gpt-4o", LIMITS, tokens=4000, now=0.0)
+
+    correct_usage(state, "openai:gpt-4o", LIMITS, estimated_tokens=4000, actual_tokens=1000, now=0.0)
+
+    assert state["openai:gpt-4o"]["tokens"] == pytest.approx(5000)
+
+
+def test_blocked_key_waits_for_the_retry_after():
+    state = {}
+    block(state, "anthropic", LIMITS, delay=20.0, now=10.0)
+
+    assert take(state, "anthropic", LIMITS, tokens=1, now=15.0) == pytest.approx(15.0)
+    assert take(state, "anthropic", LIMITS, tokens=1, now=30.0) == 0
@@ -0,0 +1,31 @@
+from src.AiHelper.providers.llm._shared import SharedCacheLLMClient
+
+
+class RecordingClient:
+    """ stands in for a provider client: keeps the arguments of every call """
+
+    def __init__(self):
+        self.calls = []
+
+    def create_chat_completion(self, messages, model=None, **kwargs):
+        self.calls.append(kwargs)
+        return kwargs
+
+    def format_response(self, response, include_tokens=True, include_reason=False):
+        return {"content": "ok", "prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12}
+
+
+MESSAGES = [{"role": "user", "content": "Is the login button shown?"}]
+
+
+def test_max_tokens_is_left_to_the_wrapped_client_when_not_given():
+    inner = RecordingClient()
+    SharedCacheLLMClient(inner, "openai", "gpt-5").create_chat_completion(MESSAGES, max_completion_tokens=800)
+    assert "max_tokens" not in inner.calls[0]
+    assert inner.calls[0]["max_completion_tokens"] == 800
+
+
+def test_max_tokens_is_forwarded_when_given():
+    inner = RecordingClient()
+    SharedCacheLLMClient(inner, "anthropic", "claude-3-haiku").create_chat_completion(MESSAGES, max_tokens=300)
+    assert inner.calls[0]["max_tokens"] == 300
@@ -0,0 +1,93 @@
+import pytest
+
+from src.AiHelper.common import _stability
+from src.AiHelper.common._stability import ScreenStabilityWaiter
+
+
+class FakeClock:
+    """ stands in for the time module of _stability: sleeping advances the clock """
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def sampler(*values):
+    """ returns the values in order, then the last one forever """
+    remaining = list(values)
+    return lambda: remaining.pop(0) if len(remaining) > 1 else remaining[0]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(_stability, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def waiter(monkeypatch, tmp_path):
+    waiter = ScreenStabilityWaiter()
+    monkeypatch.setattr(waiter, "poll_interval", 0.1)
+    monkeypatch.setattr(waiter, "min_stable_time", 0.5)
+    monkeypatch.setattr(waiter, "state_file", str(tmp_path / "settle_times.json"))
+    monkeypatch.setattr(waiter, "_settle_times", {})
+    return waiter
+
+
+def test_stable_after_the_samples_stay_identical_for_the_window(clock, waiter):
+    result = waiter.wait(5, key="click:Log in", sampler=sampler("splash", "loading", "home"))
+
+    # Settled at the first "home" sample (0.2 s), stable once it stayed the same for 0.5 s
+    assert result.stable
+    assert result.waited == pytest.approx(0.7)
+    assert result.samples == 8
+    assert waiter.learned_settle_time("click:Log in") == pytest.approx(0.2)
+
+
+def test_window_is_at_most_half_of_the_max_wait(clock, waiter):
+    result = waiter.wait(0.4, sampler=sampler("home"))
+
+    assert result.stable
+    assert result.waited == pytest.approx(0.2)
+
+
+def test_learned_settle_time_is_mostly_slept_then_one_poll_interval_is_enough(clock, waiter):
+    waiter._learn("verify:home", 2.0)
+
+    result = waiter.wait(5, key="verify:home", sampler=sampler("home"))
+
+    assert clock.sleeps[0] == pytest.approx(1.4)
+    assert result.stable
+    assert result.samples == 2
+    assert result.waited == pytest.approx(1.5)
+    # Exponentially weighted average of the learned 2.0 s and the observed 1.4 s
+    assert waiter.learned_settle_time("verify:home") == pytest.approx(0.3 * 1.4 + 0.7 * 2.0)
+
+
+def test_unstable_screen_gives_up_at_max_wait_and_learns_it(clock, waiter):
+    frames = iter(range(1000))
+
+    result = waiter.wait(1.0, key="verify:animation", sampler=lambda: next(frames))
+
+    assert not result.stable
+    assert result.waited <= 1.0
+    assert waiter.learned_settle_time("verify:animation") == 1.0
+
+
+def test_failing_sampler_sleeps_the_max_wait(clock, waiter):
+    def no_driver():
+        raise RuntimeError("no driver")
+
+    result = waiter.wait(2.0, key="verify:home", sampler=no_driver)
+
+    assert not result.stable
+    assert clock.now == pytest.approx(2.0)
+    assert waiter.learned_settle_time("verify:home") is None
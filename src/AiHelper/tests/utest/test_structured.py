@@ -0,0 +1,48 @@
+import pytest
+
+from src.AiHelper.common._structured import extract_json
+
+
+def test_pure_json_and_code_fence():
+    assert extract_json('{"verified": true}') == {"verified": True}
+    assert extract_json('```json\n{"verified": false, "reason": "no button"}\n```') == {"verified": False,
+                                                                                        "reason": "no button"}
+
+
+def test_braces_inside_strings_do_not_end_the_object():
+    reply = 'Here it is: {"reason": "the label shows {name} and a }", "verified": true} Hope it helps {'
+
+    assert extract_json(reply) == {"reason": "the label shows {name} and a }", "verified": True}
+
+
+def test_escaped_quotes_inside_strings():
+    reply = 'Answer {"reason": "the title is \\"Home {1}\\"", "verified": true} done'
+
+    assert extract_json(reply) == {"reason": 'the title is "Home {1}"', "verified": True}
+
+
+def test_object_with_the_required_keys_is_preferred():
+    reply = 'Example: {"x": 1}. Result: {"verified": true, "reason": "ok"}'
+
+    assert extract_json(reply, required=["verified"]) == {"verified": True, "reason": "ok"}
+    # Without one, the first object found is returned
+    assert extract_json('Example: {"x": 1}. Nothing else', required=["verified"]) == {"x": 1}
+
+
+def test_truncated_reply_is_closed():
+    reply = 'Sure. {"steps": [{"action": "tap", "target": "n4"}, {"action": "type", "text": "hel'
+
+    assert extract_json(reply) == {"steps": [{"action": "tap", "target": "n4"}, {"action": "type", "text": "hel"}]}
+
+
+def test_trailing_commas_smart_quotes_and_python_literals_are_repaired():
+    assert extract_json('{"verified": True, "reason": None,}') == {"verified": True, "reason": None}
+    assert extract_json('{“verified”: false}') == {"verified": False}
+    assert extract_json("{'verified': True, 'reason': 'ok'}") == {"verified": True, "reason": "ok"}
+
+
+def test_no_object_raises_value_error():
+    with pytest.raises(ValueError):
+        extract_json("The login button is shown.")
+    with pytest.raises(ValueError):
+        extract_json("a set {1, 2} is not an object")
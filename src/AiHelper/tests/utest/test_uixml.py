@@ -0,0 +1,74 @@
+from src.AiHelper.common._uixml import UIDiffTracker, UISnapshot, diff_snapshots
+
+
+def _node(index, text, resource_id, top, clickable=False):
+    return (f'<node index="{index}" class="android.widget.TextView" text="{text}" resource-id="app:id/{resource_id}" '
+            f'clickable="{str(clickable).lower()}" bounds="[0,{top}][1080,{top + 90}]" />')
+
+
+def _screen(*nodes):
+    return f'<hierarchy><node index="0" class="android.widget.FrameLayout" bounds="[0,0][1080,2400]">{"".join(nodes)}</node></hierarchy>'
+
+
+LOGIN = _screen(_node(0, "Welcome", "title", 0), _node(1, "Log in", "login", 200, clickable=True),
+                _node(2, "Help", "help", 400, clickable=True))
+
+
+def test_parse_keeps_the_nodes_with_content_only():
+    snapshot = UISnapshot.parse(LOGIN)
+
+    # The FrameLayout shows nothing and cannot be acted on
+    assert [node.text for node in snapshot.nodes] == ["Welcome", "Log in", "Help"]
+    assert snapshot.nodes[1].line() == 'n2 TextView "Log in" id=login click @540,245'
+
+
+def test_diff_reports_added_removed_and_changed_nodes():
+    after = UISnapshot.parse(_screen(_node(0, "Welcome back", "title", 0), _node(1, "Log in", "login", 200, clickable=True),
+                                     _node(2, "Forgot password?", "forgot", 600, clickable=True)))
+
+    diff = diff_snapshots(UISnapshot.parse(LOGIN), after)
+
+    assert [node.text for node in diff.added] == ["Forgot password?"]
+    assert [node.text for node in diff.removed] == ["Help"]
+    assert [(before.text, after.text) for before, after in diff.changed] == [("Welcome", "Welcome back")]
+
+
+def test_node_moved_by_a_new_sibling_is_not_a_change_of_text():
+    after = UISnapshot.parse(_screen(_node(0, "Offline", "banner", 0), _node(1, "Welcome", "title", 100),
+                                     _node(2, "Log in", "login", 300, clickable=True),
+                                     _node(3, "Help", "help", 500, clickable=True)))
+
+    diff = diff_snapshots(UISnapshot.parse(LOGIN), after)
+
+    assert [node.text for node in diff.added] == ["Offline"]
+    assert not diff.removed
+    # Matched by class, id and texts: only their position changed
+    assert [(before.text, after.text) for before, after in diff.changed] == [
+        ("Welcome", "Welcome"), ("Log in", "Log in"), ("Help", "Help")]
+
+
+def test_identical_screens_have_no_diff():
+    assert not diff_snapshots(UISnapshot.parse(LOGIN), UISnapshot.parse(LOGIN))
+
+
+def test_tracker_keeps_the_references_of_the_nodes_already_sent():
+    tracker = UIDiffTracker()
+    first = tracker.turn(UISnapshot.parse(LOGIN))
+    second = tracker.turn(UISnapshot.parse(_screen(_node(0, "Loading", "spinner", 800), _node(1, "Welcome", "title", 0),
+                                                   _node(2, "Log in", "login", 200, clickable=True),
+                                                   _node(3, "Help", "help", 400, clickable=True))))
+
+    assert not first.incremental
+    assert second.incremental
+    assert second.text == '+ n4 TextView "Loading" id=spinner @540,845'
+    assert [node.ref for node in second.snapshot.nodes] == ["n4", "n1", "n2", "n3"]
+
+
+def test_tracker_sends_the_full_tree_when_the_diff_is_not_smaller():
+    tracker = UIDiffTracker()
+    tracker.turn(UISnapshot.parse(LOGIN))
+
+    turn = tracker.turn(UISnapshot.parse(_screen(_node(0, "Settings", "settings", 0))))
+
+    assert not turn.incremental
+    assert turn.text == turn.full_text